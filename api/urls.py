@@ -1,6 +1,6 @@
 from django.urls import path
 
-from .views import HealthCheckView, MeView, StatusView, VersionView
+from .views import CacheSelectoresView, HealthCheckView, MeView, StatusView, VersionView
 
 
 urlpatterns = [
@@ -8,4 +8,5 @@ urlpatterns = [
     path("status/", StatusView.as_view(), name="api-status"),
     path("version/", VersionView.as_view(), name="api-version"),
     path("me/", MeView.as_view(), name="api-me"),
+    path("cache/selectores/", CacheSelectoresView.as_view(), name="api-cache-selectores"),
 ]
@@ -4,6 +4,8 @@ from rest_framework import permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from plataformaelemental.cache_selectores import cache_activa, estadisticas_cache
+
 
 class HealthCheckView(APIView):
     permission_classes = [permissions.AllowAny]
@@ -50,3 +52,17 @@ class MeView(APIView):
             },
             status=status.HTTP_200_OK,
         )
+
+
+class CacheSelectoresView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(
+            {
+                "activa": cache_activa(),
+                "backend": settings.SELECTORES_CACHE_BACKEND,
+                "selectores": estadisticas_cache(),
+            },
+            status=status.HTTP_200_OK,
+        )
@@ -0,0 +1,29 @@
+"""Exportaciones de asistencias: se entregan en línea o desde la cola de `exportaciones`."""
+
+from exportaciones.registro import registrar_exportacion
+from personas.permissions import ACCION_EXPORTAR_DATOS, permiso_requerido
+from plataformaelemental.context import descripcion_periodo, organizacion_desde_request, resolver_periodo
+from plataformaelemental.exports import FORMATO_XLSX, Exportacion, iterar_en_bloques, periodo_sufijo_archivo
+
+from .selectors import asistencias_export_queryset
+from .services.exportaciones import ASISTENCIAS_XLSX_HEADERS, filas_export_asistencias
+
+
+exportar_asistencias_required = permiso_requerido(ACCION_EXPORTAR_DATOS, permitir_staff_global=False)
+
+
+@registrar_exportacion("asistencias.asistencias_xlsx", permiso=exportar_asistencias_required)
+def exportacion_asistencias_xlsx(request):
+    periodo = resolver_periodo(request)
+    organizacion = organizacion_desde_request(request)
+    asistencias = asistencias_export_queryset(request, organizacion=organizacion)
+    return Exportacion(
+        formato=FORMATO_XLSX,
+        filename=f"asistencias_{periodo_sufijo_archivo(periodo)}.xlsx",
+        sheet_title="Asistencias",
+        headers=ASISTENCIAS_XLSX_HEADERS,
+        rows=filas_export_asistencias(
+            iterar_en_bloques(asistencias),
+            periodo_descripcion=descripcion_periodo(request=request, corta=True),
+        ),
+    )
@@ -2,6 +2,13 @@ from django.conf import settings
 from django.db import models
 
 
+def _guardar_actualizado_en(kwargs):
+    """`auto_now` solo se escribe si está en `update_fields`; la reconciliación incremental lo lee."""
+    update_fields = kwargs.get("update_fields")
+    if update_fields is not None:
+        kwargs["update_fields"] = {*update_fields, "actualizado_en"}
+
+
 class RelacionOperativaQuerySet(models.QuerySet):
     def operativas(self):
         """Solo relaciones explícitas o históricas revisadas que estén activas."""
@@ -53,6 +60,7 @@ class Disciplina(models.Model):
     )
     activa = models.BooleanField(default=True)
     creada_en = models.DateTimeField(auto_now_add=True)
+    actualizado_en = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         verbose_name = "Disciplina"
@@ -64,6 +72,10 @@ class Disciplina(models.Model):
     def __str__(self) -> str:
         return self.nombre
 
+    def save(self, *args, **kwargs):
+        _guardar_actualizado_en(kwargs)
+        super().save(*args, **kwargs)
+
     @property
     def badge_class(self) -> str:
         return f"disciplina-badge {self.BADGE_COLOR_CLASSES.get(self.badge_color, self.BADGE_COLOR_CLASSES[self.BadgeColor.AZUL])}"
@@ -265,6 +277,7 @@ class SesionClase(models.Model):
     cupo_maximo = models.PositiveIntegerField(null=True, blank=True)
     notas = models.TextField(blank=True)
     creada_en = models.DateTimeField(auto_now_add=True)
+    actualizado_en = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         verbose_name = "Sesion de clase"
@@ -278,6 +291,10 @@ class SesionClase(models.Model):
     def __str__(self) -> str:
         return f"{self.disciplina} - {self.fecha}"
 
+    def save(self, *args, **kwargs):
+        _guardar_actualizado_en(kwargs)
+        super().save(*args, **kwargs)
+
     @property
     def profesores_resumen(self):
         return ", ".join([str(persona) for persona in self.profesores.all()])
@@ -331,6 +348,7 @@ class Asistencia(models.Model):
     )
     comentario = models.TextField(blank=True)
     registrada_en = models.DateTimeField(auto_now_add=True)
+    actualizado_en = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         verbose_name = "Asistencia"
@@ -342,6 +360,10 @@ class Asistencia(models.Model):
     def __str__(self) -> str:
         return f"{self.persona} - {self.sesion} ({self.estado})"
 
+    def save(self, *args, **kwargs):
+        _guardar_actualizado_en(kwargs)
+        super().save(*args, **kwargs)
+
 
 class ClaseLiberada(models.Model):
     asistencia = models.OneToOneField(
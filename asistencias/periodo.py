@@ -2,6 +2,7 @@ from plataformaelemental.context import (
     aplicar_periodo,
     descripcion_periodo,
     filtros_periodo,
+    rango_periodo,
     resolver_periodo,
 )
 
@@ -10,5 +11,6 @@ __all__ = [
     "aplicar_periodo",
     "descripcion_periodo",
     "filtros_periodo",
+    "rango_periodo",
     "resolver_periodo",
 ]
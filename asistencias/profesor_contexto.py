@@ -5,6 +5,8 @@ from django.http import Http404
 from django.utils import timezone
 from django.utils.formats import date_format
 
+from plataformaelemental.context import aplicar_periodo
+
 from .models import AsignacionProfesorDisciplina, Disciplina
 from .services.profesor import organizaciones_profesor, rol_profesor_activo
 
@@ -184,9 +186,4 @@ def exigir_contexto_mutable(contexto):
 def filtrar_periodo(queryset, campo, contexto):
     if contexto["periodo_todos"]:
         return queryset
-    return queryset.filter(
-        **{
-            f"{campo}__month": contexto["periodo_mes"],
-            f"{campo}__year": contexto["periodo_anio"],
-        }
-    )
+    return aplicar_periodo(queryset, campo, mes=contexto["periodo_mes"], anio=contexto["periodo_anio"])
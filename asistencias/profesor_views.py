@@ -17,6 +17,7 @@ from finanzas.models import LotePago, Payment, PaymentPlan, Transaction
 from finanzas.services import confirmar_lote_pagos, crear_pago_operacional
 from personas.models import Persona
 from personas.search import filtrar_por_fragmentos
+from plataformaelemental.context import filtros_periodo
 
 from .models import AlumnoDisciplina, SesionClase
 from .profesor_contexto import (
@@ -113,7 +114,7 @@ def _glosas_profesor(contexto):
     mes, anio = contexto["periodo_mes"], contexto["periodo_anio"]
     resumenes = (
         _sesiones_profesor(contexto)
-        .filter(fecha__month=mes, fecha__year=anio, estado=SesionClase.Estado.COMPLETADA)
+        .filter(**filtros_periodo("fecha", mes=mes, anio=anio), estado=SesionClase.Estado.COMPLETADA)
         .values("disciplina_id", "disciplina__nombre")
         .annotate(sesiones_realizadas=Count("id", distinct=True), asistentes=Count("asistencias"))
         .order_by("disciplina__nombre")
@@ -1,7 +1,8 @@
 from django.db.models import Case, Count, IntegerField, Max, Q, Sum, Value, When
 
 from personas.models import Persona, PersonaRol
-from personas.permissions import normalizar_codigo_rol
+from personas.permissions import mapa_permisos
+from plataformaelemental.cache_selectores import selector_cacheado
 from plataformaelemental.context import aplicar_periodo, filtros_periodo, resolver_periodo
 
 from .models import AsignacionProfesorDisciplina, Asistencia, SesionClase
@@ -32,17 +33,12 @@ def sesiones_visibles_para_usuario(user):
     persona = getattr(user, "persona", None)
     if not persona:
         return sesiones.none()
-    roles = PersonaRol.objects.filter(persona=persona, activo=True).values_list(
-        "organizacion_id",
-        "rol__codigo",
-    )
     organizaciones_administradas = set()
     organizaciones_profesora = set()
-    for organizacion_id, codigo in roles:
-        codigo_normalizado = normalizar_codigo_rol(codigo)
-        if codigo_normalizado in {"admin", "staff_asistencia"}:
+    for organizacion_id, roles in mapa_permisos(user).items():
+        if roles & {"admin", "staff_asistencia"}:
             organizaciones_administradas.add(organizacion_id)
-        elif codigo_normalizado == "profesor":
+        elif "profesor" in roles:
             organizaciones_profesora.add(organizacion_id)
 
     filtro = Q(disciplina__organizacion_id__in=organizaciones_administradas)
@@ -72,10 +68,16 @@ def asistencias_export_queryset(request, *, organizacion=None):
     return queryset
 
 
-def resumen_profesores_periodo_queryset(request, *, organizacion=None):
-    from personas.models import PersonaRol
+def _clave_periodo_organizacion(request, *, organizacion=None):
+    return organizacion, resolver_periodo(request)
+
+
+def _clave_periodo_disciplina(request, *, disciplina):
+    return disciplina.organizacion_id, {**resolver_periodo(request), "disciplina": disciplina.pk}
 
-    periodo = resolver_periodo(request)
+
+@selector_cacheado("asistencias.resumen_profesores_periodo", _clave_periodo_organizacion)
+def resumen_profesores_periodo_queryset(request, *, organizacion=None):
     roles = (
         PersonaRol.objects.select_related("persona", "organizacion")
         .filter(rol__codigo__iexact="PROFESOR", activo=True, persona__activo=True)
@@ -89,7 +91,7 @@ def resumen_profesores_periodo_queryset(request, *, organizacion=None):
     if not persona_ids or not organizacion_ids:
         return roles.none(), {}, {}, {}
 
-    filtros_fecha = filtros_periodo("sesion__fecha", mes=periodo["mes"], anio=periodo["anio"])
+    filtros_fecha = filtros_periodo("sesion__fecha", request=request)
     asistencias_agregadas = (
         Asistencia.objects.filter(
             sesion__profesores__in=persona_ids,
@@ -111,7 +113,7 @@ def resumen_profesores_periodo_queryset(request, *, organizacion=None):
         SesionClase.objects.filter(
             profesores__in=persona_ids,
             disciplina__organizacion_id__in=organizacion_ids,
-            **filtros_periodo("fecha", mes=periodo["mes"], anio=periodo["anio"]),
+            **filtros_periodo("fecha", request=request),
         )
         .exclude(estado=SesionClase.Estado.CANCELADA)
         .values("profesores", "disciplina__organizacion")
@@ -128,7 +130,7 @@ def resumen_profesores_periodo_queryset(request, *, organizacion=None):
         SesionClase.objects.filter(
             profesores__in=persona_ids,
             disciplina__organizacion_id__in=organizacion_ids,
-            **filtros_periodo("fecha", mes=periodo["mes"], anio=periodo["anio"]),
+            **filtros_periodo("fecha", request=request),
         )
         .values("profesores", "disciplina__organizacion", "disciplina__nombre")
         .distinct()
@@ -142,6 +144,7 @@ def resumen_profesores_periodo_queryset(request, *, organizacion=None):
     return roles, asistencias_por_profesor, sesiones_por_profesor, disciplinas_por_profesor
 
 
+@selector_cacheado("asistencias.estudiantes_operativos_periodo", _clave_periodo_organizacion)
 def estudiantes_operativos_periodo(request, *, organizacion=None):
     from finanzas.models import AttendanceConsumption, Payment
     from personas.models import Persona
@@ -257,12 +260,12 @@ def estudiantes_operativos_periodo(request, *, organizacion=None):
     return resultado
 
 
+@selector_cacheado("asistencias.estudiantes_financieros_disciplina", _clave_periodo_disciplina)
 def estudiantes_financieros_disciplina(request, *, disciplina):
     """Estado financiero por estudiante de una disciplina, sin consultas por fila."""
     from finanzas.models import AttendanceConsumption, Payment
 
-    periodo = resolver_periodo(request)
-    fecha_asistencia = filtros_periodo("asistencias__sesion__fecha", mes=periodo["mes"], anio=periodo["anio"])
+    fecha_asistencia = filtros_periodo("asistencias__sesion__fecha", request=request)
     base = Persona.objects.filter(
         asistencias__sesion__disciplina=disciplina,
         **fecha_asistencia,
@@ -273,7 +276,7 @@ def estudiantes_financieros_disciplina(request, *, disciplina):
         persona_id__in=persona_ids,
         organizacion_id=disciplina.organizacion_id,
         revertido_en__isnull=True,
-        **filtros_periodo("fecha_pago", mes=periodo["mes"], anio=periodo["anio"]),
+        **filtros_periodo("fecha_pago", request=request),
     ).values("persona_id").annotate(
         clases_pagadas=Sum("clases_asignadas"),
         tiene_plan=Count("plan", distinct=True),
@@ -283,7 +286,7 @@ def estudiantes_financieros_disciplina(request, *, disciplina):
     consumos = AttendanceConsumption.objects.filter(
         persona_id__in=persona_ids,
         asistencia__sesion__disciplina=disciplina,
-        **filtros_periodo("clase_fecha", mes=periodo["mes"], anio=periodo["anio"]),
+        **filtros_periodo("clase_fecha", request=request),
     ).values("persona_id").annotate(
         clases_usadas=Count("id", filter=Q(estado=AttendanceConsumption.Estado.CONSUMIDO)),
         deuda_clases=Count("id", filter=Q(estado=AttendanceConsumption.Estado.DEUDA)),
@@ -1,7 +1,33 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
 
-from .models import AlumnoDisciplina, Asistencia
+from plataformaelemental.cache_selectores import invalidar_selectores, invalidar_selectores_de
+from plataformaelemental.procesamiento import encolar_trabajo
+
+from .models import AlumnoDisciplina, AsignacionProfesorDisciplina, Asistencia, ClaseLiberada, Disciplina, SesionClase
+
+
+TRABAJO_MATRICULAS = "asistencias.matriculas"
+
+
+def _asegurar_matriculas_historicas(claves):
+    """Upsert en bloque de las matrículas históricas de pares `(sesion_id, persona_id)`."""
+    disciplinas = dict(
+        SesionClase.objects.filter(pk__in={sesion_id for sesion_id, _ in claves}).values_list("pk", "disciplina_id")
+    )
+    pares = {(disciplinas[sesion_id], persona_id) for sesion_id, persona_id in claves}
+    AlumnoDisciplina.objects.bulk_create(
+        [
+            AlumnoDisciplina(
+                disciplina_id=disciplina_id,
+                alumno_id=persona_id,
+                activa=False,
+                origen=AlumnoDisciplina.Origen.HISTORICA,
+            )
+            for disciplina_id, persona_id in sorted(pares)
+        ],
+        ignore_conflicts=True,
+    )
 
 
 @receiver(post_save, sender=Asistencia)
@@ -9,6 +35,12 @@ def mantener_matricula_operativa(sender, instance, raw=False, **kwargs):
     """Conserva trazabilidad histórica sin convertir asistencia en matrícula vigente."""
     if raw:
         return
+    if encolar_trabajo(
+        TRABAJO_MATRICULAS,
+        {(instance.sesion_id, instance.persona_id)},
+        _asegurar_matriculas_historicas,
+    ):
+        return
     AlumnoDisciplina.objects.get_or_create(
         disciplina=instance.sesion.disciplina,
         alumno=instance.persona,
@@ -17,3 +49,35 @@ def mantener_matricula_operativa(sender, instance, raw=False, **kwargs):
             "origen": AlumnoDisciplina.Origen.HISTORICA,
         },
     )
+
+
+RUTA_ORGANIZACION_CACHE = {
+    AlumnoDisciplina: "disciplina__organizacion_id",
+    Asistencia: "sesion__disciplina__organizacion_id",
+    SesionClase: "disciplina__organizacion_id",
+    ClaseLiberada: "organizacion_id",
+    Disciplina: "organizacion_id",
+    AsignacionProfesorDisciplina: "disciplina__organizacion_id",
+}
+
+
+@receiver([post_save, post_delete], sender=AlumnoDisciplina)
+@receiver([post_save, post_delete], sender=Asistencia)
+@receiver([post_save, post_delete], sender=SesionClase)
+@receiver([post_save, post_delete], sender=ClaseLiberada)
+@receiver([post_save, post_delete], sender=Disciplina)
+@receiver([post_save, post_delete], sender=AsignacionProfesorDisciplina)
+def invalidar_cache_selectores(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    invalidar_selectores_de(instance, RUTA_ORGANIZACION_CACHE[sender], eliminada="created" not in kwargs)
+
+
+@receiver(m2m_changed, sender=SesionClase.profesores.through)
+def invalidar_cache_selectores_profesores(sender, instance, action, reverse, **kwargs):
+    if not action.startswith("post_"):
+        return
+    if reverse:
+        invalidar_selectores([None])
+        return
+    invalidar_selectores_de(instance, RUTA_ORGANIZACION_CACHE[SesionClase])
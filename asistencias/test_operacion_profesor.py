@@ -888,18 +888,11 @@ class PagoMasivoProfesorIntegrityTests(TestCase):
         self.assertEqual(repetido.pk, lote.pk)
         self.assertEqual(Payment.objects.filter(lote=lote).count(), 10)
 
-        from finanzas.services import pagos as pagos_service
-
-        original = pagos_service.crear_pago_operacional
-        llamadas = {"cantidad": 0}
-
-        def fallar_en_quinta(*args, **kwargs):
-            llamadas["cantidad"] += 1
-            if llamadas["cantidad"] == 5:
-                raise ValidationError("Fallo controlado de persistencia")
-            return original(*args, **kwargs)
-
-        with patch("finanzas.services.pagos.crear_pago_operacional", side_effect=fallar_en_quinta):
+        # El lote inserta pagos y transacciones en bloque: el fallo llega después de escribirlos.
+        with patch(
+            "finanzas.services.pagos.imputar_consumos_en_lote",
+            side_effect=ValidationError("Fallo controlado de persistencia"),
+        ):
             with self.assertRaisesMessage(ValidationError, "Fallo controlado"):
                 confirmar_lote_pagos(
                     usuario=self.user,
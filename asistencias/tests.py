@@ -7,8 +7,9 @@ from pathlib import Path
 from tempfile import TemporaryDirectory
 
 from django.contrib.auth import get_user_model
+from django.core.cache import caches
 from django.core.management import call_command
-from django.core.exceptions import ValidationError
+from django.core.exceptions import PermissionDenied, ValidationError
 from django.core.management.base import CommandError
 from django.db import close_old_connections, connection
 from django.db.models.signals import pre_save
@@ -24,7 +25,19 @@ from finanzas.models import AttendanceConsumption, Payment, PaymentPlan
 from finanzas.services import asignar_consumo_asistencia
 from personas.models import Organizacion, Persona, PersonaRol, Rol
 from personas.test_factories import asignar_profesora_a_sesion, crear_usuario_con_rol
-from plataformaelemental.context import nav_context, organizacion_desde_request, periodo_context
+from plataformaelemental.cache_selectores import ALIAS_CACHE
+from plataformaelemental.context import (
+    ContextoPeticion,
+    ContextoPeticionMiddleware,
+    aplicar_periodo,
+    contexto_peticion,
+    descripcion_periodo,
+    filtros_periodo,
+    nav_context,
+    organizacion_desde_request,
+    periodo_context,
+    resolver_periodo,
+)
 
 from .models import AlumnoDisciplina, Asistencia, BloqueHorario, ClaseLiberada, Disciplina, SesionClase
 from .services import cambiar_estado_asistencia, liberar_clase, revertir_clase_liberada
@@ -77,6 +90,92 @@ class ContextoGlobalTests(TestCase):
         self.assertEqual(contexto["persona"], persona)
         self.assertEqual(contexto["roles_usuario"], ["ADMIN"])
 
+    def test_contexto_peticion_resuelve_periodo_organizacion_y_roles_una_vez(self):
+        User = get_user_model()
+        user = User.objects.create_user(username="contexto_memo", password=TEST_PASSWORD)
+        persona = Persona.objects.create(nombres="Memo", apellidos="Contexto", user=user)
+        rol = Rol.objects.create(nombre="Administrador", codigo="ADMIN")
+        PersonaRol.objects.create(persona=persona, rol=rol, organizacion=self.organizacion, activo=True)
+        request = self.factory.get("/", {"organizacion": self.organizacion.pk, "periodo_anio": "2026"})
+        request.user = user
+        periodo_context(request)
+        list(nav_context(request, permitir_staff_global=False)["organizaciones_global"])
+
+        with CaptureQueriesContext(connection) as consultas:
+            for _ in range(3):
+                self.assertEqual(resolver_periodo(request)["anio"], 2026)
+                self.assertEqual(organizacion_desde_request(request), self.organizacion)
+                self.assertEqual(list(periodo_context(request)["organizaciones_global"]), [self.organizacion])
+                self.assertEqual(nav_context(request)["roles_usuario"], ["ADMIN"])
+                self.assertEqual(contexto_peticion(request).roles, {"admin"})
+
+        self.assertEqual(len(consultas), 0)
+
+    def test_contexto_peticion_se_descarta_al_cambiar_usuario_o_filtros(self):
+        User = get_user_model()
+        request = self.factory.get("/", {"organizacion": self.organizacion.pk})
+        contexto = ContextoPeticionMiddleware(lambda request: request.contexto)(request)
+        self.assertIsInstance(contexto, ContextoPeticion)
+        self.assertIs(contexto_peticion(request), contexto)
+        self.assertEqual(organizacion_desde_request(request), self.organizacion)
+
+        request.user = User.objects.create_user(username="contexto_sin_rol", password=TEST_PASSWORD)
+        with self.assertRaises(PermissionDenied):
+            organizacion_desde_request(request)
+
+        request.GET = request.GET.copy()
+        request.GET["organizacion"] = "todas"
+        self.assertIsNone(organizacion_desde_request(request))
+
+
+    def test_filtros_periodo_generan_rangos_semiabiertos(self):
+        self.assertEqual(
+            filtros_periodo("fecha", mes=12, anio=2025),
+            {"fecha__gte": date(2025, 12, 1), "fecha__lt": date(2026, 1, 1)},
+        )
+        self.assertEqual(
+            filtros_periodo("fecha", anio=2026),
+            {"fecha__gte": date(2026, 1, 1), "fecha__lt": date(2027, 1, 1)},
+        )
+        self.assertEqual(
+            filtros_periodo("fecha", anio=2026, trimestre=2),
+            {"fecha__gte": date(2026, 4, 1), "fecha__lt": date(2026, 7, 1)},
+        )
+        self.assertEqual(
+            filtros_periodo("fecha", desde=date(2026, 3, 10), hasta=date(2026, 3, 20)),
+            {"fecha__gte": date(2026, 3, 10), "fecha__lt": date(2026, 3, 21)},
+        )
+        self.assertEqual(filtros_periodo("fecha", mes=5), {"fecha__month": 5})
+        self.assertEqual(filtros_periodo("fecha"), {})
+
+    def test_resolver_periodo_acepta_trimestre_y_rango_personalizado(self):
+        periodo = resolver_periodo(self.factory.get("/", {"periodo_anio": "2026", "periodo_trimestre": "3"}))
+        self.assertIsNone(periodo["mes"])
+        self.assertEqual(periodo["trimestre"], 3)
+
+        request = self.factory.get("/", {"periodo_desde": "2026-02-01", "periodo_hasta": "2026-02-15"})
+        self.assertEqual(
+            filtros_periodo("fecha", request=request),
+            {"fecha__gte": date(2026, 2, 1), "fecha__lt": date(2026, 2, 16)},
+        )
+
+        abierto = self.factory.get("/", {"periodo_desde": "2026-02-01"})
+        self.assertEqual(filtros_periodo("fecha", request=abierto), {"fecha__gte": date(2026, 2, 1)})
+        self.assertEqual(descripcion_periodo(request=abierto), "Desde 01-02-2026 en adelante")
+        self.assertEqual(descripcion_periodo(request=abierto, corta=True), "01-02-2026 en adelante")
+
+    def test_aplicar_periodo_filtra_por_rango_sin_extract(self):
+        disciplina = Disciplina.objects.create(organizacion=self.organizacion, nombre="Rango")
+        for fecha in (date(2026, 3, 31), date(2026, 4, 1), date(2026, 4, 30), date(2026, 5, 1)):
+            SesionClase.objects.create(disciplina=disciplina, fecha=fecha)
+
+        queryset = aplicar_periodo(SesionClase.objects.all(), "fecha", mes=4, anio=2026)
+
+        self.assertEqual(
+            sorted(queryset.values_list("fecha", flat=True)),
+            [date(2026, 4, 1), date(2026, 4, 30)],
+        )
+        self.assertNotIn("EXTRACT", str(queryset.query).upper())
 
 class ImportAsistenciasCommandTests(TestCase):
     def setUp(self):
@@ -159,7 +258,7 @@ class AsistenciasViewTests(TestCase):
         )
 
     def _xlsx_rows(self, response):
-        workbook = load_workbook(BytesIO(response.content))
+        workbook = load_workbook(BytesIO(response.getvalue()))
         return list(workbook.active.iter_rows(values_only=True))
 
     def _login_admin_organizacion(self, organizacion, username="admin_org"):
@@ -840,6 +939,57 @@ class AsistenciasViewTests(TestCase):
         self.assertNotIn("email", response_email.json()["resultados"][0])
         self.assertNotIn("rut", response_email.json()["resultados"][0])
 
+    @override_settings(SELECTORES_CACHE_SEGUNDOS=300)
+    def test_roster_asistentes_usa_etag_y_se_reconstruye_al_cambiar_matriculas(self):
+        caches[ALIAS_CACHE].clear()
+        self._login_admin_organizacion(self.organizacion)
+        inactiva = Persona.objects.create(
+            nombres="Inés",
+            apellidos="Núñez",
+            email="ines.roster@example.com",
+            rut="12.345.678-5",
+            activo=False,
+        )
+        PersonaRol.objects.create(
+            persona=inactiva, rol=self.rol_estudiante, organizacion=self.organizacion, activo=True
+        )
+        presente = Persona.objects.create(nombres="Pía", apellidos="Presente")
+        PersonaRol.objects.create(
+            persona=presente, rol=self.rol_estudiante, organizacion=self.organizacion, activo=True
+        )
+        Asistencia.objects.create(sesion=self.sesion, persona=presente)
+        url = reverse("asistencias:sesion_asistentes_roster", kwargs={"pk": self.sesion.pk})
+
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Cache-Control"], "private, no-cache")
+        data = response.json()
+        self.assertEqual(data["campos"], ["id", "nombre", "texto", "inactivo"])
+        self.assertEqual(
+            data["estudiantes"],
+            [
+                [self.estudiante.pk, "Ana Diaz", "ana\ndiaz", 0],
+                [inactiva.pk, "Inés Núñez", "ines\nnunez", 1],
+            ],
+        )
+        self.assertNotIn(b"ines.roster", response.content)
+        self.assertNotIn(b"12.345", response.content)
+
+        etag = response["ETag"]
+        with CaptureQueriesContext(connection) as consultas:
+            no_modificado = self.client.get(url, headers={"If-None-Match": f"W/{etag}"})
+        self.assertEqual(no_modificado.status_code, 304)
+        self.assertEqual(no_modificado.content, b"")
+        self.assertFalse([query for query in consultas.captured_queries if "rol_activo" in query["sql"]])
+
+        nueva = Persona.objects.create(nombres="Nora", apellidos="Nueva")
+        PersonaRol.objects.create(persona=nueva, rol=self.rol_estudiante, organizacion=self.organizacion, activo=True)
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertIn(nueva.pk, [fila[0] for fila in response.json()["estudiantes"]])
+
     def test_agregar_asistente_mobile_crea_asistencia_y_consumo_financiero(self):
         self._login_admin_organizacion(self.organizacion)
         Payment.objects.create(
@@ -2582,6 +2732,7 @@ class SprintDosDominioAsistenciasTests(TestCase):
             persona=self.estudiante,
             estado=Asistencia.Estado.PRESENTE,
         )
+        pago.refresh_from_db()
         self.assertEqual(pago.saldo_clases, 0)
 
         cambiar_estado_asistencia(
@@ -2722,6 +2873,7 @@ class SprintDosDominioAsistenciasTests(TestCase):
     def test_eliminar_asistencia_elimina_consumo_y_recupera_saldo(self):
         pago = self._crear_pago(clases=1)
         asistencia = Asistencia.objects.create(sesion=self.sesion, persona=self.estudiante)
+        pago.refresh_from_db()
         self.assertEqual(pago.saldo_clases, 0)
         asistencia.delete()
         pago.refresh_from_db()
@@ -3245,6 +3397,30 @@ class SprintTresJornadaMovilTests(TestCase):
         self.assertNotIn(self.estudiante_otra_org.pk, [item["id"] for item in resultados])
         self.assertEqual(set(resultados[0]), {"id", "nombre", "inactivo"})
 
+    def test_roster_profesora_solo_trae_matriculados_de_la_sesion(self):
+        Asistencia.objects.create(sesion=self.sesion_temprano, persona=self.estudiante)
+        elegible = Persona.objects.create(nombres="Elena", apellidos="Disponible")
+        sin_matricula = Persona.objects.create(nombres="Elisa", apellidos="Sin Matricula")
+        for persona in (elegible, sin_matricula):
+            PersonaRol.objects.create(
+                persona=persona, rol=self.rol_estudiante, organizacion=self.organizacion, activo=True
+            )
+        AlumnoDisciplina.objects.create(disciplina=self.disciplina, alumno=elegible)
+        self._login_asignada()
+
+        response = self.client.get(
+            reverse("asistencias:sesion_asistentes_roster", kwargs={"pk": self.sesion_temprano.pk}),
+            self._parametros_org(),
+        )
+        no_asignada = self.client.get(
+            reverse("asistencias:sesion_asistentes_roster", kwargs={"pk": self.sesion_no_asignada.pk}),
+            self._parametros_org(),
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([fila[0] for fila in response.json()["estudiantes"]], [elegible.pk])
+        self.assertEqual(no_asignada.status_code, 404)
+
     def test_busqueda_directa_sesion_no_asignada_es_indistinguible_de_inexistente(self):
         self._login_asignada()
         responses = (
@@ -11,6 +11,7 @@ urlpatterns = [
     path("sesiones/", views.sesiones_legacy_redirect),
     path("sesiones/<int:pk>/", views.sesion_detail, name="sesion_detail"),
     path("sesiones/<int:pk>/asistentes/buscar/", views.sesion_asistentes_buscar, name="sesion_asistentes_buscar"),
+    path("sesiones/<int:pk>/asistentes/roster/", views.sesion_asistentes_roster, name="sesion_asistentes_roster"),
     path("sesiones/<int:pk>/asistentes/agregar/", views.sesion_asistente_agregar, name="sesion_asistente_agregar"),
     path(
         "sesiones/<int:pk>/asistencias/<int:asistencia_pk>/estado/",
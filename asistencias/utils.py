@@ -2,7 +2,7 @@ from django.core.exceptions import PermissionDenied
 
 from .models import Disciplina
 from personas.models import Persona, PersonaRol
-from personas.permissions import normalizar_codigo_rol
+from personas.permissions import normalizar_codigo_rol, roles_usuario
 
 ROLE_ADMIN = "admin"
 ROLE_STAFF_ASISTENCIA = "staff_asistencia"
@@ -30,17 +30,8 @@ def usuario_tiene_roles(user, roles: list[str], *, organizacion=None) -> bool:
     persona = getattr(user, "persona", None)
     if not persona:
         return False
-    roles_qs = PersonaRol.objects.filter(
-        persona=persona,
-        activo=True,
-    )
-    if organizacion is not None:
-        roles_qs = roles_qs.filter(organizacion=organizacion)
-    roles_usuario = {
-        normalizar_codigo_rol(codigo)
-        for codigo in roles_qs.values_list("rol__codigo", flat=True)
-    }
-    return bool(roles_usuario.intersection(roles_normalizados)) or PersonaRol.objects.filter(
+    # `roles_usuario` se memoriza en el usuario, así que las verificaciones repetidas no consultan.
+    return bool(roles_usuario(user, organizacion=organizacion) & roles_normalizados) or PersonaRol.objects.filter(
         persona=persona,
         activo=True,
         organizacion=organizacion,
@@ -1,4 +1,5 @@
 import calendar
+import hashlib
 import json
 from datetime import date
 from decimal import Decimal
@@ -7,42 +8,45 @@ from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.core.exceptions import PermissionDenied, ValidationError
 from django.db import transaction
-from django.db.models import Count, Prefetch, Q, Sum
-from django.http import Http404, JsonResponse
+from django.db.models import Count, Exists, OuterRef, Prefetch, Q, Sum
+from django.http import Http404, HttpResponse, HttpResponseNotModified, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.http import parse_etags
 from django.views.decorators.http import require_GET, require_POST
 
 from auditoria.models import AuditLog
 from auditoria.services import registrar_auditoria, registrar_cambio
 from finanzas.models import AttendanceConsumption, Payment
 from personas.models import Organizacion, Persona, PersonaRol, Rol
-from personas.search import filtrar_por_fragmentos
+from personas.search import filtrar_por_fragmentos, texto_busqueda
 from personas.permissions import (
     ACCION_ADMINISTRAR_PERSONAS,
     ACCION_ADMINISTRAR_SESIONES,
     ACCION_EDITAR_ASISTENCIAS,
-    ACCION_EXPORTAR_DATOS,
     ACCION_LIBERAR_CLASE,
     ACCION_OPERAR_PAGOS,
     ACCION_VER_SESION,
     ACCION_VER_FINANZAS,
-    permiso_requerido,
+    invalidar_permisos,
     usuario_tiene_permiso,
 )
+from exportaciones.views import responder_exportacion
+from plataformaelemental.cache_selectores import invalidar_selectores, resultado_cacheado
 from plataformaelemental.context import (
     aplicar_periodo,
+    contexto_peticion,
     descripcion_periodo,
     filtros_periodo,
     nav_context,
     organizacion_desde_request,
-    organizaciones_visibles_para_usuario,
     resolver_periodo,
 )
-from plataformaelemental.exports import periodo_sufijo_archivo, xlsx_response
+from plataformaelemental.procesamiento import procesamiento_diferido
 
 from .decorators import role_required
+from .exportaciones import exportacion_asistencias_xlsx, exportar_asistencias_required
 from .forms import (
     AsistenciaMasivaForm,
     DisciplinaForm,
@@ -61,11 +65,9 @@ from .models import (
 from .profesor_contexto import resolver_contexto_profesor
 from .selectors import (
     estudiantes_financieros_disciplina,
-    asistencias_export_queryset,
     estudiantes_operativos_periodo,
     sesiones_visibles_para_usuario,
 )
-from .services.exportaciones import ASISTENCIAS_XLSX_HEADERS, filas_export_asistencias
 from .services import (
     asegurar_asignaciones_profesores,
     asegurar_matricula_operativa,
@@ -163,20 +165,9 @@ def _rol_profesor_solicitado(request):
     )
 
 
-@permiso_requerido(ACCION_EXPORTAR_DATOS, permitir_staff_global=False)
+@exportar_asistencias_required
 def export_asistencias_xlsx(request):
-    periodo = resolver_periodo(request)
-    organizacion = organizacion_desde_request(request)
-    asistencias = asistencias_export_queryset(request, organizacion=organizacion)
-    return xlsx_response(
-        filename=f"asistencias_{periodo_sufijo_archivo(periodo)}.xlsx",
-        sheet_title="Asistencias",
-        headers=ASISTENCIAS_XLSX_HEADERS,
-        rows=filas_export_asistencias(
-            asistencias,
-            periodo_descripcion=descripcion_periodo(request=request, corta=True),
-        ),
-    )
+    return responder_exportacion(request, exportacion_asistencias_xlsx)
 
 
 def _crear_persona_estudiante_en_organizacion(persona_form, organizacion):
@@ -218,15 +209,21 @@ def _estudiantes_para_asistencia_qs(organizacion):
     return queryset.distinct().order_by("apellidos", "nombres")
 
 
-def _estudiantes_sesion_para_usuario(user, sesion):
-    queryset = _estudiantes_para_asistencia_qs(sesion.disciplina.organizacion)
-    puede_administrar_personas = usuario_tiene_permiso(
+def _solo_estudiantes_matriculados(user, sesion):
+    """Quien no administra personas solo ve a los alumnos con matrícula operativa en la disciplina."""
+    return not usuario_tiene_permiso(
         user,
         ACCION_ADMINISTRAR_PERSONAS,
         organizacion=sesion.disciplina.organizacion,
         permitir_staff_global=False,
     )
-    if not puede_administrar_personas:
+
+
+def _estudiantes_sesion_para_usuario(user, sesion, *, solo_matriculados=None):
+    queryset = _estudiantes_para_asistencia_qs(sesion.disciplina.organizacion)
+    if solo_matriculados is None:
+        solo_matriculados = _solo_estudiantes_matriculados(user, sesion)
+    if solo_matriculados:
         alumnos_operativos = AlumnoDisciplina.objects.operativas().filter(
             disciplina=sesion.disciplina,
         ).values("alumno_id")
@@ -265,6 +262,8 @@ def _reactivar_estudiante_para_asistencia(persona, organizacion):
         rol__codigo="ESTUDIANTE",
         organizacion=organizacion,
     ).update(activo=True)
+    invalidar_selectores([organizacion.pk])
+    invalidar_permisos([persona.pk])
 
 
 def _usuario_es_profesor_asignado(user, sesion):
@@ -980,10 +979,7 @@ def disciplina_create(request):
     form = DisciplinaForm(
         request.POST or None,
         initial=initial,
-        organizaciones=organizaciones_visibles_para_usuario(
-            request.user,
-            permitir_staff_global=False,
-        ),
+        organizaciones=contexto_peticion(request).organizaciones_visibles(permitir_staff_global=False),
     )
     if request.method == "POST" and form.is_valid():
         disciplina = form.save()
@@ -1012,10 +1008,7 @@ def disciplina_edit(request, pk):
     form = DisciplinaForm(
         request.POST or None,
         instance=disciplina,
-        organizaciones=organizaciones_visibles_para_usuario(
-            request.user,
-            permitir_staff_global=False,
-        ),
+        organizaciones=contexto_peticion(request).organizaciones_visibles(permitir_staff_global=False),
     )
 
     if request.method == "POST" and form.is_valid():
@@ -1162,21 +1155,22 @@ def asistencias_list(request):
                 estudiantes_seleccionados = list(asistencia_form.cleaned_data["estudiantes"])
                 creados = 0
                 asistencia_ids_creadas = []
-                for persona in estudiantes_seleccionados:
-                    asegurar_matricula_operativa(
-                        user=request.user,
-                        disciplina=sesion.disciplina,
-                        alumno=persona,
-                    )
-                    _reactivar_estudiante_para_asistencia(persona, sesion.disciplina.organizacion)
-                    asistencia, created = Asistencia.objects.get_or_create(
-                        sesion=sesion,
-                        persona=persona,
-                        defaults={"estado": Asistencia.Estado.PRESENTE},
-                    )
-                    if created:
-                        creados += 1
-                        asistencia_ids_creadas.append(asistencia.pk)
+                with procesamiento_diferido():
+                    for persona in estudiantes_seleccionados:
+                        asegurar_matricula_operativa(
+                            user=request.user,
+                            disciplina=sesion.disciplina,
+                            alumno=persona,
+                        )
+                        _reactivar_estudiante_para_asistencia(persona, sesion.disciplina.organizacion)
+                        asistencia, created = Asistencia.objects.get_or_create(
+                            sesion=sesion,
+                            persona=persona,
+                            defaults={"estado": Asistencia.Estado.PRESENTE},
+                        )
+                        if created:
+                            creados += 1
+                            asistencia_ids_creadas.append(asistencia.pk)
                 estado_anterior = sesion.estado
                 if estudiantes_seleccionados and sesion.estado == SesionClase.Estado.PROGRAMADA:
                     sesion.estado = SesionClase.Estado.COMPLETADA
@@ -1282,10 +1276,7 @@ def asistencias_list(request):
             "estudiantes_total_disciplina_periodo": estudiantes_total_disciplina_periodo,
             "disciplinas": disciplinas_vigentes_qs(organizacion=organizacion),
             "profesores": profesores_vigentes_qs(organizacion=organizacion),
-            "organizaciones": organizaciones_visibles_para_usuario(
-                request.user,
-                permitir_staff_global=False,
-            ),
+            "organizaciones": contexto_peticion(request).organizaciones_visibles(permitir_staff_global=False),
         }
     )
     return render(request, "asistencias/asistencias_list.html", context)
@@ -1354,69 +1345,73 @@ def sesion_detail(request, pk):
             persona_form = PersonaRapidaForm(request.POST)
             open_nueva_persona = True
             if persona_form.is_valid():
-                persona = _crear_persona_estudiante_en_organizacion(
-                    persona_form,
-                    sesion.disciplina.organizacion,
-                )
-                if persona:
-                    asegurar_matricula_operativa(
-                        user=request.user,
-                        disciplina=sesion.disciplina,
-                        alumno=persona,
-                    )
-                    registrar_auditoria(
-                        usuario=request.user,
-                        accion=AuditLog.ACCION_CREAR,
-                        dominio="personas",
-                        objeto=persona,
-                        organizacion=sesion.disciplina.organizacion,
-                        resumen="Persona creada desde sesión",
-                        metadata={"persona_id": persona.pk, "sesion_id": sesion.pk, "origen": "sesion_detail"},
+                with procesamiento_diferido():
+                    persona = _crear_persona_estudiante_en_organizacion(
+                        persona_form,
+                        sesion.disciplina.organizacion,
                     )
-                    agregar_a_sesion = request.POST.get("agregar_a_sesion") == "1"
-                    if agregar_a_sesion:
-                        asistencia, created = Asistencia.objects.get_or_create(
-                            sesion=sesion,
-                            persona=persona,
-                            defaults={"estado": Asistencia.Estado.PRESENTE},
+                    if persona:
+                        asegurar_matricula_operativa(
+                            user=request.user,
+                            disciplina=sesion.disciplina,
+                            alumno=persona,
                         )
-                        estado_anterior = sesion.estado
-                        if sesion.estado == SesionClase.Estado.PROGRAMADA:
-                            sesion.estado = SesionClase.Estado.COMPLETADA
-                            sesion.save(update_fields=["estado"])
-                        if created:
-                            registrar_auditoria(
-                                usuario=request.user,
-                                accion=AuditLog.ACCION_CREAR,
-                                dominio="asistencias",
-                                objeto=asistencia,
-                                organizacion=sesion.disciplina.organizacion,
-                                resumen="Asistencia creada desde alta rápida",
-                                metadata={
-                                    **_metadata_asistencia(asistencia),
-                                    "origen": "alta_rapida_sesion",
-                                },
-                            )
-                        if estado_anterior != sesion.estado:
-                            registrar_cambio(
-                                usuario=request.user,
-                                dominio="asistencias",
-                                objeto=sesion,
-                                organizacion=sesion.disciplina.organizacion,
-                                resumen="Estado de sesión actualizado por alta rápida",
-                                antes={"estado": estado_anterior},
-                                despues={"estado": sesion.estado},
-                                campos=["estado"],
-                                accion=AuditLog.ACCION_CAMBIAR_ESTADO,
-                                metadata=_metadata_sesion(sesion),
+                        registrar_auditoria(
+                            usuario=request.user,
+                            accion=AuditLog.ACCION_CREAR,
+                            dominio="personas",
+                            objeto=persona,
+                            organizacion=sesion.disciplina.organizacion,
+                            resumen="Persona creada desde sesión",
+                            metadata={"persona_id": persona.pk, "sesion_id": sesion.pk, "origen": "sesion_detail"},
+                        )
+                        agregar_a_sesion = request.POST.get("agregar_a_sesion") == "1"
+                        if agregar_a_sesion:
+                            asistencia, created = Asistencia.objects.get_or_create(
+                                sesion=sesion,
+                                persona=persona,
+                                defaults={"estado": Asistencia.Estado.PRESENTE},
                             )
-                        if created:
-                            messages.success(request, "Persona creada y agregada a la asistencia.")
+                            estado_anterior = sesion.estado
+                            if sesion.estado == SesionClase.Estado.PROGRAMADA:
+                                sesion.estado = SesionClase.Estado.COMPLETADA
+                                sesion.save(update_fields=["estado"])
+                            if created:
+                                registrar_auditoria(
+                                    usuario=request.user,
+                                    accion=AuditLog.ACCION_CREAR,
+                                    dominio="asistencias",
+                                    objeto=asistencia,
+                                    organizacion=sesion.disciplina.organizacion,
+                                    resumen="Asistencia creada desde alta rápida",
+                                    metadata={
+                                        **_metadata_asistencia(asistencia),
+                                        "origen": "alta_rapida_sesion",
+                                    },
+                                )
+                            if estado_anterior != sesion.estado:
+                                registrar_cambio(
+                                    usuario=request.user,
+                                    dominio="asistencias",
+                                    objeto=sesion,
+                                    organizacion=sesion.disciplina.organizacion,
+                                    resumen="Estado de sesión actualizado por alta rápida",
+                                    antes={"estado": estado_anterior},
+                                    despues={"estado": sesion.estado},
+                                    campos=["estado"],
+                                    accion=AuditLog.ACCION_CAMBIAR_ESTADO,
+                                    metadata=_metadata_sesion(sesion),
+                                )
+                            if created:
+                                messages.success(request, "Persona creada y agregada a la asistencia.")
+                            else:
+                                messages.success(
+                                    request,
+                                    "Persona creada; la asistencia ya existía para esta sesión.",
+                                )
                         else:
-                            messages.success(request, "Persona creada; la asistencia ya existía para esta sesión.")
-                    else:
-                        messages.success(request, "Persona creada y asignada como estudiante de la sesión.")
-                    return redirect(_url_con_filtros(request, "asistencias:sesion_detail", pk=sesion.pk))
+                            messages.success(request, "Persona creada y asignada como estudiante de la sesión.")
+                        return redirect(_url_con_filtros(request, "asistencias:sesion_detail", pk=sesion.pk))
         elif "eliminar_asistente" in request.POST:
             if not puede_registrar:
                 raise PermissionDenied("No tienes permisos para quitar asistentes de esta sesión.")
@@ -1544,27 +1539,28 @@ def sesion_detail(request, pk):
             estudiantes_seleccionados = list(estudiantes_qs.filter(pk__in=estudiantes_ids))
             creados = 0
             asistencia_ids_creadas = []
-            for persona in estudiantes_seleccionados:
-                if usuario_tiene_permiso(
-                    request.user,
-                    ACCION_ADMINISTRAR_PERSONAS,
-                    organizacion=sesion.disciplina.organizacion,
-                    permitir_staff_global=False,
-                ):
-                    asegurar_matricula_operativa(
-                        user=request.user,
-                        disciplina=sesion.disciplina,
-                        alumno=persona,
+            with procesamiento_diferido():
+                for persona in estudiantes_seleccionados:
+                    if usuario_tiene_permiso(
+                        request.user,
+                        ACCION_ADMINISTRAR_PERSONAS,
+                        organizacion=sesion.disciplina.organizacion,
+                        permitir_staff_global=False,
+                    ):
+                        asegurar_matricula_operativa(
+                            user=request.user,
+                            disciplina=sesion.disciplina,
+                            alumno=persona,
+                        )
+                    _reactivar_estudiante_para_asistencia(persona, sesion.disciplina.organizacion)
+                    asistencia, created = Asistencia.objects.get_or_create(
+                        sesion=sesion,
+                        persona=persona,
+                        defaults={"estado": Asistencia.Estado.PRESENTE},
                     )
-                _reactivar_estudiante_para_asistencia(persona, sesion.disciplina.organizacion)
-                asistencia, created = Asistencia.objects.get_or_create(
-                    sesion=sesion,
-                    persona=persona,
-                    defaults={"estado": Asistencia.Estado.PRESENTE},
-                )
-                if created:
-                    creados += 1
-                    asistencia_ids_creadas.append(asistencia.pk)
+                    if created:
+                        creados += 1
+                        asistencia_ids_creadas.append(asistencia.pk)
             estado_anterior = sesion.estado
             if estudiantes_seleccionados and sesion.estado == SesionClase.Estado.PROGRAMADA:
                 sesion.estado = (
@@ -1702,6 +1698,72 @@ def sesion_asistentes_buscar(request, pk):
     )
 
 
+CAMPOS_ROSTER_SESION = ("id", "nombre", "texto", "inactivo")
+
+
+def _roster_sesion(user, sesion, *, solo_matriculados):
+    """JSON compacto con los estudiantes que se pueden agregar a `sesion` y el ETag de ese contenido.
+
+    `texto` es el nombre sin tildes y en minúsculas (`texto_busqueda`); el email y el RUT no
+    salen al navegador, así que esas búsquedas siguen yendo a `sesion_asistentes_buscar`.
+    """
+    organizacion = sesion.disciplina.organizacion
+    rol_activo = PersonaRol.objects.filter(
+        persona_id=OuterRef("pk"),
+        organizacion=organizacion,
+        rol__codigo="ESTUDIANTE",
+        activo=True,
+    )
+    filas = (
+        _estudiantes_sesion_para_usuario(user, sesion, solo_matriculados=solo_matriculados)
+        .exclude(pk__in=Asistencia.objects.filter(sesion=sesion).values("persona_id"))
+        .annotate(rol_activo=Exists(rol_activo))
+        .values_list("pk", "nombres", "apellidos", "activo", "rol_activo")
+    )
+    contenido = json.dumps(
+        {
+            "ok": True,
+            "campos": CAMPOS_ROSTER_SESION,
+            "estudiantes": [
+                [pk, f"{nombres} {apellidos}".strip(), texto_busqueda(nombres, apellidos), int(not (activo and rol))]
+                for pk, nombres, apellidos, activo, rol in filas
+            ],
+        },
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode()
+    return {"etag": f'"{hashlib.sha256(contenido).hexdigest()[:32]}"', "contenido": contenido}
+
+
+@require_GET
+def sesion_asistentes_roster(request, pk):
+    """Estudiantes que se pueden agregar a la sesión, una vez, para filtrar en el navegador.
+
+    El roster se guarda en la caché de selectores por sesión y alcance del usuario, y se
+    reconstruye cuando cambian los datos de la organización (matrículas, roles, asistencias).
+    Con un `If-None-Match` que coincide responde 304 sin cuerpo.
+    """
+    sesion, error = _verificar_acceso_sesion_json(request, pk)
+    if error:
+        return error
+
+    solo_matriculados = _solo_estudiantes_matriculados(request.user, sesion)
+    roster = resultado_cacheado(
+        "asistencias.roster_sesion",
+        organizacion=sesion.disciplina.organizacion_id,
+        parametros={"sesion": sesion.pk, "solo_matriculados": solo_matriculados},
+        calcular=lambda: _roster_sesion(request.user, sesion, solo_matriculados=solo_matriculados),
+    )
+    solicitados = {etag.removeprefix("W/") for etag in parse_etags(request.headers.get("If-None-Match", ""))}
+    if roster["etag"] in solicitados or "*" in solicitados:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(roster["contenido"], content_type="application/json")
+    response["ETag"] = roster["etag"]
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+
 @require_POST
 def sesion_asistente_agregar(request, pk):
     sesion, error = _verificar_acceso_sesion_json(request, pk)
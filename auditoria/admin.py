@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import AuditLog
+from .models import AuditLog, AuditLogArchivado
 
 
 @admin.register(AuditLog)
@@ -48,3 +48,11 @@ class AuditLogAdmin(admin.ModelAdmin):
 
     def has_view_permission(self, request, obj=None):
         return bool(request.user and request.user.is_staff)
+
+
+@admin.register(AuditLogArchivado)
+class AuditLogArchivadoAdmin(AuditLogAdmin):
+    """Misma revisión de solo lectura sobre los meses retirados por `archivar_auditoria`."""
+
+    list_display = (*AuditLogAdmin.list_display, "archivado_en")
+    readonly_fields = (*AuditLogAdmin.readonly_fields, "archivado_en")
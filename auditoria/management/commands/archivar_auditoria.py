@@ -0,0 +1,64 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from auditoria.particiones import DESTINOS, archivar_particiones, asegurar_particiones, tabla_particionada
+
+
+class Command(BaseCommand):
+    help = (
+        "Crea las particiones mensuales próximas de la auditoría y retira a archivo las "
+        "anteriores al periodo de retención. Sin --aplicar solo muestra qué movería."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--meses",
+            type=int,
+            default=settings.AUDITORIA_RETENCION_MESES,
+            help="Meses que quedan en la tabla viva, contando el actual (por defecto: AUDITORIA_RETENCION_MESES).",
+        )
+        parser.add_argument(
+            "--destino",
+            choices=DESTINOS,
+            default="tabla",
+            help="tabla: AuditLogArchivado, visible en el admin; jsonl: archivo .jsonl.gz por partición.",
+        )
+        parser.add_argument(
+            "--directorio",
+            help="Carpeta de los .jsonl.gz (por defecto: AUDITORIA_ARCHIVO_DIR).",
+        )
+        parser.add_argument(
+            "--aplicar",
+            action="store_true",
+            help="Crea particiones y mueve los datos. Sin esta opción solo muestra el estado.",
+        )
+
+    def handle(self, *args, **options):
+        if options["meses"] < 1:
+            raise CommandError("--meses debe ser al menos 1.")
+        if not tabla_particionada():
+            raise CommandError("La tabla de auditoría no está particionada; se requiere PostgreSQL.")
+
+        if options["aplicar"]:
+            creadas = asegurar_particiones()
+            self.stdout.write(f"Particiones creadas: {len(creadas)}")
+            for mes in creadas:
+                self.stdout.write(f"  - {mes:%Y-%m}")
+        resultado = archivar_particiones(
+            meses=options["meses"],
+            destino=options["destino"],
+            directorio=options["directorio"],
+            aplicar=options["aplicar"],
+        )
+
+        modo = "APLICADO" if resultado["aplicado"] else "PREVIEW"
+        self.stdout.write(
+            f"{modo}: auditoría anterior a {resultado['corte']:%Y-%m} hacia {resultado['destino']}"
+        )
+        for particion in resultado["particiones"]:
+            self.stdout.write("  - {nombre}: {filas} registros".format(**particion))
+        if not resultado["aplicado"]:
+            self.stdout.write(self.style.WARNING("No se modificaron datos; use --aplicar para archivar."))
+            return
+        total = sum(particion["filas"] for particion in resultado["particiones"])
+        self.stdout.write(self.style.SUCCESS(f"Auditoría archivada: {total} registros."))
@@ -0,0 +1,166 @@
+from datetime import UTC, datetime
+
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+TABLA = "auditoria_auditlog"
+SECUENCIA = f"{TABLA}_id_seq"
+MESES_ADELANTE = 3
+
+
+def _sumar_meses(fecha, meses):
+    indice = fecha.year * 12 + fecha.month - 1 + meses
+    return fecha.replace(year=indice // 12, month=indice % 12 + 1, day=1)
+
+
+def _limite(fecha):
+    return datetime(fecha.year, fecha.month, 1, tzinfo=UTC).isoformat()
+
+
+def _restricciones(schema_editor, modelo, cursor):
+    """FK e índices de `AuditLog` sobre la tabla recién creada.
+
+    `LIKE ... INCLUDING DEFAULTS` no copia índices: los de las FK se recrean aquí y, en la
+    tabla particionada, PostgreSQL los propaga a cada partición, también a las que se adjunten.
+    """
+    qn = schema_editor.quote_name
+    for campo in ("usuario", "organizacion"):
+        field = modelo._meta.get_field(campo)
+        destino = field.related_model._meta
+        cursor.execute(
+            f"ALTER TABLE {qn(TABLA)} ADD CONSTRAINT {qn(f'{TABLA}_{field.column}_fk')} "
+            f"FOREIGN KEY ({qn(field.column)}) REFERENCES {qn(destino.db_table)} ({qn(destino.pk.column)}) "
+            "DEFERRABLE INITIALLY DEFERRED"
+        )
+        schema_editor.execute(schema_editor._create_index_sql(modelo, fields=[field]))
+    for indice in modelo._meta.indexes:
+        schema_editor.add_index(modelo, indice)
+
+
+def particionar_auditoria(apps, schema_editor):
+    """Convierte la tabla de auditoría en una tabla particionada por mes de `fecha` (UTC).
+
+    PostgreSQL exige que la clave primaria incluya la columna de partición, así que la
+    PK pasa a `(id, fecha)`; `id` sigue siendo único porque sale de una sola secuencia.
+    Se crean particiones desde el mes del registro más antiguo hasta tres meses adelante
+    y una partición por defecto para lo que quede fuera de rango.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != "postgresql":
+        return
+    AuditLog = apps.get_model("auditoria", "AuditLog")
+    qn = schema_editor.quote_name
+    nueva = f"{TABLA}_particionada"
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT min(fecha) FROM {qn(TABLA)}")
+        minimo = cursor.fetchone()[0]
+        hoy = timezone.now().astimezone(UTC).date()
+        mes = (minimo.astimezone(UTC).date() if minimo else hoy).replace(day=1)
+        ultimo = _sumar_meses(hoy, MESES_ADELANTE)
+
+        cursor.execute(
+            f"CREATE TABLE {qn(nueva)} (LIKE {qn(TABLA)} INCLUDING DEFAULTS) PARTITION BY RANGE (fecha)"
+        )
+        # `id` pasa a una secuencia propia de la tabla nueva; la de la tabla vieja se borra con ella.
+        cursor.execute(f"ALTER TABLE {qn(nueva)} ALTER COLUMN id DROP DEFAULT")
+        cursor.execute(f"ALTER TABLE {qn(nueva)} ADD CONSTRAINT {qn(f'{nueva}_pkey')} PRIMARY KEY (id, fecha)")
+        while mes <= ultimo:
+            siguiente = _sumar_meses(mes, 1)
+            cursor.execute(
+                f"CREATE TABLE {qn(f'{TABLA}_p{mes:%Y_%m}')} PARTITION OF {qn(nueva)} "
+                f"FOR VALUES FROM ('{_limite(mes)}') TO ('{_limite(siguiente)}')"
+            )
+            mes = siguiente
+        cursor.execute(f"CREATE TABLE {qn(f'{TABLA}_pdefault')} PARTITION OF {qn(nueva)} DEFAULT")
+        cursor.execute(f"INSERT INTO {qn(nueva)} SELECT * FROM {qn(TABLA)}")
+        cursor.execute(f"DROP TABLE {qn(TABLA)}")
+        cursor.execute(f"ALTER TABLE {qn(nueva)} RENAME TO {qn(TABLA)}")
+        cursor.execute(f"ALTER TABLE {qn(TABLA)} RENAME CONSTRAINT {qn(f'{nueva}_pkey')} TO {qn(f'{TABLA}_pkey')}")
+
+        cursor.execute(f"CREATE SEQUENCE {qn(SECUENCIA)} OWNED BY {qn(TABLA)}.id")
+        cursor.execute(f"SELECT setval('{SECUENCIA}', COALESCE(max(id), 0) + 1, false) FROM {qn(TABLA)}")
+        cursor.execute(f"ALTER TABLE {qn(TABLA)} ALTER COLUMN id SET DEFAULT nextval('{SECUENCIA}')")
+        _restricciones(schema_editor, AuditLog, cursor)
+
+        # El archivo se lee poco y guarda metadata voluminosa: lz4 comprime más rápido que pglz si existe.
+        cursor.execute("SELECT 'lz4' = ANY(enumvals) FROM pg_settings WHERE name = 'default_toast_compression'")
+        fila = cursor.fetchone()
+        if fila and fila[0]:
+            for columna in ("metadata", "resumen"):
+                cursor.execute(f"ALTER TABLE auditoria_auditlogarchivado ALTER COLUMN {columna} SET COMPRESSION lz4")
+
+
+def desparticionar_auditoria(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != "postgresql":
+        return
+    AuditLog = apps.get_model("auditoria", "AuditLog")
+    qn = schema_editor.quote_name
+    nueva = f"{TABLA}_simple"
+    with connection.cursor() as cursor:
+        cursor.execute(f"CREATE TABLE {qn(nueva)} (LIKE {qn(TABLA)} INCLUDING DEFAULTS)")
+        cursor.execute(f"INSERT INTO {qn(nueva)} SELECT * FROM {qn(TABLA)}")
+        cursor.execute(f"ALTER SEQUENCE {qn(SECUENCIA)} OWNED BY NONE")
+        cursor.execute(f"DROP TABLE {qn(TABLA)}")
+        cursor.execute(f"ALTER TABLE {qn(nueva)} RENAME TO {qn(TABLA)}")
+        cursor.execute(f"ALTER SEQUENCE {qn(SECUENCIA)} OWNED BY {qn(TABLA)}.id")
+        cursor.execute(f"ALTER TABLE {qn(TABLA)} ADD CONSTRAINT {qn(f'{TABLA}_pkey')} PRIMARY KEY (id)")
+        _restricciones(schema_editor, AuditLog, cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auditoria', '0001_initial'),
+        ('personas', '0009_solicitudacceso_resolucion_organizacion_rol'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditLogArchivado',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('fecha', models.DateTimeField()),
+                ('accion', models.CharField(max_length=50)),
+                ('dominio', models.CharField(max_length=50)),
+                ('modelo', models.CharField(max_length=100)),
+                ('objeto_id', models.CharField(max_length=100)),
+                ('resumen', models.TextField()),
+                ('metadata', models.JSONField(blank=True, default=dict)),
+                ('archivado_en', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'registro de auditoria archivado',
+                'verbose_name_plural': 'registros de auditoria archivados',
+                'ordering': ['-fecha'],
+            },
+        ),
+        migrations.AddField(
+            model_name='auditlogarchivado',
+            name='organizacion',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='personas.organizacion'),
+        ),
+        migrations.AddField(
+            model_name='auditlogarchivado',
+            name='usuario',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='auditlogarchivado',
+            index=models.Index(fields=['dominio', 'modelo', 'objeto_id'], name='auditoria_archivo_objeto_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditlogarchivado',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['fecha'], name='auditoria_archivo_fecha_brin'),
+        ),
+        migrations.RunPython(particionar_auditoria, desparticionar_auditoria),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['fecha'], name='auditoria_auditlog_fecha_brin'),
+        ),
+    ]
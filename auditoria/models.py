@@ -1,4 +1,5 @@
 from django.conf import settings
+from django.contrib.postgres.indexes import BrinIndex
 from django.db import models
 
 
@@ -39,9 +40,56 @@ class AuditLog(models.Model):
             models.Index(fields=["dominio", "modelo", "objeto_id"]),
             models.Index(fields=["organizacion", "fecha"]),
             models.Index(fields=["usuario", "fecha"]),
+            BrinIndex(fields=["fecha"], name="auditoria_auditlog_fecha_brin"),
         ]
         verbose_name = "registro de auditoria"
         verbose_name_plural = "registros de auditoria"
 
     def __str__(self):
         return f"{self.fecha:%Y-%m-%d %H:%M} {self.dominio}.{self.accion} {self.modelo}:{self.objeto_id}"
+
+
+class AuditLogArchivado(models.Model):
+    """Registro de auditoría retirado de las particiones vivas por `archivar_auditoria`.
+
+    Conserva el id y los datos originales. Usuario y organización no tienen FK en la
+    base: el archivo sobrevive a borrados posteriores.
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    usuario = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        null=True,
+        blank=True,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name="+",
+    )
+    fecha = models.DateTimeField()
+    accion = models.CharField(max_length=50)
+    dominio = models.CharField(max_length=50)
+    modelo = models.CharField(max_length=100)
+    objeto_id = models.CharField(max_length=100)
+    organizacion = models.ForeignKey(
+        "personas.Organizacion",
+        null=True,
+        blank=True,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name="+",
+    )
+    resumen = models.TextField()
+    metadata = models.JSONField(default=dict, blank=True)
+    archivado_en = models.DateTimeField()
+
+    class Meta:
+        ordering = ["-fecha"]
+        indexes = [
+            models.Index(fields=["dominio", "modelo", "objeto_id"], name="auditoria_archivo_objeto_idx"),
+            BrinIndex(fields=["fecha"], name="auditoria_archivo_fecha_brin"),
+        ]
+        verbose_name = "registro de auditoria archivado"
+        verbose_name_plural = "registros de auditoria archivados"
+
+    def __str__(self):
+        return f"{self.fecha:%Y-%m-%d %H:%M} {self.dominio}.{self.accion} {self.modelo}:{self.objeto_id}"
@@ -0,0 +1,257 @@
+"""Particiones mensuales de `AuditLog` y retención hacia el archivo.
+
+En PostgreSQL la tabla de auditoría está particionada por mes de `fecha` (límites en
+UTC), con una partición `..._pdefault` para lo que no tenga mes creado. Retirar un mes
+antiguo es desacoplar y borrar su partición: no deja filas muertas ni índices inflados
+en la tabla viva. Los registros retirados pasan a `AuditLogArchivado`, que el admin
+sigue mostrando, o a un archivo JSON-lines comprimido en disco.
+"""
+
+import gzip
+import json
+import os
+import re
+from datetime import UTC, datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import AuditLog, AuditLogArchivado
+
+
+TABLA = AuditLog._meta.db_table
+TABLA_ARCHIVO = AuditLogArchivado._meta.db_table
+PARTICION_DEFECTO = f"{TABLA}_pdefault"
+COLUMNAS = (
+    "id",
+    "fecha",
+    "accion",
+    "dominio",
+    "modelo",
+    "objeto_id",
+    "resumen",
+    "metadata",
+    "organizacion_id",
+    "usuario_id",
+)
+DESTINOS = ("tabla", "jsonl")
+
+_PATRON_PARTICION = re.compile(rf"^{TABLA}_p(\d{{4}})_(\d{{2}})$")
+_FILAS_POR_LECTURA = 2000
+
+
+def sumar_meses(fecha, meses):
+    indice = fecha.year * 12 + fecha.month - 1 + meses
+    return fecha.replace(year=indice // 12, month=indice % 12 + 1, day=1)
+
+
+def nombre_particion(mes):
+    return f"{TABLA}_p{mes:%Y_%m}"
+
+
+def _limite(mes):
+    return datetime(mes.year, mes.month, 1, tzinfo=UTC)
+
+
+def _qn(nombre):
+    return connection.ops.quote_name(nombre)
+
+
+def tabla_particionada():
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)",
+            [TABLA],
+        )
+        return cursor.fetchone() is not None
+
+
+def particiones_mensuales():
+    """`{mes: nombre}` de las particiones mensuales vivas, con `mes` como primer día en UTC."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT hija.relname
+              FROM pg_inherits
+              JOIN pg_class hija ON hija.oid = pg_inherits.inhrelid
+             WHERE pg_inherits.inhparent = to_regclass(%s)
+            """,
+            [TABLA],
+        )
+        nombres = [fila[0] for fila in cursor.fetchall()]
+    particiones = {}
+    for nombre in nombres:
+        coincidencia = _PATRON_PARTICION.match(nombre)
+        if coincidencia:
+            anio, mes = map(int, coincidencia.groups())
+            particiones[datetime(anio, mes, 1).date()] = nombre
+    return dict(sorted(particiones.items()))
+
+
+def _contar(cursor, tabla, condicion="", parametros=()):
+    cursor.execute(f"SELECT count(*) FROM {_qn(tabla)} {condicion}", parametros)
+    return cursor.fetchone()[0]
+
+
+def _crear_particion(cursor, mes):
+    """Crea la partición de `mes` moviendo antes las filas que hayan caído en la partición por defecto.
+
+    PostgreSQL rechaza adjuntar un rango que la partición por defecto ya contiene. `LIKE` no
+    copia índices: `ATTACH PARTITION` crea en la partición los de la tabla padre.
+    """
+    nombre = nombre_particion(mes)
+    desde, hasta = _limite(mes), _limite(sumar_meses(mes, 1))
+    cursor.execute(f"CREATE TABLE {_qn(nombre)} (LIKE {_qn(TABLA)} INCLUDING DEFAULTS)")
+    cursor.execute(
+        f"""
+        WITH movidas AS (
+            DELETE FROM {_qn(PARTICION_DEFECTO)} WHERE fecha >= %s AND fecha < %s RETURNING *
+        )
+        INSERT INTO {_qn(nombre)} SELECT * FROM movidas
+        """,
+        [desde, hasta],
+    )
+    cursor.execute(
+        f"ALTER TABLE {_qn(TABLA)} ATTACH PARTITION {_qn(nombre)} FOR VALUES FROM (%s) TO (%s)",
+        [desde, hasta],
+    )
+
+
+def asegurar_particiones(*, desde=None, hasta=None, meses_adelante=3):
+    """Crea las particiones mensuales que falten entre `desde` y `hasta` (por defecto, mes actual + 3).
+
+    Devuelve los meses creados. Sin particionado (otro motor o migración revertida) no hace nada.
+    """
+    if not tabla_particionada():
+        return []
+    hoy = timezone.now().astimezone(UTC).date().replace(day=1)
+    mes = (desde or hoy).replace(day=1)
+    hasta = (hasta or sumar_meses(hoy, meses_adelante)).replace(day=1)
+    existentes = particiones_mensuales()
+    creadas = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        while mes <= hasta:
+            if mes not in existentes:
+                _crear_particion(cursor, mes)
+                creadas.append(mes)
+            mes = sumar_meses(mes, 1)
+    return creadas
+
+
+def _filas(cursor, tabla, condicion="", parametros=()):
+    columnas = ", ".join(_qn(columna) for columna in COLUMNAS)
+    cursor.execute(f"SELECT {columnas} FROM {_qn(tabla)} {condicion} ORDER BY fecha, id", parametros)
+    while bloque := cursor.fetchmany(_FILAS_POR_LECTURA):
+        for fila in bloque:
+            yield dict(zip(COLUMNAS, fila))
+
+
+def _escribir_jsonl(cursor, *, tabla, ruta, condicion="", parametros=()):
+    """Escribe las filas en `ruta` (gzip) a través de un temporal; devuelve la cantidad escrita."""
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    temporal = ruta.with_name(f".{ruta.name}.tmp")
+    total = 0
+    with gzip.open(temporal, "wt", encoding="utf-8") as archivo:
+        for fila in _filas(cursor, tabla, condicion, parametros):
+            fila["fecha"] = fila["fecha"].isoformat()
+            if isinstance(fila["metadata"], str):
+                fila["metadata"] = json.loads(fila["metadata"])
+            archivo.write(json.dumps(fila, ensure_ascii=False, separators=(",", ":")) + "\n")
+            total += 1
+    os.replace(temporal, ruta)
+    return total
+
+
+def _copiar_a_tabla(cursor, *, origen):
+    columnas = ", ".join(_qn(columna) for columna in COLUMNAS)
+    cursor.execute(
+        f"""
+        INSERT INTO {_qn(TABLA_ARCHIVO)} ({columnas}, archivado_en)
+        SELECT {columnas}, now() FROM {origen}
+        """
+    )
+    return cursor.rowcount
+
+
+def _archivar_particion(cursor, *, nombre, destino, directorio):
+    if destino == "tabla":
+        total = _copiar_a_tabla(cursor, origen=_qn(nombre))
+    else:
+        total = _escribir_jsonl(cursor, tabla=nombre, ruta=directorio / f"{nombre}.jsonl.gz")
+    # Las FK diferidas de inserciones de esta transacción impiden borrar la tabla: se verifican ahora.
+    connection.check_constraints()
+    cursor.execute(f"ALTER TABLE {_qn(TABLA)} DETACH PARTITION {_qn(nombre)}")
+    cursor.execute(f"DROP TABLE {_qn(nombre)}")
+    return total
+
+
+def _archivar_defecto(cursor, *, corte, destino, directorio):
+    """Retira de la partición por defecto las filas anteriores a `corte`."""
+    condicion = "WHERE fecha < %s"
+    if destino == "tabla":
+        columnas = ", ".join(_qn(columna) for columna in COLUMNAS)
+        cursor.execute(
+            f"""
+            WITH movidas AS (
+                DELETE FROM {_qn(PARTICION_DEFECTO)} {condicion} RETURNING {columnas}
+            )
+            INSERT INTO {_qn(TABLA_ARCHIVO)} ({columnas}, archivado_en)
+            SELECT {columnas}, now() FROM movidas
+            """,
+            [corte],
+        )
+        return cursor.rowcount
+    ruta = directorio / f"{PARTICION_DEFECTO}_antes_{corte:%Y_%m}.jsonl.gz"
+    total = _escribir_jsonl(cursor, tabla=PARTICION_DEFECTO, ruta=ruta, condicion=condicion, parametros=[corte])
+    cursor.execute(f"DELETE FROM {_qn(PARTICION_DEFECTO)} {condicion}", [corte])
+    return total
+
+
+def archivar_particiones(*, meses, destino="tabla", directorio=None, aplicar=False, hoy=None):
+    """Retira de la tabla viva los meses anteriores a los últimos `meses` (contando el actual).
+
+    Sin `aplicar` solo informa qué particiones y cuántas filas se moverían. Con `aplicar`
+    cada partición se copia a `AuditLogArchivado` (`destino="tabla"`) o a
+    `<directorio>/<partición>.jsonl.gz` (`destino="jsonl"`) y luego se desacopla y borra,
+    todo en una transacción por partición.
+    """
+    if destino not in DESTINOS:
+        raise ValueError(f"Destino de archivo desconocido: {destino}")
+    hoy = (hoy or timezone.now().astimezone(UTC).date()).replace(day=1)
+    corte_mes = sumar_meses(hoy, -(meses - 1))
+    corte = _limite(corte_mes)
+    directorio = Path(directorio or settings.AUDITORIA_ARCHIVO_DIR)
+
+    resultado = {"aplicado": aplicar, "corte": corte_mes, "destino": destino, "particiones": []}
+    with connection.cursor() as cursor:
+        vencidas = [(mes, nombre) for mes, nombre in particiones_mensuales().items() if mes < corte_mes]
+        for _, nombre in vencidas:
+            if aplicar:
+                with transaction.atomic():
+                    filas = _archivar_particion(cursor, nombre=nombre, destino=destino, directorio=directorio)
+            else:
+                filas = _contar(cursor, nombre)
+            resultado["particiones"].append({"nombre": nombre, "filas": filas})
+        if aplicar:
+            with transaction.atomic():
+                filas = _archivar_defecto(cursor, corte=corte, destino=destino, directorio=directorio)
+        else:
+            filas = _contar(cursor, PARTICION_DEFECTO, "WHERE fecha < %s", [corte])
+        if filas:
+            resultado["particiones"].append({"nombre": PARTICION_DEFECTO, "filas": filas})
+    return resultado
+
+
+__all__ = [
+    "DESTINOS",
+    "archivar_particiones",
+    "asegurar_particiones",
+    "nombre_particion",
+    "particiones_mensuales",
+    "sumar_meses",
+    "tabla_particionada",
+]
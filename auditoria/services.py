@@ -1,8 +1,10 @@
 import logging
+import threading
 from datetime import date, datetime
 from decimal import Decimal
 from uuid import UUID
 
+from django.conf import settings
 from django.db import models, transaction
 
 from .models import AuditLog
@@ -13,8 +15,10 @@ logger = logging.getLogger(__name__)
 CAMPO_SENSIBLE = object()
 CAMPOS_SENSIBLES_DEFAULT = {"rut", "email", "telefono"}
 
+_estado = threading.local()
 
-def registrar_auditoria(
+
+def _construir_log(
     *,
     usuario,
     accion,
@@ -26,27 +30,192 @@ def registrar_auditoria(
     organizacion=None,
     metadata=None,
 ):
-    usuario = usuario if getattr(usuario, "is_authenticated", False) else None
-    modelo_nombre = modelo or _modelo_nombre(objeto)
     objeto_id_valor = objeto_id if objeto_id is not None else getattr(objeto, "pk", "")
-    metadata_segura = _serializar_metadata(metadata or {})
+    return AuditLog(
+        usuario=usuario if getattr(usuario, "is_authenticated", False) else None,
+        accion=accion,
+        dominio=dominio,
+        modelo=modelo or _modelo_nombre(objeto),
+        objeto_id=str(objeto_id_valor or ""),
+        organizacion=organizacion,
+        resumen=resumen,
+        metadata=_serializar_metadata(metadata or {}),
+    )
+
+
+def _maximo_buffer():
+    return max(1, getattr(settings, "AUDITORIA_BUFFER_MAXIMO", 1000))
+
+
+def _escribir_logs(logs):
+    if not logs:
+        return
+    try:
+        AuditLog.objects.bulk_create(logs, batch_size=_maximo_buffer())
+    except Exception:
+        logger.warning("No se pudieron registrar %s auditorias", len(logs), exc_info=True)
+
+
+class _Marca:
+    """Auditorías de una llamada, registradas con `transaction.on_commit`.
+
+    Django solo la ejecuta si hace commit sin revertir ninguno de `savepoints`: que corra
+    confirma sus auditorías.
+    """
+
+    def __init__(self, buffer, logs, savepoints, orden):
+        self.buffer = buffer
+        self.logs = list(logs)
+        self.savepoints = savepoints
+        self.orden = orden
+        self.confirmada = False
+        self.escrita = False
+
+    def __call__(self):
+        self.buffer.confirmar(self)
+
+
+class _BufferAuditoria:
+    """Auditorías pendientes de la transacción en curso, escritas con un solo `bulk_create`.
+
+    Cada llamada guarda los savepoints abiertos (`connection.savepoint_ids`) junto a su
+    marca. Tras el commit las marcas corren en orden y cada una deja la escritura a una
+    posterior que con seguridad también correrá: una del nivel exterior, o la última si ya
+    corrió una marca de cada uno de sus savepoints. La que escribe descarta las marcas
+    anteriores que no corrieron, porque quedaron en un savepoint o una transacción revertidos.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.atomico = _bloque_exterior(connection)
+        self.marcas = []
+        self.orden = 0
+        self.ultima_exterior = None
+        self.confirmados = set()
+        self.por_nivel = {}
+        self.pendientes = {}
+
+    def agregar(self, logs):
+        savepoints = tuple(sid for sid in self.connection.savepoint_ids if sid is not None)
+        self.orden += 1
+        marca = _Marca(self, logs, savepoints, self.orden)
+        transaction.on_commit(marca, robust=False)
+        self.marcas.append(marca)
+        if not savepoints:
+            self.ultima_exterior = marca
+        self._pendiente(marca)
+        if self.pendientes[savepoints] >= _maximo_buffer():
+            self.desbordar(savepoints)
+
+    def _pendiente(self, marca):
+        self.por_nivel.setdefault(marca.savepoints, []).append(marca)
+        self.pendientes[marca.savepoints] = self.pendientes.get(marca.savepoints, 0) + len(marca.logs)
+
+    def confirmar(self, marca):
+        marca.confirmada = True
+        self.confirmados.update(marca.savepoints)
+        posterior = self.marcas[-1]
+        if posterior is not marca and (
+            (self.ultima_exterior is not None and self.ultima_exterior.orden > marca.orden)
+            or self.confirmados.issuperset(posterior.savepoints)
+        ):
+            return
+        self.vaciar(marca)
+
+    def vaciar(self, hasta):
+        """Escribe las marcas confirmadas hasta `hasta` y descarta las que no corrieron.
+
+        Las posteriores siguen en el buffer: tras un commit real correrán después. Solo
+        quedan sin correr cuando se ejecutan los callbacks de una parte de la transacción,
+        como hace `captureOnCommitCallbacks`.
+        """
+        logs = [
+            log
+            for marca in self.marcas
+            if marca.orden <= hasta.orden and marca.confirmada and not marca.escrita
+            for log in marca.logs
+        ]
+        self.marcas = [marca for marca in self.marcas if marca.orden > hasta.orden]
+        self.por_nivel = {}
+        self.pendientes = {}
+        for marca in self.marcas:
+            if not marca.escrita:
+                self._pendiente(marca)
+        if not self.marcas:
+            self.confirmados.clear()
+        _escribir_logs(logs)
 
-    def _crear_log():
+    def desbordar(self, savepoints):
+        """Escribe dentro de la transacción las auditorías del nivel en curso al superar el máximo.
+
+        Solo se escriben las registradas bajo los mismos savepoints que siguen abiertos, así
+        que las filas corren la misma suerte que sus marcas: si un savepoint las revierte,
+        sus marcas también se descartan. Un error solo revierte el savepoint de la escritura
+        y se registra como advertencia.
+        """
+        marcas = self.por_nivel.pop(savepoints)
+        del self.pendientes[savepoints]
+        logs = [log for marca in marcas for log in marca.logs]
         try:
-            AuditLog.objects.create(
+            with transaction.atomic():
+                AuditLog.objects.bulk_create(logs, batch_size=_maximo_buffer())
+        except Exception:
+            logger.warning("No se pudieron registrar %s auditorias desbordadas", len(logs), exc_info=True)
+        for marca in marcas:
+            marca.escrita = True
+
+
+def _bloque_exterior(connection):
+    return connection.atomic_blocks[0] if connection.atomic_blocks else None
+
+
+def _encolar_logs(logs):
+    """Acumula `logs` en el buffer de la transacción en curso; sin transacción los escribe al instante."""
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        _escribir_logs(logs)
+        return
+    buffer = getattr(_estado, "buffer", None)
+    if buffer is None or buffer.connection is not connection or buffer.atomico is not _bloque_exterior(connection):
+        buffer = _BufferAuditoria(connection)
+        _estado.buffer = buffer
+    buffer.agregar(logs)
+
+
+def registrar_auditoria(
+    *,
+    usuario,
+    accion,
+    dominio,
+    resumen,
+    objeto=None,
+    modelo=None,
+    objeto_id=None,
+    organizacion=None,
+    metadata=None,
+):
+    _encolar_logs(
+        [
+            _construir_log(
                 usuario=usuario,
                 accion=accion,
                 dominio=dominio,
-                modelo=modelo_nombre,
-                objeto_id=str(objeto_id_valor or ""),
-                organizacion=organizacion,
                 resumen=resumen,
-                metadata=metadata_segura,
+                objeto=objeto,
+                modelo=modelo,
+                objeto_id=objeto_id,
+                organizacion=organizacion,
+                metadata=metadata,
             )
-        except Exception:
-            logger.warning("No se pudo registrar auditoria %s.%s", dominio, accion, exc_info=True)
+        ]
+    )
+
 
-    transaction.on_commit(_crear_log)
+def registrar_auditorias(registros):
+    """Como `registrar_auditoria` para varios registros de una vez."""
+    logs = [_construir_log(**registro) for registro in registros]
+    if logs:
+        _encolar_logs(logs)
 
 
 def registrar_cambio(
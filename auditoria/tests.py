@@ -1,15 +1,32 @@
-from datetime import date, datetime
+import gzip
+import json
+from datetime import UTC, date, datetime
 from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
 from uuid import uuid4
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from personas.models import Organizacion, Persona
 
-from .models import AuditLog
-from .services import registrar_auditoria, registrar_cambio
+from .models import AuditLog, AuditLogArchivado
+from .particiones import (
+    PARTICION_DEFECTO,
+    archivar_particiones,
+    asegurar_particiones,
+    nombre_particion,
+    particiones_mensuales,
+    tabla_particionada,
+)
+from .services import registrar_auditoria, registrar_auditorias, registrar_cambio
 
 
 TEST_PASSWORD = "not-a-real-test-password"
@@ -114,6 +131,238 @@ class AuditoriaServiceTests(TestCase):
         self.assertNotIn("+56911111111", metadata_text)
 
 
+class BufferAuditoriaTests(TestCase):
+    def setUp(self):
+        self.org = Organizacion.objects.create(
+            nombre="Org Buffer Auditoria",
+            razon_social="Org Buffer Auditoria SPA",
+            rut="76.333.333-3",
+        )
+
+    def _registrar(self, resumen):
+        registrar_auditoria(
+            usuario=None,
+            accion=AuditLog.ACCION_CREAR,
+            dominio="personas",
+            modelo="personas.Persona",
+            objeto_id=resumen,
+            organizacion=self.org,
+            resumen=resumen,
+        )
+
+    def _insertados(self, consultas):
+        return [
+            query
+            for query in consultas.captured_queries
+            if query["sql"].startswith('INSERT INTO "auditoria_auditlog"')
+        ]
+
+    def test_auditorias_de_la_transaccion_se_escriben_con_un_insert(self):
+        with CaptureQueriesContext(connection) as consultas, self.captureOnCommitCallbacks(execute=True):
+            for indice in range(5):
+                with transaction.atomic():
+                    self._registrar(f"evento {indice}")
+            registrar_auditorias(
+                [
+                    {
+                        "usuario": None,
+                        "accion": AuditLog.ACCION_EDITAR,
+                        "dominio": "personas",
+                        "resumen": "evento en lote",
+                        "organizacion": self.org,
+                    }
+                ]
+            )
+            self.assertFalse(AuditLog.objects.exists())
+
+        self.assertEqual(AuditLog.objects.count(), 6)
+        self.assertEqual(len(self._insertados(consultas)), 1)
+
+    def test_savepoint_revertido_descarta_solo_sus_auditorias(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self._registrar("exterior")
+            try:
+                with transaction.atomic():
+                    self._registrar("revertido")
+                    raise ValueError("fallo de fila")
+            except ValueError:
+                pass
+            self._registrar("posterior")
+
+        self.assertEqual(
+            sorted(AuditLog.objects.values_list("resumen", flat=True)),
+            ["exterior", "posterior"],
+        )
+
+    @override_settings(AUDITORIA_BUFFER_MAXIMO=3)
+    def test_buffer_desbordado_se_escribe_dentro_de_la_transaccion(self):
+        with CaptureQueriesContext(connection) as consultas, self.captureOnCommitCallbacks(execute=True):
+            for indice in range(7):
+                self._registrar(f"evento {indice}")
+            self.assertEqual(AuditLog.objects.count(), 6)
+
+        self.assertEqual(AuditLog.objects.count(), 7)
+        self.assertEqual(len(self._insertados(consultas)), 3)
+
+    @override_settings(AUDITORIA_BUFFER_MAXIMO=3)
+    def test_desborde_revertido_por_savepoint_conserva_auditorias_exteriores(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self._registrar("exterior 0")
+            self._registrar("exterior 1")
+            try:
+                with transaction.atomic():
+                    for indice in range(3):
+                        self._registrar(f"revertido {indice}")
+                    self.assertEqual(AuditLog.objects.count(), 3)
+                    raise ValueError("fallo de fila")
+            except ValueError:
+                pass
+            self.assertFalse(AuditLog.objects.exists())
+
+        self.assertEqual(
+            sorted(AuditLog.objects.values_list("resumen", flat=True)),
+            ["exterior 0", "exterior 1"],
+        )
+
+    def test_error_al_escribir_registra_advertencia_sin_propagar(self):
+        with patch.object(AuditLog.objects, "bulk_create", side_effect=RuntimeError("base caída")):
+            with self.assertLogs("auditoria.services", level="WARNING") as registros:
+                with self.captureOnCommitCallbacks(execute=True):
+                    self._registrar("evento")
+
+        self.assertIn("No se pudieron registrar 1 auditorias", registros.output[0])
+        self.assertFalse(AuditLog.objects.exists())
+
+
+class BufferAuditoriaTransaccionesTests(TransactionTestCase):
+    def _registrar(self, resumen):
+        registrar_auditoria(
+            usuario=None,
+            accion=AuditLog.ACCION_CREAR,
+            dominio="personas",
+            modelo="personas.Persona",
+            objeto_id=resumen,
+            resumen=resumen,
+        )
+
+    def test_auditorias_de_una_transaccion_revertida_no_pasan_a_la_siguiente(self):
+        @transaction.atomic
+        def operacion(resumen, fallar=False):
+            self._registrar(resumen)
+            with transaction.atomic():
+                self._registrar(f"{resumen} anidado")
+            if fallar:
+                raise ValueError("fallo")
+
+        with self.assertRaises(ValueError):
+            operacion("revertida", fallar=True)
+        operacion("confirmada")
+
+        self.assertEqual(
+            sorted(AuditLog.objects.values_list("resumen", flat=True)),
+            ["confirmada", "confirmada anidado"],
+        )
+
+
+class ParticionesAuditoriaTests(TestCase):
+    def setUp(self):
+        if connection.vendor != "postgresql":
+            self.skipTest("El particionado de auditoría requiere PostgreSQL.")
+        self.org = Organizacion.objects.create(
+            nombre="Org Particiones",
+            razon_social="Org Particiones SPA",
+            rut="76.444.444-4",
+        )
+
+    def _log(self, fecha, resumen="evento"):
+        log = AuditLog.objects.create(
+            accion=AuditLog.ACCION_CREAR,
+            dominio="finanzas",
+            modelo="finanzas.LotePago",
+            objeto_id="1",
+            organizacion=self.org,
+            resumen=resumen,
+            metadata={"pago_ids": [1, 2, 3]},
+        )
+        AuditLog.objects.filter(pk=log.pk).update(fecha=fecha)
+        return log
+
+    def _filas(self, tabla):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT count(*) FROM {connection.ops.quote_name(tabla)}")
+            return cursor.fetchone()[0]
+
+    def test_registro_nuevo_cae_en_la_particion_del_mes(self):
+        self.assertTrue(tabla_particionada())
+        mes_actual = datetime.now(UTC).date().replace(day=1)
+        self.assertIn(mes_actual, particiones_mensuales())
+
+        AuditLog.objects.create(accion="crear", dominio="personas", modelo="x", objeto_id="1", resumen="hoy")
+
+        self.assertEqual(self._filas(nombre_particion(mes_actual)), 1)
+        self.assertEqual(self._filas(PARTICION_DEFECTO), 0)
+
+    def test_asegurar_particion_mueve_filas_de_la_particion_por_defecto(self):
+        self._log(datetime(2020, 3, 15, tzinfo=UTC))
+        self.assertEqual(self._filas(PARTICION_DEFECTO), 1)
+
+        creadas = asegurar_particiones(desde=date(2020, 3, 1), hasta=date(2020, 3, 1))
+
+        self.assertEqual(creadas, [date(2020, 3, 1)])
+        self.assertEqual(self._filas(PARTICION_DEFECTO), 0)
+        self.assertEqual(self._filas(nombre_particion(date(2020, 3, 1))), 1)
+        self.assertEqual(AuditLog.objects.count(), 1)
+
+    def test_indices_de_fk_existen_en_la_tabla_y_en_particiones_nuevas(self):
+        asegurar_particiones(desde=date(2020, 3, 1), hasta=date(2020, 3, 1))
+
+        for tabla in (AuditLog._meta.db_table, nombre_particion(date(2020, 3, 1))):
+            with connection.cursor() as cursor:
+                restricciones = connection.introspection.get_constraints(cursor, tabla)
+            indexadas = [datos["columns"] for datos in restricciones.values() if datos["index"]]
+            self.assertIn(["usuario_id"], indexadas, tabla)
+            self.assertIn(["organizacion_id"], indexadas, tabla)
+
+    def test_comando_archiva_meses_vencidos_en_la_tabla_de_archivo(self):
+        asegurar_particiones(desde=date(2020, 3, 1), hasta=date(2020, 3, 1))
+        marzo = self._log(datetime(2020, 3, 15, tzinfo=UTC), "marzo")
+        mayo = self._log(datetime(2020, 5, 2, tzinfo=UTC), "mayo")
+        vigente = self._log(datetime.now(UTC), "vigente")
+
+        salida = StringIO()
+        call_command("archivar_auditoria", "--meses", "12", stdout=salida)
+        self.assertIn("PREVIEW", salida.getvalue())
+        self.assertIn(f"{nombre_particion(date(2020, 3, 1))}: 1 registros", salida.getvalue())
+        self.assertEqual(AuditLog.objects.count(), 3)
+        self.assertFalse(AuditLogArchivado.objects.exists())
+
+        call_command("archivar_auditoria", "--meses", "12", "--aplicar", stdout=StringIO())
+
+        self.assertEqual(list(AuditLog.objects.values_list("pk", flat=True)), [vigente.pk])
+        archivados = {log.pk: log for log in AuditLogArchivado.objects.all()}
+        self.assertEqual(set(archivados), {marzo.pk, mayo.pk})
+        self.assertEqual(archivados[marzo.pk].resumen, "marzo")
+        self.assertEqual(archivados[marzo.pk].metadata, {"pago_ids": [1, 2, 3]})
+        self.assertEqual(archivados[mayo.pk].organizacion_id, self.org.pk)
+        self.assertNotIn(date(2020, 3, 1), particiones_mensuales())
+
+    def test_archivo_jsonl_escribe_una_linea_por_registro(self):
+        asegurar_particiones(desde=date(2020, 3, 1), hasta=date(2020, 3, 1))
+        marzo = self._log(datetime(2020, 3, 15, tzinfo=UTC), "marzo")
+
+        with TemporaryDirectory() as directorio:
+            resultado = archivar_particiones(meses=12, destino="jsonl", directorio=directorio, aplicar=True)
+            ruta = Path(directorio) / f"{nombre_particion(date(2020, 3, 1))}.jsonl.gz"
+            with gzip.open(ruta, "rt", encoding="utf-8") as archivo:
+                filas = [json.loads(linea) for linea in archivo]
+
+        self.assertEqual(resultado["particiones"], [{"nombre": nombre_particion(date(2020, 3, 1)), "filas": 1}])
+        self.assertEqual(filas[0]["id"], marzo.pk)
+        self.assertEqual(filas[0]["metadata"], {"pago_ids": [1, 2, 3]})
+        self.assertFalse(AuditLog.objects.exists())
+        self.assertFalse(AuditLogArchivado.objects.exists())
+
+
 class AuditLogAdminTests(TestCase):
     def setUp(self):
         User = get_user_model()
@@ -153,3 +402,21 @@ class AuditLogAdminTests(TestCase):
         self.assertEqual(change_response.status_code, 200)
         self.assertEqual(delete_response.status_code, 403)
         self.assertNotContains(change_response, 'name="resumen"', html=False)
+
+    def test_auditlog_archivado_visible_en_admin_de_solo_lectura(self):
+        archivado = AuditLogArchivado.objects.create(
+            id=9001,
+            fecha=datetime(2020, 3, 15, tzinfo=UTC),
+            accion=AuditLog.ACCION_CREAR,
+            dominio="finanzas",
+            modelo="finanzas.LotePago",
+            objeto_id="1",
+            organizacion=self.org,
+            resumen="Lote archivado",
+            archivado_en=datetime(2026, 1, 1, tzinfo=UTC),
+        )
+        response = self.client.get(reverse("admin:auditoria_auditlogarchivado_changelist"))
+        self.assertContains(response, "Lote archivado")
+        detalle = self.client.get(reverse("admin:auditoria_auditlogarchivado_change", args=[archivado.pk]))
+        self.assertEqual(detalle.status_code, 200)
+        self.assertEqual(self.client.get(reverse("admin:auditoria_auditlogarchivado_add")).status_code, 403)
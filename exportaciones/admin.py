@@ -0,0 +1,29 @@
+from django.contrib import admin
+
+from .models import TrabajoExportacion
+
+
+@admin.register(TrabajoExportacion)
+class TrabajoExportacionAdmin(admin.ModelAdmin):
+    list_display = ("creado_en", "usuario", "tipo", "estado", "filas", "tamano", "expira_en")
+    list_filter = ("estado", "tipo")
+    search_fields = ("usuario__username", "tipo", "nombre_archivo")
+    date_hierarchy = "creado_en"
+    readonly_fields = (
+        "usuario",
+        "tipo",
+        "parametros",
+        "estado",
+        "nombre_archivo",
+        "archivo",
+        "filas",
+        "tamano",
+        "error",
+        "creado_en",
+        "iniciado_en",
+        "terminado_en",
+        "expira_en",
+    )
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
+
+
+class ExportacionesConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "exportaciones"
+    verbose_name = "Exportaciones"
+
+    def ready(self):
+        # Each app declares its exportable files in its own `exportaciones.py` module.
+        autodiscover_modules("exportaciones")
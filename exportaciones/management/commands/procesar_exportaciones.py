@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from exportaciones.services import limpiar_exportaciones, procesar_pendientes
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera las exportaciones encoladas y borra los archivos vencidos. "
+        "Sin --una-vez queda atendiendo la cola cada --intervalo segundos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--una-vez", action="store_true", help="Procesa la cola actual y termina.")
+        parser.add_argument("--intervalo", type=float, default=5, help="Segundos de espera con la cola vacía.")
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            limpieza = limpiar_exportaciones()
+            if limpieza["vencidos"] or limpieza["interrumpidos"]:
+                self.stdout.write(
+                    f"Limpieza: {limpieza['vencidos']} vencidas, {limpieza['interrumpidos']} interrumpidas."
+                )
+            for trabajo in procesar_pendientes():
+                detalle = f"{trabajo.filas} filas" if not trabajo.error else trabajo.error
+                self.stdout.write(f"  - {trabajo.pk} {trabajo.tipo}: {trabajo.get_estado_display()} ({detalle})")
+            if options["una_vez"]:
+                return
+            time.sleep(options["intervalo"])
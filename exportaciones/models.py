@@ -0,0 +1,51 @@
+import uuid
+
+from django.conf import settings
+from django.db import models
+
+
+class TrabajoExportacion(models.Model):
+    """Exportación pedida por un usuario y generada fuera del request por `procesar_exportaciones`."""
+
+    class Estado(models.TextChoices):
+        PENDIENTE = "pendiente", "Pendiente"
+        EN_PROCESO = "en_proceso", "En proceso"
+        LISTO = "listo", "Listo"
+        ERROR = "error", "Error"
+        VENCIDO = "vencido", "Vencido"
+
+    # UUID: el identificador forma parte de la ruta del archivo y no debe ser adivinable.
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    usuario = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="trabajos_exportacion",
+    )
+    tipo = models.CharField(max_length=80)
+    parametros = models.JSONField(default=dict, blank=True)
+    estado = models.CharField(max_length=20, choices=Estado.choices, default=Estado.PENDIENTE)
+    nombre_archivo = models.CharField(max_length=255, blank=True)
+    archivo = models.CharField(max_length=500, blank=True, help_text="Ruta relativa a MEDIA_ROOT.")
+    filas = models.PositiveIntegerField(default=0)
+    tamano = models.PositiveBigIntegerField(default=0)
+    error = models.TextField(blank=True)
+    creado_en = models.DateTimeField(auto_now_add=True)
+    iniciado_en = models.DateTimeField(null=True, blank=True)
+    terminado_en = models.DateTimeField(null=True, blank=True)
+    expira_en = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Trabajo de exportación"
+        verbose_name_plural = "Trabajos de exportación"
+        ordering = ["-creado_en"]
+        indexes = [
+            models.Index(fields=["estado", "creado_en"], name="exportacion_estado_idx"),
+            models.Index(fields=["usuario", "-creado_en"], name="exportacion_usuario_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.tipo} ({self.get_estado_display()})"
+
+    @property
+    def terminado(self):
+        return self.estado in {self.Estado.LISTO, self.Estado.ERROR, self.Estado.VENCIDO}
@@ -0,0 +1,34 @@
+"""Registro de exportaciones que pueden generarse en un trabajo de fondo.
+
+Cada app declara en su módulo `exportaciones.py` funciones `construir(request)` que
+devuelven una `plataformaelemental.exports.Exportacion`. La vista las usa en línea y el
+worker las vuelve a llamar con un request reconstruido desde los parámetros guardados.
+"""
+
+EXPORTACIONES = {}
+
+
+def registrar_exportacion(tipo, *, permiso):
+    """Registra `construir` bajo `tipo`.
+
+    `permiso` es el decorador de permiso de la vista original; el worker construye a
+    través de él para que un usuario que perdió el permiso o la organización no reciba
+    el archivo. La función devuelta no cambia: la vista ya verifica el permiso.
+    """
+
+    def decorador(construir):
+        EXPORTACIONES[tipo] = permiso(construir)
+        construir.tipo_exportacion = tipo
+        return construir
+
+    return decorador
+
+
+def obtener_exportacion(tipo):
+    try:
+        return EXPORTACIONES[tipo]
+    except KeyError:
+        raise ValueError(f"Exportación desconocida: {tipo}") from None
+
+
+__all__ = ["EXPORTACIONES", "obtener_exportacion", "registrar_exportacion"]
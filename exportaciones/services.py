@@ -0,0 +1,178 @@
+"""Cola de exportaciones en segundo plano.
+
+La vista guarda el tipo de exportación y los parámetros GET del request; el worker
+(`python manage.py procesar_exportaciones`) toma los trabajos pendientes, reconstruye el
+request con el mismo usuario y escribe el archivo por bloques bajo
+`MEDIA_ROOT/<EXPORTACIONES_DIR>/<id>/`. El archivo queda disponible hasta `expira_en`;
+después la limpieza lo borra y marca el trabajo como vencido.
+"""
+
+import logging
+import os
+import shutil
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.http import HttpRequest, QueryDict
+from django.utils import timezone
+
+from plataformaelemental.exports import escribir_exportacion, filas_por_bloque
+
+from .models import TrabajoExportacion
+from .registro import obtener_exportacion
+
+
+logger = logging.getLogger(__name__)
+
+PARAMETRO_SEGUNDO_PLANO = "segundo_plano"
+
+
+def _directorio_exportaciones():
+    return Path(settings.MEDIA_ROOT) / settings.EXPORTACIONES_DIR
+
+
+def ruta_archivo(trabajo):
+    return Path(settings.MEDIA_ROOT) / trabajo.archivo
+
+
+def encolar_exportacion(*, usuario, tipo, parametros):
+    """Crea un trabajo pendiente; `parametros` es `{clave: [valores]}` como `QueryDict.lists()`."""
+    obtener_exportacion(tipo)
+    parametros = {clave: list(valores) for clave, valores in parametros.items() if clave != PARAMETRO_SEGUNDO_PLANO}
+    return TrabajoExportacion.objects.create(usuario=usuario, tipo=tipo, parametros=parametros)
+
+
+def request_de_trabajo(trabajo):
+    """Request GET equivalente al que encoló el trabajo."""
+    request = HttpRequest()
+    request.method = "GET"
+    request.user = trabajo.usuario
+    query = QueryDict(mutable=True)
+    for clave, valores in trabajo.parametros.items():
+        query.setlist(clave, valores)
+    query._mutable = False
+    request.GET = query
+    return request
+
+
+def tomar_trabajo():
+    """Marca en proceso el trabajo pendiente más antiguo; varios workers no toman el mismo."""
+    with transaction.atomic():
+        trabajo = (
+            TrabajoExportacion.objects.select_for_update(skip_locked=True)
+            .select_related("usuario")
+            .filter(estado=TrabajoExportacion.Estado.PENDIENTE)
+            .order_by("creado_en")
+            .first()
+        )
+        if trabajo is None:
+            return None
+        trabajo.estado = TrabajoExportacion.Estado.EN_PROCESO
+        trabajo.iniciado_en = timezone.now()
+        trabajo.save(update_fields=["estado", "iniciado_en"])
+    return trabajo
+
+
+def _contar_filas(trabajo, filas):
+    """Deja pasar las filas y publica el avance en `trabajo.filas` cada bloque."""
+    tamano = filas_por_bloque()
+    total = 0
+    for fila in filas:
+        yield fila
+        total += 1
+        if total % tamano == 0:
+            TrabajoExportacion.objects.filter(pk=trabajo.pk).update(filas=total)
+    trabajo.filas = total
+
+
+def procesar_trabajo(trabajo):
+    """Genera el archivo de un trabajo en proceso y deja el trabajo listo o con error."""
+    directorio = _directorio_exportaciones() / str(trabajo.pk)
+    try:
+        exportacion = obtener_exportacion(trabajo.tipo)(request_de_trabajo(trabajo))
+        exportacion.rows = _contar_filas(trabajo, exportacion.rows)
+        directorio.mkdir(parents=True, exist_ok=True)
+        destino = directorio / Path(exportacion.filename).name
+        parcial = destino.with_name(f"{destino.name}.parcial")
+        escribir_exportacion(exportacion, parcial)
+        os.replace(parcial, destino)
+    except Exception as exc:
+        if isinstance(exc, PermissionDenied):
+            logger.warning("Exportacion %s rechazada: %s", trabajo.pk, exc)
+        else:
+            logger.exception("Fallo la exportacion %s (%s)", trabajo.pk, trabajo.tipo)
+        shutil.rmtree(directorio, ignore_errors=True)
+        trabajo.estado = TrabajoExportacion.Estado.ERROR
+        trabajo.error = str(exc)[:500] or exc.__class__.__name__
+        trabajo.terminado_en = timezone.now()
+        trabajo.save(update_fields=["estado", "error", "filas", "terminado_en"])
+        return trabajo
+
+    ahora = timezone.now()
+    trabajo.estado = TrabajoExportacion.Estado.LISTO
+    trabajo.nombre_archivo = destino.name
+    trabajo.archivo = destino.relative_to(settings.MEDIA_ROOT).as_posix()
+    trabajo.tamano = destino.stat().st_size
+    trabajo.terminado_en = ahora
+    trabajo.expira_en = ahora + timedelta(hours=settings.EXPORTACIONES_HORAS_VIGENCIA)
+    trabajo.save(
+        update_fields=["estado", "nombre_archivo", "archivo", "filas", "tamano", "terminado_en", "expira_en"]
+    )
+    return trabajo
+
+
+def procesar_pendientes(*, limite=None):
+    """Procesa trabajos pendientes hasta vaciar la cola o llegar a `limite`; devuelve los procesados."""
+    procesados = []
+    while limite is None or len(procesados) < limite:
+        trabajo = tomar_trabajo()
+        if trabajo is None:
+            break
+        procesados.append(procesar_trabajo(trabajo))
+    return procesados
+
+
+def limpiar_exportaciones(*, ahora=None):
+    """Borra los archivos vencidos y cierra los trabajos que quedaron en proceso por un worker caído.
+
+    Devuelve `{"vencidos": n, "interrumpidos": n}`.
+    """
+    ahora = ahora or timezone.now()
+    vencidos = 0
+    for trabajo in TrabajoExportacion.objects.filter(estado=TrabajoExportacion.Estado.LISTO, expira_en__lte=ahora):
+        shutil.rmtree(_directorio_exportaciones() / str(trabajo.pk), ignore_errors=True)
+        trabajo.estado = TrabajoExportacion.Estado.VENCIDO
+        trabajo.archivo = ""
+        trabajo.save(update_fields=["estado", "archivo"])
+        vencidos += 1
+
+    limite = ahora - timedelta(minutes=settings.EXPORTACIONES_MINUTOS_MAXIMOS)
+    interrumpidos = list(
+        TrabajoExportacion.objects.filter(
+            estado=TrabajoExportacion.Estado.EN_PROCESO,
+            iniciado_en__lt=limite,
+        ).values_list("pk", flat=True)
+    )
+    for pk in interrumpidos:
+        shutil.rmtree(_directorio_exportaciones() / str(pk), ignore_errors=True)
+    TrabajoExportacion.objects.filter(pk__in=interrumpidos, estado=TrabajoExportacion.Estado.EN_PROCESO).update(
+        estado=TrabajoExportacion.Estado.ERROR,
+        error="La exportación se interrumpió antes de terminar.",
+        terminado_en=ahora,
+    )
+    return {"vencidos": vencidos, "interrumpidos": len(interrumpidos)}
+
+
+__all__ = [
+    "PARAMETRO_SEGUNDO_PLANO",
+    "encolar_exportacion",
+    "limpiar_exportaciones",
+    "procesar_pendientes",
+    "procesar_trabajo",
+    "request_de_trabajo",
+    "ruta_archivo",
+    "tomar_trabajo",
+]
@@ -0,0 +1,168 @@
+import csv
+from datetime import timedelta
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from finanzas.models import Payment
+from personas.models import Organizacion, Persona, PersonaRol, Rol
+
+from .models import TrabajoExportacion
+from .services import limpiar_exportaciones, procesar_pendientes, ruta_archivo
+
+
+TEST_PASSWORD = "not-a-real-test-password"
+
+
+@override_settings(EXPORTACIONES_SEGUNDO_PLANO=True)
+class TrabajosExportacionTests(TestCase):
+    def setUp(self):
+        self.media = TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        self.enterContext(self.settings(MEDIA_ROOT=self.media.name))
+
+        User = get_user_model()
+        self.org = Organizacion.objects.create(nombre="Org Export", razon_social="Org Export SPA", rut="21.111.111-1")
+        rol_finanzas = Rol.objects.create(nombre="Finanzas", codigo="FINANZAS")
+        rol_estudiante = Rol.objects.create(nombre="Estudiante", codigo="ESTUDIANTE")
+        self.usuario = User.objects.create_user("export_fin", password=TEST_PASSWORD)
+        persona = Persona.objects.create(nombres="Export", apellidos="Fin", user=self.usuario)
+        self.rol = PersonaRol.objects.create(persona=persona, rol=rol_finanzas, organizacion=self.org, activo=True)
+        self.estudiante = Persona.objects.create(nombres="Ana", apellidos="Cola")
+        PersonaRol.objects.create(persona=self.estudiante, rol=rol_estudiante, organizacion=self.org, activo=True)
+        for anio in (2024, 2025, 2026):
+            Payment.objects.create(
+                persona=self.estudiante,
+                organizacion=self.org,
+                fecha_pago=f"{anio}-03-10",
+                metodo_pago=Payment.Metodo.EFECTIVO,
+                aplica_iva=False,
+                monto_referencia=1000 * (anio - 2020),
+                clases_asignadas=2,
+            )
+        self.client.force_login(self.usuario)
+
+    def _encolar_pagos(self, **extra):
+        return self.client.get(
+            reverse("finanzas:export_pagos_csv"),
+            {"periodo_mes": "todos", "periodo_anio": "todos", "organizacion": self.org.pk, **extra},
+        )
+
+    def _trabajo_listo(self):
+        self._encolar_pagos()
+        (trabajo,) = procesar_pendientes()
+        return trabajo
+
+    def test_periodo_de_todos_los_anios_se_encola_y_el_worker_escribe_el_mismo_csv(self):
+        response = self._encolar_pagos()
+
+        trabajo = TrabajoExportacion.objects.get()
+        self.assertRedirects(response, reverse("exportaciones:trabajo_detalle", args=[trabajo.pk]))
+        self.assertEqual(trabajo.estado, TrabajoExportacion.Estado.PENDIENTE)
+        self.assertEqual(trabajo.tipo, "finanzas.pagos_csv")
+        self.assertEqual(trabajo.parametros["periodo_anio"], ["todos"])
+
+        procesar_pendientes()
+        trabajo.refresh_from_db()
+        en_linea = self._encolar_pagos(segundo_plano="0").getvalue()
+
+        self.assertEqual(trabajo.estado, TrabajoExportacion.Estado.LISTO)
+        self.assertEqual(trabajo.filas, 3)
+        self.assertEqual(trabajo.nombre_archivo, "pagos_finanzas.csv")
+        self.assertGreater(trabajo.expira_en, timezone.now())
+        self.assertEqual(ruta_archivo(trabajo).read_bytes(), en_linea)
+        self.assertEqual(len(list(csv.reader(en_linea.decode().splitlines()))), 4)
+
+        estado = self.client.get(reverse("exportaciones:trabajo_estado", args=[trabajo.pk])).json()
+        self.assertEqual(estado["estado"], "listo")
+        self.assertEqual(estado["descarga"], reverse("exportaciones:trabajo_descargar", args=[trabajo.pk]))
+
+    def test_mes_concreto_se_exporta_en_linea(self):
+        response = self.client.get(
+            reverse("finanzas:export_pagos_csv"),
+            {"periodo_mes": 3, "periodo_anio": 2026, "organizacion": self.org.pk},
+        )
+
+        self.assertTrue(response.streaming)
+        self.assertFalse(TrabajoExportacion.objects.exists())
+
+    @override_settings(EXPORTACIONES_SEGUNDO_PLANO=False)
+    def test_sin_worker_habilitado_todo_se_exporta_en_linea(self):
+        response = self._encolar_pagos(segundo_plano="1")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(TrabajoExportacion.objects.exists())
+
+    def test_descarga_admite_rangos_para_reanudar(self):
+        trabajo = self._trabajo_listo()
+        url = reverse("exportaciones:trabajo_descargar", args=[trabajo.pk])
+        completo = ruta_archivo(trabajo).read_bytes()
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="pagos_finanzas.csv"')
+        self.assertEqual(response.getvalue(), completo)
+        etag = response["ETag"]
+
+        response = self.client.get(url, headers={"Range": "bytes=10-19", "If-Range": etag})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], f"bytes 10-19/{len(completo)}")
+        self.assertEqual(response["Content-Length"], "10")
+        self.assertEqual(response.getvalue(), completo[10:20])
+
+        response = self.client.get(url, headers={"Range": "bytes=-5"})
+        self.assertEqual(response.getvalue(), completo[-5:])
+
+        response = self.client.get(url, headers={"Range": "bytes=10-", "If-Range": '"otro"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.getvalue(), completo)
+
+        response = self.client.get(url, headers={"Range": f"bytes={len(completo)}-"})
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], f"bytes */{len(completo)}")
+
+    def test_solo_el_autor_ve_y_descarga_su_trabajo(self):
+        trabajo = self._trabajo_listo()
+        otro = get_user_model().objects.create_user("otro_export", password=TEST_PASSWORD)
+        self.client.force_login(otro)
+
+        for nombre in ("trabajo_detalle", "trabajo_estado", "trabajo_descargar"):
+            response = self.client.get(reverse(f"exportaciones:{nombre}", args=[trabajo.pk]))
+            self.assertEqual(response.status_code, 404)
+
+    def test_worker_vuelve_a_verificar_el_permiso(self):
+        self._encolar_pagos()
+        self.rol.activo = False
+        self.rol.save(update_fields=["activo"])
+
+        (trabajo,) = procesar_pendientes()
+
+        self.assertEqual(trabajo.estado, TrabajoExportacion.Estado.ERROR)
+        self.assertIn("organización", trabajo.error)
+        self.assertFalse((Path(self.media.name) / "exportaciones" / str(trabajo.pk)).exists())
+
+    def test_limpieza_borra_vencidos_y_cierra_interrumpidos(self):
+        trabajo = self._trabajo_listo()
+        ruta = ruta_archivo(trabajo)
+        colgado = TrabajoExportacion.objects.create(
+            usuario=self.usuario,
+            tipo="finanzas.pagos_csv",
+            estado=TrabajoExportacion.Estado.EN_PROCESO,
+            iniciado_en=timezone.now() - timedelta(hours=3),
+        )
+
+        resultado = limpiar_exportaciones(ahora=trabajo.expira_en + timedelta(seconds=1))
+
+        self.assertEqual(resultado, {"vencidos": 1, "interrumpidos": 1})
+        trabajo.refresh_from_db()
+        colgado.refresh_from_db()
+        self.assertEqual(trabajo.estado, TrabajoExportacion.Estado.VENCIDO)
+        self.assertFalse(ruta.exists())
+        self.assertEqual(colgado.estado, TrabajoExportacion.Estado.ERROR)
+        response = self.client.get(reverse("exportaciones:trabajo_descargar", args=[trabajo.pk]))
+        self.assertEqual(response.status_code, 404)
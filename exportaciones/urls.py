@@ -0,0 +1,13 @@
+from django.urls import path
+
+from . import views
+
+
+app_name = "exportaciones"
+
+urlpatterns = [
+    path("", views.trabajos_list, name="trabajos_list"),
+    path("<uuid:pk>/", views.trabajo_detalle, name="trabajo_detalle"),
+    path("<uuid:pk>/estado/", views.trabajo_estado, name="trabajo_estado"),
+    path("<uuid:pk>/descargar/", views.trabajo_descargar, name="trabajo_descargar"),
+]
@@ -0,0 +1,168 @@
+import re
+
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import reverse
+
+from plataformaelemental.context import resolver_periodo
+from plataformaelemental.exports import respuesta_exportacion
+
+from .models import TrabajoExportacion
+from .services import PARAMETRO_SEGUNDO_PLANO, encolar_exportacion, ruta_archivo
+
+
+_PATRON_RANGO = re.compile(r"^bytes=(\d*)-(\d*)$")
+_BLOQUE_DESCARGA = 64 * 1024
+
+
+def exportacion_en_segundo_plano(request):
+    """`segundo_plano=1|0` decide explícitamente; sin él, van a la cola los periodos de todos los años."""
+    if not settings.EXPORTACIONES_SEGUNDO_PLANO:
+        return False
+    valor = (request.GET.get(PARAMETRO_SEGUNDO_PLANO) or "").strip().lower()
+    if valor in {"1", "si", "true"}:
+        return True
+    if valor in {"0", "no", "false"}:
+        return False
+    periodo = resolver_periodo(request)
+    return periodo["anio"] is None and periodo["desde"] is None and periodo["hasta"] is None
+
+
+def responder_exportacion(request, construir):
+    """Entrega la exportación en línea o la encola y redirige al estado del trabajo."""
+    if not exportacion_en_segundo_plano(request):
+        return respuesta_exportacion(construir(request))
+    trabajo = encolar_exportacion(
+        usuario=request.user,
+        tipo=construir.tipo_exportacion,
+        parametros=dict(request.GET.lists()),
+    )
+    messages.info(request, "La exportación quedó en cola. Puedes descargarla desde esta página cuando esté lista.")
+    return redirect("exportaciones:trabajo_detalle", pk=trabajo.pk)
+
+
+def _trabajo_del_usuario(request, pk):
+    return get_object_or_404(TrabajoExportacion, pk=pk, usuario=request.user)
+
+
+def _estado_json(trabajo):
+    return {
+        "ok": True,
+        "id": str(trabajo.pk),
+        "tipo": trabajo.tipo,
+        "estado": trabajo.estado,
+        "terminado": trabajo.terminado,
+        "filas": trabajo.filas,
+        "tamano": trabajo.tamano,
+        "nombre_archivo": trabajo.nombre_archivo,
+        "error": trabajo.error,
+        "expira_en": trabajo.expira_en.isoformat() if trabajo.expira_en else None,
+        "descarga": (
+            reverse("exportaciones:trabajo_descargar", args=[trabajo.pk])
+            if trabajo.estado == TrabajoExportacion.Estado.LISTO
+            else None
+        ),
+    }
+
+
+@login_required
+def trabajos_list(request):
+    trabajos = TrabajoExportacion.objects.filter(usuario=request.user)[:20]
+    return render(request, "exportaciones/trabajos_list.html", {"trabajos": trabajos})
+
+
+@login_required
+def trabajo_detalle(request, pk):
+    trabajo = _trabajo_del_usuario(request, pk)
+    return render(request, "exportaciones/trabajo_detalle.html", {"trabajo": trabajo})
+
+
+@login_required
+def trabajo_estado(request, pk):
+    return JsonResponse(_estado_json(_trabajo_del_usuario(request, pk)))
+
+
+def _rango_solicitado(encabezado, tamano):
+    """`(inicio, fin)` inclusivos del único rango pedido, o `None` para enviar el archivo completo.
+
+    Varios rangos o una cabecera mal formada se ignoran (se responde 200 completo, como
+    permite RFC 9110). Un rango fuera del archivo lanza `ValueError` (416).
+    """
+    coincidencia = _PATRON_RANGO.match(encabezado.strip())
+    if not coincidencia or coincidencia.groups() == ("", ""):
+        return None
+    inicio, fin = coincidencia.groups()
+    if not inicio:
+        sufijo = int(fin)
+        if sufijo == 0 or tamano == 0:
+            raise ValueError("Rango vacío.")
+        return max(tamano - sufijo, 0), tamano - 1
+    inicio = int(inicio)
+    fin = min(int(fin), tamano - 1) if fin else tamano - 1
+    if inicio >= tamano:
+        raise ValueError("Rango fuera del archivo.")
+    if fin < inicio:
+        return None
+    return inicio, fin
+
+
+class _TramoArchivo:
+    """Vista de solo lectura sobre `largo` bytes de un archivo abierto, para `FileResponse`."""
+
+    def __init__(self, archivo, largo):
+        self._archivo = archivo
+        self._restante = largo
+
+    def read(self, tamano=-1):
+        if self._restante <= 0:
+            return b""
+        if tamano < 0 or tamano > self._restante:
+            tamano = self._restante
+        datos = self._archivo.read(tamano)
+        self._restante -= len(datos)
+        return datos
+
+    def close(self):
+        self._archivo.close()
+
+
+@login_required
+def trabajo_descargar(request, pk):
+    """Descarga del archivo generado con soporte de `Range` e `If-Range` para reanudar."""
+    trabajo = _trabajo_del_usuario(request, pk)
+    if trabajo.estado != TrabajoExportacion.Estado.LISTO:
+        raise Http404("La exportación no está disponible.")
+    ruta = ruta_archivo(trabajo)
+    try:
+        archivo = open(ruta, "rb")
+    except FileNotFoundError:
+        raise Http404("La exportación no está disponible.") from None
+    tamano = trabajo.tamano
+    etag = f'"{trabajo.pk.hex}-{tamano}"'
+
+    rango = None
+    encabezado = request.headers.get("Range")
+    if encabezado and request.headers.get("If-Range", etag) == etag:
+        try:
+            rango = _rango_solicitado(encabezado, tamano)
+        except ValueError:
+            archivo.close()
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{tamano}"
+            return response
+
+    inicio, fin = rango or (0, tamano - 1)
+    archivo.seek(inicio)
+    largo = fin - inicio + 1 if tamano else 0
+    response = FileResponse(_TramoArchivo(archivo, largo), as_attachment=True, filename=trabajo.nombre_archivo)
+    response.block_size = _BLOQUE_DESCARGA
+    if rango:
+        response.status_code = 206
+        response["Content-Range"] = f"bytes {inicio}-{fin}/{tamano}"
+    response["Content-Length"] = str(largo)
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    return response
@@ -1,7 +1,16 @@
 from django.contrib import admin
 from django.db.models import Count
 
-from .models import AttendanceConsumption, Category, DocumentoTributario, LotePago, Payment, PaymentPlan, Transaction
+from .models import (
+    AttendanceConsumption,
+    Category,
+    DocumentoTributario,
+    HallazgoReconciliacion,
+    LotePago,
+    Payment,
+    PaymentPlan,
+    Transaction,
+)
 
 
 @admin.register(LotePago)
@@ -12,6 +21,15 @@ class LotePagoAdmin(admin.ModelAdmin):
     actions = None
 
 
+@admin.register(HallazgoReconciliacion)
+class HallazgoReconciliacionAdmin(admin.ModelAdmin):
+    list_display = ("tipo", "clave", "organizacion", "detectado_en", "revisado_en", "resuelto_en")
+    list_filter = ("tipo", "organizacion", ("resuelto_en", admin.EmptyFieldListFilter))
+    search_fields = ("clave",)
+    readonly_fields = tuple(field.name for field in HallazgoReconciliacion._meta.fields)
+    actions = None
+
+
 @admin.register(PaymentPlan)
 class PaymentPlanAdmin(admin.ModelAdmin):
     list_display = ("nombre", "organizacion", "num_clases", "precio", "precio_incluye_iva", "activo")
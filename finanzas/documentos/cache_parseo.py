@@ -0,0 +1,119 @@
+"""Caché persistente de resultados de parseo por contenido.
+
+La clave es `(sha256 del archivo, origen, PARSER_VERSION)`: el mismo XML o PDF subido
+otra vez no vuelve a pasar por el parser (ni por pypdf/pdftotext). Subir `PARSER_VERSION`
+deja fuera todas las entradas anteriores. Cada entrada guarda la lista de documentos del
+archivo (un EnvioDTE trae uno por DTE). Solo se guarda la parte que depende del archivo;
+duplicados y sugerencias dependen de la base y la organización y se recalculan siempre.
+"""
+
+from decimal import Decimal
+
+from finanzas.models import ResultadoParseoDocumento
+
+from .dtos import NormalizedTaxDocument
+from .parsers import PARSER_VERSION, _filename_hash, hash_archivo
+
+
+SECCIONES = ("encabezado", "emisor", "receptor", "montos", "metadata_archivo")
+
+
+def _rutas_decimales(normalized):
+    """Ubicación de los valores `Decimal`, que `to_dict()` guarda como texto."""
+    rutas = []
+    for section in SECCIONES:
+        for key, campo in getattr(normalized, section).items():
+            if isinstance(campo.value, Decimal):
+                rutas.append([section, key])
+    for indice, linea in enumerate(normalized.lineas):
+        for key, campo in linea.fields.items():
+            if isinstance(campo.value, Decimal):
+                rutas.append(["lineas", indice, key])
+    return rutas
+
+
+def _restaurar_decimales(normalized, rutas):
+    for ruta in rutas:
+        if ruta[0] == "lineas":
+            campo = normalized.lineas[ruta[1]].fields[ruta[2]]
+        else:
+            campo = getattr(normalized, ruta[0])[ruta[1]]
+        campo.value = Decimal(campo.value)
+
+
+def hash_contenido(contenido):
+    return _filename_hash(contenido)
+
+
+def _documentos_de_registro(resultado, nombre_archivo):
+    documentos = []
+    for guardado in resultado["documentos"]:
+        normalized = NormalizedTaxDocument.from_dict(guardado["documento"])
+        _restaurar_decimales(normalized, guardado.get("decimales", []))
+        if "nombre_archivo" in normalized.metadata_archivo:
+            normalized.metadata_archivo["nombre_archivo"].value = nombre_archivo
+        documentos.append(normalized)
+    return documentos
+
+
+def obtener_resultados(claves):
+    """Resultados vigentes para varias claves `(hash_contenido, origen, nombre_archivo)` en una consulta.
+
+    Devuelve `{(hash_contenido, origen): [NormalizedTaxDocument, ...]}` solo con las claves encontradas.
+    """
+    claves = list(claves)
+    if not claves:
+        return {}
+    registros = ResultadoParseoDocumento.objects.filter(
+        hash_contenido__in={hash_contenido for hash_contenido, _origen, _nombre in claves},
+        version_parser=PARSER_VERSION,
+    ).values_list("hash_contenido", "origen", "resultado")
+    guardados = {(hash_contenido, origen): resultado for hash_contenido, origen, resultado in registros}
+    return {
+        (hash_contenido, origen): _documentos_de_registro(guardados[(hash_contenido, origen)], nombre)
+        for hash_contenido, origen, nombre in claves
+        if (hash_contenido, origen) in guardados
+    }
+
+
+def obtener_resultado(*, hash_contenido, origen, nombre_archivo=None):
+    """Documentos guardados para este contenido, o `None` si no hay entrada vigente."""
+    return obtener_resultados([(hash_contenido, origen, nombre_archivo)]).get((hash_contenido, origen))
+
+
+def guardar_resultados(entradas):
+    """Guarda `(hash_contenido, origen, documentos)` sin errores; una carrera entre dos imports no falla."""
+    registros = []
+    for hash_contenido, origen, documentos in entradas:
+        if any(normalized.errors for normalized in documentos):
+            continue
+        guardados = []
+        for normalized in documentos:
+            documento = normalized.to_dict()
+            documento["posibles_duplicados"] = []
+            documento["sugerencias_mapeo"] = {}
+            guardados.append({"documento": documento, "decimales": _rutas_decimales(normalized)})
+        registros.append(
+            ResultadoParseoDocumento(
+                hash_contenido=hash_contenido,
+                origen=origen,
+                version_parser=PARSER_VERSION,
+                resultado={"documentos": guardados},
+            )
+        )
+    if registros:
+        ResultadoParseoDocumento.objects.bulk_create(registros, ignore_conflicts=True)
+
+
+def guardar_resultado(*, hash_contenido, origen, documentos):
+    guardar_resultados([(hash_contenido, origen, documentos)])
+
+
+__all__ = [
+    "guardar_resultado",
+    "guardar_resultados",
+    "hash_archivo",
+    "hash_contenido",
+    "obtener_resultado",
+    "obtener_resultados",
+]
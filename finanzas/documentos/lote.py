@@ -0,0 +1,278 @@
+"""Importación en lote de documentos tributarios desde un ZIP o un directorio.
+
+`extraer_archivos_lote` deja los XML y PDF en disco, `preparar_lote` junta el XML y el PDF
+de cada documento, los parsea en paralelo (ver `procesos`) y marca duplicados dentro del
+lote y contra la base; un EnvioDTE con varios DTE da una fila por DTE. El resultado son
+filas serializables para la tabla de revisión;
+`finanzas.services.documentos.importar_lote_documentos` inserta las que se confirmen.
+"""
+
+import re
+import shutil
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path, PurePosixPath
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+
+from .cache_parseo import guardar_resultados, hash_archivo, obtener_resultados
+from .mapping import clave_documento, documento_desde_initial, documento_initial_from_normalized, duplicados_por_clave
+from .procesos import ParseoParalelo
+from .services import config_extraccion_pdf
+
+
+TIPOS_ARCHIVO = {".xml": "xml", ".pdf": "pdf"}
+_BLOQUE_COPIA = 64 * 1024
+
+
+@dataclass(frozen=True)
+class ArchivoLote:
+    nombre: str
+    ruta: Path
+    tipo: str
+
+
+@dataclass
+class UnidadLote:
+    """Un archivo del lote (su XML, su PDF o ambos) y los documentos que trae."""
+
+    xml: ArchivoLote | None = None
+    pdf: ArchivoLote | None = None
+    documentos: list | None = None
+
+    @property
+    def principal(self):
+        return self.xml or self.pdf
+
+    def tarea(self):
+        # El XML manda: si está, el PDF solo se adjunta y no se parsea.
+        if self.xml:
+            return {"xml_ruta": str(self.xml.ruta), "xml_nombre": PurePosixPath(self.xml.nombre).name}
+        return {"pdf_ruta": str(self.pdf.ruta), "pdf_nombre": PurePosixPath(self.pdf.nombre).name}
+
+
+def _tipo_archivo(nombre):
+    partes = PurePosixPath(nombre).parts
+    if any(parte.startswith(".") or parte == "__MACOSX" for parte in partes):
+        return None
+    return TIPOS_ARCHIVO.get(PurePosixPath(nombre).suffix.lower())
+
+
+def _validar_cantidad(cantidad):
+    if cantidad > settings.DOCUMENTOS_LOTE_MAX_ARCHIVOS:
+        raise ValidationError(
+            f"El lote supera el máximo de {settings.DOCUMENTOS_LOTE_MAX_ARCHIVOS} archivos XML/PDF."
+        )
+
+
+def _archivos_de_directorio(directorio):
+    archivos = []
+    for ruta in sorted(directorio.rglob("*")):
+        nombre = ruta.relative_to(directorio).as_posix()
+        tipo = _tipo_archivo(nombre)
+        if ruta.is_file() and tipo:
+            archivos.append(ArchivoLote(nombre=nombre, ruta=ruta, tipo=tipo))
+    _validar_cantidad(len(archivos))
+    return archivos
+
+
+def _archivos_de_zip(origen, destino):
+    """Extrae los XML/PDF a `destino` con nombres propios; no confía en las rutas ni tamaños del ZIP."""
+    maximo = settings.DOCUMENTOS_LOTE_MAX_MB * 1024 * 1024
+    try:
+        comprimido = zipfile.ZipFile(origen)
+    except zipfile.BadZipFile:
+        raise ValidationError("El archivo no es un ZIP válido.") from None
+    archivos = []
+    total = 0
+    destino = Path(destino)
+    destino.mkdir(parents=True, exist_ok=True)
+    with comprimido:
+        entradas = [info for info in comprimido.infolist() if not info.is_dir() and _tipo_archivo(info.filename)]
+        _validar_cantidad(len(entradas))
+        for indice, info in enumerate(entradas):
+            ruta = destino / f"{indice:04d}_{PurePosixPath(info.filename).name}"
+            with comprimido.open(info) as entrada, ruta.open("wb") as salida:
+                while bloque := entrada.read(_BLOQUE_COPIA):
+                    total += len(bloque)
+                    if total > maximo:
+                        raise ValidationError(
+                            f"El contenido del ZIP supera {settings.DOCUMENTOS_LOTE_MAX_MB} MB descomprimido."
+                        )
+                    salida.write(bloque)
+            archivos.append(ArchivoLote(nombre=info.filename, ruta=ruta, tipo=_tipo_archivo(info.filename)))
+    return archivos
+
+
+def extraer_archivos_lote(origen, destino=None):
+    """Lista los XML/PDF de un directorio o extrae los de un ZIP (ruta o archivo abierto) en `destino`.
+
+    Ignora otros tipos, carpetas ocultas y `__MACOSX`. Lanza `ValidationError` si el ZIP no es
+    válido o supera `DOCUMENTOS_LOTE_MAX_ARCHIVOS` / `DOCUMENTOS_LOTE_MAX_MB`.
+    """
+    if isinstance(origen, (str, Path)) and Path(origen).is_dir():
+        return _archivos_de_directorio(Path(origen))
+    if destino is None:
+        raise ValueError("Se necesita un directorio de destino para extraer un ZIP.")
+    try:
+        return _archivos_de_zip(origen, destino)
+    except ValidationError:
+        shutil.rmtree(destino, ignore_errors=True)
+        raise
+
+
+def _clave_nombre(archivo):
+    return PurePosixPath(archivo.nombre).stem.strip().lower()
+
+
+def emparejar_archivos(archivos):
+    """Junta en una unidad el XML y el PDF que comparten nombre (sin extensión ni carpeta)."""
+    unidades = []
+    por_nombre = {}
+    for archivo in archivos:
+        if archivo.tipo == "xml":
+            unidad = UnidadLote(xml=archivo)
+            unidades.append(unidad)
+            por_nombre.setdefault(_clave_nombre(archivo), unidad)
+    for archivo in archivos:
+        if archivo.tipo != "pdf":
+            continue
+        unidad = por_nombre.get(_clave_nombre(archivo))
+        if unidad is not None and unidad.pdf is None:
+            unidad.pdf = archivo
+        else:
+            unidades.append(UnidadLote(pdf=archivo))
+    return unidades
+
+
+def _emparejar_por_folio(unidades):
+    """Adjunta cada PDF suelto al XML sin PDF cuyo folio aparece como número en el nombre del PDF.
+
+    Un PDF emparejado por nombre con un EnvioDTE de varios documentos vuelve a quedar suelto:
+    no hay forma de saber a cuál DTE corresponde.
+    """
+    sueltos = []
+    for unidad in unidades:
+        if unidad.pdf and unidad.documentos is not None and len(unidad.documentos) > 1:
+            sueltos.append(UnidadLote(pdf=unidad.pdf))
+            unidad.pdf = None
+    unidades = unidades + sueltos
+    xml_por_folio = {}
+    for unidad in unidades:
+        if unidad.xml and unidad.pdf is None and unidad.documentos is not None and len(unidad.documentos) == 1:
+            folio = str(unidad.documentos[0].get_value("encabezado", "folio") or "").lstrip("0")
+            if folio:
+                xml_por_folio.setdefault(folio, []).append(unidad)
+    if not xml_por_folio:
+        return unidades
+    resultado = []
+    for unidad in unidades:
+        if unidad.xml is None:
+            numeros = {numero.lstrip("0") for numero in re.findall(r"\d+", _clave_nombre(unidad.pdf))}
+            candidatas = [
+                xml for folio in numeros for xml in xml_por_folio.get(folio, []) if xml.pdf is None
+            ]
+            if len(candidatas) == 1:
+                candidatas[0].pdf = unidad.pdf
+                continue
+        resultado.append(unidad)
+    return resultado
+
+
+def _resolver(parseo, unidades):
+    """Completa `documentos` desde el caché de parseo o parseando en paralelo lo que falte."""
+    if not unidades:
+        return
+    claves = [(hash_archivo(unidad.principal.ruta), unidad.principal.tipo) for unidad in unidades]
+    guardados = obtener_resultados(
+        (hash_, origen, PurePosixPath(unidad.principal.nombre).name)
+        for (hash_, origen), unidad in zip(claves, unidades)
+    )
+    pendientes = []
+    for clave, unidad in zip(claves, unidades):
+        unidad.documentos = guardados.get(clave)
+        if unidad.documentos is None:
+            pendientes.append((clave, unidad))
+    config_pdf = config_extraccion_pdf()
+    resultados = parseo.parsear({**unidad.tarea(), "config_pdf": config_pdf} for _clave, unidad in pendientes)
+    for (_clave, unidad), documentos in zip(pendientes, resultados):
+        unidad.documentos = documentos
+    guardar_resultados((hash_, origen, unidad.documentos) for (hash_, origen), unidad in pendientes)
+
+
+def _fila(indice, unidad, normalized, indice_dte, organizacion_id):
+    documento = documento_initial_from_normalized(normalized, organizacion_id=organizacion_id)
+    errores = list(normalized.errors)
+    if not errores:
+        try:
+            documento_desde_initial(documento, organizacion_id=organizacion_id)
+        except ValidationError as exc:
+            errores.extend(
+                f"{campo}: {' '.join(mensajes)}" for campo, mensajes in exc.message_dict.items()
+            )
+    return {
+        "indice": indice,
+        "xml": unidad.xml.nombre if unidad.xml else "",
+        "pdf": unidad.pdf.nombre if unidad.pdf else "",
+        "xml_ruta": str(unidad.xml.ruta) if unidad.xml else "",
+        "pdf_ruta": str(unidad.pdf.ruta) if unidad.pdf else "",
+        # Posición del DTE dentro de un EnvioDTE con varios documentos; `None` si el XML trae uno.
+        "indice_dte": indice_dte,
+        "documento": documento,
+        "warnings": list(normalized.warnings),
+        "errores": errores,
+        "duplicados": [],
+        "duplicado_de": None,
+    }
+
+
+def clave_fila(fila):
+    documento = fila["documento"]
+    return clave_documento(documento.get("tipo_documento"), documento.get("folio"), documento.get("rut_emisor"))
+
+
+def marcar_duplicados(filas, organizacion_id):
+    """Marca repetidos dentro del lote (`duplicado_de`) y contra la base (`duplicados`, una consulta)."""
+    primeras = {}
+    for fila in filas:
+        clave = clave_fila(fila)
+        if not clave[1]:
+            continue
+        if clave in primeras:
+            fila["duplicado_de"] = primeras[clave]
+        else:
+            primeras[clave] = fila["indice"]
+    existentes = duplicados_por_clave(primeras, organizacion_id)
+    for fila in filas:
+        fila["duplicados"] = existentes.get(clave_fila(fila), [])
+        fila["importable"] = not fila["errores"]
+        fila["sugerida"] = fila["importable"] and not fila["duplicados"] and fila["duplicado_de"] is None
+    return filas
+
+
+def preparar_lote(archivos, *, organizacion_id, procesos=None):
+    """Filas de revisión para los archivos de un lote, en el orden en que se emparejaron."""
+    procesos = settings.DOCUMENTOS_LOTE_PROCESOS if procesos is None else procesos
+    unidades = emparejar_archivos(archivos)
+    with ParseoParalelo(procesos) as parseo:
+        _resolver(parseo, [unidad for unidad in unidades if unidad.xml])
+        unidades = _emparejar_por_folio(unidades)
+        _resolver(parseo, [unidad for unidad in unidades if unidad.documentos is None])
+    filas = []
+    for unidad in unidades:
+        varios = len(unidad.documentos) > 1
+        for indice_dte, normalized in enumerate(unidad.documentos):
+            filas.append(_fila(len(filas), unidad, normalized, indice_dte if varios else None, organizacion_id))
+    return marcar_duplicados(filas, organizacion_id)
+
+
+__all__ = [
+    "ArchivoLote",
+    "UnidadLote",
+    "clave_fila",
+    "emparejar_archivos",
+    "extraer_archivos_lote",
+    "marcar_duplicados",
+    "preparar_lote",
+]
@@ -1,10 +1,11 @@
 import json
 from decimal import Decimal
 
+from django.db.models import Q
 from django.utils.dateparse import parse_date
 
 from personas.models import Organizacion, Persona
-from personas.validators import formatear_rut_chileno
+from personas.validators import formatear_rut_chileno, limpiar_rut_chileno
 
 from finanzas.models import DocumentoTributario, Payment
 
@@ -140,7 +141,22 @@ def _sugerir_contraparte(normalized, organizacion_id=None):
     return persona_sugerida, organizacion_sugerida, lado_encontrado
 
 
+def _duplicado(item):
+    return {
+        "id": item.pk,
+        "folio": item.folio,
+        "fecha_emision": item.fecha_emision.isoformat(),
+        "monto_total": str(item.monto_total),
+    }
+
+
 def detectar_duplicados_documento(normalized, organizacion_id=None):
+    """Documentos ya guardados que coinciden con `normalized` (máximo 10).
+
+    Con tipo, folio y RUT emisor la búsqueda usa el índice `documento_clave_normalizada`; un
+    documento importado desde el mismo archivo (igual `hash_contenido`, solo para archivos de un
+    documento) también cuenta como duplicado aunque el parseo haya cambiado alguno de esos campos.
+    """
     queryset = DocumentoTributario.objects.all()
     if organizacion_id:
         queryset = queryset.filter(organizacion_id=organizacion_id)
@@ -149,36 +165,60 @@ def detectar_duplicados_documento(normalized, organizacion_id=None):
     total = normalized.get_value("montos", "total_bruto")
     rut_emisor = normalized.get_value("emisor", "rut")
     rut_receptor = normalized.get_value("receptor", "rut")
+    hash_contenido = None
+    if (normalized.get_value("metadata_archivo", "documentos_en_archivo") or 1) == 1:
+        hash_contenido = normalized.get_value("metadata_archivo", "hash")
     tipo_documento = map_tipo_documento(normalized)
     if folio and tipo_documento and rut_emisor:
-        queryset = queryset.filter(
-            folio=folio,
+        condicion = Q(
+            folio=str(folio).strip(),
             tipo_documento=tipo_documento,
-            rut_emisor__iexact=rut_emisor,
+            rut_emisor_normalizado=limpiar_rut_chileno(rut_emisor),
         )
     else:
+        condicion = Q()
         if folio:
-            queryset = queryset.filter(folio=folio)
+            condicion &= Q(folio=folio)
         if tipo_documento:
-            queryset = queryset.filter(tipo_documento=tipo_documento)
+            condicion &= Q(tipo_documento=tipo_documento)
         fecha_parseada = parse_date(fecha) if isinstance(fecha, str) else fecha
         if fecha_parseada:
-            queryset = queryset.filter(fecha_emision=fecha_parseada)
+            condicion &= Q(fecha_emision=fecha_parseada)
         if total is not None:
-            queryset = queryset.filter(monto_total=total)
+            condicion &= Q(monto_total=total)
         if rut_emisor:
-            queryset = queryset.filter(rut_emisor__iexact=rut_emisor)
+            condicion &= Q(rut_emisor_normalizado=limpiar_rut_chileno(rut_emisor))
         if rut_receptor:
-            queryset = queryset.filter(rut_receptor__iexact=rut_receptor)
-    return [
-        {
-            "id": item.pk,
-            "folio": item.folio,
-            "fecha_emision": item.fecha_emision.isoformat(),
-            "monto_total": str(item.monto_total),
-        }
-        for item in queryset[:10]
-    ]
+            condicion &= Q(rut_receptor__iexact=rut_receptor)
+    if hash_contenido:
+        condicion |= Q(hash_contenido=hash_contenido)
+    return [_duplicado(item) for item in queryset.filter(condicion).order_by("pk")[:10]]
+
+
+def clave_documento(tipo_documento, folio, rut_emisor):
+    """Clave de unicidad operativa `tipo + folio + rut_emisor`, con el RUT sin puntos ni guion."""
+    return (tipo_documento or "", str(folio or "").strip(), limpiar_rut_chileno(rut_emisor))
+
+
+def duplicados_por_clave(claves, organizacion_id):
+    """Documentos existentes de la organización para varias claves, en una sola consulta.
+
+    Cada clave es una búsqueda exacta sobre el índice `documento_clave_normalizada`.
+    Devuelve `{clave: [duplicado, ...]}` con el mismo formato de `detectar_duplicados_documento`.
+    """
+    claves = {clave for clave in claves if clave[0] and clave[1]}
+    if not claves:
+        return {}
+    condicion = Q()
+    for tipo_documento, folio, rut_normalizado in claves:
+        condicion |= Q(tipo_documento=tipo_documento, folio=folio, rut_emisor_normalizado=rut_normalizado)
+    encontrados = {}
+    queryset = DocumentoTributario.objects.filter(condicion, organizacion_id=organizacion_id).order_by("pk")
+    campos = ("pk", "tipo_documento", "folio", "rut_emisor_normalizado", "fecha_emision", "monto_total")
+    for item in queryset.only(*campos):
+        clave = (item.tipo_documento, item.folio, item.rut_emisor_normalizado)
+        encontrados.setdefault(clave, []).append(_duplicado(item))
+    return encontrados
 
 
 def documento_initial_from_normalized(normalized, organizacion_id=None):
@@ -248,3 +288,36 @@ def sugerencias_mapeo(normalized, organizacion_id=None):
         "organizacion_sugerida_id": organizacion.pk if organizacion else None,
         "organizacion_sugerida_nombre": organizacion.nombre if organizacion else "",
     }
+
+
+# Campos que `documento_desde_initial` no valida: las FK se resuelven por id y los archivos se adjuntan después.
+CAMPOS_SIN_VALIDAR_LOTE = [
+    "organizacion",
+    "persona_relacionada",
+    "organizacion_relacionada",
+    "documento_relacionado",
+    "archivo_pdf",
+    "archivo_xml",
+]
+
+
+def documento_desde_initial(initial, *, organizacion_id):
+    """`DocumentoTributario` sin guardar a partir de `documento_initial_from_normalized`.
+
+    Convierte y valida los campos como lo haría el formulario de revisión; lanza
+    `ValidationError` si falta el folio, la fecha u otro campo obligatorio.
+    """
+    valores = dict(initial)
+    metadata = valores.pop("metadata_extra", None) or "{}"
+    persona_id = valores.pop("persona_relacionada", None) or None
+    organizacion_relacionada_id = valores.pop("organizacion_relacionada", None) or None
+    valores.pop("organizacion", None)
+    documento = DocumentoTributario(
+        organizacion_id=organizacion_id,
+        persona_relacionada_id=persona_id,
+        organizacion_relacionada_id=organizacion_relacionada_id,
+        metadata_extra=json.loads(metadata) if isinstance(metadata, str) else dict(metadata),
+        **{campo: "" if valor is None else valor for campo, valor in valores.items()},
+    )
+    documento.full_clean(exclude=CAMPOS_SIN_VALIDAR_LOTE, validate_unique=False, validate_constraints=False)
+    return documento
@@ -1,11 +1,18 @@
+import contextlib
+import functools
 import hashlib
 import io
 import re
 import subprocess
+import sys
 import tempfile
+import threading
+import time
 import unicodedata
 import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
 from decimal import Decimal, InvalidOperation
+from pathlib import Path
 
 from .dtos import NormalizedTaxDocument, NormalizedTaxLine
 
@@ -14,6 +21,20 @@ try:
 except Exception:  # pragma: no cover - dependencia opcional
     PdfReader = None
 
+try:
+    import resource
+except ImportError:  # pragma: no cover - no existe en Windows
+    resource = None
+
+
+SII_DTE_NAMESPACE = "http://www.sii.cl/SiiDte"
+# Los DTE extraídos de un EnvioDTE se serializan sin prefijo `ns0:`, como los emite el SII.
+ET.register_namespace("", SII_DTE_NAMESPACE)
+ET.register_namespace("ds", "http://www.w3.org/2000/09/xmldsig#")
+
+# Subir al cambiar lo que producen los parsers: los resultados guardados con otra versión se ignoran.
+PARSER_VERSION = "3"
+
 
 def _text(element):
     return (element.text or "").strip() if element is not None and element.text is not None else ""
@@ -114,6 +135,59 @@ def _filename_hash(content):
     return hashlib.sha256(content).hexdigest()
 
 
+@contextlib.contextmanager
+def _abrir_xml(fuente):
+    """Archivo binario para `iterparse` desde bytes, una ruta o un archivo ya abierto."""
+    if isinstance(fuente, (bytes, bytearray)):
+        yield io.BytesIO(fuente)
+    elif hasattr(fuente, "read"):
+        yield fuente
+    else:
+        with open(fuente, "rb") as handler:
+            yield handler
+
+
+def hash_archivo(ruta):
+    """sha256 de un archivo en disco, leído por bloques."""
+    digest = hashlib.sha256()
+    with open(ruta, "rb") as handler:
+        while bloque := handler.read(1024 * 1024):
+            digest.update(bloque)
+    return digest.hexdigest()
+
+
+def _recorrer_dte(fuente):
+    """Entrega `(contenedor, documento, fecha_generacion)` por cada DTE, leyendo con `iterparse`.
+
+    El contenedor es el `DTE` completo (con su firma) o el `Documento` si viene sin sobre.
+    Apenas se entrega se suelta del árbol, así que un EnvioDTE o un libro de muchos MB se
+    recorre con memoria constante.
+    """
+    fecha_generacion = ""
+    pila = []
+    with _abrir_xml(fuente) as handler:
+        for evento, elemento in ET.iterparse(handler, events=("start", "end")):
+            if evento == "start":
+                pila.append(elemento)
+                continue
+            pila.pop()
+            padre = pila[-1] if pila else None
+            nombre = _local_name(elemento.tag)
+            if nombre == "TmstFirmaEnv":
+                fecha_generacion = _text(elemento)
+                continue
+            if nombre == "DTE":
+                documento = _find_child(elemento, "Documento")
+            elif nombre == "Documento" and (padre is None or _local_name(padre.tag) != "DTE"):
+                documento = elemento
+            else:
+                continue
+            if documento is not None and _find_child(documento, "Encabezado") is not None:
+                yield elemento, documento, fecha_generacion
+            if padre is not None:
+                padre.remove(elemento)
+
+
 def _document_category_from_dte(tipo_dte):
     mapping = {
         "33": ("invoice", "factura electrónica", "factura_afecta"),
@@ -126,6 +200,68 @@ def _document_category_from_dte(tipo_dte):
     return mapping.get(str(tipo_dte), ("other", "documento tributario", "otro"))
 
 
+PDF_EXTRACTORES = ("pypdf", "pdftotext")
+
+
+@dataclass(frozen=True)
+class ConfigExtraccionPdf:
+    """Cómo se saca el texto de un PDF; se arma desde settings y viaja a los procesos del lote.
+
+    `orden_por_familia` mapea la familia (`familia_pdf`) al orden de extractores; `default`
+    rige hasta que el texto extraído revela la familia. Ambos extractores corren en un proceso
+    hijo (pypdf en otro intérprete Python) con `timeout_segundos`, un tope de `memoria_mb` y como
+    máximo `concurrencia` procesos a la vez por proceso Python.
+    """
+
+    orden_por_familia: dict = field(default_factory=lambda: {"default": list(PDF_EXTRACTORES)})
+    timeout_segundos: int = 20
+    memoria_mb: int = 512
+    concurrencia: int = 2
+
+    def orden(self, familia):
+        orden = self.orden_por_familia.get(familia) or self.orden_por_familia.get("default") or PDF_EXTRACTORES
+        return [extractor for extractor in orden if extractor in PDF_EXTRACTORES]
+
+
+def familia_pdf(texto):
+    """Familia del documento según el texto del PDF, con las mismas palabras clave que el parser."""
+    upper = (texto or "").upper()
+    if "HONORARIOS" in upper:
+        return "boleta_honorarios"
+    if "FACTURA" in upper:
+        return "factura"
+    if "BOLETA" in upper:
+        return "boleta_venta"
+    return "otro"
+
+
+# Corre en un intérprete aparte: lee el PDF por stdin y escribe el texto en UTF-8 por stdout.
+_PYPDF_HIJO = """
+import io, sys
+from pypdf import PdfReader
+reader = PdfReader(io.BytesIO(sys.stdin.buffer.read()))
+texto = "\\n".join(page.extract_text() or "" for page in reader.pages)
+sys.stdout.buffer.write(texto.encode("utf-8", "replace"))
+"""
+
+
+@functools.lru_cache(maxsize=None)
+def _cupos_extraccion(concurrencia):
+    return threading.BoundedSemaphore(max(1, concurrencia))
+
+
+def _limitar_memoria(memoria_mb):
+    """`preexec_fn` que limita la memoria virtual del proceso hijo; `None` si no aplica."""
+    if not memoria_mb or resource is None:
+        return None
+    limite = memoria_mb * 1024 * 1024
+
+    def limitar():
+        resource.setrlimit(resource.RLIMIT_AS, (limite, limite))
+
+    return limitar
+
+
 class BaseTaxDocumentParser:
     parser_name = "base"
 
@@ -137,18 +273,31 @@ class DteXmlParser(BaseTaxDocumentParser):
     parser_name = "xml_dte"
 
     def parse(self, *, xml_bytes=None, pdf_bytes=None, xml_name=None, pdf_name=None):
-        root = ET.fromstring(xml_bytes)
-        documento_node = next(
-            (
-                node
-                for node in root.iter()
-                if _local_name(node.tag) == "Documento" and _find_child(node, "Encabezado") is not None
-            ),
-            None,
-        )
-        if documento_node is None:
+        """Primer documento del XML; para un EnvioDTE con varios DTE ver `iterar`."""
+        documentos = self.iterar(xml_bytes, xml_name=xml_name, hash_archivo=_filename_hash(xml_bytes))
+        try:
+            normalized = next(documentos, None)
+        finally:
+            documentos.close()
+        if normalized is None:
             raise ValueError("No se encontro un nodo Documento valido en el XML DTE.")
+        return normalized
+
+    def iterar(self, fuente, *, xml_name=None, hash_archivo=""):
+        """Un `NormalizedTaxDocument` por cada DTE de `fuente` (bytes, ruta o archivo binario).
+
+        `indice_en_archivo` en `metadata_archivo` es la posición del DTE dentro del sobre.
+        """
+        for indice, (_contenedor, documento_node, fecha_generacion) in enumerate(_recorrer_dte(fuente)):
+            yield self._normalizar(
+                documento_node,
+                fecha_generacion=fecha_generacion,
+                xml_name=xml_name,
+                hash_archivo=hash_archivo,
+                indice=indice,
+            )
 
+    def _normalizar(self, documento_node, *, fecha_generacion, xml_name, hash_archivo, indice):
         encabezado = _find_child(documento_node, "Encabezado")
         id_doc = _find_child(encabezado, "IdDoc")
         emisor = _find_child(encabezado, "Emisor")
@@ -165,13 +314,7 @@ class DteXmlParser(BaseTaxDocumentParser):
         normalized.set_field("encabezado", "tipo_documento_sugerido", tipo_documento, "xml", "high")
         normalized.set_field("encabezado", "folio", _text(_find_child(id_doc, "Folio")), "xml", "high")
         normalized.set_field("encabezado", "fecha_emision", _text(_find_child(id_doc, "FchEmis")), "xml", "high")
-        normalized.set_field(
-            "encabezado",
-            "fecha_generacion",
-            _text(next((n for n in root.iter() if _local_name(n.tag) == "TmstFirmaEnv"), None)),
-            "xml",
-            "medium",
-        )
+        normalized.set_field("encabezado", "fecha_generacion", fecha_generacion, "xml", "medium")
         normalized.set_field("encabezado", "moneda", "CLP", "inferred", "medium")
         normalized.set_field(
             "encabezado",
@@ -226,10 +369,11 @@ class DteXmlParser(BaseTaxDocumentParser):
         normalized.set_field("metadata_archivo", "nombre_archivo", xml_name, "xml", "high")
         normalized.set_field("metadata_archivo", "tipo_mime", "application/xml", "inferred", "high")
         normalized.set_field("metadata_archivo", "extension", "xml", "inferred", "high")
-        normalized.set_field("metadata_archivo", "hash", _filename_hash(xml_bytes), "xml", "high")
+        normalized.set_field("metadata_archivo", "hash", hash_archivo, "xml", "high")
         normalized.set_field("metadata_archivo", "formato_origen", "xml_dte", "xml", "high")
         normalized.set_field("metadata_archivo", "parser_usado", self.parser_name, "xml", "high")
         normalized.set_field("metadata_archivo", "fuente_principal", "xml", "xml", "high")
+        normalized.set_field("metadata_archivo", "indice_en_archivo", indice, "xml", "high")
         return normalized
 
 
@@ -308,6 +452,9 @@ class BheXmlParser(BaseTaxDocumentParser):
 class PdfFallbackParser(BaseTaxDocumentParser):
     parser_name = "pdf_fallback"
 
+    def __init__(self, config=None):
+        self.config = config or ConfigExtraccionPdf()
+
     @staticmethod
     def _normalize_pdf_text(text):
         return (
@@ -319,17 +466,30 @@ class PdfFallbackParser(BaseTaxDocumentParser):
         )
 
     @staticmethod
-    def _extract_text_with_pypdf(pdf_bytes):
+    def _extract_text_with_pypdf(pdf_bytes, *, timeout=None, memoria_mb=None):
+        """Texto de pypdf en un proceso hijo; `TimeoutError` si no termina en `timeout` segundos."""
         if PdfReader is None:
             return ""
         try:
-            reader = PdfReader(io.BytesIO(pdf_bytes))
-            return "\n".join(page.extract_text() or "" for page in reader.pages)
+            result = subprocess.run(
+                [sys.executable, "-c", _PYPDF_HIJO],
+                input=pdf_bytes,
+                capture_output=True,
+                check=False,
+                timeout=timeout,
+                preexec_fn=_limitar_memoria(memoria_mb),
+            )
+        except subprocess.TimeoutExpired as exc:
+            raise TimeoutError(f"pypdf no termino en {timeout} s.") from exc
         except Exception:
             return ""
+        if result.returncode != 0:
+            return ""
+        return result.stdout.decode("utf-8", "replace")
 
     @staticmethod
-    def _extract_text_with_pdftotext(pdf_bytes):
+    def _extract_text_with_pdftotext(pdf_bytes, *, timeout=None, memoria_mb=None):
+        """Texto de `pdftotext -layout`; `TimeoutError` si el proceso no termina en `timeout` segundos."""
         try:
             with tempfile.NamedTemporaryFile(suffix=".pdf") as tmp_pdf:
                 tmp_pdf.write(pdf_bytes)
@@ -339,13 +499,67 @@ class PdfFallbackParser(BaseTaxDocumentParser):
                     capture_output=True,
                     text=True,
                     check=False,
+                    timeout=timeout,
+                    preexec_fn=_limitar_memoria(memoria_mb),
                 )
                 if result.returncode == 0:
                     return result.stdout or ""
+        except subprocess.TimeoutExpired as exc:
+            raise TimeoutError(f"pdftotext no termino en {timeout} s.") from exc
         except Exception:
             return ""
         return ""
 
+    def _extraer_con(self, extractor, pdf_bytes):
+        extraer = self._extract_text_with_pypdf if extractor == "pypdf" else self._extract_text_with_pdftotext
+        cupos = _cupos_extraccion(self.config.concurrencia)
+        if not cupos.acquire(timeout=self.config.timeout_segundos):
+            raise TimeoutError(f"No hubo cupo para ejecutar {extractor}.")
+        try:
+            return extraer(pdf_bytes, timeout=self.config.timeout_segundos, memoria_mb=self.config.memoria_mb)
+        finally:
+            cupos.release()
+
+    def _extraer_texto(self, pdf_bytes):
+        """Texto del PDF y tiempos de cada extractor probado (`[{extractor, ms, resultado}]`).
+
+        Se sigue el orden `default` hasta obtener texto; si la familia que revela ese texto
+        prefiere otro extractor (p. ej. `pdftotext -layout` para honorarios), se usa ese.
+        """
+        tiempos = []
+        textos = {}
+
+        def probar(extractor):
+            if extractor not in textos:
+                inicio = time.perf_counter()
+                try:
+                    texto = self._extraer_con(extractor, pdf_bytes) or ""
+                    resultado = "ok" if texto.strip() else "vacio"
+                except TimeoutError:
+                    texto, resultado = "", "timeout"
+                tiempos.append(
+                    {
+                        "extractor": extractor,
+                        "ms": round((time.perf_counter() - inicio) * 1000),
+                        "resultado": resultado,
+                    }
+                )
+                textos[extractor] = texto
+            return textos[extractor]
+
+        texto = ""
+        for extractor in self.config.orden("default"):
+            texto = probar(extractor)
+            if texto.strip():
+                break
+        if texto.strip():
+            for extractor in self.config.orden(familia_pdf(texto)):
+                preferido = probar(extractor)
+                if preferido.strip():
+                    texto = preferido
+                    break
+        return texto, tiempos
+
     @staticmethod
     def _join_wrapped_lines(parts):
         resultado = []
@@ -799,9 +1013,11 @@ class PdfFallbackParser(BaseTaxDocumentParser):
         normalized.set_field("metadata_archivo", "formato_origen", "pdf", "pdf", "high")
         normalized.set_field("metadata_archivo", "parser_usado", self.parser_name, "pdf", "high")
         normalized.set_field("metadata_archivo", "fuente_principal", "pdf", "pdf", "high")
-        text = self._extract_text_with_pypdf(pdf_bytes)
-        if not text.strip():
-            text = self._extract_text_with_pdftotext(pdf_bytes)
+        text, tiempos = self._extraer_texto(pdf_bytes)
+        normalized.set_field("metadata_archivo", "extraccion_pdf", tiempos, "pdf", "high")
+        vencidos = [tiempo["extractor"] for tiempo in tiempos if tiempo["resultado"] == "timeout"]
+        if vencidos:
+            normalized.warnings.append(f"{', '.join(vencidos)} no termino a tiempo; el texto puede estar incompleto.")
 
         if not text.strip():
             normalized.errors.append("El PDF no contiene texto seleccionable util para parsear.")
@@ -812,12 +1028,77 @@ class PdfFallbackParser(BaseTaxDocumentParser):
         return normalized
 
 
-def detectar_familia_xml(xml_bytes):
-    root = ET.fromstring(xml_bytes)
-    root_name = _local_name(root.tag).lower()
-    all_tags = {_local_name(node.tag) for node in root.iter()}
-    if "Documento" in all_tags and "Encabezado" in all_tags:
-        return "dte"
-    if root_name == "datos" or "numeroBoleta" in all_tags:
+def detectar_familia_xml(fuente):
+    """`dte`, `bhe` o `desconocido`; lee `fuente` (bytes, ruta o archivo) solo hasta decidir."""
+    raiz = None
+    etiquetas = set()
+    with _abrir_xml(fuente) as handler:
+        for _evento, elemento in ET.iterparse(handler, events=("start",)):
+            nombre = _local_name(elemento.tag)
+            if raiz is None:
+                raiz = nombre.lower()
+            etiquetas.add(nombre)
+            if "Documento" in etiquetas and "Encabezado" in etiquetas:
+                return "dte"
+    if raiz == "datos" or "numeroBoleta" in etiquetas:
         return "bhe"
     return "desconocido"
+
+
+def parsear_documentos(*, xml=None, xml_name=None, pdf_bytes=None, pdf_name=None, config_pdf=None):
+    """Parsea un XML (bytes o ruta, si viene) o un PDF sin tocar la base; el XML manda sobre el PDF.
+
+    Devuelve una lista: un EnvioDTE o un libro trae un documento por DTE (con
+    `documentos_en_archivo` en `metadata_archivo`); BHE y PDF traen uno. `config_pdf` es la
+    `ConfigExtraccionPdf` para el PDF.
+    """
+    if xml:
+        familia = detectar_familia_xml(xml)
+        if familia == "dte":
+            es_ruta = not isinstance(xml, (bytes, bytearray))
+            documentos = list(
+                DteXmlParser().iterar(
+                    xml,
+                    xml_name=xml_name,
+                    hash_archivo=hash_archivo(xml) if es_ruta else _filename_hash(xml),
+                )
+            )
+            if not documentos:
+                raise ValueError("No se encontro un nodo Documento valido en el XML DTE.")
+            for normalized in documentos:
+                normalized.set_field("metadata_archivo", "documentos_en_archivo", len(documentos), "xml", "high")
+            return documentos
+        if familia == "bhe":
+            xml_bytes = xml if isinstance(xml, (bytes, bytearray)) else Path(xml).read_bytes()
+            return [BheXmlParser().parse(xml_bytes=xml_bytes, xml_name=xml_name)]
+        normalized = NormalizedTaxDocument()
+        normalized.errors.append("No se pudo reconocer la familia del XML.")
+        return [normalized]
+    return [PdfFallbackParser(config_pdf).parse(pdf_bytes=pdf_bytes, pdf_name=pdf_name)]
+
+
+def _serializar_dte(elemento):
+    elemento.tail = None
+    return ET.tostring(elemento, encoding="utf-8", xml_declaration=True)
+
+
+def extraer_fragmentos_dte(fuente, indices):
+    """XML propio de los DTE pedidos por posición (`{indice: bytes}`), leyendo `fuente` en streaming.
+
+    Sirve para adjuntar a cada documento de un EnvioDTE solo su nodo `DTE` en vez del sobre completo.
+    """
+    pendientes = set(indices)
+    fragmentos = {}
+    if not pendientes:
+        return fragmentos
+    recorrido = _recorrer_dte(fuente)
+    try:
+        for indice, (contenedor, _documento, _fecha) in enumerate(recorrido):
+            if indice in pendientes:
+                fragmentos[indice] = _serializar_dte(contenedor)
+                pendientes.discard(indice)
+                if not pendientes:
+                    break
+    finally:
+        recorrido.close()
+    return fragmentos
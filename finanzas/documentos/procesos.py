@@ -0,0 +1,74 @@
+"""Parseo de documentos tributarios en procesos separados.
+
+Este módulo no importa Django ni modelos: los procesos hijos se inician con `spawn` (no
+heredan las conexiones a la base ni los hilos del proceso web) y solo cargan los parsers.
+Los hijos reciben rutas de archivo y devuelven la lista de `NormalizedTaxDocument` del
+archivo (un EnvioDTE trae varios); el caché y la base se consultan siempre en el proceso que
+llama.
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from .dtos import NormalizedTaxDocument
+from .parsers import parsear_documentos
+
+
+def parsear_rutas(*, xml_ruta=None, xml_nombre=None, pdf_ruta=None, pdf_nombre=None, config_pdf=None):
+    """Parsea desde disco; un archivo ilegible queda como documento con error, no corta el lote.
+
+    El XML se lee en streaming desde la ruta, sin cargarlo completo en memoria.
+    """
+    try:
+        return parsear_documentos(
+            xml=Path(xml_ruta) if xml_ruta else None,
+            xml_name=xml_nombre,
+            pdf_bytes=Path(pdf_ruta).read_bytes() if pdf_ruta else None,
+            pdf_name=pdf_nombre,
+            config_pdf=config_pdf,
+        )
+    except Exception as exc:
+        normalized = NormalizedTaxDocument()
+        normalized.errors.append(f"No se pudo parsear {xml_nombre or pdf_nombre}: {exc}")
+        return [normalized]
+
+
+class ParseoParalelo:
+    """Reparte tandas de `parsear_rutas` entre procesos.
+
+    El pool se crea con la primera tanda de más de un archivo y se reutiliza en las
+    siguientes; con `procesos <= 1`, o dentro de un proceso daemon, todo se parsea en el
+    proceso actual.
+    """
+
+    def __init__(self, procesos):
+        self.procesos = max(1, int(procesos or 1))
+        if multiprocessing.current_process().daemon:
+            # Un proceso daemon (p. ej. un worker de `multiprocessing.Pool`) no puede crear hijos.
+            self.procesos = 1
+        self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    def parsear(self, tareas):
+        """Resultados en el mismo orden que `tareas` (diccionarios de argumentos de `parsear_rutas`)."""
+        tareas = list(tareas)
+        if self.procesos == 1 or (len(tareas) <= 1 and self._pool is None):
+            return [parsear_rutas(**tarea) for tarea in tareas]
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.procesos,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        futuros = [self._pool.submit(parsear_rutas, **tarea) for tarea in tareas]
+        return [futuro.result() for futuro in futuros]
+
+
+__all__ = ["ParseoParalelo", "parsear_rutas"]
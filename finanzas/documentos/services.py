@@ -1,20 +1,52 @@
+from django.conf import settings
+
+from .cache_parseo import guardar_resultado, hash_contenido, obtener_resultado
 from .dtos import NormalizedTaxDocument
 from .mapping import detectar_duplicados_documento, documento_initial_from_normalized, pago_initial_from_normalized, sugerencias_mapeo
-from .parsers import BheXmlParser, DteXmlParser, PdfFallbackParser, detectar_familia_xml
+from .parsers import ConfigExtraccionPdf, parsear_documentos
+
+
+def config_extraccion_pdf():
+    """`ConfigExtraccionPdf` según `DOCUMENTOS_PDF_*` en settings."""
+    return ConfigExtraccionPdf(
+        orden_por_familia=settings.DOCUMENTOS_PDF_ORDEN_EXTRACCION,
+        timeout_segundos=settings.DOCUMENTOS_PDF_TIMEOUT_SEGUNDOS,
+        memoria_mb=settings.DOCUMENTOS_PDF_MEMORIA_MB,
+        concurrencia=settings.DOCUMENTOS_PDF_CONCURRENCIA,
+    )
+
+
+def _parsear_con_cache(*, xml_bytes, xml_name, pdf_bytes, pdf_name):
+    # El XML manda aunque venga también el PDF: la clave del caché es el archivo que se parsea.
+    origen, contenido, nombre = ("xml", xml_bytes, xml_name) if xml_bytes else ("pdf", pdf_bytes, pdf_name)
+    clave = hash_contenido(contenido)
+    documentos = obtener_resultado(hash_contenido=clave, origen=origen, nombre_archivo=nombre)
+    if documentos is None:
+        documentos = parsear_documentos(
+            xml=xml_bytes,
+            xml_name=xml_name,
+            pdf_bytes=pdf_bytes,
+            pdf_name=pdf_name,
+            config_pdf=config_extraccion_pdf(),
+        )
+        guardar_resultado(hash_contenido=clave, origen=origen, documentos=documentos)
+    return documentos
 
 
 def parse_tax_document(*, xml_bytes=None, xml_name=None, pdf_bytes=None, pdf_name=None, organizacion_id=None):
-    if xml_bytes:
-        familia = detectar_familia_xml(xml_bytes)
-        if familia == "dte":
-            normalized = DteXmlParser().parse(xml_bytes=xml_bytes, xml_name=xml_name, pdf_bytes=pdf_bytes, pdf_name=pdf_name)
-        elif familia == "bhe":
-            normalized = BheXmlParser().parse(xml_bytes=xml_bytes, xml_name=xml_name, pdf_bytes=pdf_bytes, pdf_name=pdf_name)
-        else:
-            normalized = NormalizedTaxDocument()
-            normalized.errors.append("No se pudo reconocer la familia del XML.")
-    elif pdf_bytes:
-        normalized = PdfFallbackParser().parse(pdf_bytes=pdf_bytes, pdf_name=pdf_name)
+    """Primer documento del archivo, con duplicados y sugerencias para la revisión individual.
+
+    Un EnvioDTE con varios DTE deja `documentos_en_archivo` en `metadata_archivo` y un aviso;
+    la importación en lote (`finanzas.documentos.lote`) carga todos.
+    """
+    if xml_bytes or pdf_bytes:
+        documentos = _parsear_con_cache(xml_bytes=xml_bytes, xml_name=xml_name, pdf_bytes=pdf_bytes, pdf_name=pdf_name)
+        normalized = documentos[0]
+        if len(documentos) > 1:
+            normalized.warnings.append(
+                f"El XML contiene {len(documentos)} documentos; aqui se revisa solo el primero. "
+                "Usa la importacion en lote para cargarlos todos."
+            )
     else:
         normalized = NormalizedTaxDocument()
         normalized.errors.append("No se recibio ningun archivo para parsear.")
@@ -1,44 +1,107 @@
+"""Importaciones de documentos tributarios en revisión.
+
+Los archivos subidos quedan en `MEDIA_ROOT/finanzas/importaciones_tmp/<token>/` y la revisión
+(payload normalizado, valores iniciales, filas del lote) en `ImportacionTemporal`, con dueño y
+vencimiento. La sesión solo guarda la lista de tokens abiertos, así que no crece con el payload.
+`limpiar_importaciones_temporales` borra las vencidas y los directorios sin registro.
+"""
+
 import json
 import shutil
 import uuid
+from datetime import timedelta
 from pathlib import Path
 
 from django.conf import settings
+from django.utils import timezone
+
+from finanzas.models import ImportacionTemporal
 
 
 SESSION_KEY = "finanzas_importaciones_documentos"
+# Tokens recordados por sesión; los más antiguos se olvidan y el barrido borra sus datos al vencer.
+MAX_TOKENS_SESION = 20
 
 
-def _session_bucket(request):
-    return request.session.setdefault(SESSION_KEY, {})
+def _directorio_base():
+    return Path(settings.MEDIA_ROOT) / "finanzas" / "importaciones_tmp"
 
 
-def guardar_importacion_temporal(request, *, xml_file=None, pdf_file=None, payload=None):
+def _tokens_sesion(request):
+    tokens = request.session.get(SESSION_KEY)
+    # Las sesiones anteriores guardaban aquí un diccionario con el payload completo.
+    return list(tokens) if isinstance(tokens, list) else []
+
+
+def _guardar_tokens_sesion(request, tokens):
+    request.session[SESSION_KEY] = tokens[-MAX_TOKENS_SESION:]
+
+
+def _serializable(payload):
+    return json.loads(json.dumps(payload or {}, default=str))
+
+
+def _nuevo_directorio():
     token = uuid.uuid4().hex
-    base_dir = Path(settings.MEDIA_ROOT) / "finanzas" / "importaciones_tmp" / token
+    base_dir = _directorio_base() / token
     base_dir.mkdir(parents=True, exist_ok=True)
-    payload_serializable = json.loads(json.dumps(payload or {}, default=str))
-    info = {"payload": payload_serializable, "files": {}}
+    return token, base_dir
+
+
+def _crear_importacion(request, token, base_dir, *, payload=None, archivos=None):
+    ImportacionTemporal.objects.create(
+        token=token,
+        usuario=request.user,
+        payload=_serializable(payload),
+        archivos=archivos or {},
+        directorio=str(base_dir),
+        expira_en=timezone.now() + timedelta(hours=settings.DOCUMENTOS_IMPORTACION_HORAS_VIGENCIA),
+    )
+    _guardar_tokens_sesion(request, [*_tokens_sesion(request), token])
+
+
+def _importacion(request, token):
+    """La importación vigente de este usuario y esta sesión, o `None`."""
+    if not token or token not in _tokens_sesion(request):
+        return None
+    return ImportacionTemporal.objects.filter(
+        token=token,
+        usuario_id=request.user.pk,
+        expira_en__gt=timezone.now(),
+    ).first()
+
+
+def reservar_importacion_temporal(request):
+    """Crea una importación vacía y devuelve `(token, directorio)` para que el llamador escriba sus archivos."""
+    token, base_dir = _nuevo_directorio()
+    _crear_importacion(request, token, base_dir)
+    return token, base_dir
+
+
+def _guardar_archivo(base_dir, archivo):
+    ruta = base_dir / archivo.name
+    with ruta.open("wb") as output:
+        for chunk in archivo.chunks():
+            output.write(chunk)
+    return {"path": str(ruta), "name": archivo.name}
+
+
+def guardar_importacion_temporal(request, *, xml_file=None, pdf_file=None, payload=None):
+    token, base_dir = _nuevo_directorio()
+    archivos = {}
     if xml_file:
-        xml_path = base_dir / xml_file.name
-        with xml_path.open("wb") as output:
-            for chunk in xml_file.chunks():
-                output.write(chunk)
-        info["files"]["xml"] = {"path": str(xml_path), "name": xml_file.name}
+        archivos["xml"] = _guardar_archivo(base_dir, xml_file)
     if pdf_file:
-        pdf_path = base_dir / pdf_file.name
-        with pdf_path.open("wb") as output:
-            for chunk in pdf_file.chunks():
-                output.write(chunk)
-        info["files"]["pdf"] = {"path": str(pdf_path), "name": pdf_file.name}
-    bucket = _session_bucket(request)
-    bucket[token] = info
-    request.session.modified = True
+        archivos["pdf"] = _guardar_archivo(base_dir, pdf_file)
+    _crear_importacion(request, token, base_dir, payload=payload, archivos=archivos)
     return token
 
 
 def cargar_importacion_temporal(request, token):
-    return _session_bucket(request).get(token)
+    importacion = _importacion(request, token)
+    if importacion is None:
+        return None
+    return {"payload": importacion.payload, "files": importacion.archivos, "directorio": importacion.directorio}
 
 
 def cargar_archivo_importacion_temporal(request, token, tipo_archivo):
@@ -55,23 +118,51 @@ def cargar_archivo_importacion_temporal(request, token, tipo_archivo):
 
 
 def actualizar_payload_importacion(request, token, payload):
-    bucket = _session_bucket(request)
-    if token in bucket:
-        bucket[token]["payload"] = payload
-        request.session.modified = True
+    if token in _tokens_sesion(request):
+        ImportacionTemporal.objects.filter(token=token, usuario_id=request.user.pk).update(
+            payload=_serializable(payload)
+        )
 
 
 def eliminar_importacion_temporal(request, token):
-    bucket = _session_bucket(request)
-    info = bucket.pop(token, None)
-    request.session.modified = True
-    if not info:
+    tokens = _tokens_sesion(request)
+    if token not in tokens:
+        return
+    _guardar_tokens_sesion(request, [item for item in tokens if item != token])
+    importacion = ImportacionTemporal.objects.filter(token=token, usuario_id=request.user.pk).first()
+    if importacion is None:
         return
-    files = info.get("files", {})
-    path = None
-    if files.get("xml"):
-        path = Path(files["xml"]["path"]).parent
-    elif files.get("pdf"):
-        path = Path(files["pdf"]["path"]).parent
-    if path and path.exists():
-        shutil.rmtree(path, ignore_errors=True)
+    shutil.rmtree(importacion.directorio, ignore_errors=True)
+    importacion.delete()
+
+
+def limpiar_importaciones_temporales(*, ahora=None, aplicar=True):
+    """Borra las importaciones vencidas y los directorios de `importaciones_tmp` sin registro.
+
+    Un directorio sin registro solo se borra si lleva más de `DOCUMENTOS_IMPORTACION_HORAS_VIGENCIA`
+    sin cambios, para no tocar una subida que todavía se está escribiendo. Con `aplicar=False`
+    solo cuenta. Devuelve `{"vencidas": n, "huerfanos": n}`.
+    """
+    ahora = ahora or timezone.now()
+    vencidas = list(ImportacionTemporal.objects.filter(expira_en__lte=ahora).values_list("token", "directorio"))
+    limite = (ahora - timedelta(hours=settings.DOCUMENTOS_IMPORTACION_HORAS_VIGENCIA)).timestamp()
+    huerfanos = []
+    base = _directorio_base()
+    if base.is_dir():
+        vigentes = set(ImportacionTemporal.objects.filter(expira_en__gt=ahora).values_list("token", flat=True))
+        vencidos = {token for token, _directorio in vencidas}
+        huerfanos = [
+            ruta
+            for ruta in base.iterdir()
+            if ruta.is_dir()
+            and ruta.name not in vigentes
+            and ruta.name not in vencidos
+            and ruta.stat().st_mtime < limite
+        ]
+    if aplicar:
+        for _token, directorio in vencidas:
+            shutil.rmtree(directorio, ignore_errors=True)
+        for ruta in huerfanos:
+            shutil.rmtree(ruta, ignore_errors=True)
+        ImportacionTemporal.objects.filter(token__in=[token for token, _directorio in vencidas]).delete()
+    return {"vencidas": len(vencidas), "huerfanos": len(huerfanos)}
@@ -0,0 +1,116 @@
+"""Exportaciones financieras: se entregan en línea o desde la cola de `exportaciones`."""
+
+from asistencias.selectors import resumen_profesores_periodo_queryset
+from asistencias.services.exportaciones import PAGOS_PROFESORES_XLSX_HEADERS, filas_export_pagos_profesores
+from exportaciones.registro import registrar_exportacion
+from plataformaelemental.context import descripcion_periodo, organizacion_desde_request, resolver_periodo
+from plataformaelemental.exports import (
+    FORMATO_CSV,
+    FORMATO_XLSX,
+    Exportacion,
+    iterar_en_bloques,
+    periodo_sufijo_archivo,
+)
+
+from .decorators import exportar_finanzas_required
+from .selectors import libro_caja_queryset, pagos_export_queryset, transacciones_export_queryset
+from .services.reportes import (
+    LIBRO_CAJA_CSV_HEADERS,
+    PAGOS_ALUMNOS_XLSX_HEADERS,
+    PAGOS_CSV_HEADERS,
+    TRANSACCIONES_CSV_HEADERS,
+    TRANSACCIONES_XLSX_HEADERS,
+    filas_export_libro_caja,
+    filas_export_pagos,
+    filas_export_pagos_alumnos_xlsx,
+    filas_export_transacciones,
+    filas_export_transacciones_xlsx,
+)
+
+
+@registrar_exportacion("finanzas.pagos_csv", permiso=exportar_finanzas_required)
+def exportacion_pagos_csv(request):
+    organizacion = organizacion_desde_request(request)
+    pagos = pagos_export_queryset(request, organizacion=organizacion)
+    return Exportacion(
+        formato=FORMATO_CSV,
+        filename="pagos_finanzas.csv",
+        headers=PAGOS_CSV_HEADERS,
+        rows=filas_export_pagos(iterar_en_bloques(pagos)),
+    )
+
+
+@registrar_exportacion("finanzas.pagos_alumnos_xlsx", permiso=exportar_finanzas_required)
+def exportacion_pagos_alumnos_xlsx(request):
+    periodo = resolver_periodo(request)
+    organizacion = organizacion_desde_request(request)
+    pagos = pagos_export_queryset(request, organizacion=organizacion)
+    return Exportacion(
+        formato=FORMATO_XLSX,
+        filename=f"pagos_alumnos_{periodo_sufijo_archivo(periodo)}.xlsx",
+        sheet_title="Pagos alumnos",
+        headers=PAGOS_ALUMNOS_XLSX_HEADERS,
+        rows=filas_export_pagos_alumnos_xlsx(iterar_en_bloques(pagos)),
+    )
+
+
+@registrar_exportacion("finanzas.transacciones_csv", permiso=exportar_finanzas_required)
+def exportacion_transacciones_csv(request):
+    organizacion = organizacion_desde_request(request)
+    transacciones = transacciones_export_queryset(request, organizacion=organizacion)
+    return Exportacion(
+        formato=FORMATO_CSV,
+        filename="transacciones_finanzas.csv",
+        headers=TRANSACCIONES_CSV_HEADERS,
+        rows=filas_export_transacciones(iterar_en_bloques(transacciones)),
+    )
+
+
+@registrar_exportacion("finanzas.transacciones_xlsx", permiso=exportar_finanzas_required)
+def exportacion_transacciones_xlsx(request):
+    periodo = resolver_periodo(request)
+    organizacion = organizacion_desde_request(request)
+    transacciones = transacciones_export_queryset(request, organizacion=organizacion)
+    return Exportacion(
+        formato=FORMATO_XLSX,
+        filename=f"transacciones_{periodo_sufijo_archivo(periodo)}.xlsx",
+        sheet_title="Transacciones",
+        headers=TRANSACCIONES_XLSX_HEADERS,
+        rows=filas_export_transacciones_xlsx(iterar_en_bloques(transacciones)),
+    )
+
+
+@registrar_exportacion("finanzas.pagos_profesores_xlsx", permiso=exportar_finanzas_required)
+def exportacion_pagos_profesores_xlsx(request):
+    periodo = resolver_periodo(request)
+    organizacion = organizacion_desde_request(request)
+    roles, asistencias_por_profesor, sesiones_por_profesor, disciplinas_por_profesor = (
+        resumen_profesores_periodo_queryset(request, organizacion=organizacion)
+    )
+    return Exportacion(
+        formato=FORMATO_XLSX,
+        filename=f"estimacion_pagos_profesores_{periodo_sufijo_archivo(periodo)}.xlsx",
+        sheet_title="Estimacion profesores",
+        headers=PAGOS_PROFESORES_XLSX_HEADERS,
+        rows=filas_export_pagos_profesores(
+            roles,
+            asistencias_por_profesor=asistencias_por_profesor,
+            sesiones_por_profesor=sesiones_por_profesor,
+            disciplinas_por_profesor=disciplinas_por_profesor,
+            periodo_descripcion=descripcion_periodo(request=request, corta=True),
+        ),
+    )
+
+
+@registrar_exportacion("finanzas.libro_caja_csv", permiso=exportar_finanzas_required)
+def exportacion_libro_caja_csv(request):
+    organizacion = organizacion_desde_request(request)
+    transacciones = libro_caja_queryset(request, organizacion=organizacion)
+    return Exportacion(
+        formato=FORMATO_CSV,
+        filename="libro_caja.csv",
+        headers=LIBRO_CAJA_CSV_HEADERS,
+        rows=filas_export_libro_caja(iterar_en_bloques(transacciones)),
+        content_type="text/csv; charset=utf-8",
+        bom=True,
+    )
@@ -7,6 +7,7 @@ from django.utils import timezone
 from decimal import Decimal, InvalidOperation
 
 from personas.models import Organizacion, Persona, PersonaRol
+from plataformaelemental.context import aplicar_periodo
 
 from .models import Category, DocumentoTributario, Payment, PaymentPlan, Transaction
 
@@ -15,10 +16,7 @@ def _documentos_para_asociacion(*, organizacion=None, periodo_mes=None, periodo_
     queryset = DocumentoTributario.objects.order_by("-fecha_emision", "-id")
     if organizacion is not None:
         queryset = queryset.filter(organizacion=organizacion)
-    if periodo_anio is not None:
-        queryset = queryset.filter(fecha_emision__year=periodo_anio)
-    if periodo_mes is not None:
-        queryset = queryset.filter(fecha_emision__month=periodo_mes)
+    queryset = aplicar_periodo(queryset, "fecha_emision", mes=periodo_mes, anio=periodo_anio)
     documentos_actuales = [pk for pk in (documentos_actuales or []) if pk]
     if documentos_actuales:
         queryset = DocumentoTributario.objects.filter(Q(pk__in=queryset.values("pk")) | Q(pk__in=documentos_actuales))
@@ -572,3 +570,13 @@ class DocumentoTributarioImportConfirmForm(forms.Form):
         initial=False,
         label="Guardar tambien el pago sugerido",
     )
+
+
+class DocumentoTributarioLoteUploadForm(forms.Form):
+    archivo = forms.FileField(label="Archivo ZIP")
+
+    def clean_archivo(self):
+        archivo = self.cleaned_data["archivo"]
+        if not (archivo.name or "").lower().endswith(".zip"):
+            raise forms.ValidationError("Sube un archivo .zip con los XML y PDF del lote.")
+        return archivo
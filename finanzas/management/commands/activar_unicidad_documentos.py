@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from finanzas.services.documentos import (
+    INDICE_UNICO_CLAVE,
+    conflictos_clave_documentos,
+    crear_indice_unico_clave,
+    estado_indice_unico_clave,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Crea el índice único de documentos tributarios sobre organización, tipo, folio y RUT emisor "
+        "normalizado. Sin --aplicar solo lista los documentos que lo impiden."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--aplicar",
+            action="store_true",
+            help="Crea el índice si no hay conflictos. Sin esta opción solo informa.",
+        )
+
+    def handle(self, *args, **options):
+        estado = estado_indice_unico_clave()
+        if estado:
+            self.stdout.write(self.style.SUCCESS(f"El índice {INDICE_UNICO_CLAVE} ya existe."))
+            return
+        if estado is False:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"El índice {INDICE_UNICO_CLAVE} quedó inválido tras un intento fallido y no impone la "
+                    "unicidad; --aplicar lo borra y lo vuelve a crear."
+                )
+            )
+
+        conflictos = conflictos_clave_documentos()
+        for grupo in conflictos:
+            self.stdout.write(
+                f"  - organizacion_id={grupo['organizacion_id']}, tipo={grupo['tipo_documento']}, "
+                f"folio={grupo['folio']}, rut={grupo['rut_emisor_normalizado'] or '-'}: "
+                f"documentos {', '.join(f'#{pk}' for pk in grupo['ids'])}"
+            )
+        if conflictos:
+            raise CommandError(
+                f"{len(conflictos)} claves repetidas; fusione o corrija esos documentos antes de crear el índice."
+            )
+        if not options["aplicar"]:
+            self.stdout.write(self.style.WARNING("Sin conflictos; use --aplicar para crear el índice."))
+            return
+        crear_indice_unico_clave()
+        self.stdout.write(self.style.SUCCESS(f"Índice {INDICE_UNICO_CLAVE} creado."))
@@ -0,0 +1,77 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from finanzas.documentos.lote import extraer_archivos_lote, preparar_lote
+from finanzas.services.documentos import importar_lote_documentos
+from personas.models import Organizacion
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa en lote los XML/PDF tributarios de un ZIP o un directorio. "
+        "Sin --aplicar solo muestra la revisión."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("origen", help="Archivo .zip o directorio con XML y PDF.")
+        parser.add_argument("--organizacion", type=int, required=True, help="ID de la organización.")
+        parser.add_argument(
+            "--procesos",
+            type=int,
+            default=None,
+            help="Procesos para parsear (por defecto DOCUMENTOS_LOTE_PROCESOS).",
+        )
+        parser.add_argument(
+            "--aplicar",
+            action="store_true",
+            help="Inserta los documentos sin errores ni duplicados. Sin esta opción solo muestra la revisión.",
+        )
+
+    def handle(self, *args, **options):
+        organizacion = Organizacion.objects.filter(pk=options["organizacion"]).first()
+        if not organizacion:
+            raise CommandError("La organización indicada no existe.")
+        origen = Path(options["origen"])
+        if not origen.exists():
+            raise CommandError(f"No existe {origen}.")
+
+        with TemporaryDirectory() as temporal:
+            try:
+                archivos = extraer_archivos_lote(origen, Path(temporal) / "lote")
+            except ValidationError as exc:
+                raise CommandError(" ".join(exc.messages)) from exc
+            filas = preparar_lote(archivos, organizacion_id=organizacion.pk, procesos=options["procesos"])
+            self._mostrar(filas)
+            if not options["aplicar"]:
+                self.stdout.write(self.style.WARNING("No se modificaron datos; use --aplicar para importar."))
+                return
+            resultado = importar_lote_documentos(usuario=None, organizacion=organizacion, filas=filas)
+
+        for omitido in resultado["omitidos"]:
+            self.stdout.write(f"  omitida fila {omitido['indice']}: {omitido['motivo']}")
+        self.stdout.write(
+            self.style.SUCCESS(f"Importación completada: {len(resultado['creados'])} documentos creados.")
+        )
+
+    def _mostrar(self, filas):
+        sugeridas = sum(1 for fila in filas if fila["sugerida"])
+        self.stdout.write(f"PREVIEW: {len(filas)} documentos, {sugeridas} se importarían.")
+        for fila in filas:
+            documento = fila["documento"]
+            if fila["errores"]:
+                estado = "error: " + " | ".join(fila["errores"])
+            elif fila["duplicados"]:
+                estado = "duplicado de " + ", ".join(f"#{item['id']}" for item in fila["duplicados"])
+            elif fila["duplicado_de"] is not None:
+                estado = f"repetido en el lote (fila {fila['duplicado_de']})"
+            else:
+                estado = "ok"
+            self.stdout.write(
+                f"  [{fila['indice']}] {fila['xml'] or fila['pdf']}"
+                f"{' + ' + fila['pdf'] if fila['xml'] and fila['pdf'] else ''}: "
+                f"{documento['tipo_documento']} folio={documento['folio'] or '-'} "
+                f"total={documento['monto_total']} -> {estado}"
+            )
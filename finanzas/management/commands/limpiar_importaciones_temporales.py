@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from finanzas.documentos.temp_storage import limpiar_importaciones_temporales
+
+
+class Command(BaseCommand):
+    help = (
+        "Borra las importaciones de documentos tributarios vencidas y los directorios de "
+        "importaciones_tmp sin registro. Sin --aplicar solo muestra cuántos hay."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--aplicar",
+            action="store_true",
+            help="Borra los registros y archivos. Sin esta opción solo los cuenta.",
+        )
+
+    def handle(self, *args, **options):
+        resultado = limpiar_importaciones_temporales(aplicar=options["aplicar"])
+        self.stdout.write(
+            f"Importaciones vencidas: {resultado['vencidas']}; directorios sin registro: {resultado['huerfanos']}."
+        )
+        if not options["aplicar"]:
+            self.stdout.write(self.style.WARNING("No se modificaron datos; use --aplicar para borrar."))
+            return
+        self.stdout.write(self.style.SUCCESS("Limpieza completada."))
@@ -1,16 +1,68 @@
+from datetime import date
+
+from django.core.exceptions import ValidationError
 from django.core.management.base import BaseCommand, CommandError
 
+from finanzas.models import EjecucionReconciliacion
 from finanzas.services.reconciliacion import reconciliar_integridad_dominio
+from personas.models import Organizacion
 
 
 class Command(BaseCommand):
     help = "Diagnostica inconsistencias entre asistencias, consumos y pagos sin modificar datos."
 
+    def add_arguments(self, parser):
+        parser.add_argument("--organizacion", type=int, help="ID de la organización a revisar (por defecto: todas).")
+        parser.add_argument(
+            "--desde",
+            type=date.fromisoformat,
+            help="Fecha ISO inicial (inclusive) de clases y pagos revisados.",
+        )
+        parser.add_argument(
+            "--hasta",
+            type=date.fromisoformat,
+            help="Fecha ISO final (inclusive) de clases y pagos revisados.",
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help=(
+                "Revisa solo lo modificado desde la última marca de agua, guarda los hallazgos "
+                "y muestra todos los que siguen abiertos."
+            ),
+        )
+
     def handle(self, *args, **options):
-        resultado = reconciliar_integridad_dominio()
-        self.stdout.write("Reconciliación de integridad de dominio (solo lectura)")
+        organizacion = None
+        if options["organizacion"] is not None:
+            organizacion = Organizacion.objects.filter(pk=options["organizacion"]).first()
+            if not organizacion:
+                raise CommandError("La organización indicada no existe.")
+        if options["desde"] and options["hasta"] and options["desde"] > options["hasta"]:
+            raise CommandError("--desde no puede ser posterior a --hasta.")
+
+        tiempos = {}
+        try:
+            resultado = reconciliar_integridad_dominio(
+                organizacion=organizacion,
+                desde=options["desde"],
+                hasta=options["hasta"],
+                tiempos=tiempos,
+                incremental=options["incremental"],
+            )
+        except ValidationError as exc:
+            raise CommandError(" ".join(exc.messages)) from exc
+        if options["incremental"]:
+            ejecucion = EjecucionReconciliacion.objects.order_by("-marca_agua", "-id").first()
+            self.stdout.write(
+                f"Reconciliación {ejecucion.get_modo_display().lower()} de integridad de dominio "
+                f"(marca de agua {ejecucion.marca_agua:%Y-%m-%d %H:%M:%S}, "
+                f"{ejecucion.consumos_revisados} consumos y {ejecucion.pagos_revisados} pagos revisados)"
+            )
+        else:
+            self.stdout.write("Reconciliación de integridad de dominio (solo lectura)")
         for tipo, total in resultado["resumen"].items():
-            self.stdout.write(f"{tipo}: {total}")
+            self.stdout.write(f"{tipo}: {total} ({tiempos.get(tipo, 0):.3f} s)")
             for referencia in resultado["detalle"][tipo]:
                 campos = ", ".join(
                     f"{clave}={valor}" for clave, valor in referencia.items()
@@ -0,0 +1,55 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from finanzas.services.resumen_mensual import reconstruir_resumenes_mensuales
+from personas.models import Organizacion
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula el resumen financiero mensual materializado de los meses cerrados. "
+        "Sin --aplicar solo compara lo guardado con el cálculo en vivo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--organizacion", type=int, help="ID de la organización (por defecto: todas).")
+        parser.add_argument("--anio", type=int, required=True)
+        parser.add_argument("--mes", type=int, help="Mes a reconstruir (por defecto: todo el año).")
+        parser.add_argument(
+            "--aplicar",
+            action="store_true",
+            help="Escribe los resúmenes. Sin esta opción solo muestra el estado.",
+        )
+
+    def handle(self, *args, **options):
+        if options["mes"] is not None and options["mes"] not in range(1, 13):
+            raise CommandError("El mes debe estar entre 1 y 12.")
+        organizacion = None
+        if options["organizacion"] is not None:
+            organizacion = Organizacion.objects.filter(pk=options["organizacion"]).first()
+            if not organizacion:
+                raise CommandError("La organización indicada no existe.")
+        anio = options["anio"]
+        desde = date(anio, options["mes"] or 1, 1)
+        hasta = date(anio, options["mes"] or 12, 1)
+
+        resultado = reconstruir_resumenes_mensuales(
+            desde=desde,
+            hasta=hasta,
+            organizacion=organizacion,
+            aplicar=options["aplicar"],
+        )
+
+        modo = "APLICADO" if resultado["aplicado"] else "PREVIEW"
+        self.stdout.write(f"{modo}: resumen financiero mensual, {resultado['meses']} meses cerrados")
+        for fila in resultado["filas"]:
+            self.stdout.write(
+                "  - {anio}-{mes:02d} organizacion={organizacion_id}: {estado}".format(**fila)
+            )
+        if not resultado["aplicado"]:
+            self.stdout.write(self.style.WARNING("No se modificaron datos; use --aplicar para escribir."))
+            return
+        self.stdout.write(
+            self.style.SUCCESS(f"Resumen reconstruido: {len(resultado['filas'])} filas escritas.")
+        )
@@ -0,0 +1,56 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from finanzas.services.reimputacion import reimputar_consumos_mes
+from personas.models import Organizacion
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula en bloque los consumos de clases de una organización y mes. "
+        "Sin --aplicar solo muestra el diff."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--organizacion", type=int, required=True, help="ID de la organización.")
+        parser.add_argument("--anio", type=int, required=True)
+        parser.add_argument("--mes", type=int, required=True)
+        parser.add_argument(
+            "--aplicar",
+            action="store_true",
+            help="Escribe los cambios. Sin esta opción solo muestra el diff.",
+        )
+
+    def handle(self, *args, **options):
+        if options["mes"] not in range(1, 13):
+            raise CommandError("El mes debe estar entre 1 y 12.")
+        organizacion = Organizacion.objects.filter(pk=options["organizacion"]).first()
+        if not organizacion:
+            raise CommandError("La organización indicada no existe.")
+        try:
+            resultado = reimputar_consumos_mes(
+                organizacion=organizacion,
+                anio=options["anio"],
+                mes=options["mes"],
+                aplicar=options["aplicar"],
+            )
+        except ValidationError as exc:
+            raise CommandError(" ".join(exc.messages)) from exc
+
+        modo = "APLICADO" if resultado["aplicado"] else "PREVIEW"
+        self.stdout.write(
+            f"{modo}: reimputación {resultado['anio']}-{resultado['mes']:02d} organizacion={organizacion.pk}"
+        )
+        for clave, valor in resultado["resumen"].items():
+            self.stdout.write(f"{clave}: {valor}")
+        for cambio in resultado["cambios"]:
+            self.stdout.write(
+                "  - asistencia={asistencia_id} persona={persona_id} fecha={clase_fecha}: "
+                "{estado_anterior}/{pago_anterior_id} -> {estado_nuevo}/{pago_nuevo_id}".format(**cambio)
+            )
+        if not resultado["aplicado"]:
+            self.stdout.write(self.style.WARNING("No se modificaron datos; use --aplicar para escribir."))
+            return
+        self.stdout.write(
+            self.style.SUCCESS(f"Reimputación completada: {len(resultado['cambios'])} consumos modificados.")
+        )
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from finanzas.services.contadores import pagos_con_contador_desincronizado, recalcular_clases_consumidas
+from personas.models import Organizacion
+from plataformaelemental.cache_selectores import invalidar_selectores
+
+
+class Command(BaseCommand):
+    help = (
+        "Verifica Payment.clases_consumidas contra los consumos reales. "
+        "Con --aplicar reconstruye los contadores desincronizados."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--organizacion", type=int, help="Limita la verificación a una organización.")
+        parser.add_argument(
+            "--aplicar",
+            action="store_true",
+            help="Reconstruye los contadores desincronizados. Sin esta opción solo informa.",
+        )
+
+    def handle(self, *args, **options):
+        organizacion = None
+        if options.get("organizacion"):
+            organizacion = Organizacion.objects.filter(pk=options["organizacion"]).first()
+            if not organizacion:
+                raise CommandError("La organización indicada no existe.")
+
+        with transaction.atomic():
+            desincronizados = pagos_con_contador_desincronizado(organizacion=organizacion)
+            for item in desincronizados:
+                self.stdout.write(
+                    f"  - pago_id={item['pk']}, organizacion_id={item['organizacion_id']}, "
+                    f"contador={item['clases_consumidas']}, real={item['consumidos_reales']}"
+                )
+            if desincronizados and options["aplicar"]:
+                recalcular_clases_consumidas(pago_ids=[item["pk"] for item in desincronizados])
+                invalidar_selectores({item["organizacion_id"] for item in desincronizados})
+
+        if not desincronizados:
+            self.stdout.write(self.style.SUCCESS("Contadores de clases consumidas sincronizados."))
+            return
+        if not options["aplicar"]:
+            raise CommandError(f"{len(desincronizados)} pagos con contador desincronizado; use --aplicar para reconstruir.")
+        self.stdout.write(self.style.SUCCESS(f"Contadores reconstruidos: {len(desincronizados)} pagos."))
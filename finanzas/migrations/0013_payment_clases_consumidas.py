@@ -0,0 +1,32 @@
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def poblar_clases_consumidas(apps, schema_editor):
+    Payment = apps.get_model("finanzas", "Payment")
+    AttendanceConsumption = apps.get_model("finanzas", "AttendanceConsumption")
+    consumidos = (
+        AttendanceConsumption.objects.filter(pago_id=OuterRef("pk"), estado="consumido")
+        .order_by()
+        .values("pago_id")
+        .annotate(total=Count("id"))
+        .values("total")[:1]
+    )
+    Payment.objects.update(clases_consumidas=Coalesce(Subquery(consumidos), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("finanzas", "0012_payment_clave_idempotencia_payment_disciplina_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="payment",
+            name="clases_consumidas",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(poblar_clases_consumidas, migrations.RunPython.noop),
+    ]
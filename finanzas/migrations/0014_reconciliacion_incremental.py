@@ -0,0 +1,73 @@
+# Generated by Django 5.2.9 on 2026-10-16 23:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('asistencias', '0005_reparar_schema_0004_aplicada_precommit'),
+        ('finanzas', '0013_payment_clases_consumidas'),
+        ('personas', '0009_solicitudacceso_resolucion_organizacion_rol'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EjecucionReconciliacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('iniciada_en', models.DateTimeField(auto_now_add=True)),
+                ('marca_agua', models.DateTimeField()),
+                ('modo', models.CharField(choices=[('completa', 'Completa'), ('incremental', 'Incremental')], max_length=20)),
+                ('consumos_revisados', models.PositiveIntegerField(default=0)),
+                ('pagos_revisados', models.PositiveIntegerField(default=0)),
+                ('hallazgos_abiertos', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Ejecución de reconciliación',
+                'verbose_name_plural': 'Ejecuciones de reconciliación',
+                'ordering': ['-marca_agua', '-id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='HallazgoReconciliacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(max_length=60)),
+                ('clave', models.CharField(max_length=60)),
+                ('detalle', models.JSONField(default=dict)),
+                ('detectado_en', models.DateTimeField(auto_now_add=True)),
+                ('revisado_en', models.DateTimeField(auto_now=True)),
+                ('resuelto_en', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Hallazgo de reconciliación',
+                'verbose_name_plural': 'Hallazgos de reconciliación',
+                'ordering': ['tipo', 'id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='attendanceconsumption',
+            index=models.Index(fields=['actualizado_en'], name='finanzas_at_actuali_2fcfa0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['actualizado_en'], name='finanzas_pa_actuali_0d9f34_idx'),
+        ),
+        migrations.AddField(
+            model_name='hallazgoreconciliacion',
+            name='organizacion',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='hallazgos_reconciliacion', to='personas.organizacion'),
+        ),
+        migrations.AddIndex(
+            model_name='hallazgoreconciliacion',
+            index=models.Index(fields=['resuelto_en', 'tipo'], name='finanzas_ha_resuelt_4cb03c_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='hallazgoreconciliacion',
+            constraint=models.UniqueConstraint(fields=('tipo', 'clave'), name='finanzas_hallazgo_tipo_clave_unico'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.9 on 2026-10-17 00:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finanzas', '0014_reconciliacion_incremental'),
+        ('personas', '0009_solicitudacceso_resolucion_organizacion_rol'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenFinancieroMensual',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('anio', models.PositiveSmallIntegerField()),
+                ('mes', models.PositiveSmallIntegerField()),
+                ('ingresos_contables', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('egresos_contables', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('iva_debito', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('pagos_operacionales_monto', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_pagos_operacionales', models.PositiveIntegerField(default=0)),
+                ('total_transacciones', models.PositiveIntegerField(default=0)),
+                ('clases_pagadas', models.PositiveIntegerField(default=0)),
+                ('deuda_clases', models.PositiveIntegerField(default=0)),
+                ('total_documentos_periodo', models.PositiveIntegerField(default=0)),
+                ('documentos_con_transaccion', models.PositiveIntegerField(default=0)),
+                ('transacciones_sin_documento', models.PositiveIntegerField(default=0)),
+                ('transacciones_con_documento_fuera_periodo', models.PositiveIntegerField(default=0)),
+                ('pagos_con_documento_fuera_periodo', models.PositiveIntegerField(default=0)),
+                ('calculado_en', models.DateTimeField(auto_now=True)),
+                ('organizacion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_financieros_mensuales', to='personas.organizacion')),
+            ],
+            options={
+                'verbose_name': 'Resumen financiero mensual',
+                'verbose_name_plural': 'Resúmenes financieros mensuales',
+                'ordering': ['-anio', '-mes', 'organizacion_id'],
+                'constraints': [models.UniqueConstraint(fields=('organizacion', 'anio', 'mes'), name='finanzas_resumen_mensual_unico')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.9 on 2026-10-17 00:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finanzas', '0015_resumen_financiero_mensual'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResultadoParseoDocumento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hash_contenido', models.CharField(max_length=64)),
+                ('origen', models.CharField(max_length=10)),
+                ('version_parser', models.CharField(max_length=20)),
+                ('resultado', models.JSONField()),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Resultado de parseo de documento',
+                'verbose_name_plural': 'Resultados de parseo de documentos',
+                'constraints': [models.UniqueConstraint(fields=('hash_contenido', 'origen', 'version_parser'), name='finanzas_parseo_contenido_version_unico')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.9 on 2026-10-17 01:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finanzas', '0016_resultado_parseo_documento'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportacionTemporal',
+            fields=[
+                ('token', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('archivos', models.JSONField(blank=True, default=dict)),
+                ('directorio', models.CharField(max_length=500)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('expira_en', models.DateTimeField(db_index=True)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='importaciones_temporales', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Importación temporal de documentos',
+                'verbose_name_plural': 'Importaciones temporales de documentos',
+            },
+        ),
+    ]
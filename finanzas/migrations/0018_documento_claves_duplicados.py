@@ -0,0 +1,57 @@
+from django.db import migrations, models
+from django.db.models import F, Func, Q, Value
+from django.db.models.fields.json import KT
+from django.db.models.functions import Coalesce, Upper
+
+ARCHIVO = "metadata_extra__importacion_normalizada__metadata_archivo"
+
+
+def poblar_claves_duplicados(apps, schema_editor):
+    """Mismo resultado que `DocumentoTributario.completar_campos_calculados`, con dos UPDATE."""
+    DocumentoTributario = apps.get_model("finanzas", "DocumentoTributario")
+    DocumentoTributario.objects.update(
+        rut_emisor_normalizado=Upper(
+            Func(F("rut_emisor"), Value("[^[:alnum:]]"), Value(""), Value("g"), function="regexp_replace")
+        )
+    )
+    DocumentoTributario.objects.filter(
+        Q(**{f"{ARCHIVO}__documentos_en_archivo__value__isnull": True})
+        | Q(**{f"{ARCHIVO}__documentos_en_archivo__value": 1})
+    ).update(hash_contenido=Coalesce(KT(f"{ARCHIVO}__hash__value"), Value("")))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("finanzas", "0017_importacion_temporal"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="documentotributario",
+            name="hash_contenido",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                help_text="sha256 del archivo importado (el mismo del caché de parseo).",
+                max_length=64,
+            ),
+        ),
+        migrations.AddField(
+            model_name="documentotributario",
+            name="rut_emisor_normalizado",
+            field=models.CharField(blank=True, editable=False, max_length=20),
+        ),
+        migrations.RunPython(poblar_claves_duplicados, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="documentotributario",
+            index=models.Index(
+                fields=["organizacion", "tipo_documento", "folio", "rut_emisor_normalizado"],
+                name="documento_clave_normalizada",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="documentotributario",
+            index=models.Index(fields=["organizacion", "hash_contenido"], name="documento_hash_contenido"),
+        ),
+    ]
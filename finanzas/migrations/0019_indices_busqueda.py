@@ -0,0 +1,45 @@
+# Generated by Django 5.2.9 on 2026-10-17 01:20
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finanzas', '0018_documento_claves_duplicados'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentotributario',
+            name='busqueda',
+            field=models.GeneratedField(db_persist=True, expression=django.contrib.postgres.search.SearchVector(models.Func('folio', models.Value('ÁÉÍÓÚÜÑáéíóúüñ'), models.Value('AEIOUUNaeiouun'), function='TRANSLATE', output_field=models.CharField()), models.Func('nombre_emisor', models.Value('ÁÉÍÓÚÜÑáéíóúüñ'), models.Value('AEIOUUNaeiouun'), function='TRANSLATE', output_field=models.CharField()), models.Func('nombre_receptor', models.Value('ÁÉÍÓÚÜÑáéíóúüñ'), models.Value('AEIOUUNaeiouun'), function='TRANSLATE', output_field=models.CharField()), models.Func('rut_emisor_normalizado', models.Value('ÁÉÍÓÚÜÑáéíóúüñ'), models.Value('AEIOUUNaeiouun'), function='TRANSLATE', output_field=models.CharField()), config='simple'), output_field=django.contrib.postgres.search.SearchVectorField()),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='busqueda',
+            field=models.GeneratedField(db_persist=True, expression=django.contrib.postgres.search.SearchVector(models.Func('descripcion', models.Value('ÁÉÍÓÚÜÑáéíóúüñ'), models.Value('AEIOUUNaeiouun'), function='TRANSLATE', output_field=models.CharField()), config='simple'), output_field=django.contrib.postgres.search.SearchVectorField()),
+        ),
+        migrations.AddIndex(
+            model_name='documentotributario',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['busqueda'], name='documento_busqueda'),
+        ),
+        migrations.AddIndex(
+            model_name='documentotributario',
+            index=models.Index(fields=['organizacion', 'folio'], name='documento_folio'),
+        ),
+        migrations.AddIndex(
+            model_name='documentotributario',
+            index=models.Index(fields=['organizacion', 'rut_emisor_normalizado'], name='documento_rut_emisor'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['numero_comprobante'], name='pago_comprobante', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['busqueda'], name='transaccion_busqueda'),
+        ),
+    ]
@@ -1,13 +1,23 @@
+from collections import defaultdict
 from decimal import Decimal, ROUND_HALF_UP
 
 from django.conf import settings
 import uuid
 
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import F
 from django.utils import timezone
 
+from personas.search import vector_busqueda
+from personas.validators import limpiar_rut_chileno
+
 
 IVA_RATE = Decimal("0.19")
+# Campos de `DocumentoTributario.busqueda` (ver `finanzas.selectors.buscar_en_finanzas`).
+CAMPOS_BUSQUEDA_DOCUMENTO = ("folio", "nombre_emisor", "nombre_receptor", "rut_emisor_normalizado")
 
 
 def _money(value: Decimal) -> Decimal:
@@ -116,6 +126,19 @@ class DocumentoTributario(TimeStampedModel):
     fecha_emision = models.DateField(default=timezone.localdate)
     nombre_emisor = models.CharField(max_length=255, blank=True)
     rut_emisor = models.CharField(max_length=20, blank=True)
+    # Derivados en `completar_campos_calculados`: claves de la detección de duplicados.
+    rut_emisor_normalizado = models.CharField(max_length=20, blank=True, editable=False)
+    hash_contenido = models.CharField(
+        max_length=64,
+        blank=True,
+        editable=False,
+        help_text="sha256 del archivo importado (el mismo del caché de parseo).",
+    )
+    busqueda = models.GeneratedField(
+        expression=vector_busqueda(*CAMPOS_BUSQUEDA_DOCUMENTO),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
     nombre_receptor = models.CharField(max_length=255, blank=True)
     rut_receptor = models.CharField(max_length=20, blank=True)
     monto_neto = models.DecimalField(max_digits=12, decimal_places=2, default=0)
@@ -158,10 +181,67 @@ class DocumentoTributario(TimeStampedModel):
         ordering = ["-fecha_emision", "-id"]
         db_table = "finanzas_invoice"
         unique_together = ("organizacion", "tipo_documento", "folio", "rut_emisor")
+        indexes = [
+            models.Index(
+                fields=["organizacion", "tipo_documento", "folio", "rut_emisor_normalizado"],
+                name="documento_clave_normalizada",
+            ),
+            models.Index(fields=["organizacion", "hash_contenido"], name="documento_hash_contenido"),
+            # Coincidencias exactas de la búsqueda transversal: se suman a los candidatos del índice GIN.
+            models.Index(fields=["organizacion", "folio"], name="documento_folio"),
+            models.Index(fields=["organizacion", "rut_emisor_normalizado"], name="documento_rut_emisor"),
+            GinIndex(fields=["busqueda"], name="documento_busqueda"),
+        ]
 
     def __str__(self) -> str:
         return f"{self.get_tipo_documento_display()} #{self.folio}"
 
+    def completar_campos_calculados(self):
+        """Llena `rut_emisor_normalizado` y, si falta, `hash_contenido` desde la importación.
+
+        El hash solo se toma de archivos con un documento; un EnvioDTE con varios DTE queda sin él.
+
+        `bulk_create` no pasa por `save()`: quien inserte en bloque debe llamarlo antes.
+        """
+        self.rut_emisor_normalizado = limpiar_rut_chileno(self.rut_emisor)
+        if not self.hash_contenido:
+            metadata = self.metadata_extra if isinstance(self.metadata_extra, dict) else {}
+            archivo = (metadata.get("importacion_normalizada") or {}).get("metadata_archivo") or {}
+            # Los DTE de un mismo EnvioDTE comparten el hash del archivo: no identifica a ninguno.
+            if ((archivo.get("documentos_en_archivo") or {}).get("value") or 1) == 1:
+                self.hash_contenido = str((archivo.get("hash") or {}).get("value") or "")
+
+    def save(self, *args, **kwargs):
+        self.completar_campos_calculados()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            derivados = {"rut_emisor": "rut_emisor_normalizado", "metadata_extra": "hash_contenido"}
+            kwargs["update_fields"] = {
+                *update_fields,
+                *(derivado for campo, derivado in derivados.items() if campo in update_fields),
+            }
+        super().save(*args, **kwargs)
+
+    def validate_unique(self, exclude=None):
+        super().validate_unique(exclude=exclude)
+        campos = {"organizacion", "tipo_documento", "folio", "rut_emisor"}
+        if exclude and campos & set(exclude):
+            return
+        # `unique_together` compara el RUT tal como se escribió; el mismo documento con otro formato
+        # de RUT ("12.345.678-9" y "12345678-9") también es duplicado.
+        duplicados = DocumentoTributario.objects.filter(
+            organizacion_id=self.organizacion_id,
+            tipo_documento=self.tipo_documento,
+            folio=self.folio,
+            rut_emisor_normalizado=limpiar_rut_chileno(self.rut_emisor),
+        )
+        if self.pk:
+            duplicados = duplicados.exclude(pk=self.pk)
+        if duplicados.exists():
+            raise ValidationError(
+                "Ya existe un documento de esta organizacion con el mismo tipo, folio y RUT emisor."
+            )
+
     @property
     def archivo_principal(self):
         return self.archivo_pdf or self.archivo_xml
@@ -271,6 +351,7 @@ class Payment(TimeStampedModel):
     monto_iva = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     monto_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     clases_asignadas = models.PositiveIntegerField(default=0)
+    clases_consumidas = models.IntegerField(default=0, editable=False)
     observaciones = models.TextField(blank=True)
     respaldo = models.FileField(upload_to="finanzas/pagos/", null=True, blank=True)
     registrado_por = models.ForeignKey(
@@ -313,6 +394,9 @@ class Payment(TimeStampedModel):
         indexes = [
             models.Index(fields=["fecha_pago", "organizacion"]),
             models.Index(fields=["persona", "fecha_pago"]),
+            models.Index(fields=["actualizado_en"]),
+            # `=` y prefijo (`LIKE 'x%'`) de la búsqueda transversal.
+            models.Index(fields=["numero_comprobante"], name="pago_comprobante", opclasses=["varchar_pattern_ops"]),
         ]
 
     def __str__(self) -> str:
@@ -339,12 +423,6 @@ class Payment(TimeStampedModel):
             total = _money(neto + iva)
         return neto, iva, total
 
-    @property
-    def clases_consumidas(self):
-        if self.revertido_en:
-            return 0
-        return self.consumos.filter(estado=AttendanceConsumption.Estado.CONSUMIDO).count()
-
     @property
     def saldo_clases(self):
         if self.revertido_en:
@@ -355,17 +433,32 @@ class Payment(TimeStampedModel):
     def esta_revertido(self):
         return self.revertido_en is not None
 
-    def save(self, *args, **kwargs):
+    def completar_campos_calculados(self):
+        """Clases del plan, exención de IVA y montos; `save()` y las altas en bloque lo aplican igual."""
         if self.plan_id and not self.clases_asignadas:
             self.clases_asignadas = self.plan.num_clases
         if self.organizacion.es_exenta_iva:
             self.aplica_iva = False
-        neto, iva, total = self.calcular_montos()
-        self.monto_neto = neto
-        self.monto_iva = iva
-        self.monto_total = total
+        self.monto_neto, self.monto_iva, self.monto_total = self.calcular_montos()
+
+    def save(self, *args, **kwargs):
+        self.completar_campos_calculados()
+        if not args and kwargs.get("update_fields") is None and not self._state.adding:
+            # El contador solo cambia por incrementos atómicos; un save completo no lo pisa.
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != "clases_consumidas"
+            ]
         super().save(*args, **kwargs)
 
+    @classmethod
+    def sumar_clases_consumidas(cls, deltas):
+        """Aplica incrementos atómicos al contador; `deltas` es `{pago_id: delta}`."""
+        for pago_id, delta in sorted(deltas.items()):
+            if pago_id and delta:
+                cls.objects.filter(pk=pago_id).update(clases_consumidas=F("clases_consumidas") + delta)
+
 
 class AttendanceConsumption(TimeStampedModel):
     class Estado(models.TextChoices):
@@ -402,11 +495,57 @@ class AttendanceConsumption(TimeStampedModel):
         indexes = [
             models.Index(fields=["persona", "clase_fecha"]),
             models.Index(fields=["estado", "clase_fecha"]),
+            models.Index(fields=["actualizado_en"]),
         ]
 
+    _imputacion_persistida = None
+
     def __str__(self) -> str:
         return f"{self.persona} - {self.clase_fecha} ({self.get_estado_display()})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        if "pago_id" in instancia.__dict__ and "estado" in instancia.__dict__:
+            instancia._imputacion_persistida = (instancia.pago_id, instancia.estado)
+        return instancia
+
+    @classmethod
+    def deltas_clases_consumidas(cls, anterior, actual):
+        """Diferencia de `Payment.clases_consumidas` entre dos pares `(pago_id, estado)`."""
+        deltas = defaultdict(int)
+        for clave, signo in ((anterior, -1), (actual, 1)):
+            if clave and clave[0] and clave[1] == cls.Estado.CONSUMIDO:
+                deltas[clave[0]] += signo
+        return {pago_id: delta for pago_id, delta in deltas.items() if delta}
+
+    def cuenta_en_pago(self, pago_id):
+        """Indica si el estado ya persistido de este consumo ocupa un cupo de `pago_id`."""
+        return self._imputacion_persistida == (pago_id, self.Estado.CONSUMIDO)
+
+    def save(self, *args, **kwargs):
+        anterior = None
+        if not self._state.adding:
+            anterior = self._imputacion_persistida
+            if anterior is None:
+                anterior = AttendanceConsumption.objects.filter(pk=self.pk).values_list("pago_id", "estado").first()
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or anterior is None:
+            actual = (self.pago_id, self.estado)
+        else:
+            update_fields = set(update_fields)
+            actual = (
+                self.pago_id if update_fields & {"pago", "pago_id"} else anterior[0],
+                self.estado if "estado" in update_fields else anterior[1],
+            )
+        self._imputacion_persistida = actual
+        deltas = self.deltas_clases_consumidas(anterior, actual)
+        Payment.sumar_clases_consumidas(deltas)
+        pago = self.pago if AttendanceConsumption.pago.is_cached(self) else None
+        if pago is not None and pago.pk in deltas:
+            pago.clases_consumidas += deltas[pago.pk]
+
 
 class Transaction(TimeStampedModel):
     class Tipo(models.TextChoices):
@@ -427,6 +566,11 @@ class Transaction(TimeStampedModel):
     tipo = models.CharField(max_length=20, choices=Tipo.choices)
     monto = models.DecimalField(max_digits=12, decimal_places=2)
     descripcion = models.TextField(blank=True)
+    busqueda = models.GeneratedField(
+        expression=vector_busqueda("descripcion"),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
     archivo = models.FileField(upload_to="finanzas/transactions/", null=True, blank=True)
     creado_por = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -449,10 +593,160 @@ class Transaction(TimeStampedModel):
         indexes = [
             models.Index(fields=["fecha", "organizacion"]),
             models.Index(fields=["tipo", "fecha"]),
+            GinIndex(fields=["busqueda"], name="transaccion_busqueda"),
         ]
 
     def __str__(self) -> str:
         return f"{self.get_tipo_display()} {self.monto} ({self.categoria})"
 
 
+class ResumenFinancieroMensual(models.Model):
+    """Totales del dashboard financiero por organización y mes, materializados para meses cerrados.
+
+    Se borra cuando una escritura toca el mes y se recalcula al volver a consultarlo.
+    """
+
+    organizacion = models.ForeignKey(
+        "personas.Organizacion",
+        on_delete=models.CASCADE,
+        related_name="resumenes_financieros_mensuales",
+    )
+    anio = models.PositiveSmallIntegerField()
+    mes = models.PositiveSmallIntegerField()
+    ingresos_contables = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    egresos_contables = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    iva_debito = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    pagos_operacionales_monto = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_pagos_operacionales = models.PositiveIntegerField(default=0)
+    total_transacciones = models.PositiveIntegerField(default=0)
+    clases_pagadas = models.PositiveIntegerField(default=0)
+    deuda_clases = models.PositiveIntegerField(default=0)
+    total_documentos_periodo = models.PositiveIntegerField(default=0)
+    documentos_con_transaccion = models.PositiveIntegerField(default=0)
+    transacciones_sin_documento = models.PositiveIntegerField(default=0)
+    transacciones_con_documento_fuera_periodo = models.PositiveIntegerField(default=0)
+    pagos_con_documento_fuera_periodo = models.PositiveIntegerField(default=0)
+    calculado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Resumen financiero mensual"
+        verbose_name_plural = "Resúmenes financieros mensuales"
+        ordering = ["-anio", "-mes", "organizacion_id"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["organizacion", "anio", "mes"],
+                name="finanzas_resumen_mensual_unico",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.organizacion} {self.anio}-{self.mes:02d}"
+
+
+class EjecucionReconciliacion(models.Model):
+    """Corrida persistida de la reconciliación; la última marca de agua limita la siguiente."""
+
+    class Modo(models.TextChoices):
+        COMPLETA = "completa", "Completa"
+        INCREMENTAL = "incremental", "Incremental"
+
+    iniciada_en = models.DateTimeField(auto_now_add=True)
+    marca_agua = models.DateTimeField()
+    modo = models.CharField(max_length=20, choices=Modo.choices)
+    consumos_revisados = models.PositiveIntegerField(default=0)
+    pagos_revisados = models.PositiveIntegerField(default=0)
+    hallazgos_abiertos = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Ejecución de reconciliación"
+        verbose_name_plural = "Ejecuciones de reconciliación"
+        ordering = ["-marca_agua", "-id"]
+
+    def __str__(self):
+        return f"Reconciliación {self.get_modo_display().lower()} hasta {self.marca_agua:%Y-%m-%d %H:%M}"
+
+
+class HallazgoReconciliacion(models.Model):
+    """Inconsistencia detectada; se conserva abierta entre corridas hasta que deja de reproducirse."""
+
+    tipo = models.CharField(max_length=60)
+    clave = models.CharField(max_length=60)
+    organizacion = models.ForeignKey(
+        "personas.Organizacion",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="hallazgos_reconciliacion",
+    )
+    detalle = models.JSONField(default=dict)
+    detectado_en = models.DateTimeField(auto_now_add=True)
+    revisado_en = models.DateTimeField(auto_now=True)
+    resuelto_en = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Hallazgo de reconciliación"
+        verbose_name_plural = "Hallazgos de reconciliación"
+        ordering = ["tipo", "id"]
+        constraints = [
+            models.UniqueConstraint(fields=["tipo", "clave"], name="finanzas_hallazgo_tipo_clave_unico"),
+        ]
+        indexes = [
+            models.Index(fields=["resuelto_en", "tipo"]),
+        ]
+
+    def __str__(self):
+        return f"{self.tipo} · {self.clave}"
+
+
+
+class ResultadoParseoDocumento(models.Model):
+    """Resultado normalizado de parsear un XML/PDF tributario, por contenido y versión del parser."""
+
+    hash_contenido = models.CharField(max_length=64)
+    origen = models.CharField(max_length=10)
+    version_parser = models.CharField(max_length=20)
+    resultado = models.JSONField()
+    creado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Resultado de parseo de documento"
+        verbose_name_plural = "Resultados de parseo de documentos"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["hash_contenido", "origen", "version_parser"],
+                name="finanzas_parseo_contenido_version_unico",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.origen} {self.hash_contenido[:12]} v{self.version_parser}"
+
+class ImportacionTemporal(models.Model):
+    """Archivos y revisión de una carga de documentos tributarios mientras el usuario la confirma.
+
+    La sesión solo guarda el token; `limpiar_importaciones_temporales` borra las vencidas y su
+    directorio bajo `MEDIA_ROOT/finanzas/importaciones_tmp/`.
+    """
+
+    # El token viaja en formularios y URLs y nombra el directorio: uuid4 no adivinable.
+    token = models.CharField(max_length=32, primary_key=True)
+    usuario = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="importaciones_temporales",
+    )
+    payload = models.JSONField(default=dict, blank=True)
+    archivos = models.JSONField(default=dict, blank=True)
+    directorio = models.CharField(max_length=500)
+    creado_en = models.DateTimeField(auto_now_add=True)
+    expira_en = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = "Importación temporal de documentos"
+        verbose_name_plural = "Importaciones temporales de documentos"
+
+    def __str__(self):
+        return f"{self.token} ({self.usuario_id})"
+
+
 Invoice = DocumentoTributario
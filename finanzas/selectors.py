@@ -1,9 +1,33 @@
-from django.db.models import CharField, Count, ExpressionWrapper, F, IntegerField, OuterRef, Prefetch, Q, Subquery, Sum, Value
+import re
+from contextlib import contextmanager
+from datetime import date
+
+from django.db import connection, transaction
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import (
+    Case,
+    CharField,
+    Count,
+    ExpressionWrapper,
+    F,
+    FloatField,
+    IntegerField,
+    OuterRef,
+    Prefetch,
+    Q,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
 from django.db.models.functions import Coalesce
 
 from asistencias.models import Asistencia
-from plataformaelemental.context import aplicar_periodo, filtros_periodo
-from personas.search import filtrar_por_fragmentos
+from plataformaelemental.cache_selectores import selector_cacheado
+from plataformaelemental.context import aplicar_periodo, argumentos_periodo, filtros_periodo, resolver_periodo
+from personas.models import Persona, PersonaRol
+from personas.search import consulta_busqueda, filtrar_por_fragmentos
+from personas.validators import formatear_rut_chileno, limpiar_rut_chileno
 
 from .models import AttendanceConsumption, Category, DocumentoTributario, Payment, PaymentPlan, Transaction
 
@@ -19,13 +43,13 @@ def planes_queryset(organizacion=None):
     return queryset
 
 
-def _subquery_disciplina_principal(*, mes=None, anio=None):
+def _subquery_disciplina_principal(periodo):
     filtros = {
         "persona_id": OuterRef("persona_id"),
         "sesion__disciplina__organizacion_id": OuterRef("organizacion_id"),
         "estado": Asistencia.Estado.PRESENTE,
     }
-    filtros.update(filtros_periodo("sesion__fecha", mes=mes, anio=anio))
+    filtros.update(filtros_periodo("sesion__fecha", **argumentos_periodo(periodo)))
     return (
         Asistencia.objects.filter(**filtros)
         .values("sesion__disciplina__nombre")
@@ -35,17 +59,11 @@ def _subquery_disciplina_principal(*, mes=None, anio=None):
     )
 
 
-def pagos_queryset(request, *, organizacion=None, mes=None, anio=None):
-    disciplina_principal_historica = _subquery_disciplina_principal(mes=mes, anio=anio)
+def pagos_queryset(request, *, organizacion=None):
+    disciplina_principal_historica = _subquery_disciplina_principal(resolver_periodo(request))
     queryset = (
         Payment.objects.select_related("persona", "organizacion", "plan", "documento_tributario")
-        .annotate(
-            clases_consumidas_calculadas=Count(
-                "consumos",
-                filter=Q(consumos__estado=AttendanceConsumption.Estado.CONSUMIDO),
-                distinct=True,
-            )
-        )
+        .annotate(clases_consumidas_calculadas=F("clases_consumidas"))
         .annotate(
             saldo_clases_calculado=ExpressionWrapper(
                 F("clases_asignadas") - F("clases_consumidas_calculadas"),
@@ -150,19 +168,20 @@ def resumen_transacciones(queryset):
     )
 
 
-def dashboard_querysets(request, *, organizacion=None):
+def dashboard_querysets(request, *, organizacion=None, mes=None, anio=None):
+    periodo = {"request": request} if request is not None else {"mes": mes, "anio": anio}
     pagos_qs = aplicar_periodo(
         Payment.objects.filter(revertido_en__isnull=True).select_related("persona", "organizacion"),
         "fecha_pago",
-        request=request,
+        **periodo,
     )
     transacciones_qs = aplicar_periodo(
         Transaction.objects.select_related("categoria", "organizacion").prefetch_related("documentos_tributarios"),
         "fecha",
-        request=request,
+        **periodo,
     )
-    documentos_qs = aplicar_periodo(DocumentoTributario.objects.all(), "fecha_emision", request=request)
-    consumos_qs = aplicar_periodo(AttendanceConsumption.objects.all(), "clase_fecha", request=request)
+    documentos_qs = aplicar_periodo(DocumentoTributario.objects.all(), "fecha_emision", **periodo)
+    consumos_qs = aplicar_periodo(AttendanceConsumption.objects.all(), "clase_fecha", **periodo)
     if organizacion:
         pagos_qs = pagos_qs.filter(organizacion=organizacion)
         transacciones_qs = transacciones_qs.filter(organizacion=organizacion)
@@ -171,16 +190,16 @@ def dashboard_querysets(request, *, organizacion=None):
     return pagos_qs, transacciones_qs, documentos_qs, consumos_qs
 
 
-def _filtro_fuera_periodo_documento(prefix, *, mes=None, anio=None):
-    filtros = Q()
-    if anio is not None:
-        filtros |= ~Q(**{f"{prefix}fecha_emision__year": anio})
-    if mes is not None:
-        filtros |= ~Q(**{f"{prefix}fecha_emision__month": mes})
-    return filtros
+def _filtro_fuera_periodo_documento(prefix, **periodo):
+    filtros = filtros_periodo(f"{prefix}fecha_emision", **periodo)
+    return ~Q(**filtros) if filtros else Q()
+
 
+def totales_dashboard(pagos_qs, transacciones_qs, documentos_qs, consumos_qs, **periodo):
+    """Totales escalares del dashboard; `ResumenFinancieroMensual` guarda estos mismos valores por mes.
 
-def resumen_dashboard(pagos_qs, transacciones_qs, documentos_qs, consumos_qs, *, mes=None, anio=None):
+    `periodo` son los argumentos de `filtros_periodo` (`mes`, `anio`, `trimestre`, `desde`, `hasta`).
+    """
     ingresos_transacciones = (
         transacciones_qs.filter(tipo=Transaction.Tipo.INGRESO).aggregate(total=Sum("monto")).get("total") or 0
     )
@@ -190,32 +209,24 @@ def resumen_dashboard(pagos_qs, transacciones_qs, documentos_qs, consumos_qs, *,
     iva_debito = pagos_qs.aggregate(total=Sum("monto_iva")).get("total") or 0
     pagos_operacionales_monto = pagos_qs.aggregate(total=Sum("monto_total")).get("total") or 0
     clases_pagadas = pagos_qs.aggregate(total=Sum("clases_asignadas")).get("total") or 0
-    clases_consumidas = AttendanceConsumption.objects.filter(
-        pago__in=pagos_qs,
-        estado=AttendanceConsumption.Estado.CONSUMIDO,
-    ).count()
+    clases_consumidas = pagos_qs.aggregate(total=Sum("clases_consumidas")).get("total") or 0
     saldo_clases = clases_pagadas - clases_consumidas
     deuda_clases = consumos_qs.filter(estado=AttendanceConsumption.Estado.DEUDA).count()
-    categorias_totales = (
-        transacciones_qs.values("categoria__nombre", "categoria__tipo").annotate(total=Sum("monto")).order_by("-total")
-    )
     transacciones_sin_documento = (
         transacciones_qs.annotate(documentos_total=Count("documentos_tributarios", distinct=True))
         .filter(documentos_total=0)
         .count()
     )
-    filtro_documento_fuera_periodo = _filtro_fuera_periodo_documento("documentos_tributarios__", mes=mes, anio=anio)
+    filtro_documento_fuera_periodo = _filtro_fuera_periodo_documento("documentos_tributarios__", **periodo)
     transacciones_con_documento_fuera_periodo = (
         transacciones_qs.filter(filtro_documento_fuera_periodo).distinct().count()
         if filtro_documento_fuera_periodo
         else 0
     )
+    filtro_pago_fuera_periodo = _filtro_fuera_periodo_documento("documento_tributario__", **periodo)
     pagos_con_documento_fuera_periodo = (
-        pagos_qs.filter(documento_tributario__isnull=False)
-        .filter(_filtro_fuera_periodo_documento("documento_tributario__", mes=mes, anio=anio))
-        .distinct()
-        .count()
-        if _filtro_fuera_periodo_documento("documento_tributario__", mes=mes, anio=anio)
+        pagos_qs.filter(documento_tributario__isnull=False).filter(filtro_pago_fuera_periodo).distinct().count()
+        if filtro_pago_fuera_periodo
         else 0
     )
     return {
@@ -228,10 +239,10 @@ def resumen_dashboard(pagos_qs, transacciones_qs, documentos_qs, consumos_qs, *,
         "pagos_operacionales_monto": pagos_operacionales_monto,
         "total_pagos_operacionales": pagos_qs.count(),
         "clases_pagadas": clases_pagadas,
+        "clases_consumidas": clases_consumidas,
         "saldo_clases": saldo_clases,
         "deuda_clases": deuda_clases,
         "iva_debito": iva_debito,
-        "categorias_totales": categorias_totales,
         "transacciones_sin_documento": transacciones_sin_documento,
         "transacciones_con_documento_fuera_periodo": transacciones_con_documento_fuera_periodo,
         "pagos_con_documento_fuera_periodo": pagos_con_documento_fuera_periodo,
@@ -239,6 +250,24 @@ def resumen_dashboard(pagos_qs, transacciones_qs, documentos_qs, consumos_qs, *,
     }
 
 
+def categorias_totales_dashboard(transacciones_qs):
+    return (
+        transacciones_qs.values("categoria__nombre", "categoria__tipo").annotate(total=Sum("monto")).order_by("-total")
+    )
+
+
+def resumen_dashboard(pagos_qs, transacciones_qs, documentos_qs, consumos_qs, **periodo):
+    return {
+        **totales_dashboard(pagos_qs, transacciones_qs, documentos_qs, consumos_qs, **periodo),
+        "categorias_totales": categorias_totales_dashboard(transacciones_qs),
+    }
+
+
+def _clave_periodo_organizacion(request, *, organizacion=None):
+    return organizacion, resolver_periodo(request)
+
+
+@selector_cacheado("finanzas.consolidado_categorias", _clave_periodo_organizacion)
 def consolidado_categorias_queryset(request, *, organizacion=None):
     queryset = aplicar_periodo(Transaction.objects.all(), "fecha", request=request)
     if organizacion:
@@ -261,13 +290,7 @@ def pagos_export_queryset(request, *, organizacion=None):
             "plan",
             "documento_tributario",
         )
-        .annotate(
-            clases_consumidas_calculadas=Count(
-                "consumos",
-                filter=Q(consumos__estado=AttendanceConsumption.Estado.CONSUMIDO),
-                distinct=True,
-            )
-        )
+        .annotate(clases_consumidas_calculadas=F("clases_consumidas"))
         .annotate(
             saldo_clases_calculado=ExpressionWrapper(
                 F("clases_asignadas") - F("clases_consumidas_calculadas"),
@@ -302,3 +325,205 @@ def libro_caja_queryset(request, *, organizacion=None):
     if organizacion:
         queryset = queryset.filter(organizacion=organizacion)
     return queryset.order_by("fecha", "id")
+
+
+# Búsqueda transversal: un identificador exacto (folio, comprobante, RUT) pesa más que
+# un prefijo de comprobante, y ambos más que cualquier coincidencia de texto (`ts_rank`).
+RANGO_IDENTIFICADOR = 1.0
+RANGO_PREFIJO = 0.5
+# Coincidencias por entidad sobre las que se calcula el rango; acota el costo de un prefijo muy común ("a").
+CANDIDATOS_BUSQUEDA = 500
+_PATRON_IDENTIFICADOR = re.compile(r"[\d.\-]*\d[\d.\-]*[kK]?")
+
+
+def _consulta_identificador(termino):
+    """Folio o RUT con puntos/guion como un solo prefijo ("12.345.678-9" -> `123456789:*`)."""
+    if not _PATRON_IDENTIFICADOR.fullmatch(termino):
+        return None
+    return SearchQuery(f"{limpiar_rut_chileno(termino).lower()}:*", search_type="raw", config="simple")
+
+
+def _rango(expresion):
+    return ExpressionWrapper(expresion, output_field=FloatField())
+
+
+def _candidatos(queryset, *, exactos=None):
+    """Primeras `CANDIDATOS_BUSQUEDA` coincidencias de `queryset`, más todas las de `exactos`.
+
+    El límite se toma sin orden, porque ordenar por rango exigiría calcularlo sobre todas las
+    coincidencias; con un prefijo común podría dejar fuera el identificador exacto. Por eso
+    `exactos` (igualdad sobre columnas con índice B-tree) se consulta aparte y se suma siempre.
+    """
+    candidatos = Q(pk__in=queryset.order_by().values("pk")[:CANDIDATOS_BUSQUEDA])
+    if exactos is not None:
+        candidatos |= Q(pk__in=exactos.order_by().values("pk"))
+    return queryset.filter(candidatos)
+
+
+@contextmanager
+def _sin_recorrido_secuencial():
+    """Desactiva `enable_seqscan` solo mientras se evalúa una consulta por índice GIN.
+
+    PostgreSQL estima un prefijo `palabra:*` sobre un `tsvector` con un valor fijo (~2 % de la
+    tabla) cuando el prefijo no está entre los lexemas más comunes de las estadísticas; ni
+    `ANALYZE` ni un `STATISTICS` mayor ni las estadísticas extendidas lo cambian, porque no
+    dependen de los datos. Con esa estimación prefiere recorrer la tabla entera, aunque por el
+    índice un término poco frecuente cuesta décimas de ms.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SELECT current_setting('enable_seqscan'), set_config('enable_seqscan', 'off', true)")
+        anterior = cursor.fetchone()[0]
+        try:
+            yield
+        finally:
+            # `SET LOCAL` dura hasta el final de la transacción externa, no del savepoint.
+            cursor.execute("SELECT set_config('enable_seqscan', %s, true)", [anterior])
+
+
+def _buscar_personas(termino, organizacion_ids, consulta, limite):
+    if consulta is None:
+        return []
+    miembros = PersonaRol.objects.filter(organizacion_id__in=organizacion_ids, activo=True)
+    personas = Persona.objects.filter(pk__in=miembros.values("persona_id"))
+    rut = formatear_rut_chileno(termino) if _PATRON_IDENTIFICADOR.fullmatch(termino) else None
+    identificador = Case(When(rut=rut, then=Value(RANGO_IDENTIFICADOR)), default=Value(0.0)) if rut else Value(0.0)
+    queryset = (
+        _candidatos(personas.filter(busqueda=consulta), exactos=personas.filter(rut=rut) if rut else None)
+        .annotate(
+            rango=_rango(SearchRank(F("busqueda"), consulta) + identificador),
+            organizacion_busqueda=Subquery(
+                miembros.filter(persona_id=OuterRef("pk")).order_by("organizacion_id").values("organizacion_id")[:1]
+            ),
+        )
+        .order_by("-rango", "apellidos", "nombres")
+    )
+    with _sin_recorrido_secuencial():
+        encontradas = list(queryset[:limite])
+    return [
+        {
+            "tipo": "persona",
+            "id": persona.pk,
+            "titulo": persona.nombre_completo,
+            "detalle": persona.rut or persona.email or "",
+            "fecha": None,
+            "organizacion_id": persona.organizacion_busqueda,
+            "rango": persona.rango,
+        }
+        for persona in encontradas
+    ]
+
+
+def _buscar_pagos(termino, organizacion_ids, limite):
+    if not termino or " " in termino:
+        return []
+    queryset = (
+        Payment.objects.filter(organizacion_id__in=organizacion_ids, numero_comprobante__startswith=termino)
+        .select_related("persona")
+        .annotate(
+            rango=Case(
+                When(numero_comprobante=termino, then=Value(RANGO_IDENTIFICADOR)),
+                default=Value(RANGO_PREFIJO),
+                output_field=FloatField(),
+            )
+        )
+        .order_by("-rango", "-fecha_pago", "-id")
+    )
+    return [
+        {
+            "tipo": "pago",
+            "id": pago.pk,
+            "titulo": f"Comprobante {pago.numero_comprobante}",
+            "detalle": f"{pago.persona.nombre_completo} · {pago.monto_total}",
+            "fecha": pago.fecha_pago,
+            "organizacion_id": pago.organizacion_id,
+            "rango": pago.rango,
+        }
+        for pago in queryset[:limite]
+    ]
+
+
+def _buscar_documentos(termino, organizacion_ids, consulta, limite):
+    consulta = _consulta_identificador(termino) or consulta
+    if consulta is None:
+        return []
+    rut = limpiar_rut_chileno(termino)
+    documentos = DocumentoTributario.objects.filter(organizacion_id__in=organizacion_ids)
+    queryset = (
+        _candidatos(
+            documentos.filter(busqueda=consulta),
+            exactos=documentos.filter(Q(folio=termino) | Q(rut_emisor_normalizado=rut)),
+        )
+        .annotate(
+            rango=_rango(
+                SearchRank(F("busqueda"), consulta)
+                + Case(
+                    When(Q(folio=termino) | Q(rut_emisor_normalizado=rut), then=Value(RANGO_IDENTIFICADOR)),
+                    default=Value(0.0),
+                )
+            )
+        )
+        .order_by("-rango", "-fecha_emision", "-id")
+    )
+    with _sin_recorrido_secuencial():
+        encontrados = list(queryset[:limite])
+    return [
+        {
+            "tipo": "documento",
+            "id": documento.pk,
+            "titulo": f"{documento.get_tipo_documento_display()} #{documento.folio}",
+            "detalle": " · ".join(filter(None, [documento.nombre_emisor, documento.rut_emisor])),
+            "fecha": documento.fecha_emision,
+            "organizacion_id": documento.organizacion_id,
+            "rango": documento.rango,
+        }
+        for documento in encontrados
+    ]
+
+
+def _buscar_transacciones(organizacion_ids, consulta, limite):
+    if consulta is None:
+        return []
+    queryset = (
+        _candidatos(Transaction.objects.filter(organizacion_id__in=organizacion_ids, busqueda=consulta))
+        .annotate(rango=_rango(SearchRank(F("busqueda"), consulta)))
+        .order_by("-rango", "-fecha", "-id")
+    )
+    with _sin_recorrido_secuencial():
+        encontradas = list(queryset[:limite])
+    return [
+        {
+            "tipo": "transaccion",
+            "id": transaccion.pk,
+            "titulo": transaccion.descripcion[:120],
+            "detalle": f"{transaccion.get_tipo_display()} · {transaccion.monto}",
+            "fecha": transaccion.fecha,
+            "organizacion_id": transaccion.organizacion_id,
+            "rango": transaccion.rango,
+        }
+        for transaccion in encontradas
+    ]
+
+
+def buscar_en_finanzas(termino, *, organizacion_ids, limite=20):
+    """Personas, pagos (comprobante), documentos tributarios y transacciones que coinciden con `termino`.
+
+    Solo busca dentro de `organizacion_ids`, que quien llama ya filtró por permisos. Personas,
+    documentos y transacciones se buscan por prefijo de palabra en sus columnas `busqueda`
+    (`tsvector` guardado, índice GIN) y los pagos por prefijo de `numero_comprobante`. El
+    rango se calcula sobre las primeras `CANDIDATOS_BUSQUEDA` coincidencias de cada entidad
+    más las que coinciden exacto con un folio o RUT, y cada entidad trae a lo más `limite`
+    filas; el resultado conjunto se ordena por `rango` y luego por fecha, de la más reciente.
+    """
+    termino = " ".join((termino or "").split())
+    organizacion_ids = list(organizacion_ids)
+    if not termino or not organizacion_ids:
+        return []
+    consulta = consulta_busqueda(termino)
+    resultados = [
+        *_buscar_personas(termino, organizacion_ids, _consulta_identificador(termino) or consulta, limite),
+        *_buscar_pagos(termino, organizacion_ids, limite),
+        *_buscar_documentos(termino, organizacion_ids, consulta, limite),
+        *_buscar_transacciones(organizacion_ids, consulta, limite),
+    ]
+    resultados.sort(key=lambda item: (item["rango"], item["fecha"] or date.min), reverse=True)
+    return resultados[:limite]
@@ -1,3 +1,4 @@
+from .documentos import importar_lote_documentos
 from .imputacion import (
     asignar_consumo_asistencia,
     asociar_asistencia_a_pago,
@@ -25,6 +26,7 @@ from .reportes import (
     filas_export_pagos,
     filas_export_transacciones,
 )
+from .reimputacion import reimputar_consumos_mes
 from .reversas import revertir_pago
 
 
@@ -41,9 +43,11 @@ __all__ = [
     "enriquecer_pagos_para_listado",
     "filas_export_pagos",
     "filas_export_transacciones",
+    "importar_lote_documentos",
     "imputar_pago_a_deudas",
     "pago_otorga_derecho",
     "PAGOS_CSV_HEADERS",
+    "reimputar_consumos_mes",
     "resumen_consumos_pago",
     "sincronizar_transaccion_pago",
     "resumen_financiero_estudiante",
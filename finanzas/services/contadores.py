@@ -0,0 +1,48 @@
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from ..models import AttendanceConsumption, Payment
+
+
+def _consumidos_reales():
+    return Coalesce(
+        Subquery(
+            AttendanceConsumption.objects.filter(
+                pago_id=OuterRef("pk"),
+                estado=AttendanceConsumption.Estado.CONSUMIDO,
+            )
+            .order_by()
+            .values("pago_id")
+            .annotate(total=Count("id"))
+            .values("total")[:1]
+        ),
+        Value(0),
+    )
+
+
+def _pagos_alcance(pago_ids=None, organizacion=None):
+    queryset = Payment.objects.all()
+    if pago_ids is not None:
+        queryset = queryset.filter(pk__in=pago_ids)
+    if organizacion is not None:
+        queryset = queryset.filter(organizacion=organizacion)
+    return queryset
+
+
+def pagos_con_contador_desincronizado(*, pago_ids=None, organizacion=None):
+    """Pagos cuyo `clases_consumidas` no coincide con sus consumos `CONSUMIDO` reales."""
+    return list(
+        _pagos_alcance(pago_ids, organizacion)
+        .annotate(consumidos_reales=_consumidos_reales())
+        .exclude(clases_consumidas=F("consumidos_reales"))
+        .order_by("pk")
+        .values("pk", "organizacion_id", "clases_consumidas", "consumidos_reales")
+    )
+
+
+def recalcular_clases_consumidas(*, pago_ids=None, organizacion=None):
+    """Reconstruye el contador desde los consumos en un solo UPDATE."""
+    return _pagos_alcance(pago_ids, organizacion).update(clases_consumidas=_consumidos_reales())
+
+
+__all__ = ["pagos_con_contador_desincronizado", "recalcular_clases_consumidas"]
@@ -0,0 +1,182 @@
+from pathlib import PurePosixPath
+
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.db.models import Count
+
+from auditoria.models import AuditLog
+from auditoria.services import registrar_auditorias
+from plataformaelemental.cache_selectores import invalidar_selectores
+
+from ..documentos.lote import clave_fila
+from ..documentos.mapping import documento_desde_initial, duplicados_por_clave
+from ..documentos.parsers import extraer_fragmentos_dte
+from ..models import DocumentoTributario
+from .resumen_mensual import clave_resumen, invalidar_resumenes_mensuales
+
+
+def _adjuntar_archivo(campo, ruta, nombre):
+    if not ruta:
+        return
+    with open(ruta, "rb") as handler:
+        campo.save(PurePosixPath(nombre).name, File(handler), save=False)
+
+
+def _fragmentos_por_fila(filas):
+    """XML propio de cada fila que viene de un EnvioDTE con varios DTE; una pasada por sobre."""
+    por_archivo = {}
+    for fila in filas:
+        if fila.get("indice_dte") is not None:
+            por_archivo.setdefault(fila["xml_ruta"], set()).add(fila["indice_dte"])
+    fragmentos = {ruta: extraer_fragmentos_dte(ruta, indices) for ruta, indices in por_archivo.items()}
+    return {
+        fila["indice"]: fragmentos[fila["xml_ruta"]].get(fila["indice_dte"])
+        for fila in filas
+        if fila.get("indice_dte") is not None
+    }
+
+
+@transaction.atomic
+def importar_lote_documentos(*, usuario, organizacion, filas, indices=None):
+    """Inserta con un solo `bulk_create` las filas de `preparar_lote` elegidas en la revisión.
+
+    `indices` son las filas confirmadas; sin él se importan las sugeridas. Los duplicados se
+    vuelven a buscar dentro de la transacción (otra carga pudo guardar el mismo documento
+    después de la revisión): esas filas, las repetidas dentro del lote y las con errores se
+    omiten. A cada documento de un EnvioDTE con varios DTE se le adjunta solo su nodo `DTE`,
+    no el sobre completo. Devuelve `{"creados": [...], "omitidos": [{"indice", "motivo"}]}`.
+    """
+    organizacion_id = organizacion.pk
+    indices = {fila["indice"] for fila in filas if fila.get("sugerida")} if indices is None else set(indices)
+    elegidas = [fila for fila in filas if fila["indice"] in indices]
+    existentes = duplicados_por_clave([clave_fila(fila) for fila in elegidas], organizacion_id)
+
+    omitidos = []
+    claves_vistas = set()
+    documentos = []
+    origenes = []
+    importables = []
+    for fila in elegidas:
+        clave = clave_fila(fila)
+        if fila["errores"]:
+            omitidos.append({"indice": fila["indice"], "motivo": "El documento tiene errores de parseo."})
+            continue
+        if clave in existentes:
+            omitidos.append({"indice": fila["indice"], "motivo": "Ya existe en la organización."})
+            continue
+        if clave in claves_vistas:
+            omitidos.append({"indice": fila["indice"], "motivo": "Repetido dentro del lote."})
+            continue
+        claves_vistas.add(clave)
+        importables.append(fila)
+
+    fragmentos = _fragmentos_por_fila(importables)
+    for fila in importables:
+        documento = documento_desde_initial(fila["documento"], organizacion_id=organizacion_id)
+        documento.metadata_extra.update(
+            {
+                "importacion_normalizada": dict(documento.metadata_extra),
+                "warnings_importacion": list(fila["warnings"]),
+                "duplicates_detected": list(fila["duplicados"]),
+                "importacion_lote": {
+                    "archivo_xml": fila["xml"],
+                    "archivo_pdf": fila["pdf"],
+                    "indice_dte": fila.get("indice_dte"),
+                },
+            }
+        )
+        fragmento = fragmentos.get(fila["indice"])
+        if fragmento is not None:
+            nombre = f"{PurePosixPath(fila['xml']).stem}_{fila['indice_dte'] + 1:04d}.xml"
+            documento.archivo_xml.save(nombre, ContentFile(fragmento), save=False)
+        else:
+            _adjuntar_archivo(documento.archivo_xml, fila["xml_ruta"], fila["xml"])
+        _adjuntar_archivo(documento.archivo_pdf, fila["pdf_ruta"], fila["pdf"])
+        documento.completar_campos_calculados()
+        documentos.append(documento)
+        origenes.append(fila)
+
+    # `bulk_create` no emite señales: se aplica aquí el trabajo de `finanzas.signals`.
+    creados = DocumentoTributario.objects.bulk_create(documentos)
+    if creados:
+        invalidar_resumenes_mensuales({clave_resumen(organizacion_id, documento.fecha_emision) for documento in creados})
+        invalidar_selectores([organizacion_id])
+        registrar_auditorias(
+            {
+                "usuario": usuario,
+                "accion": AuditLog.ACCION_IMPORTAR,
+                "dominio": "finanzas",
+                "objeto": documento,
+                "organizacion": organizacion,
+                "resumen": "Documento tributario importado en lote",
+                "metadata": {
+                    "organizacion_id": documento.organizacion_id,
+                    "tipo_documento": documento.tipo_documento,
+                    "fuente": documento.fuente,
+                    "folio": documento.folio,
+                    "fecha_emision": documento.fecha_emision,
+                    "monto_total": documento.monto_total,
+                    "warnings_count": len(fila["warnings"]),
+                    "duplicates_count": len(fila["duplicados"]),
+                    "tiene_xml": bool(fila["xml"]),
+                    "tiene_pdf": bool(fila["pdf"]),
+                    "origen": "importacion_lote",
+                },
+            }
+            for documento, fila in zip(creados, origenes)
+        )
+    return {"creados": creados, "omitidos": omitidos}
+
+
+INDICE_UNICO_CLAVE = "documento_clave_normalizada_unica"
+
+
+def conflictos_clave_documentos():
+    """Grupos de documentos que comparten organización, tipo, folio y RUT emisor normalizado.
+
+    Son los que hoy impiden crear `INDICE_UNICO_CLAVE`: `unique_together` compara el RUT tal como
+    se escribió, así que "12.345.678-9" y "12345678-9" conviven en la tabla.
+    """
+    return list(
+        DocumentoTributario.objects.values("organizacion_id", "tipo_documento", "folio", "rut_emisor_normalizado")
+        .annotate(total=Count("id"), ids=ArrayAgg("id", order_by="id"))
+        .filter(total__gt=1)
+        .order_by("organizacion_id", "tipo_documento", "folio")
+    )
+
+
+def estado_indice_unico_clave():
+    """`None` si `INDICE_UNICO_CLAVE` no existe, `False` si quedó inválido y `True` si es válido.
+
+    Un `CREATE UNIQUE INDEX CONCURRENTLY` que falla (por un conflicto insertado durante la
+    construcción) deja el índice creado pero inválido: existe para el catálogo y para
+    `IF NOT EXISTS`, pero no impone la unicidad.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", [INDICE_UNICO_CLAVE])
+        fila = cursor.fetchone()
+    return fila[0] if fila else None
+
+
+def crear_indice_unico_clave():
+    """Crea el índice único opcional sobre la clave normalizada; sin transacción usa `CONCURRENTLY`.
+
+    Un índice inválido que haya quedado de un intento anterior se borra antes de crearlo.
+    Falla con `IntegrityError` si quedan conflictos (ver `conflictos_clave_documentos`).
+    """
+    concurrente = "" if connection.in_atomic_block else "CONCURRENTLY "
+    tabla = DocumentoTributario._meta.db_table
+    nombre = connection.ops.quote_name(INDICE_UNICO_CLAVE)
+    invalido = estado_indice_unico_clave() is False
+    with connection.cursor() as cursor:
+        if not concurrente:
+            # Dentro de una transacción, las FK diferidas pendientes impiden tocar la tabla.
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        if invalido:
+            cursor.execute(f"DROP INDEX {concurrente}IF EXISTS {nombre}")
+        cursor.execute(
+            f"CREATE UNIQUE INDEX {concurrente}IF NOT EXISTS {nombre} "
+            f"ON {connection.ops.quote_name(tabla)} (organizacion_id, tipo_documento, folio, rut_emisor_normalizado)"
+        )
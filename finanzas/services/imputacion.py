@@ -4,7 +4,7 @@ from django.utils.dateparse import parse_date
 
 from asistencias.models import Asistencia, ClaseLiberada
 from personas.models import Persona
-from plataformaelemental.context import aplicar_periodo
+from plataformaelemental.context import aplicar_periodo, filtros_periodo
 
 from ..models import AttendanceConsumption, Payment
 
@@ -14,10 +14,7 @@ def _filtro_mismo_periodo_mensual(fecha, prefijo_campo):
         fecha = parse_date(fecha)
     if fecha is None:
         raise ValueError("La fecha entregada para filtrar periodo mensual no es valida.")
-    return {
-        f"{prefijo_campo}__year": fecha.year,
-        f"{prefijo_campo}__month": fecha.month,
-    }
+    return filtros_periodo(prefijo_campo, mes=fecha.month, anio=fecha.year)
 
 
 def _misma_clave_periodo_mensual(fecha_a, fecha_b):
@@ -51,10 +48,10 @@ def pago_otorga_derecho(pago, asistencia, *, consumo_actual=None):
         return False
     if not _plan_vigente_para_fecha(pago, asistencia.sesion.fecha):
         return False
-    usados = pago.consumos.filter(estado=AttendanceConsumption.Estado.CONSUMIDO)
-    if consumo_actual and consumo_actual.pago_id == pago.pk:
-        usados = usados.exclude(pk=consumo_actual.pk)
-    return pago.clases_asignadas > usados.count()
+    usados = pago.clases_consumidas
+    if consumo_actual and consumo_actual.cuenta_en_pago(pago.pk):
+        usados -= 1
+    return pago.clases_asignadas > usados
 
 
 def consumo_tiene_derecho_valido(consumo):
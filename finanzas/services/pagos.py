@@ -3,8 +3,9 @@ from django.db import IntegrityError, transaction
 from django.utils import timezone
 
 from auditoria.models import AuditLog
-from auditoria.services import registrar_auditoria
+from auditoria.services import registrar_auditoria, registrar_auditorias
 from personas.models import Persona, PersonaRol, Rol
+from plataformaelemental.cache_selectores import invalidar_selectores
 
 from ..models import (
     AttendanceConsumption,
@@ -15,6 +16,65 @@ from ..models import (
     PaymentPlan,
     Transaction,
 )
+from .reimputacion import imputar_consumos_en_lote
+from .resumen_mensual import clave_resumen, invalidar_resumenes_mensuales
+
+
+def _categoria_cobranza():
+    categoria, _ = Category.objects.get_or_create(
+        nombre="Cobranza de clases",
+        defaults={"tipo": Category.Tipo.INGRESO, "activa": True},
+    )
+    if categoria.tipo != Category.Tipo.INGRESO:
+        raise ValidationError("La categoría contable de cobranza no está configurada como ingreso.")
+    return categoria
+
+
+def _transaccion_de_pago(pago, categoria):
+    return Transaction(
+        organizacion=pago.organizacion,
+        categoria=categoria,
+        fecha=pago.fecha_pago,
+        tipo=Transaction.Tipo.INGRESO,
+        monto=pago.monto_total,
+        descripcion=pago.observaciones.strip()
+        or f"Pago de clases de {pago.persona.nombre_completo}",
+        creado_por=pago.registrado_por,
+    )
+
+
+def _auditorias_pago_creado(*, pago, transaccion, usuario, lote, origen, clave_idempotencia):
+    return [
+        {
+            "usuario": usuario,
+            "accion": AuditLog.ACCION_CREAR,
+            "dominio": "finanzas",
+            "objeto": transaccion,
+            "organizacion": pago.organizacion,
+            "resumen": "Transacción creada desde pago operacional",
+            "metadata": {
+                "pago_id": pago.pk,
+                "transaccion_id": transaccion.pk,
+                "origen": origen,
+            },
+        },
+        {
+            "usuario": usuario,
+            "accion": AuditLog.ACCION_CREAR,
+            "dominio": "finanzas",
+            "objeto": pago,
+            "organizacion": pago.organizacion,
+            "resumen": "Pago creado",
+            "metadata": {
+                "pago_id": pago.pk,
+                "lote_id": str(lote.pk) if lote else None,
+                "transaccion_id": transaccion.pk,
+                "disciplina_id": pago.disciplina_id,
+                "clave_idempotencia": clave_idempotencia,
+                "origen": origen,
+            },
+        },
+    ]
 
 
 @transaction.atomic
@@ -44,53 +104,20 @@ def crear_pago_operacional(
     pago.clave_idempotencia = clave_idempotencia
     pago.save()
 
-    categoria, _ = Category.objects.get_or_create(
-        nombre="Cobranza de clases",
-        defaults={"tipo": Category.Tipo.INGRESO, "activa": True},
-    )
-    if categoria.tipo != Category.Tipo.INGRESO:
-        raise ValidationError("La categoría contable de cobranza no está configurada como ingreso.")
-    transaccion = Transaction.objects.create(
-        organizacion=pago.organizacion,
-        categoria=categoria,
-        fecha=pago.fecha_pago,
-        tipo=Transaction.Tipo.INGRESO,
-        monto=pago.monto_total,
-        descripcion=pago.observaciones.strip()
-        or f"Pago de clases de {pago.persona.nombre_completo}",
-        creado_por=pago.registrado_por,
-    )
+    transaccion = _transaccion_de_pago(pago, _categoria_cobranza())
+    transaccion.save()
     pago.transaccion = transaccion
     pago.save(update_fields=["transaccion", "actualizado_en"])
 
-    registrar_auditoria(
-        usuario=usuario,
-        accion=AuditLog.ACCION_CREAR,
-        dominio="finanzas",
-        objeto=transaccion,
-        organizacion=pago.organizacion,
-        resumen="Transacción creada desde pago operacional",
-        metadata={
-            "pago_id": pago.pk,
-            "transaccion_id": transaccion.pk,
-            "origen": origen,
-        },
-    )
-    registrar_auditoria(
-        usuario=usuario,
-        accion=AuditLog.ACCION_CREAR,
-        dominio="finanzas",
-        objeto=pago,
-        organizacion=pago.organizacion,
-        resumen="Pago creado",
-        metadata={
-            "pago_id": pago.pk,
-            "lote_id": str(lote.pk) if lote else None,
-            "transaccion_id": transaccion.pk,
-            "disciplina_id": pago.disciplina_id,
-            "clave_idempotencia": clave_idempotencia,
-            "origen": origen,
-        },
+    registrar_auditorias(
+        _auditorias_pago_creado(
+            pago=pago,
+            transaccion=transaccion,
+            usuario=usuario,
+            lote=lote,
+            origen=origen,
+            clave_idempotencia=clave_idempotencia,
+        )
     )
     return pago
 
@@ -118,35 +145,68 @@ def sincronizar_transaccion_pago(*, pago, usuario=None):
     return pago
 
 
-def _resolver_fila_pago(*, fila, organizacion_id):
-    persona = Persona.objects.filter(
-        pk=fila["persona_id"],
+def _referencias_lote(*, filas, organizacion_id):
+    """Personas, planes, documentos y disciplinas elegibles del lote, en una consulta por tipo."""
+    from asistencias.models import Disciplina
+
+    def ids(campo):
+        return {fila[campo] for fila in filas if fila.get(campo)}
+
+    personas = Persona.objects.filter(
+        pk__in=ids("persona_id"),
         roles__organizacion_id=organizacion_id,
         roles__rol__codigo__iexact="ESTUDIANTE",
         roles__activo=True,
-    ).first()
-    if not persona:
-        raise ValidationError("La persona seleccionada no es elegible para la organización.")
-    plan = None
-    if fila.get("plan_id"):
-        plan = PaymentPlan.objects.filter(pk=fila["plan_id"], organizacion_id=organizacion_id, activo=True).first()
-        if not plan:
-            raise ValidationError("El plan seleccionado no pertenece a la organización o no está activo.")
-    documento = None
-    if fila.get("documento_tributario_id"):
-        documento = DocumentoTributario.objects.filter(
-            pk=fila["documento_tributario_id"], organizacion_id=organizacion_id
-        ).first()
-        if not documento:
-            raise ValidationError("El documento seleccionado no pertenece a la organización.")
-    return persona, plan, documento
+    ).distinct()
+    referencias = {"persona_id": {persona.pk: persona for persona in personas}}
+    consultas = {
+        "plan_id": PaymentPlan.objects.filter(organizacion_id=organizacion_id, activo=True),
+        "documento_tributario_id": DocumentoTributario.objects.filter(organizacion_id=organizacion_id),
+        "disciplina_id": Disciplina.objects.filter(organizacion_id=organizacion_id, activa=True),
+    }
+    for campo, queryset in consultas.items():
+        pks = ids(campo)
+        referencias[campo] = queryset.in_bulk(pks) if pks else {}
+    return referencias
+
+
+def _resolver_filas_lote(*, filas, organizacion_id):
+    """Valida las filas en orden con las referencias precargadas; la primera fila inválida aborta."""
+    referencias = _referencias_lote(filas=filas, organizacion_id=organizacion_id)
+    errores = {
+        "persona_id": "La persona seleccionada no es elegible para la organización.",
+        "plan_id": "El plan seleccionado no pertenece a la organización o no está activo.",
+        "documento_tributario_id": "El documento seleccionado no pertenece a la organización.",
+        "disciplina_id": "La disciplina no pertenece a la organización o no está activa.",
+    }
+    personas_vistas = set()
+    resueltas = []
+    for fila in filas:
+        if fila["persona_id"] in personas_vistas:
+            raise ValidationError("Una persona no puede repetirse dentro del lote.")
+        personas_vistas.add(fila["persona_id"])
+        objetos = {}
+        for campo, mensaje in errores.items():
+            if campo != "persona_id" and not fila.get(campo):
+                objetos[campo] = None
+                continue
+            objetos[campo] = referencias[campo].get(fila[campo])
+            if objetos[campo] is None:
+                raise ValidationError(mensaje)
+        resueltas.append(objetos)
+    return resueltas
 
 
 @transaction.atomic
 def confirmar_lote_pagos(
     *, usuario, organizacion_id, clave_idempotencia, filas, metadatos=None, respaldo=None
 ):
-    """Confirma todas las filas o ninguna; una clave solo puede producir un lote."""
+    """Confirma todas las filas o ninguna; una clave solo puede producir un lote.
+
+    Equivale a `crear_pago_operacional` por fila, pero valida contra referencias
+    precargadas, inserta pagos y transacciones en bloque, imputa deudas una vez por
+    organización y mes, y escribe la auditoría en un solo lote.
+    """
     try:
         with transaction.atomic():
             lote = LotePago.objects.create(
@@ -164,64 +224,85 @@ def confirmar_lote_pagos(
             return lote, False
         raise
 
-    pagos = []
-    try:
-        personas_vistas = set()
-        for indice, fila in enumerate(filas):
-            if fila["persona_id"] in personas_vistas:
-                raise ValidationError("Una persona no puede repetirse dentro del lote.")
-            personas_vistas.add(fila["persona_id"])
-            persona, plan, documento = _resolver_fila_pago(fila=fila, organizacion_id=organizacion_id)
-            disciplina = None
-            if fila.get("disciplina_id"):
-                from asistencias.models import Disciplina
-
-                disciplina = Disciplina.objects.filter(
-                    pk=fila["disciplina_id"],
-                    organizacion_id=organizacion_id,
-                    activa=True,
-                ).first()
-                if not disciplina:
-                    raise ValidationError("La disciplina no pertenece a la organización o no está activa.")
-            pago = Payment(
-                persona=persona,
-                organizacion_id=organizacion_id,
-                plan=plan,
-                disciplina=disciplina,
-                documento_tributario=documento,
-                fecha_pago=fila["fecha_pago"],
-                metodo_pago=fila["metodo_pago"],
-                numero_comprobante=fila.get("numero_comprobante", ""),
-                aplica_iva=fila.get("aplica_iva", True),
-                monto_incluye_iva=fila.get("monto_incluye_iva", False),
-                monto_referencia=fila["monto_referencia"],
-                clases_asignadas=fila.get("clases_asignadas", 0),
-                observaciones=fila.get("observaciones", ""),
-            )
-            clave_item = fila.get("clave_idempotencia") or (
-                f"{clave_idempotencia}:{indice}:{persona.pk}"
-            )
-            pagos.append(
-                crear_pago_operacional(
+    resueltas = _resolver_filas_lote(filas=filas, organizacion_id=organizacion_id)
+    # Igual que `crear_pago_operacional`: una clave con espacios sigue siendo la misma clave.
+    claves = [
+        (fila.get("clave_idempotencia") or "").strip() or f"{clave_idempotencia}:{indice}:{objetos['persona_id'].pk}"
+        for indice, (fila, objetos) in enumerate(zip(filas, resueltas))
+    ]
+    existentes = Payment.objects.select_for_update().in_bulk(set(claves), field_name="clave_idempotencia")
+    for existente in existentes.values():
+        if existente.organizacion_id != organizacion_id:
+            raise ValidationError("La clave de idempotencia pertenece a otra organización.")
+
+    organizacion = lote.organizacion
+    registrado_por = usuario if getattr(usuario, "is_authenticated", False) else None
+    por_clave = dict(existentes)
+    nuevos = []
+    for fila, objetos, clave_item in zip(filas, resueltas, claves):
+        if clave_item in por_clave:
+            continue
+        pago = Payment(
+            persona=objetos["persona_id"],
+            organizacion=organizacion,
+            plan=objetos["plan_id"],
+            disciplina=objetos["disciplina_id"],
+            documento_tributario=objetos["documento_tributario_id"],
+            fecha_pago=fila["fecha_pago"],
+            metodo_pago=fila["metodo_pago"],
+            numero_comprobante=fila.get("numero_comprobante", ""),
+            aplica_iva=fila.get("aplica_iva", True),
+            monto_incluye_iva=fila.get("monto_incluye_iva", False),
+            monto_referencia=fila["monto_referencia"],
+            clases_asignadas=fila.get("clases_asignadas", 0),
+            observaciones=fila.get("observaciones", ""),
+            lote=lote,
+            registrado_por=registrado_por,
+            clave_idempotencia=clave_item,
+        )
+        pago.completar_campos_calculados()
+        por_clave[clave_item] = pago
+        nuevos.append(pago)
+    pagos = [por_clave[clave_item] for clave_item in claves]
+
+    auditorias = []
+    if nuevos:
+        categoria = _categoria_cobranza()
+        transacciones = Transaction.objects.bulk_create(
+            [_transaccion_de_pago(pago, categoria) for pago in nuevos]
+        )
+        for pago, transaccion in zip(nuevos, transacciones):
+            pago.transaccion = transaccion
+        Payment.objects.bulk_create(nuevos)
+        # `bulk_create` no emite señales: se aplica aquí el trabajo de `finanzas.signals`.
+        imputar_consumos_en_lote(pago_ids=[pago.pk for pago in nuevos])
+        invalidar_resumenes_mensuales({clave_resumen(organizacion_id, pago.fecha_pago) for pago in nuevos})
+        invalidar_selectores([organizacion_id])
+        for pago in nuevos:
+            auditorias.extend(
+                _auditorias_pago_creado(
                     pago=pago,
+                    transaccion=pago.transaccion,
                     usuario=usuario,
                     lote=lote,
                     origen="pago_masivo",
-                    clave_idempotencia=clave_item,
+                    clave_idempotencia=pago.clave_idempotencia,
                 )
             )
-        lote.cantidad_pagos = len(pagos)
-        lote.monto_total = sum((pago.monto_total for pago in pagos), 0)
-        lote.confirmado_en = timezone.now()
-        lote.save(update_fields=["cantidad_pagos", "monto_total", "confirmado_en", "actualizado_en"])
-        registrar_auditoria(
-            usuario=usuario,
-            accion=AuditLog.ACCION_CREAR,
-            dominio="finanzas",
-            objeto=lote,
-            organizacion=lote.organizacion,
-            resumen="Lote de pagos confirmado",
-            metadata={
+
+    lote.cantidad_pagos = len(pagos)
+    lote.monto_total = sum((pago.monto_total for pago in pagos), 0)
+    lote.confirmado_en = timezone.now()
+    lote.save(update_fields=["cantidad_pagos", "monto_total", "confirmado_en", "actualizado_en"])
+    auditorias.append(
+        {
+            "usuario": usuario,
+            "accion": AuditLog.ACCION_CREAR,
+            "dominio": "finanzas",
+            "objeto": lote,
+            "organizacion": organizacion,
+            "resumen": "Lote de pagos confirmado",
+            "metadata": {
                 "lote_id": str(lote.pk),
                 "pago_ids": [pago.pk for pago in pagos],
                 "cantidad_pagos": lote.cantidad_pagos,
@@ -229,9 +310,9 @@ def confirmar_lote_pagos(
                 "transaccion_ids": [pago.transaccion_id for pago in pagos],
                 "origen": "pago_masivo",
             },
-        )
-    except Exception:
-        raise
+        }
+    )
+    registrar_auditorias(auditorias)
     return lote, True
 
 
@@ -285,7 +366,7 @@ def enriquecer_pagos_para_listado(pagos):
 
 def calcular_saldo_clases_pago(pago, *, consumos_consumidos=None):
     if consumos_consumidos is None:
-        consumos_consumidos = pago.consumos.filter(estado=AttendanceConsumption.Estado.CONSUMIDO).count()
+        consumos_consumidos = pago.clases_consumidas
     return pago.clases_asignadas - consumos_consumidos
 
 
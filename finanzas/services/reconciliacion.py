@@ -1,10 +1,17 @@
 from collections import defaultdict
+from datetime import timedelta
+from time import perf_counter
 
-from django.db.models import Count, F, Q
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count, Exists, F, OuterRef, Q
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
 
-from asistencias.models import ClaseLiberada
+from asistencias.models import Asistencia, ClaseLiberada
+from plataformaelemental.context import filtros_periodo
 
-from ..models import AttendanceConsumption, Payment
+from ..models import AttendanceConsumption, EjecucionReconciliacion, HallazgoReconciliacion, Payment
 
 
 TIPOS_INCONSISTENCIA = (
@@ -19,122 +26,314 @@ TIPOS_INCONSISTENCIA = (
     "estado_asistencia_incompatible",
 )
 
+CAMPO_ORGANIZACION_CONSUMO = "asistencia__sesion__disciplina__organizacion_id"
+CAMPO_FECHA_CLASE = "asistencia__sesion__fecha"
+CONSUMIDO = AttendanceConsumption.Estado.CONSUMIDO
+# Solapamiento para no perder filas de transacciones que confirmaron después de fijar la marca.
+MARGEN_MARCA_AGUA = timedelta(minutes=5)
 
-def _mismo_periodo_mensual(fecha_a, fecha_b):
-    return fecha_a.year == fecha_b.year and fecha_a.month == fecha_b.month
 
+def _consumos_en_alcance(*, organizacion=None, desde=None, hasta=None):
+    consumos = AttendanceConsumption.objects.filter(**filtros_periodo(CAMPO_FECHA_CLASE, desde=desde, hasta=hasta))
+    if organizacion is not None:
+        consumos = consumos.filter(**{CAMPO_ORGANIZACION_CONSUMO: organizacion.pk})
+    return consumos
 
-def _plan_cubre_fecha(pago, fecha):
-    if not pago.plan_id:
-        return True
-    if pago.plan.fecha_inicio and fecha < pago.plan.fecha_inicio:
-        return False
-    if pago.plan.fecha_fin and fecha > pago.plan.fecha_fin:
-        return False
-    return True
 
+def _pagos_en_alcance(*, organizacion=None, desde=None, hasta=None):
+    pagos = Payment.objects.filter(**filtros_periodo("fecha_pago", desde=desde, hasta=hasta))
+    if organizacion is not None:
+        pagos = pagos.filter(organizacion=organizacion)
+    return pagos
 
-def reconciliar_integridad_dominio():
-    hallazgos = defaultdict(list)
 
+def _liberacion_activa():
+    return Exists(ClaseLiberada.objects.filter(asistencia_id=OuterRef("asistencia_id"), revertida_en__isnull=True))
+
+
+def _referencias(consumos, *, con_pago=False):
+    campos = ["pk", "asistencia_id", CAMPO_ORGANIZACION_CONSUMO]
+    if con_pago:
+        campos.append("pago_id")
+    claves = ["consumo_id", "asistencia_id", "organizacion_id", "pago_id"]
+    return [dict(zip(claves, fila)) for fila in consumos.order_by("id").values_list(*campos)]
+
+
+def _consumos_con_pago(consumos):
+    return consumos.filter(estado=CONSUMIDO, pago__isnull=False)
+
+
+def _consumos_duplicados(consumos, pagos):
     duplicados = (
-        AttendanceConsumption.objects.values("asistencia_id")
+        consumos.values("asistencia_id")
         .annotate(total=Count("id"))
         .filter(total__gt=1)
+        .order_by("asistencia_id")
     )
-    hallazgos["consumos_duplicados"] = [
-        {"asistencia_id": item["asistencia_id"], "total": item["total"]}
-        for item in duplicados
-    ]
-
-    consumos = AttendanceConsumption.objects.select_related(
-        "pago__plan",
-        "asistencia__sesion__disciplina__organizacion",
-        "asistencia__persona",
-    ).order_by("id")
-    liberaciones_activas = set(
-        ClaseLiberada.objects.filter(revertida_en__isnull=True).values_list(
-            "asistencia_id",
-            flat=True,
-        )
+    return [{"asistencia_id": item["asistencia_id"], "total": item["total"]} for item in duplicados]
+
+
+def _consumo_fuera_periodo(consumos, pagos):
+    return _referencias(
+        _consumos_con_pago(consumos)
+        .annotate(mes_pago=TruncMonth("pago__fecha_pago"), mes_clase=TruncMonth(CAMPO_FECHA_CLASE))
+        .exclude(mes_pago=F("mes_clase")),
+        con_pago=True,
     )
+
+
+def _consumo_sin_pago(consumos, pagos):
+    return _referencias(consumos.filter(estado=CONSUMIDO, pago__isnull=True))
+
+
+def _sobreconsumo_pago(consumos, pagos):
     pagos_sobreconsumidos = (
-        Payment.objects.annotate(
-            consumos_consumidos=Count(
-                "consumos",
-                filter=Q(consumos__estado=AttendanceConsumption.Estado.CONSUMIDO),
-            )
-        )
+        pagos.annotate(consumos_consumidos=Count("consumos", filter=Q(consumos__estado=CONSUMIDO)))
         .filter(consumos_consumidos__gt=F("clases_asignadas"))
         .order_by("id")
+        .values_list("pk", "organizacion_id", "clases_asignadas", "consumos_consumidos")
     )
-    hallazgos["sobreconsumo_pago"] = [
-        {
-            "pago_id": pago.pk,
-            "organizacion_id": pago.organizacion_id,
-            "clases_asignadas": pago.clases_asignadas,
-            "consumos_consumidos": pago.consumos_consumidos,
-        }
-        for pago in pagos_sobreconsumidos
-    ]
-
-    for consumo in consumos:
-        asistencia = consumo.asistencia
-        organizacion_id = asistencia.sesion.disciplina.organizacion_id
-        referencia = {
-            "consumo_id": consumo.pk,
-            "asistencia_id": asistencia.pk,
-            "organizacion_id": organizacion_id,
-        }
-        if (
-            consumo.estado == AttendanceConsumption.Estado.CONSUMIDO
-            and not consumo.pago_id
-        ):
-            hallazgos["consumo_sin_pago"].append(referencia)
-        if (
-            asistencia.pk in liberaciones_activas
-            and consumo.estado == AttendanceConsumption.Estado.CONSUMIDO
-        ):
-            hallazgos["clase_liberada_consumiendo"].append(referencia)
-        if consumo.pago_id and consumo.estado == AttendanceConsumption.Estado.CONSUMIDO:
-            referencia_pago = {**referencia, "pago_id": consumo.pago_id}
-            if not _mismo_periodo_mensual(
-                consumo.pago.fecha_pago,
-                asistencia.sesion.fecha,
-            ):
-                hallazgos["consumo_fuera_periodo"].append(referencia_pago)
-            if (
-                consumo.pago.organizacion_id != organizacion_id
-                or consumo.pago.persona_id != asistencia.persona_id
-            ):
-                hallazgos["consumo_otra_persona_organizacion"].append(
-                    referencia_pago
-                )
-            if consumo.pago.revertido_en:
-                hallazgos["pago_revertido_incluido"].append(referencia_pago)
-            if not _plan_cubre_fecha(consumo.pago, asistencia.sesion.fecha):
-                hallazgos["plan_fuera_vigencia"].append(referencia_pago)
-
-        if asistencia.pk in liberaciones_activas:
-            incompatible = (
-                consumo.estado != AttendanceConsumption.Estado.PENDIENTE
-                or consumo.pago_id is not None
-            )
-        else:
-            incompatible = (
-                consumo.estado == AttendanceConsumption.Estado.PENDIENTE
-                or (
-                    consumo.estado == AttendanceConsumption.Estado.DEUDA
-                    and consumo.pago_id is not None
-                )
-            )
-        if incompatible:
-            hallazgos["estado_asistencia_incompatible"].append(referencia)
+    claves = ["pago_id", "organizacion_id", "clases_asignadas", "consumos_consumidos"]
+    return [dict(zip(claves, fila)) for fila in pagos_sobreconsumidos]
+
+
+def _clase_liberada_consumiendo(consumos, pagos):
+    return _referencias(consumos.filter(_liberacion_activa(), estado=CONSUMIDO))
+
+
+def _consumo_otra_persona_organizacion(consumos, pagos):
+    return _referencias(
+        _consumos_con_pago(consumos).filter(
+            ~Q(pago__organizacion_id=F(CAMPO_ORGANIZACION_CONSUMO)) | ~Q(pago__persona_id=F("asistencia__persona_id"))
+        ),
+        con_pago=True,
+    )
+
+
+def _pago_revertido_incluido(consumos, pagos):
+    return _referencias(_consumos_con_pago(consumos).filter(pago__revertido_en__isnull=False), con_pago=True)
+
+
+def _plan_fuera_vigencia(consumos, pagos):
+    return _referencias(
+        _consumos_con_pago(consumos).filter(
+            Q(pago__plan__fecha_inicio__gt=F(CAMPO_FECHA_CLASE)) | Q(pago__plan__fecha_fin__lt=F(CAMPO_FECHA_CLASE))
+        ),
+        con_pago=True,
+    )
+
+
+def _estado_asistencia_incompatible(consumos, pagos):
+    pendiente = AttendanceConsumption.Estado.PENDIENTE
+    liberada_no_pendiente = Q(liberada=True) & (~Q(estado=pendiente) | Q(pago__isnull=False))
+    ordinaria_incompatible = Q(liberada=False) & (
+        Q(estado=pendiente) | Q(estado=AttendanceConsumption.Estado.DEUDA, pago__isnull=False)
+    )
+    return _referencias(
+        consumos.annotate(liberada=_liberacion_activa()).filter(liberada_no_pendiente | ordinaria_incompatible)
+    )
+
+
+VERIFICACIONES = {
+    "consumos_duplicados": _consumos_duplicados,
+    "consumo_fuera_periodo": _consumo_fuera_periodo,
+    "consumo_sin_pago": _consumo_sin_pago,
+    "sobreconsumo_pago": _sobreconsumo_pago,
+    "clase_liberada_consumiendo": _clase_liberada_consumiendo,
+    "consumo_otra_persona_organizacion": _consumo_otra_persona_organizacion,
+    "pago_revertido_incluido": _pago_revertido_incluido,
+    "plan_fuera_vigencia": _plan_fuera_vigencia,
+    "estado_asistencia_incompatible": _estado_asistencia_incompatible,
+}
 
-    detalle = {tipo: hallazgos.get(tipo, []) for tipo in TIPOS_INCONSISTENCIA}
+
+def _verificar(consumos, pagos, tiempos):
+    detalle = {}
+    for tipo in TIPOS_INCONSISTENCIA:
+        inicio = perf_counter()
+        detalle[tipo] = VERIFICACIONES[tipo](consumos, pagos)
+        if tiempos is not None:
+            tiempos[tipo] = perf_counter() - inicio
+    return detalle
+
+
+def _resultado(detalle):
     resumen = {tipo: len(detalle[tipo]) for tipo in TIPOS_INCONSISTENCIA}
     return {
         "ok": not any(resumen.values()),
         "resumen": resumen,
         "detalle": detalle,
     }
+
+
+def _clave_hallazgo(referencia):
+    if "consumo_id" in referencia:
+        return f"consumo:{referencia['consumo_id']}"
+    if "pago_id" in referencia:
+        return f"pago:{referencia['pago_id']}"
+    return f"asistencia:{referencia['asistencia_id']}"
+
+
+def _alcance_incremental(marca_anterior):
+    """Consumos y pagos a revisar: tocados desde la marca, sus dependientes y los hallazgos abiertos."""
+    marca_anterior -= MARGEN_MARCA_AGUA
+    abiertos = HallazgoReconciliacion.objects.filter(resuelto_en__isnull=True).values_list("clave", flat=True)
+    ids_abiertos = defaultdict(set)
+    for clave in abiertos:
+        prefijo, pk = clave.split(":", 1)
+        ids_abiertos[prefijo].add(int(pk))
+
+    pago_ids = set(Payment.objects.filter(actualizado_en__gte=marca_anterior).values_list("pk", flat=True))
+    pago_ids |= set(
+        Payment.objects.filter(plan__actualizado_en__gte=marca_anterior).values_list("pk", flat=True)
+    )
+    asistencia_ids = set(
+        ClaseLiberada.objects.filter(
+            Q(liberada_en__gte=marca_anterior) | Q(revertida_en__gte=marca_anterior)
+        ).values_list("asistencia_id", flat=True)
+    )
+    # Cambios de fecha o disciplina de la sesión, de persona de la asistencia o de organización de
+    # la disciplina no tocan el consumo, pero cambian lo que verifican varias comprobaciones.
+    asistencia_ids |= set(
+        Asistencia.objects.filter(actualizado_en__gte=marca_anterior)
+        .values_list("pk", flat=True)
+        .union(
+            Asistencia.objects.filter(sesion__actualizado_en__gte=marca_anterior).values_list("pk", flat=True),
+            Asistencia.objects.filter(sesion__disciplina__actualizado_en__gte=marca_anterior).values_list(
+                "pk", flat=True
+            ),
+        )
+    )
+    asistencia_ids |= ids_abiertos["asistencia"]
+    consumos = AttendanceConsumption.objects.filter(
+        Q(actualizado_en__gte=marca_anterior)
+        | Q(pago_id__in=pago_ids)
+        | Q(asistencia_id__in=asistencia_ids)
+        | Q(pk__in=ids_abiertos["consumo"])
+    )
+    consumos_tocados = list(consumos.values_list("pk", "asistencia_id", "pago_id"))
+    asistencia_ids |= {asistencia_id for _, asistencia_id, _ in consumos_tocados}
+    pago_ids |= {pago_id for _, _, pago_id in consumos_tocados if pago_id}
+    pago_ids |= ids_abiertos["pago"]
+    claves_revisadas = (
+        {f"consumo:{pk}" for pk, _, _ in consumos_tocados}
+        | {f"consumo:{pk}" for pk in ids_abiertos["consumo"]}
+        | {f"pago:{pk}" for pk in pago_ids}
+        | {f"asistencia:{pk}" for pk in asistencia_ids}
+    )
+    return (
+        AttendanceConsumption.objects.filter(asistencia_id__in=asistencia_ids),
+        Payment.objects.filter(pk__in=pago_ids),
+        claves_revisadas,
+    )
+
+
+def _persistir_hallazgos(detalle, *, claves_revisadas=None):
+    """Abre o actualiza los hallazgos encontrados y resuelve los revisados que ya no aparecen."""
+    ahora = timezone.now()
+    encontrados = {
+        (tipo, _clave_hallazgo(referencia)): referencia
+        for tipo in TIPOS_INCONSISTENCIA
+        for referencia in detalle[tipo]
+    }
+    existentes = {
+        (hallazgo.tipo, hallazgo.clave): hallazgo
+        for hallazgo in HallazgoReconciliacion.objects.select_for_update().filter(
+            Q(resuelto_en__isnull=True) | Q(clave__in={clave for _, clave in encontrados})
+        )
+    }
+    por_crear = []
+    por_actualizar = []
+    for (tipo, clave), referencia in encontrados.items():
+        hallazgo = existentes.get((tipo, clave))
+        if hallazgo is None:
+            por_crear.append(
+                HallazgoReconciliacion(
+                    tipo=tipo,
+                    clave=clave,
+                    organizacion_id=referencia.get("organizacion_id"),
+                    detalle=referencia,
+                )
+            )
+            continue
+        hallazgo.detalle = referencia
+        hallazgo.organizacion_id = referencia.get("organizacion_id")
+        hallazgo.resuelto_en = None
+        hallazgo.revisado_en = ahora
+        por_actualizar.append(hallazgo)
+    for (tipo, clave), hallazgo in existentes.items():
+        if hallazgo.resuelto_en or (tipo, clave) in encontrados:
+            continue
+        if claves_revisadas is not None and clave not in claves_revisadas:
+            continue
+        hallazgo.resuelto_en = ahora
+        hallazgo.revisado_en = ahora
+        por_actualizar.append(hallazgo)
+    HallazgoReconciliacion.objects.bulk_create(por_crear)
+    HallazgoReconciliacion.objects.bulk_update(
+        por_actualizar,
+        ["detalle", "organizacion", "resuelto_en", "revisado_en"],
+    )
+
+
+def _referencia_ordenada(referencia):
+    """Devuelve la referencia con el orden de campos del diagnóstico (jsonb no conserva el orden)."""
+    if "consumo_id" in referencia or "pago_id" not in referencia:
+        orden = ("consumo_id", "asistencia_id", "organizacion_id", "pago_id", "total")
+    else:
+        orden = ("pago_id", "organizacion_id", "clases_asignadas", "consumos_consumidos")
+    return {campo: referencia[campo] for campo in orden if campo in referencia}
+
+
+def _detalle_hallazgos_abiertos():
+    detalle = {tipo: [] for tipo in TIPOS_INCONSISTENCIA}
+    abiertos = HallazgoReconciliacion.objects.filter(
+        resuelto_en__isnull=True,
+        tipo__in=TIPOS_INCONSISTENCIA,
+    ).values_list("tipo", "detalle")
+    for tipo, referencia in abiertos:
+        detalle[tipo].append(_referencia_ordenada(referencia))
+    for referencias in detalle.values():
+        referencias.sort(key=lambda item: next(iter(item.values())))
+    return detalle
+
+
+@transaction.atomic
+def _reconciliar_incremental(*, tiempos=None):
+    marca_agua = timezone.now()
+    ultima = EjecucionReconciliacion.objects.order_by("-marca_agua", "-id").first()
+    if ultima is None:
+        modo = EjecucionReconciliacion.Modo.COMPLETA
+        consumos, pagos, claves_revisadas = _consumos_en_alcance(), _pagos_en_alcance(), None
+    else:
+        modo = EjecucionReconciliacion.Modo.INCREMENTAL
+        consumos, pagos, claves_revisadas = _alcance_incremental(ultima.marca_agua)
+
+    _persistir_hallazgos(_verificar(consumos, pagos, tiempos), claves_revisadas=claves_revisadas)
+    detalle = _detalle_hallazgos_abiertos()
+    EjecucionReconciliacion.objects.create(
+        marca_agua=marca_agua,
+        modo=modo,
+        consumos_revisados=consumos.count(),
+        pagos_revisados=pagos.count(),
+        hallazgos_abiertos=sum(len(referencias) for referencias in detalle.values()),
+    )
+    return _resultado(detalle)
+
+
+def reconciliar_integridad_dominio(*, organizacion=None, desde=None, hasta=None, tiempos=None, incremental=False):
+    """Diagnostica las inconsistencias de dominio con una consulta agregada o anti-join por tipo.
+
+    `organizacion` y `desde`/`hasta` (inclusive, sobre la fecha de la clase o del pago)
+    acotan el alcance. Si se entrega `tiempos` (dict), se completa con los segundos por tipo.
+
+    Con `incremental=True` solo revisa lo tocado desde la última marca de agua (más sus
+    dependientes y los hallazgos abiertos), persiste los hallazgos y devuelve todos los
+    que siguen abiertos. La primera corrida incremental revisa todo.
+    """
+    if incremental:
+        if organizacion is not None or desde is not None or hasta is not None:
+            raise ValidationError("El modo incremental revisa todas las organizaciones y fechas.")
+        return _reconciliar_incremental(tiempos=tiempos)
+    alcance = {"organizacion": organizacion, "desde": desde, "hasta": hasta}
+    return _resultado(_verificar(_consumos_en_alcance(**alcance), _pagos_en_alcance(**alcance), tiempos))
@@ -0,0 +1,333 @@
+from collections import defaultdict
+from datetime import date
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from auditoria.models import AuditLog
+from auditoria.services import registrar_auditoria
+from asistencias.models import Asistencia, ClaseLiberada
+from plataformaelemental.cache_selectores import invalidar_selectores
+
+from ..models import AttendanceConsumption, Payment
+from .contadores import recalcular_clases_consumidas
+from .imputacion import _filtro_mismo_periodo_mensual, _plan_vigente_para_fecha
+from .resumen_mensual import clave_resumen, invalidar_resumenes_mensuales
+
+
+TAMANO_LOTE_ESCRITURA = 500
+CAMPOS_CONSUMO = ["persona", "clase_fecha", "pago", "estado", "actualizado_en"]
+
+
+def _cupos_iniciales(pagos, consumos_fuera_alcance):
+    return {
+        pago.pk: pago.clases_asignadas - consumos_fuera_alcance.get(pago.pk, 0)
+        for pago in pagos
+    }
+
+
+def _pago_vigente(pago, asistencia, cupos):
+    return (
+        pago is not None
+        and pago.persona_id == asistencia.persona_id
+        and cupos.get(pago.pk, 0) > 0
+        and _plan_vigente_para_fecha(pago, asistencia.sesion.fecha)
+    )
+
+
+def calcular_imputacion_mes(*, asistencias, consumos, pagos, liberadas, consumos_fuera_alcance=None):
+    """Asigna en memoria el destino de cada asistencia con las reglas de `asignar_consumo_asistencia`.
+
+    Conserva primero los consumos que siguen teniendo derecho válido y luego reparte
+    el resto en orden FIFO de pago (`fecha_pago`, `id`) y de clase (`fecha`, `id`).
+    """
+    cupos = _cupos_iniciales(pagos, consumos_fuera_alcance or {})
+    pagos_por_id = {pago.pk: pago for pago in pagos}
+    pagos_por_persona = defaultdict(list)
+    for pago in sorted(pagos, key=lambda item: (item.fecha_pago, item.pk)):
+        pagos_por_persona[pago.persona_id].append(pago)
+
+    asistencias = sorted(asistencias, key=lambda item: (item.sesion.fecha, item.pk))
+    destinos = {}
+    por_asignar = []
+    for asistencia in asistencias:
+        if asistencia.pk in liberadas:
+            destinos[asistencia.pk] = (AttendanceConsumption.Estado.PENDIENTE, None)
+            continue
+        consumo = consumos.get(asistencia.pk)
+        pago_actual = pagos_por_id.get(consumo.pago_id) if consumo else None
+        if _pago_vigente(pago_actual, asistencia, cupos):
+            cupos[pago_actual.pk] -= 1
+            destinos[asistencia.pk] = (AttendanceConsumption.Estado.CONSUMIDO, pago_actual.pk)
+            continue
+        por_asignar.append(asistencia)
+
+    for asistencia in por_asignar:
+        pago_disponible = next(
+            (
+                pago
+                for pago in pagos_por_persona.get(asistencia.persona_id, [])
+                if _pago_vigente(pago, asistencia, cupos)
+            ),
+            None,
+        )
+        if pago_disponible:
+            cupos[pago_disponible.pk] -= 1
+            destinos[asistencia.pk] = (AttendanceConsumption.Estado.CONSUMIDO, pago_disponible.pk)
+        else:
+            destinos[asistencia.pk] = (AttendanceConsumption.Estado.DEUDA, None)
+    return destinos
+
+
+def _validar_periodo(anio, mes):
+    try:
+        return date(int(anio), int(mes), 1)
+    except (TypeError, ValueError) as exc:
+        raise ValidationError("El año y mes no forman un período válido.") from exc
+
+
+def _cargar_destinos(*, asistencias, pagos_qs, aplicar):
+    """Lee consumos, liberaciones y cupos ocupados fuera del lote y calcula los destinos."""
+    asistencia_ids = [asistencia.pk for asistencia in asistencias]
+    consumos_qs = AttendanceConsumption.objects.filter(asistencia_id__in=asistencia_ids).order_by("pk")
+    if aplicar:
+        pagos_qs = pagos_qs.select_for_update(of=("self",))
+        consumos_qs = consumos_qs.select_for_update()
+    pagos = list(pagos_qs)
+    consumos = {consumo.asistencia_id: consumo for consumo in consumos_qs}
+
+    liberadas = set(
+        ClaseLiberada.objects.filter(
+            asistencia_id__in=asistencia_ids,
+            revertida_en__isnull=True,
+        ).values_list("asistencia_id", flat=True)
+    )
+    consumos_fuera_alcance = dict(
+        AttendanceConsumption.objects.filter(
+            pago_id__in=[pago.pk for pago in pagos],
+            estado=AttendanceConsumption.Estado.CONSUMIDO,
+        )
+        .exclude(asistencia_id__in=asistencia_ids)
+        .values("pago_id")
+        .annotate(total=Count("id"))
+        .values_list("pago_id", "total")
+    )
+
+    destinos = calcular_imputacion_mes(
+        asistencias=asistencias,
+        consumos=consumos,
+        pagos=pagos,
+        liberadas=liberadas,
+        consumos_fuera_alcance=consumos_fuera_alcance,
+    )
+    return pagos, consumos, destinos
+
+
+def _diferencias_consumos(*, asistencias, consumos, destinos):
+    """Compara destinos con los consumos actuales y prepara las filas a crear o actualizar."""
+    ahora = timezone.now()
+    cambios = []
+    por_crear = []
+    por_actualizar = []
+    for asistencia in asistencias:
+        estado, pago_id = destinos[asistencia.pk]
+        consumo = consumos.get(asistencia.pk)
+        if consumo is None:
+            por_crear.append(
+                AttendanceConsumption(
+                    asistencia=asistencia,
+                    persona_id=asistencia.persona_id,
+                    clase_fecha=asistencia.sesion.fecha,
+                    pago_id=pago_id,
+                    estado=estado,
+                )
+            )
+        elif (
+            consumo.estado == estado
+            and consumo.pago_id == pago_id
+            and consumo.persona_id == asistencia.persona_id
+            and consumo.clase_fecha == asistencia.sesion.fecha
+        ):
+            continue
+        else:
+            por_actualizar.append(consumo)
+        cambios.append(
+            {
+                "asistencia_id": asistencia.pk,
+                "persona_id": asistencia.persona_id,
+                "clase_fecha": asistencia.sesion.fecha,
+                "estado_anterior": consumo.estado if consumo else None,
+                "estado_nuevo": estado,
+                "pago_anterior_id": consumo.pago_id if consumo else None,
+                "pago_nuevo_id": pago_id,
+            }
+        )
+        if consumo is not None:
+            consumo.persona_id = asistencia.persona_id
+            consumo.clase_fecha = asistencia.sesion.fecha
+            consumo.pago_id = pago_id
+            consumo.estado = estado
+            consumo.actualizado_en = ahora
+    return cambios, por_crear, por_actualizar
+
+
+def _escribir_consumos(*, cambios, por_crear, por_actualizar):
+    AttendanceConsumption.objects.bulk_create(por_crear, batch_size=TAMANO_LOTE_ESCRITURA)
+    AttendanceConsumption.objects.bulk_update(
+        por_actualizar,
+        CAMPOS_CONSUMO,
+        batch_size=TAMANO_LOTE_ESCRITURA,
+    )
+    pagos_afectados = {
+        pago_id
+        for cambio in cambios
+        for pago_id in (cambio["pago_anterior_id"], cambio["pago_nuevo_id"])
+        if pago_id
+    }
+    if pagos_afectados:
+        recalcular_clases_consumidas(pago_ids=pagos_afectados)
+    invalidar_resumenes_mensuales({clave_resumen(None, cambio["clase_fecha"]) for cambio in cambios})
+    return pagos_afectados
+
+
+@transaction.atomic
+def reimputar_consumos_mes(*, organizacion, anio, mes, aplicar=False, usuario=None):
+    """Recalcula todos los consumos de una organización y mes en una sola pasada.
+
+    Sin `aplicar` solo devuelve el diff; con `aplicar` escribe los cambios en lotes.
+    """
+    referencia = _validar_periodo(anio, mes)
+    filtro_sesion = _filtro_mismo_periodo_mensual(referencia, "sesion__fecha")
+
+    asistencias = list(
+        Asistencia.objects.select_related("sesion")
+        .filter(sesion__disciplina__organizacion=organizacion, **filtro_sesion)
+        .order_by("pk")
+    )
+    pagos_qs = (
+        Payment.objects.select_related("plan")
+        .filter(
+            organizacion=organizacion,
+            revertido_en__isnull=True,
+            clases_asignadas__gt=0,
+            **_filtro_mismo_periodo_mensual(referencia, "fecha_pago"),
+        )
+        .order_by("pk")
+    )
+    pagos, consumos, destinos = _cargar_destinos(asistencias=asistencias, pagos_qs=pagos_qs, aplicar=aplicar)
+    cambios, por_crear, por_actualizar = _diferencias_consumos(
+        asistencias=asistencias,
+        consumos=consumos,
+        destinos=destinos,
+    )
+
+    if aplicar:
+        _escribir_consumos(cambios=cambios, por_crear=por_crear, por_actualizar=por_actualizar)
+        if cambios:
+            invalidar_selectores([organizacion.pk])
+            registrar_auditoria(
+                usuario=usuario,
+                accion=AuditLog.ACCION_EDITAR,
+                dominio="finanzas",
+                modelo=AttendanceConsumption._meta.label,
+                objeto_id=f"{referencia:%Y-%m}",
+                organizacion=organizacion,
+                resumen="Consumos del mes reimputados en bloque",
+                metadata={
+                    "anio": referencia.year,
+                    "mes": referencia.month,
+                    "consumos_creados": len(por_crear),
+                    "consumos_actualizados": len(por_actualizar),
+                },
+            )
+
+    estados_finales = [estado for estado, _ in destinos.values()]
+    return {
+        "organizacion_id": organizacion.pk,
+        "anio": referencia.year,
+        "mes": referencia.month,
+        "aplicado": aplicar,
+        "resumen": {
+            "asistencias": len(asistencias),
+            "pagos": len(pagos),
+            "consumos_creados": len(por_crear),
+            "consumos_actualizados": len(por_actualizar),
+            "consumidos": estados_finales.count(AttendanceConsumption.Estado.CONSUMIDO),
+            "deudas": estados_finales.count(AttendanceConsumption.Estado.DEUDA),
+            "pendientes": estados_finales.count(AttendanceConsumption.Estado.PENDIENTE),
+        },
+        "cambios": cambios,
+    }
+
+
+def _asistencias_en_deuda_de_pagos(pago_ids):
+    filtro = Q(pk__in=[])
+    pagos = Payment.objects.filter(pk__in=pago_ids, revertido_en__isnull=True, clases_asignadas__gt=0)
+    for persona_id, organizacion_id, fecha_pago in pagos.values_list("persona_id", "organizacion_id", "fecha_pago"):
+        filtro |= Q(
+            persona_id=persona_id,
+            asistencia__sesion__disciplina__organizacion_id=organizacion_id,
+            **_filtro_mismo_periodo_mensual(fecha_pago, "clase_fecha"),
+        )
+    return set(
+        AttendanceConsumption.objects.filter(
+            filtro,
+            estado=AttendanceConsumption.Estado.DEUDA,
+            pago__isnull=True,
+        ).values_list("asistencia_id", flat=True)
+    )
+
+
+@transaction.atomic
+def imputar_consumos_en_lote(*, asistencia_ids=(), pago_ids=()):
+    """Imputa en una pasada las asistencias guardadas y las deudas que cubren los pagos nuevos.
+
+    Equivale a `asignar_consumo_asistencia` por asistencia más `imputar_pago_a_deudas`
+    por pago, pero agrupa por organización y mes y escribe en bloque.
+    """
+    asistencia_ids = set(asistencia_ids)
+    if pago_ids:
+        asistencia_ids |= _asistencias_en_deuda_de_pagos(pago_ids)
+    asistencias = list(
+        Asistencia.objects.select_for_update(of=("self",))
+        .select_related("sesion__disciplina")
+        .filter(pk__in=asistencia_ids)
+        .order_by("pk")
+    )
+    grupos = defaultdict(list)
+    for asistencia in asistencias:
+        clave = (asistencia.sesion.disciplina.organizacion_id, asistencia.sesion.fecha.replace(day=1))
+        grupos[clave].append(asistencia)
+
+    creados = actualizados = 0
+    organizaciones_modificadas = set()
+    for (organizacion_id, referencia), asistencias_grupo in grupos.items():
+        pagos_qs = (
+            Payment.objects.select_related("plan")
+            .filter(
+                organizacion_id=organizacion_id,
+                persona_id__in={asistencia.persona_id for asistencia in asistencias_grupo},
+                revertido_en__isnull=True,
+                clases_asignadas__gt=0,
+                **_filtro_mismo_periodo_mensual(referencia, "fecha_pago"),
+            )
+            .order_by("pk")
+        )
+        _, consumos, destinos = _cargar_destinos(asistencias=asistencias_grupo, pagos_qs=pagos_qs, aplicar=True)
+        cambios, por_crear, por_actualizar = _diferencias_consumos(
+            asistencias=asistencias_grupo,
+            consumos=consumos,
+            destinos=destinos,
+        )
+        _escribir_consumos(cambios=cambios, por_crear=por_crear, por_actualizar=por_actualizar)
+        if cambios:
+            organizaciones_modificadas.add(organizacion_id)
+        creados += len(por_crear)
+        actualizados += len(por_actualizar)
+    invalidar_selectores(organizaciones_modificadas)
+    return {"asistencias": len(asistencias), "consumos_creados": creados, "consumos_actualizados": actualizados}
+
+
+__all__ = ["calcular_imputacion_mes", "imputar_consumos_en_lote", "reimputar_consumos_mes"]
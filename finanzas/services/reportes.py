@@ -1,5 +1,6 @@
 from ..models import Transaction
 from ..selectors import resumen_dashboard
+from .resumen_mensual import mes_cerrado, resumen_dashboard_mensual
 
 
 PAGOS_CSV_HEADERS = ["Fecha", "Organizacion", "Persona", "Metodo", "Neto", "IVA", "Total", "Clases"]
@@ -56,16 +57,33 @@ def armar_dashboard_financiero(
     organizacion,
     mes=None,
     anio=None,
+    trimestre=None,
+    desde=None,
+    hasta=None,
+    resumen_mensual=False,
 ):
-    return {
-        **resumen_dashboard(
+    if resumen_mensual and mes and anio and mes_cerrado(anio, mes):
+        resumen = resumen_dashboard_mensual(
+            anio=anio,
+            mes=mes,
+            organizacion=organizacion,
+            pagos_qs=pagos_qs,
+            transacciones_qs=transacciones_qs,
+        )
+    else:
+        resumen = resumen_dashboard(
             pagos_qs,
             transacciones_qs,
             documentos_qs,
             consumos_qs,
             mes=mes,
             anio=anio,
-        ),
+            trimestre=trimestre,
+            desde=desde,
+            hasta=hasta,
+        )
+    return {
+        **resumen,
         "pagos_recientes": pagos_qs.select_related("persona", "organizacion")[:10],
         "transacciones_recientes": transacciones_qs.select_related("categoria", "organizacion")[:10],
         "periodo_descripcion_vista": periodo_descripcion,
@@ -0,0 +1,249 @@
+"""Resumen financiero mensual materializado para el dashboard.
+
+Los meses cerrados (anteriores al mes en curso) casi no cambian, así que sus totales
+escalares se guardan por organización en `ResumenFinancieroMensual`. Las escrituras que
+tocan un mes cerrado borran su fila y el dashboard la recalcula con las mismas funciones
+del cálculo en vivo la próxima vez que se consulta. El mes en curso y los rangos
+arbitrarios siempre se calculan en vivo.
+
+En PostgreSQL el borrado y el cálculo de una fila faltante toman el mismo lock asesor de
+`(organización, mes)` hasta el fin de su transacción. Así una lectura no puede guardar
+totales calculados antes del commit de una escritura cuyo borrado ya corrió: espera ese
+commit, o la escritura espera a que la fila exista para borrarla.
+"""
+
+from django.db import connection, transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from personas.models import Organizacion
+from plataformaelemental.procesamiento import encolar_trabajo
+
+from ..models import ResumenFinancieroMensual
+from ..selectors import categorias_totales_dashboard, dashboard_querysets, totales_dashboard
+
+
+TRABAJO_RESUMEN_MENSUAL = "finanzas.resumen_mensual"
+CAMPOS_RESUMEN_MENSUAL = (
+    "ingresos_contables",
+    "egresos_contables",
+    "iva_debito",
+    "pagos_operacionales_monto",
+    "total_pagos_operacionales",
+    "total_transacciones",
+    "clases_pagadas",
+    "deuda_clases",
+    "total_documentos_periodo",
+    "documentos_con_transaccion",
+    "transacciones_sin_documento",
+    "transacciones_con_documento_fuera_periodo",
+    "pagos_con_documento_fuera_periodo",
+)
+
+
+def mes_cerrado(anio, mes, *, hoy=None):
+    hoy = hoy or timezone.localdate()
+    return (anio, mes) < (hoy.year, hoy.month)
+
+
+def clave_resumen(organizacion_id, fecha):
+    """Clave `(organizacion_id, anio, mes)`; `organizacion_id=None` abarca todas las organizaciones."""
+    return (organizacion_id, fecha.year, fecha.month)
+
+
+def _bloquear_resumenes(claves):
+    """Toma los locks asesores de `claves` hasta el fin de la transacción en curso.
+
+    Cada mes tiene un lock compartido entre organizaciones, exclusivo cuando la clave abarca
+    todas (`organizacion_id=None`), y cada `(organización, mes)` uno exclusivo. Se toman
+    siempre en el mismo orden para que dos transacciones no se bloqueen mutuamente.
+    """
+    if connection.vendor != "postgresql":
+        return
+    meses_completos = {(anio, mes) for organizacion_id, anio, mes in claves if organizacion_id is None}
+    meses = sorted({(anio, mes) for _, anio, mes in claves})
+    por_organizacion = sorted(
+        (anio, mes, organizacion_id)
+        for organizacion_id, anio, mes in claves
+        if organizacion_id is not None and (anio, mes) not in meses_completos
+    )
+    locks = []
+    for anio, mes in meses:
+        funcion = "pg_advisory_xact_lock" if (anio, mes) in meses_completos else "pg_advisory_xact_lock_shared"
+        locks.append((funcion, f"{TRABAJO_RESUMEN_MENSUAL}:{anio}-{mes}"))
+    for anio, mes, organizacion_id in por_organizacion:
+        locks.append(("pg_advisory_xact_lock", f"{TRABAJO_RESUMEN_MENSUAL}:{anio}-{mes}:{organizacion_id}"))
+    # Una sola consulta: PostgreSQL evalúa las columnas en orden.
+    columnas = ", ".join(f"{funcion}(hashtextextended(%s, 0))" for funcion, _ in locks)
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT {columnas}", [clave for _, clave in locks])
+
+
+def _invalidar_resumenes(claves):
+    filtro = Q()
+    for organizacion_id, anio, mes in claves:
+        condicion = Q(anio=anio, mes=mes)
+        if organizacion_id is not None:
+            condicion &= Q(organizacion_id=organizacion_id)
+        filtro |= condicion
+    with transaction.atomic(savepoint=False):
+        _bloquear_resumenes(claves)
+        ResumenFinancieroMensual.objects.filter(filtro).delete()
+
+
+def invalidar_resumenes_mensuales(claves):
+    """Descarta los resúmenes guardados de las claves que caen en meses cerrados.
+
+    Las claves del mes en curso se ignoran sin consultar la base. Dentro de
+    `procesamiento_diferido()` las claves se acumulan y se borran en un solo DELETE.
+    """
+    claves = {clave for clave in claves if mes_cerrado(clave[1], clave[2])}
+    if not claves:
+        return
+    if encolar_trabajo(TRABAJO_RESUMEN_MENSUAL, claves, _invalidar_resumenes):
+        return
+    _invalidar_resumenes(claves)
+
+
+def calcular_resumen_mensual(*, organizacion_id, anio, mes):
+    """Totales de una organización y mes con la misma semántica que el dashboard en vivo."""
+    querysets = dashboard_querysets(None, organizacion=organizacion_id, mes=mes, anio=anio)
+    totales = totales_dashboard(*querysets, mes=mes, anio=anio)
+    return {campo: totales[campo] for campo in CAMPOS_RESUMEN_MENSUAL}
+
+
+def resumenes_del_mes(*, anio, mes, organizacion_ids):
+    """Filas del mes para las organizaciones indicadas; calcula y guarda las que falten.
+
+    Las faltantes se calculan con el lock de su clave tomado (ver `_bloquear_resumenes`) y
+    después de volver a buscarlas, por si otra lectura las guardó mientras se esperaba.
+    """
+    filas = {
+        resumen.organizacion_id: resumen
+        for resumen in ResumenFinancieroMensual.objects.filter(
+            anio=anio,
+            mes=mes,
+            organizacion_id__in=organizacion_ids,
+        )
+    }
+    faltantes = [organizacion_id for organizacion_id in organizacion_ids if organizacion_id not in filas]
+    if not faltantes:
+        return list(filas.values())
+    with transaction.atomic():
+        _bloquear_resumenes({(organizacion_id, anio, mes) for organizacion_id in faltantes})
+        filas.update(
+            (resumen.organizacion_id, resumen)
+            for resumen in ResumenFinancieroMensual.objects.filter(
+                anio=anio,
+                mes=mes,
+                organizacion_id__in=faltantes,
+            )
+        )
+        nuevas = [
+            ResumenFinancieroMensual(
+                organizacion_id=organizacion_id,
+                anio=anio,
+                mes=mes,
+                **calcular_resumen_mensual(organizacion_id=organizacion_id, anio=anio, mes=mes),
+            )
+            for organizacion_id in faltantes
+            if organizacion_id not in filas
+        ]
+        if nuevas:
+            ResumenFinancieroMensual.objects.bulk_create(nuevas, ignore_conflicts=True)
+    return [*filas.values(), *nuevas]
+
+
+def resumen_dashboard_mensual(*, anio, mes, organizacion, pagos_qs, transacciones_qs):
+    """Equivalente de `resumen_dashboard` para un mes cerrado leído desde el resumen materializado.
+
+    `clases_consumidas` y `categorias_totales` siguen calculándose en vivo sobre los
+    querysets del periodo: el contador de los pagos se mueve con consumos posteriores.
+    """
+    if organizacion is not None:
+        organizacion_ids = [getattr(organizacion, "pk", organizacion)]
+    else:
+        organizacion_ids = list(Organizacion.objects.order_by("pk").values_list("pk", flat=True))
+    filas = resumenes_del_mes(anio=anio, mes=mes, organizacion_ids=organizacion_ids)
+    totales = {campo: sum((getattr(fila, campo) for fila in filas), 0) for campo in CAMPOS_RESUMEN_MENSUAL}
+    clases_consumidas = pagos_qs.aggregate(total=Sum("clases_consumidas")).get("total") or 0
+    return {
+        **totales,
+        "saldo_contable": totales["ingresos_contables"] - totales["egresos_contables"],
+        "clases_consumidas": clases_consumidas,
+        "saldo_clases": totales["clases_pagadas"] - clases_consumidas,
+        "pagos_operacionales_no_contables": totales["total_pagos_operacionales"],
+        "categorias_totales": categorias_totales_dashboard(transacciones_qs),
+    }
+
+
+def _meses_entre(desde, hasta):
+    anio, mes = desde.year, desde.month
+    while (anio, mes) <= (hasta.year, hasta.month):
+        yield anio, mes
+        anio, mes = (anio + 1, 1) if mes == 12 else (anio, mes + 1)
+
+
+def reconstruir_resumenes_mensuales(*, desde, hasta, organizacion=None, aplicar=False):
+    """Recalcula los resúmenes de los meses cerrados entre `desde` y `hasta`.
+
+    Sin `aplicar` solo compara lo guardado con el cálculo en vivo; con `aplicar`
+    reescribe todas las filas del rango.
+    """
+    organizaciones = Organizacion.objects.order_by("pk")
+    if organizacion is not None:
+        organizaciones = organizaciones.filter(pk=organizacion.pk)
+    organizacion_ids = list(organizaciones.values_list("pk", flat=True))
+    meses = [(anio, mes) for anio, mes in _meses_entre(desde, hasta) if mes_cerrado(anio, mes)]
+    with transaction.atomic():
+        if aplicar:
+            # El mismo lock que toma una lectura: ninguna escritura borra entre el cálculo y el upsert.
+            _bloquear_resumenes(
+                {(organizacion_id, anio, mes) for anio, mes in meses for organizacion_id in organizacion_ids}
+            )
+        guardados = {
+            (resumen.organizacion_id, resumen.anio, resumen.mes): resumen
+            for resumen in ResumenFinancieroMensual.objects.filter(
+                organizacion_id__in=organizacion_ids,
+                anio__gte=desde.year,
+                anio__lte=hasta.year,
+            )
+        }
+
+        filas = []
+        por_escribir = []
+        for anio, mes in meses:
+            for organizacion_id in organizacion_ids:
+                valores = calcular_resumen_mensual(organizacion_id=organizacion_id, anio=anio, mes=mes)
+                guardado = guardados.get((organizacion_id, anio, mes))
+                if guardado is None:
+                    estado = "faltante"
+                elif any(getattr(guardado, campo) != valor for campo, valor in valores.items()):
+                    estado = "desactualizado"
+                else:
+                    estado = "vigente"
+                filas.append({"organizacion_id": organizacion_id, "anio": anio, "mes": mes, "estado": estado})
+                por_escribir.append(
+                    ResumenFinancieroMensual(organizacion_id=organizacion_id, anio=anio, mes=mes, **valores)
+                )
+
+        if aplicar and por_escribir:
+            ResumenFinancieroMensual.objects.bulk_create(
+                por_escribir,
+                update_conflicts=True,
+                unique_fields=["organizacion", "anio", "mes"],
+                update_fields=[*CAMPOS_RESUMEN_MENSUAL, "calculado_en"],
+            )
+    return {"aplicado": aplicar, "meses": len(meses), "filas": filas}
+
+
+__all__ = [
+    "CAMPOS_RESUMEN_MENSUAL",
+    "calcular_resumen_mensual",
+    "clave_resumen",
+    "invalidar_resumenes_mensuales",
+    "mes_cerrado",
+    "reconstruir_resumenes_mensuales",
+    "resumen_dashboard_mensual",
+    "resumenes_del_mes",
+]
@@ -1,16 +1,37 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
 
 from asistencias.models import Asistencia
+from plataformaelemental.cache_selectores import invalidar_selectores_de
+from plataformaelemental.procesamiento import encolar_trabajo
 
-from .models import Payment
+from .models import AttendanceConsumption, Category, DocumentoTributario, Payment, PaymentPlan, Transaction
 from .services import asignar_consumo_asistencia, imputar_pago_a_deudas
+from .services.reimputacion import imputar_consumos_en_lote
+from .services.resumen_mensual import clave_resumen, invalidar_resumenes_mensuales
+
+
+TRABAJO_IMPUTACION = "finanzas.imputacion"
+CAMPO_FECHA_RESUMEN = {
+    Payment: "fecha_pago",
+    Transaction: "fecha",
+    DocumentoTributario: "fecha_emision",
+}
+
+
+def _procesar_imputacion_diferida(claves):
+    imputar_consumos_en_lote(
+        asistencia_ids={pk for tipo, pk in claves if tipo == "asistencia"},
+        pago_ids={pk for tipo, pk in claves if tipo == "pago"},
+    )
 
 
 @receiver(post_save, sender=Asistencia)
 def crear_consumo_financiero(sender, instance, created, raw=False, **kwargs):
     if raw:
         return
+    if encolar_trabajo(TRABAJO_IMPUTACION, {("asistencia", instance.pk)}, _procesar_imputacion_diferida):
+        return
     asignar_consumo_asistencia(instance)
 
 
@@ -20,4 +41,121 @@ def aplicar_pago_a_consumos_deuda(sender, instance, created, raw=False, **kwargs
         return
     if not created:
         return
+    if encolar_trabajo(TRABAJO_IMPUTACION, {("pago", instance.pk)}, _procesar_imputacion_diferida):
+        return
     imputar_pago_a_deudas(instance)
+
+
+@receiver(post_delete, sender=AttendanceConsumption)
+def descontar_consumo_eliminado(sender, instance, **kwargs):
+    Payment.sumar_clases_consumidas(
+        AttendanceConsumption.deltas_clases_consumidas((instance.pago_id, instance.estado), None)
+    )
+
+
+def _claves_resumen_de(modelo, pks):
+    campo_fecha = CAMPO_FECHA_RESUMEN[modelo]
+    if not pks:
+        return set()
+    return {
+        clave_resumen(organizacion_id, fecha)
+        for organizacion_id, fecha in modelo.objects.filter(pk__in=pks).values_list("organizacion_id", campo_fecha)
+    }
+
+
+def _fecha_instancia(instance, campo):
+    # Las instancias recién creadas pueden traer la fecha como texto ISO.
+    return instance._meta.get_field(campo).to_python(getattr(instance, campo))
+
+
+def _clave_resumen_instancia(instance):
+    return clave_resumen(instance.organizacion_id, _fecha_instancia(instance, CAMPO_FECHA_RESUMEN[type(instance)]))
+
+
+@receiver(pre_save, sender=Payment)
+@receiver(pre_save, sender=Transaction)
+@receiver(pre_save, sender=DocumentoTributario)
+def recordar_mes_resumen_anterior(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._clave_resumen_anterior = None
+    if raw or instance._state.adding:
+        return
+    if update_fields is not None and not set(update_fields) & {"organizacion", CAMPO_FECHA_RESUMEN[sender]}:
+        return
+    claves = _claves_resumen_de(sender, [instance.pk])
+    instance._clave_resumen_anterior = next(iter(claves), None)
+
+
+def _claves_resumen_vinculadas_documento(documento):
+    return _claves_resumen_de(
+        Payment,
+        list(documento.pagos_asociados.values_list("pk", flat=True)),
+    ) | _claves_resumen_de(
+        Transaction,
+        list(documento.transacciones_asociadas.values_list("pk", flat=True)),
+    )
+
+
+@receiver(post_save, sender=Payment)
+@receiver(post_save, sender=Transaction)
+@receiver(post_save, sender=DocumentoTributario)
+@receiver(post_delete, sender=Payment)
+@receiver(post_delete, sender=Transaction)
+def invalidar_resumen_mensual(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    actual = _clave_resumen_instancia(instance)
+    anterior = getattr(instance, "_clave_resumen_anterior", None)
+    claves = {actual, anterior} - {None}
+    if sender is DocumentoTributario and anterior not in {None, actual}:
+        # Los indicadores "fuera de periodo" de pagos y transacciones dependen de la fecha del documento.
+        claves |= _claves_resumen_vinculadas_documento(instance)
+    invalidar_resumenes_mensuales(claves)
+
+
+@receiver(pre_delete, sender=DocumentoTributario)
+def invalidar_resumen_mensual_documento_eliminado(sender, instance, **kwargs):
+    # Antes de borrar: después los pagos ya quedaron sin documento y la tabla intermedia vacía.
+    invalidar_resumenes_mensuales(
+        {_clave_resumen_instancia(instance)} | _claves_resumen_vinculadas_documento(instance)
+    )
+
+
+@receiver(m2m_changed, sender=Transaction.documentos_tributarios.through)
+def invalidar_resumen_documentos_transaccion(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in {"post_add", "post_remove", "pre_clear"}:
+        return
+    if action == "pre_clear":
+        relacionados = instance.transacciones_asociadas if reverse else instance.documentos_tributarios
+        pk_set = set(relacionados.values_list("pk", flat=True))
+    otro_modelo = Transaction if reverse else DocumentoTributario
+    invalidar_resumenes_mensuales({_clave_resumen_instancia(instance)} | _claves_resumen_de(otro_modelo, pk_set))
+
+
+@receiver(post_save, sender=AttendanceConsumption)
+@receiver(post_delete, sender=AttendanceConsumption)
+def invalidar_resumen_mensual_consumo(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    invalidar_resumenes_mensuales({clave_resumen(None, _fecha_instancia(instance, "clase_fecha"))})
+
+
+RUTA_ORGANIZACION_CACHE = {
+    Payment: "organizacion_id",
+    Transaction: "organizacion_id",
+    DocumentoTributario: "organizacion_id",
+    PaymentPlan: "organizacion_id",
+    Category: None,
+    AttendanceConsumption: "asistencia__sesion__disciplina__organizacion_id",
+}
+
+
+@receiver([post_save, post_delete], sender=Payment)
+@receiver([post_save, post_delete], sender=Transaction)
+@receiver([post_save, post_delete], sender=DocumentoTributario)
+@receiver([post_save, post_delete], sender=PaymentPlan)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=AttendanceConsumption)
+def invalidar_cache_selectores(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    invalidar_selectores_de(instance, RUTA_ORGANIZACION_CACHE[sender], eliminada="created" not in kwargs)
@@ -1,16 +1,22 @@
 import csv
+import os
+import subprocess
+import time
+import zipfile
 from io import BytesIO, StringIO
-from datetime import date
+from datetime import date, timedelta
 from pathlib import Path
 from tempfile import TemporaryDirectory
+from threading import Event, Thread
 from urllib.parse import urlencode
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.management import call_command
 from django.core.management.base import CommandError
-from django.db import IntegrityError
-from django.test import SimpleTestCase, TestCase
+from django.db import IntegrityError, connection, connections, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 from decimal import Decimal
@@ -18,11 +24,24 @@ from openpyxl import load_workbook
 from unittest.mock import patch
 
 from auditoria.models import AuditLog
+from finanzas.documentos.lote import extraer_archivos_lote, preparar_lote
+from finanzas.documentos.mapping import clave_documento, detectar_duplicados_documento, duplicados_por_clave
+from finanzas.documentos.parsers import ConfigExtraccionPdf, DteXmlParser, PdfFallbackParser
 from finanzas.documentos.services import parse_tax_document
 from finanzas.documentos.temp_storage import SESSION_KEY
 from finanzas.forms import DocumentoTributarioForm, PaymentForm, TransactionForm
-from finanzas.services import asociar_asistencia_a_pago, resumen_financiero_estudiante
-from finanzas.services.reconciliacion import reconciliar_integridad_dominio
+from finanzas.services import (
+    asignar_consumo_asistencia,
+    asociar_asistencia_a_pago,
+    importar_lote_documentos,
+    resumen_financiero_estudiante,
+)
+from finanzas.services.documentos import INDICE_UNICO_CLAVE, crear_indice_unico_clave, estado_indice_unico_clave
+from finanzas.services.reconciliacion import TIPOS_INCONSISTENCIA, reconciliar_integridad_dominio
+from finanzas.selectors import buscar_en_finanzas, dashboard_querysets, resumen_dashboard
+from finanzas.services.reimputacion import reimputar_consumos_mes
+from finanzas.services.resumen_mensual import calcular_resumen_mensual, resumen_dashboard_mensual, resumenes_del_mes
+from plataformaelemental.procesamiento import procesamiento_diferido
 from finanzas.services.reversas import revertir_pago
 from finanzas.services.pagos import (
     confirmar_lote_pagos,
@@ -33,7 +52,7 @@ from finanzas.services.pagos import (
 )
 
 from asistencias.forms import PersonaRapidaForm
-from asistencias.models import Asistencia, ClaseLiberada, Disciplina, SesionClase
+from asistencias.models import AlumnoDisciplina, Asistencia, ClaseLiberada, Disciplina, SesionClase
 from personas.models import Organizacion, Persona, PersonaRol, Rol
 from personas.test_factories import crear_usuario_con_rol
 
@@ -41,8 +60,13 @@ from finanzas.models import (
     AttendanceConsumption,
     Category,
     DocumentoTributario,
+    EjecucionReconciliacion,
+    HallazgoReconciliacion,
+    ImportacionTemporal,
     Payment,
     PaymentPlan,
+    ResultadoParseoDocumento,
+    ResumenFinancieroMensual,
     Transaction,
     LotePago,
 )
@@ -239,6 +263,124 @@ class FinanzasAccessTests(TestCase):
         response = self.client.get(reverse("finanzas:pagos_list"), {"organizacion": otra_org.pk})
         self.assertEqual(response.status_code, 403)
 
+    def test_buscar_en_finanzas_ordena_por_rango_y_respeta_organizaciones(self):
+        otra_org = Organizacion.objects.create(nombre="Org Ajena", razon_social="Org Ajena SPA", rut="99.999.999-9")
+        categoria = Category.objects.create(nombre="Servicios", tipo=Category.Tipo.EGRESO, activa=True)
+        persona = Persona.objects.create(nombres="José", apellidos="Peña Arriagada", rut="12.345.678-5")
+        PersonaRol.objects.create(persona=persona, rol=self.rol_estudiante, organizacion=self.org, activo=True)
+        Payment.objects.create(
+            persona=persona,
+            organizacion=self.org,
+            fecha_pago="2026-03-01",
+            metodo_pago=Payment.Metodo.EFECTIVO,
+            aplica_iva=False,
+            monto_referencia=10000,
+            numero_comprobante="1234567",
+        )
+        documento = DocumentoTributario.objects.create(
+            organizacion=self.org,
+            tipo_documento=DocumentoTributario.TipoDocumento.FACTURA_AFECTA,
+            folio="12345",
+            rut_emisor="76.543.210-3",
+            nombre_emisor="Arriendos Peña Ltda",
+            fecha_emision="2026-03-02",
+            monto_total=50000,
+        )
+        Transaction.objects.create(
+            organizacion=self.org,
+            categoria=categoria,
+            fecha="2026-03-03",
+            tipo=Transaction.Tipo.EGRESO,
+            monto=50000,
+            descripcion="Pago arriendo sala marzo",
+        )
+        Transaction.objects.create(
+            organizacion=otra_org,
+            categoria=categoria,
+            fecha="2026-03-03",
+            tipo=Transaction.Tipo.EGRESO,
+            monto=1000,
+            descripcion="Arriendo de otra organización",
+        )
+
+        resultados = buscar_en_finanzas("12345", organizacion_ids=[self.org.pk])
+        self.assertEqual((resultados[0]["tipo"], resultados[0]["id"]), ("documento", documento.pk))
+        # El comprobante es un prefijo; el RUT de la persona (123456785) también empieza por 12345.
+        self.assertEqual([item["tipo"] for item in resultados], ["documento", "pago", "persona"])
+
+        self.assertEqual(
+            [item["tipo"] for item in buscar_en_finanzas("12.345.678-5", organizacion_ids=[self.org.pk])],
+            ["persona"],
+        )
+        resultados = buscar_en_finanzas("arri", organizacion_ids=[self.org.pk])
+        self.assertEqual({item["tipo"] for item in resultados}, {"persona", "documento", "transaccion"})
+        self.assertTrue(all(item["organizacion_id"] == self.org.pk for item in resultados))
+        self.assertEqual(
+            [item["titulo"] for item in buscar_en_finanzas("pena arriagada", organizacion_ids=[self.org.pk])],
+            ["José Peña Arriagada"],
+        )
+        self.assertEqual(buscar_en_finanzas("arri", organizacion_ids=[]), [])
+
+    def test_buscar_en_finanzas_incluye_el_folio_exacto_aunque_sobren_prefijos(self):
+        DocumentoTributario.objects.bulk_create(
+            [
+                DocumentoTributario(
+                    organizacion=self.org,
+                    tipo_documento=DocumentoTributario.TipoDocumento.FACTURA_AFECTA,
+                    folio=f"777{indice:02d}",
+                    fecha_emision="2026-03-02",
+                    monto_total=1000,
+                )
+                for indice in range(10)
+            ]
+        )
+        exacto = DocumentoTributario.objects.create(
+            organizacion=self.org,
+            tipo_documento=DocumentoTributario.TipoDocumento.FACTURA_AFECTA,
+            folio="777",
+            fecha_emision="2026-01-02",
+            monto_total=1000,
+        )
+
+        with patch("finanzas.selectors.CANDIDATOS_BUSQUEDA", 5):
+            resultados = buscar_en_finanzas("777", organizacion_ids=[self.org.pk], limite=3)
+
+        self.assertEqual((resultados[0]["tipo"], resultados[0]["id"]), ("documento", exacto.pk))
+        self.assertEqual(len(resultados), 3)
+
+    def test_buscar_finanzas_responde_json_solo_con_permiso(self):
+        categoria = Category.objects.create(nombre="Servicios", tipo=Category.Tipo.EGRESO, activa=True)
+        transaccion = Transaction.objects.create(
+            organizacion=self.org,
+            categoria=categoria,
+            fecha="2026-03-03",
+            tipo=Transaction.Tipo.EGRESO,
+            monto=50000,
+            descripcion="Pago arriendo sala marzo",
+        )
+        url = reverse("finanzas:buscar")
+
+        self.client.force_login(self.user_sin_rol)
+        self.assertEqual(self.client.get(url, {"q": "arriendo"}).status_code, 403)
+        self.client.force_login(self.user_profesor)
+        response = self.client.get(url, {"organizacion": self.org.pk, "q": "arriendo"})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json()["codigo"], "PERMISO_DENEGADO")
+
+        self.client.force_login(self.user_finanzas)
+        self.assertEqual(self.client.get(url, {"q": "a"}).json(), {"ok": True, "resultados": []})
+        response = self.client.get(url, {"q": "arriendo marzo"})
+        self.assertEqual(response.status_code, 200)
+        [resultado] = response.json()["resultados"]
+        self.assertEqual(
+            (resultado["tipo"], resultado["id"], resultado["fecha"]),
+            ("transaccion", transaccion.pk, "2026-03-03"),
+        )
+        self.assertEqual(
+            resultado["url"],
+            self._url_con_organizacion(reverse("finanzas:transaccion_detail", args=[transaccion.pk])),
+        )
+
     def test_dashboard_mensual_usa_transacciones_como_fuente_contable(self):
         categoria_ingreso = Category.objects.create(nombre="Ingreso dashboard", tipo=Category.Tipo.INGRESO, activa=True)
         categoria_egreso = Category.objects.create(nombre="Egreso dashboard", tipo=Category.Tipo.EGRESO, activa=True)
@@ -433,7 +575,7 @@ class FinanzasAccessTests(TestCase):
             {"periodo_mes": 2, "periodo_anio": 2026, "organizacion": self.org.pk},
         )
 
-        rows = list(csv.reader(response.content.decode("utf-8-sig").splitlines()))
+        rows = list(csv.reader(response.getvalue().decode("utf-8-sig").splitlines()))
         self.assertEqual(response.status_code, 200)
         self.assertEqual(rows[0][0], "numero correlativo")
         self.assertIn("Msg", rows[0])
@@ -445,7 +587,7 @@ class FinanzasAccessTests(TestCase):
         self.assertIn("Factura afecta #LC-1", rows[1][7])
         self.assertIn("Ingreso libro", rows[1][8])
         self.assertEqual(rows[2][1], "2026-02-03")
-        self.assertNotIn("99000", response.content.decode("utf-8-sig"))
+        self.assertNotIn("99000", response.getvalue().decode("utf-8-sig"))
 
     def test_libro_caja_csv_respeta_organizacion_y_periodo(self):
         categoria = Category.objects.create(nombre="Ingreso libro filtros", tipo=Category.Tipo.INGRESO, activa=True)
@@ -481,7 +623,7 @@ class FinanzasAccessTests(TestCase):
             {"periodo_mes": 2, "periodo_anio": 2026, "organizacion": self.org.pk},
         )
 
-        contenido = response.content.decode("utf-8-sig")
+        contenido = response.getvalue().decode("utf-8-sig")
         rows = list(csv.reader(contenido.splitlines()))
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(rows), 2)
@@ -521,8 +663,50 @@ class FinanzasAccessTests(TestCase):
         )
         self.assertEqual(response.status_code, 200)
 
+    @override_settings(EXPORTACION_FILAS_POR_BLOQUE=2)
+    def test_libro_caja_csv_se_transmite_por_bloques_con_documentos_de_cada_bloque(self):
+        categoria = Category.objects.create(nombre="Ingreso bloques", tipo=Category.Tipo.INGRESO, activa=True)
+        for dia in range(1, 6):
+            transaccion = Transaction.objects.create(
+                organizacion=self.org,
+                categoria=categoria,
+                fecha=f"2026-02-{dia:02d}",
+                tipo=Transaction.Tipo.INGRESO,
+                monto=1000 * dia,
+                descripcion=f"Ingreso {dia}",
+            )
+            if dia % 2:
+                documento = DocumentoTributario.objects.create(
+                    organizacion=self.org,
+                    tipo_documento=DocumentoTributario.TipoDocumento.FACTURA_AFECTA,
+                    folio=f"BLQ-{dia}",
+                    fecha_emision=f"2026-02-{dia:02d}",
+                    monto_total=1000 * dia,
+                )
+                transaccion.documentos_tributarios.add(documento)
+
+        self.client.force_login(self.user_finanzas)
+        response = self.client.get(
+            reverse("finanzas:export_libro_caja_csv"),
+            {"periodo_mes": 2, "periodo_anio": 2026, "organizacion": self.org.pk},
+        )
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="libro_caja.csv"')
+
+        with CaptureQueriesContext(connection) as queries:
+            bloques = [bloque.decode("utf-8") for bloque in response.streaming_content]
+        prefetch = [query for query in queries.captured_queries if "documentotributario" in query["sql"]]
+        self.assertEqual(len(prefetch), 3)
+        self.assertTrue(bloques[0].startswith("\ufeffnumero correlativo"))
+        rows = list(csv.reader("".join(bloques).lstrip("\ufeff").splitlines()))
+        self.assertEqual([row[0] for row in rows[1:]], ["1", "2", "3", "4", "5"])
+        for dia, row in enumerate(rows[1:], start=1):
+            documento = f"Factura afecta #BLQ-{dia}" if dia % 2 else ""
+            self.assertEqual(row[7], documento)
+            self.assertTrue(row[8].endswith(documento or f"Ingreso {dia}"))
+
     def _xlsx_rows(self, response):
-        workbook = load_workbook(BytesIO(response.content))
+        workbook = load_workbook(BytesIO(response.getvalue()))
         return list(workbook.active.iter_rows(values_only=True))
 
     def test_export_pagos_alumnos_xlsx_respeta_periodo_organizacion_y_no_es_contable(self):
@@ -1180,7 +1364,7 @@ class FinanzasAccessTests(TestCase):
             {"periodo_mes": 2, "periodo_anio": 2026, "organizacion": self.org.pk},
         )
 
-        rows = list(csv.reader(response.content.decode().splitlines()))
+        rows = list(csv.reader(response.getvalue().decode().splitlines()))
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response["Content-Disposition"], 'attachment; filename="pagos_finanzas.csv"')
         self.assertEqual(rows[0], ["Fecha", "Organizacion", "Persona", "Metodo", "Neto", "IVA", "Total", "Clases"])
@@ -1225,7 +1409,7 @@ class FinanzasAccessTests(TestCase):
             {"periodo_mes": 2, "periodo_anio": 2026, "organizacion": self.org.pk},
         )
 
-        rows = list(csv.reader(response.content.decode().splitlines()))
+        rows = list(csv.reader(response.getvalue().decode().splitlines()))
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response["Content-Disposition"], 'attachment; filename="transacciones_finanzas.csv"')
         self.assertEqual(rows[0], ["Fecha", "Organizacion", "Tipo", "Categoria", "Monto", "Descripcion"])
@@ -1935,7 +2119,7 @@ class FinanzasAccessTests(TestCase):
         )
         self.assertEqual(DocumentoTributario.objects.count(), 0)
 
-        token = next(iter(self.client.session[SESSION_KEY].keys()))
+        token = self.client.session[SESSION_KEY][-1]
         visor_url = reverse(
             "finanzas:documento_tributario_importacion_archivo",
             kwargs={"token": token, "tipo_archivo": "pdf"},
@@ -2099,7 +2283,7 @@ class FinanzasAccessTests(TestCase):
         self.assertContains(response, "Visor del archivo subido")
         self.assertContains(response, "&lt;EnvioDTE&gt;", html=False)
 
-        token = next(iter(self.client.session[SESSION_KEY].keys()))
+        token = self.client.session[SESSION_KEY][-1]
         visor_url = reverse(
             "finanzas:documento_tributario_importacion_archivo",
             kwargs={"token": token, "tipo_archivo": "xml"},
@@ -2150,7 +2334,7 @@ class FinanzasAccessTests(TestCase):
         )
         self.assertEqual(parse_response.status_code, 200)
 
-        token = next(iter(self.client.session[SESSION_KEY].keys()))
+        token = self.client.session[SESSION_KEY][-1]
         documento_initial = dict(parse_response.context["documento_form"].initial)
         post_data = {
             "accion": "confirmar",
@@ -2196,7 +2380,7 @@ class FinanzasAccessTests(TestCase):
         self.assertEqual(parse_response.status_code, 200)
         self.assertEqual(parse_response.context["review_payload"]["duplicates"], [])
 
-        token = next(iter(self.client.session[SESSION_KEY].keys()))
+        token = self.client.session[SESSION_KEY][-1]
         post_data = {
             "accion": "confirmar",
             "token_importacion": token,
@@ -2349,6 +2533,7 @@ class FinanzasIntegrationTests(TestCase):
 
         self.assertEqual(consumo.estado, AttendanceConsumption.Estado.CONSUMIDO)
         self.assertEqual(consumo.pago, pago)
+        pago.refresh_from_db()
         self.assertEqual(pago.clases_consumidas, 1)
         self.assertEqual(pago.saldo_clases, 0)
 
@@ -2378,6 +2563,7 @@ class FinanzasIntegrationTests(TestCase):
         self.assertEqual(consumo_febrero.pago, pago)
         self.assertEqual(consumo_marzo.estado, AttendanceConsumption.Estado.DEUDA)
         self.assertIsNone(consumo_marzo.pago)
+        pago.refresh_from_db()
         self.assertEqual(pago.clases_consumidas, 1)
         self.assertEqual(pago.saldo_clases, 1)
 
@@ -2767,6 +2953,106 @@ class FinanzasIntegrationTests(TestCase):
         self.assertEqual(normalized.get_value("montos", "porcentaje_retencion"), Decimal("15.25"))
         self.assertEqual(normalized.lineas[0].fields["descripcion"].value, "Presentacion artistica")
 
+    def test_parse_tax_document_reutiliza_resultado_guardado_por_contenido(self):
+        xml = b"""
+        <datos>
+          <tipodoc>bhe</tipodoc>
+          <numeroBoleta>9002</numeroBoleta>
+          <fechaBoleta>2026-02-21</fechaBoleta>
+          <rutEmisor>12345678</rutEmisor>
+          <dvEmisor>9</dvEmisor>
+          <totalHonorarios>100000</totalHonorarios>
+          <impuestoHonorarios>15250</impuestoHonorarios>
+          <liquidoHonorarios>84750</liquidoHonorarios>
+          <porcentajeImpuesto>15.25</porcentajeImpuesto>
+          <prestacionServicios>
+            <item>Clase abierta</item>
+          </prestacionServicios>
+        </datos>
+        """
+        primero = parse_tax_document(xml_bytes=xml, xml_name="bhe.xml", organizacion_id=self.org.pk)
+        self.assertEqual(ResultadoParseoDocumento.objects.count(), 1)
+
+        with patch("finanzas.documentos.parsers.BheXmlParser.parse") as parse:
+            segundo = parse_tax_document(xml_bytes=xml, xml_name="copia.xml", organizacion_id=self.org.pk)
+
+        parse.assert_not_called()
+        self.assertEqual(segundo.get_value("montos", "porcentaje_retencion"), Decimal("15.25"))
+        self.assertEqual(segundo.get_value("encabezado", "folio"), primero.get_value("encabezado", "folio"))
+        self.assertEqual(segundo.get_value("metadata_archivo", "nombre_archivo"), "copia.xml")
+        self.assertEqual(segundo.lineas[0].fields["descripcion"].value, "Clase abierta")
+
+        with patch("finanzas.documentos.cache_parseo.PARSER_VERSION", "otra"):
+            with patch("finanzas.documentos.parsers.BheXmlParser.parse", return_value=primero) as parse:
+                parse_tax_document(xml_bytes=xml, xml_name="bhe.xml", organizacion_id=self.org.pk)
+        parse.assert_called_once()
+        self.assertEqual(ResultadoParseoDocumento.objects.count(), 2)
+
+    def test_parse_tax_document_no_guarda_resultados_con_errores(self):
+        normalized = parse_tax_document(xml_bytes=b"<otro><a>1</a></otro>", xml_name="x.xml", organizacion_id=self.org.pk)
+
+        self.assertTrue(normalized.errors)
+        self.assertFalse(ResultadoParseoDocumento.objects.exists())
+
+    @patch("finanzas.documentos.parsers.PdfFallbackParser._extract_text_with_pdftotext")
+    @patch("finanzas.documentos.parsers.PdfFallbackParser._extract_text_with_pypdf")
+    def test_pdf_usa_el_extractor_preferido_por_la_familia_y_registra_tiempos(self, con_pypdf, con_pdftotext):
+        con_pypdf.return_value = "BOLETA DE HONORARIOS ELECTRONICA N 12 texto sin columnas"
+        con_pdftotext.return_value = "BOLETA DE HONORARIOS ELECTRONICA      N 12      texto en columnas"
+        config = ConfigExtraccionPdf(
+            orden_por_familia={"default": ["pypdf", "pdftotext"], "boleta_honorarios": ["pdftotext", "pypdf"]},
+            timeout_segundos=5,
+            memoria_mb=256,
+        )
+
+        normalized = PdfFallbackParser(config).parse(pdf_bytes=b"%PDF-1.4", pdf_name="bhe.pdf")
+
+        con_pdftotext.assert_called_once_with(b"%PDF-1.4", timeout=5, memoria_mb=256)
+        self.assertEqual(normalized.get_value("encabezado", "folio"), "12")
+        tiempos = normalized.get_value("metadata_archivo", "extraccion_pdf")
+        self.assertEqual(
+            [(tiempo["extractor"], tiempo["resultado"]) for tiempo in tiempos],
+            [("pypdf", "ok"), ("pdftotext", "ok")],
+        )
+        self.assertTrue(all(isinstance(tiempo["ms"], int) for tiempo in tiempos))
+
+        con_pdftotext.reset_mock()
+        config_factura = ConfigExtraccionPdf(orden_por_familia={"default": ["pypdf", "pdftotext"]})
+        con_pypdf.return_value = "FACTURA ELECTRONICA N 40"
+        PdfFallbackParser(config_factura).parse(pdf_bytes=b"%PDF-1.4", pdf_name="factura.pdf")
+        con_pdftotext.assert_not_called()
+
+    @patch("finanzas.documentos.parsers.PdfFallbackParser._extract_text_with_pypdf", return_value="")
+    def test_pdftotext_se_corta_por_timeout_con_limite_de_memoria(self, _con_pypdf):
+        with patch(
+            "finanzas.documentos.parsers.subprocess.run",
+            side_effect=subprocess.TimeoutExpired(cmd="pdftotext", timeout=3),
+        ) as run:
+            normalized = PdfFallbackParser(ConfigExtraccionPdf(timeout_segundos=3, memoria_mb=128)).parse(
+                pdf_bytes=b"%PDF-1.4 colgado", pdf_name="colgado.pdf"
+            )
+
+        self.assertEqual(run.call_args.kwargs["timeout"], 3)
+        self.assertIsNotNone(run.call_args.kwargs["preexec_fn"])
+        self.assertEqual(normalized.get_value("metadata_archivo", "extraccion_pdf")[-1]["resultado"], "timeout")
+        self.assertTrue(any("no termino a tiempo" in warning for warning in normalized.warnings))
+        self.assertTrue(normalized.errors)
+
+    def test_pypdf_corre_en_un_proceso_hijo_con_timeout_y_limite_de_memoria(self):
+        config = ConfigExtraccionPdf(orden_por_familia={"default": ["pypdf"]}, timeout_segundos=4, memoria_mb=64)
+        with patch(
+            "finanzas.documentos.parsers.subprocess.run",
+            side_effect=subprocess.TimeoutExpired(cmd="python", timeout=4),
+        ) as run:
+            normalized = PdfFallbackParser(config).parse(pdf_bytes=b"%PDF-1.4 colgado", pdf_name="colgado.pdf")
+
+        self.assertEqual(run.call_args.kwargs["timeout"], 4)
+        self.assertEqual(run.call_args.kwargs["input"], b"%PDF-1.4 colgado")
+        self.assertIsNotNone(run.call_args.kwargs["preexec_fn"])
+        tiempos = normalized.get_value("metadata_archivo", "extraccion_pdf")
+        self.assertEqual([(tiempo["extractor"], tiempo["resultado"]) for tiempo in tiempos], [("pypdf", "timeout")])
+        self.assertIn("pypdf no termino a tiempo; el texto puede estar incompleto.", normalized.warnings)
+
     @patch("finanzas.documentos.parsers.PdfFallbackParser._extract_text_with_pdftotext")
     @patch("finanzas.documentos.parsers.PdfFallbackParser._extract_text_with_pypdf", return_value="")
     def test_parse_tax_document_bhe_pdf_extrae_folio_fecha_y_montos(
@@ -3475,6 +3761,12 @@ class SprintDosReconciliacionTests(TestCase):
             clases_asignadas=clases,
         )
 
+    def _envejecer_asistencias(self):
+        """Deja disciplinas, sesiones y asistencias existentes fuera del alcance incremental."""
+        ayer = timezone.now() - timedelta(days=1)
+        for modelo in (Disciplina, SesionClase, Asistencia):
+            modelo.objects.update(actualizado_en=ayer)
+
     def _otra_asistencia(self, *, dia=21):
         sesion = SesionClase.objects.create(
             disciplina=self.disciplina,
@@ -3617,6 +3909,177 @@ class SprintDosReconciliacionTests(TestCase):
         self.assertEqual(resultado["resumen"]["estado_asistencia_incompatible"], 1)
 
 
+    def test_reconciliacion_detecta_plan_fuera_de_vigencia(self):
+        plan = PaymentPlan.objects.create(
+            organizacion=self.organizacion,
+            nombre="Plan quincena",
+            num_clases=4,
+            precio=10000,
+            fecha_inicio=date(2026, 7, 1),
+            fecha_fin=date(2026, 7, 15),
+        )
+        pago = self._pago(clases=2)
+        Payment.objects.filter(pk=pago.pk).update(plan=plan)
+        asistencia = Asistencia.objects.create(sesion=self.sesion, persona=self.estudiante)
+        consumo = AttendanceConsumption.objects.get(asistencia=asistencia)
+        AttendanceConsumption.objects.filter(pk=consumo.pk).update(
+            estado=AttendanceConsumption.Estado.CONSUMIDO,
+            pago=pago,
+        )
+
+        resultado = reconciliar_integridad_dominio()
+
+        self.assertEqual(
+            resultado["detalle"]["plan_fuera_vigencia"],
+            [
+                {
+                    "consumo_id": consumo.pk,
+                    "asistencia_id": asistencia.pk,
+                    "organizacion_id": self.organizacion.pk,
+                    "pago_id": pago.pk,
+                }
+            ],
+        )
+
+    def test_reconciliacion_respeta_organizacion_y_rango_de_fechas(self):
+        asistencia = Asistencia.objects.create(sesion=self.sesion, persona=self.estudiante)
+        AttendanceConsumption.objects.filter(asistencia=asistencia).update(
+            estado=AttendanceConsumption.Estado.CONSUMIDO,
+            pago=None,
+        )
+
+        self.assertEqual(reconciliar_integridad_dominio()["resumen"]["consumo_sin_pago"], 1)
+        self.assertTrue(reconciliar_integridad_dominio(organizacion=self.otra_organizacion)["ok"])
+        self.assertTrue(reconciliar_integridad_dominio(desde=date(2026, 7, 21))["ok"])
+        self.assertTrue(reconciliar_integridad_dominio(hasta=date(2026, 7, 19))["ok"])
+        self.assertFalse(
+            reconciliar_integridad_dominio(desde=date(2026, 7, 20), hasta=date(2026, 7, 20))["ok"]
+        )
+
+    def test_reconciliacion_usa_una_consulta_por_tipo(self):
+        for dia in (21, 22, 23):
+            self._otra_asistencia(dia=dia)
+
+        with self.assertNumQueries(len(TIPOS_INCONSISTENCIA)):
+            reconciliar_integridad_dominio()
+
+    def test_comando_reconciliacion_filtra_y_muestra_tiempos(self):
+        salida = StringIO()
+        call_command(
+            "reconciliar_integridad_dominio",
+            organizacion=self.organizacion.pk,
+            desde=date(2026, 7, 1),
+            hasta=date(2026, 7, 31),
+            stdout=salida,
+        )
+
+        self.assertRegex(salida.getvalue(), r"consumo_sin_pago: 0 \(\d+\.\d{3} s\)")
+        with self.assertRaisesMessage(CommandError, "La organización indicada no existe."):
+            call_command("reconciliar_integridad_dominio", organizacion=999999, stdout=StringIO())
+
+    def test_reconciliacion_incremental_conserva_hallazgos_entre_corridas(self):
+        asistencia = Asistencia.objects.create(sesion=self.sesion, persona=self.estudiante)
+        consumo = AttendanceConsumption.objects.get(asistencia=asistencia)
+        AttendanceConsumption.objects.filter(pk=consumo.pk).update(
+            estado=AttendanceConsumption.Estado.CONSUMIDO,
+            pago=None,
+        )
+
+        primera = reconciliar_integridad_dominio(incremental=True)
+        segunda = reconciliar_integridad_dominio(incremental=True)
+
+        self.assertEqual(primera["resumen"]["consumo_sin_pago"], 1)
+        self.assertEqual(segunda, primera)
+        self.assertEqual(
+            list(EjecucionReconciliacion.objects.order_by("id").values_list("modo", flat=True)),
+            [EjecucionReconciliacion.Modo.COMPLETA, EjecucionReconciliacion.Modo.INCREMENTAL],
+        )
+        hallazgo = HallazgoReconciliacion.objects.get(tipo="consumo_sin_pago")
+        self.assertEqual(hallazgo.clave, f"consumo:{consumo.pk}")
+        self.assertIsNone(hallazgo.resuelto_en)
+
+        consumo.refresh_from_db()
+        consumo.estado = AttendanceConsumption.Estado.DEUDA
+        consumo.save(update_fields=["estado", "actualizado_en"])
+        tercera = reconciliar_integridad_dominio(incremental=True)
+
+        self.assertTrue(tercera["ok"])
+        hallazgo.refresh_from_db()
+        self.assertIsNotNone(hallazgo.resuelto_en)
+
+    def test_reconciliacion_incremental_solo_revisa_lo_modificado_desde_la_marca(self):
+        reconciliar_integridad_dominio(incremental=True)
+        antigua = Asistencia.objects.create(sesion=self.sesion, persona=self.estudiante)
+        AttendanceConsumption.objects.filter(asistencia=antigua).update(
+            estado=AttendanceConsumption.Estado.CONSUMIDO,
+            pago=None,
+            actualizado_en=timezone.now() - timedelta(days=1),
+        )
+        self._envejecer_asistencias()
+        reciente = self._otra_asistencia()
+        AttendanceConsumption.objects.filter(asistencia=reciente).update(
+            estado=AttendanceConsumption.Estado.CONSUMIDO,
+            pago=None,
+            actualizado_en=timezone.now(),
+        )
+
+        resultado = reconciliar_integridad_dominio(incremental=True)
+
+        self.assertEqual(
+            [referencia["asistencia_id"] for referencia in resultado["detalle"]["consumo_sin_pago"]],
+            [reciente.pk],
+        )
+        self.assertEqual(EjecucionReconciliacion.objects.order_by("-id").first().consumos_revisados, 1)
+        self.assertEqual(reconciliar_integridad_dominio()["resumen"]["consumo_sin_pago"], 2)
+
+    def test_reconciliacion_incremental_revisa_dependientes_de_pagos_modificados(self):
+        pago = self._pago(clases=1)
+        asistencia = Asistencia.objects.create(sesion=self.sesion, persona=self.estudiante)
+        AttendanceConsumption.objects.filter(asistencia=asistencia).update(
+            actualizado_en=timezone.now() - timedelta(days=1),
+        )
+        Payment.objects.filter(pk=pago.pk).update(actualizado_en=timezone.now() - timedelta(days=1))
+        reconciliar_integridad_dominio(incremental=True)
+
+        pago.refresh_from_db()
+        pago.revertido_en = timezone.now()
+        pago.motivo_reversa = "Reversa inducida"
+        pago.save()
+        resultado = reconciliar_integridad_dominio(incremental=True)
+
+        self.assertEqual(resultado["resumen"]["pago_revertido_incluido"], 1)
+
+    def test_reconciliacion_incremental_revisa_consumos_de_sesiones_editadas(self):
+        pago = self._pago(clases=1)
+        asistencia = Asistencia.objects.create(sesion=self.sesion, persona=self.estudiante)
+        self.assertEqual(AttendanceConsumption.objects.get(asistencia=asistencia).pago_id, pago.pk)
+        reconciliar_integridad_dominio(incremental=True)
+        AttendanceConsumption.objects.update(actualizado_en=timezone.now() - timedelta(days=1))
+        Payment.objects.update(actualizado_en=timezone.now() - timedelta(days=1))
+        self._envejecer_asistencias()
+
+        # Como en `sesion_edit`: solo se guardan disciplina y fecha.
+        self.sesion.fecha = date(2026, 8, 3)
+        self.sesion.save(update_fields=["disciplina", "fecha"])
+        resultado = reconciliar_integridad_dominio(incremental=True)
+
+        self.assertEqual(
+            [referencia["asistencia_id"] for referencia in resultado["detalle"]["consumo_fuera_periodo"]],
+            [asistencia.pk],
+        )
+        self.assertEqual(resultado, reconciliar_integridad_dominio())
+
+    def test_reconciliacion_incremental_no_admite_alcance_parcial(self):
+        with self.assertRaises(ValidationError):
+            reconciliar_integridad_dominio(incremental=True, organizacion=self.organizacion)
+        with self.assertRaisesMessage(CommandError, "El modo incremental"):
+            call_command(
+                "reconciliar_integridad_dominio",
+                incremental=True,
+                desde=date(2026, 7, 1),
+                stdout=StringIO(),
+            )
+
 class PagoMasivoDominioTests(TestCase):
     def setUp(self):
         User = get_user_model()
@@ -3684,6 +4147,35 @@ class PagoMasivoDominioTests(TestCase):
         self.assertTrue(all(pago.monto_total == Decimal("10000.00") for pago in pagos))
         self.assertTrue(all(pago.clases_asignadas == 2 for pago in pagos))
 
+    def test_lote_consulta_en_bloque_imputa_deudas_y_audita_cada_pago(self):
+        disciplina = Disciplina.objects.create(organizacion=self.org, nombre="Disciplina lote")
+        asistencia = Asistencia.objects.create(
+            sesion=SesionClase.objects.create(disciplina=disciplina, fecha=date(2026, 7, 6)),
+            persona=self.personas[0],
+        )
+        self.assertEqual(asistencia.consumo_financiero.estado, AttendanceConsumption.Estado.DEUDA)
+
+        with CaptureQueriesContext(connection) as consultas, self.captureOnCommitCallbacks(execute=True):
+            lote, _ = confirmar_lote_pagos(
+                usuario=self.user,
+                organizacion_id=self.org.pk,
+                clave_idempotencia="lote-consultas",
+                filas=self._filas(20),
+            )
+
+        # Referencias, altas e imputación van en bloque: las consultas no crecen con las filas.
+        self.assertLessEqual(len(consultas), 32)
+        pago = Payment.objects.get(lote=lote, persona=self.personas[0])
+        asistencia.consumo_financiero.refresh_from_db()
+        self.assertEqual(asistencia.consumo_financiero.pago_id, pago.pk)
+        self.assertEqual(asistencia.consumo_financiero.estado, AttendanceConsumption.Estado.CONSUMIDO)
+        self.assertEqual(Transaction.objects.filter(pago_operacional__lote=lote).count(), 20)
+        self.assertEqual(
+            AuditLog.objects.filter(metadata__lote_id=str(lote.pk), resumen="Pago creado").count(),
+            20,
+        )
+        self.assertEqual(AuditLog.objects.filter(objeto_id=str(lote.pk)).count(), 1)
+
     def test_fila_invalida_hace_rollback_de_todo_el_lote(self):
         filas = self._filas(10)
         filas[-1]["persona_id"] = self.personas[0].pk
@@ -3715,6 +4207,32 @@ class PagoMasivoDominioTests(TestCase):
         self.assertEqual(repetido.pk, lote.pk)
         self.assertEqual(Payment.objects.count(), 10)
 
+    def test_clave_de_fila_con_espacios_no_duplica_pagos(self):
+        filas = self._filas(3)
+        for indice, fila in enumerate(filas):
+            fila["clave_idempotencia"] = f"fila-{indice}"
+        confirmar_lote_pagos(
+            usuario=self.user,
+            organizacion_id=self.org.pk,
+            clave_idempotencia="lote-filas",
+            filas=filas,
+        )
+        for fila in filas:
+            fila["clave_idempotencia"] = f"  {fila['clave_idempotencia']} "
+
+        confirmar_lote_pagos(
+            usuario=self.user,
+            organizacion_id=self.org.pk,
+            clave_idempotencia="lote-filas-reintento",
+            filas=filas,
+        )
+
+        self.assertEqual(Payment.objects.count(), 3)
+        self.assertEqual(
+            set(Payment.objects.values_list("clave_idempotencia", flat=True)),
+            {"fila-0", "fila-1", "fila-2"},
+        )
+
     def test_persona_de_otra_organizacion_no_puede_formar_parte_del_lote(self):
         persona_ajena = Persona.objects.create(nombres="Ajena", apellidos="Lote")
         PersonaRol.objects.create(persona=persona_ajena, rol=self.rol_estudiante, organizacion=self.otra_org, activo=True)
@@ -3793,3 +4311,958 @@ class PagoMasivoDominioTests(TestCase):
         self.assertEqual(confirmado.status_code, 302)
         self.assertEqual(Payment.objects.count(), 2)
         self.assertEqual(LotePago.objects.count(), 1)
+
+
+class ReimputacionMesTests(TestCase):
+    def setUp(self):
+        self.organizacion = Organizacion.objects.create(
+            nombre="Org Reimputación",
+            razon_social="Org Reimputación SpA",
+            rut="72.000.000-1",
+        )
+        self.estudiante = Persona.objects.create(nombres="Alumno", apellidos="Reimputación")
+        self.disciplina = Disciplina.objects.create(organizacion=self.organizacion, nombre="Reimputación")
+        self.asistencias = [
+            Asistencia.objects.create(
+                sesion=SesionClase.objects.create(disciplina=self.disciplina, fecha=date(2026, 7, dia)),
+                persona=self.estudiante,
+            )
+            for dia in (3, 10, 17)
+        ]
+
+    def _pago_sin_senal(self, *, clases, fecha_pago=date(2026, 7, 1)):
+        pago = Payment(
+            persona=self.estudiante,
+            organizacion=self.organizacion,
+            fecha_pago=fecha_pago,
+            metodo_pago=Payment.Metodo.EFECTIVO,
+            aplica_iva=False,
+            monto_referencia=10000,
+            monto_total=10000,
+            clases_asignadas=clases,
+        )
+        Payment.objects.bulk_create([pago])
+        return Payment.objects.get(persona=self.estudiante, fecha_pago=fecha_pago)
+
+    def _estados(self):
+        return list(
+            AttendanceConsumption.objects.filter(asistencia__in=self.asistencias)
+            .order_by("clase_fecha")
+            .values_list("estado", "pago_id")
+        )
+
+    def test_preview_informa_diff_sin_modificar_consumos(self):
+        pago = self._pago_sin_senal(clases=2)
+        antes = self._estados()
+
+        resultado = reimputar_consumos_mes(organizacion=self.organizacion, anio=2026, mes=7)
+
+        self.assertFalse(resultado["aplicado"])
+        self.assertEqual(resultado["resumen"]["consumos_actualizados"], 2)
+        self.assertEqual(
+            [cambio["pago_nuevo_id"] for cambio in resultado["cambios"]],
+            [pago.pk, pago.pk],
+        )
+        self.assertEqual(self._estados(), antes)
+
+    def test_aplicar_asigna_fifo_y_coincide_con_imputacion_individual(self):
+        pago = self._pago_sin_senal(clases=2)
+
+        with self.assertNumQueries(11):
+            resultado = reimputar_consumos_mes(
+                organizacion=self.organizacion,
+                anio=2026,
+                mes=7,
+                aplicar=True,
+            )
+
+        self.assertTrue(resultado["aplicado"])
+        en_bloque = self._estados()
+        self.assertEqual(
+            en_bloque,
+            [
+                (AttendanceConsumption.Estado.CONSUMIDO, pago.pk),
+                (AttendanceConsumption.Estado.CONSUMIDO, pago.pk),
+                (AttendanceConsumption.Estado.DEUDA, None),
+            ],
+        )
+        for asistencia in self.asistencias:
+            asignar_consumo_asistencia(asistencia)
+        self.assertEqual(self._estados(), en_bloque)
+
+    def test_clase_liberada_queda_pendiente_y_libera_cupo(self):
+        pago = self._pago_sin_senal(clases=2)
+        reimputar_consumos_mes(organizacion=self.organizacion, anio=2026, mes=7, aplicar=True)
+        ClaseLiberada.objects.create(
+            asistencia=self.asistencias[0],
+            organizacion=self.organizacion,
+            motivo="Liberada fuera del flujo",
+        )
+
+        reimputar_consumos_mes(organizacion=self.organizacion, anio=2026, mes=7, aplicar=True)
+
+        self.assertEqual(
+            self._estados(),
+            [
+                (AttendanceConsumption.Estado.PENDIENTE, None),
+                (AttendanceConsumption.Estado.CONSUMIDO, pago.pk),
+                (AttendanceConsumption.Estado.CONSUMIDO, pago.pk),
+            ],
+        )
+
+    def test_comando_previsualiza_por_defecto(self):
+        self._pago_sin_senal(clases=1)
+        salida = StringIO()
+
+        call_command(
+            "reimputar_consumos_mes",
+            organizacion=self.organizacion.pk,
+            anio=2026,
+            mes=7,
+            stdout=salida,
+        )
+
+        self.assertIn("PREVIEW", salida.getvalue())
+        self.assertIn("consumos_actualizados: 1", salida.getvalue())
+        self.assertFalse(
+            AttendanceConsumption.objects.filter(estado=AttendanceConsumption.Estado.CONSUMIDO).exists()
+        )
+
+
+class ContadorClasesConsumidasTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("contador_consumos", password=TEST_PASSWORD)
+        self.organizacion = Organizacion.objects.create(
+            nombre="Org Contador",
+            razon_social="Org Contador SpA",
+            rut="72.000.000-2",
+        )
+        self.estudiante = Persona.objects.create(nombres="Alumno", apellidos="Contador")
+        self.disciplina = Disciplina.objects.create(organizacion=self.organizacion, nombre="Contador")
+        self.pago = Payment.objects.create(
+            persona=self.estudiante,
+            organizacion=self.organizacion,
+            fecha_pago=date(2026, 7, 1),
+            metodo_pago=Payment.Metodo.EFECTIVO,
+            aplica_iva=False,
+            monto_referencia=10000,
+            clases_asignadas=2,
+        )
+
+    def _asistencia(self, dia):
+        sesion = SesionClase.objects.create(disciplina=self.disciplina, fecha=date(2026, 7, dia))
+        return Asistencia.objects.create(sesion=sesion, persona=self.estudiante)
+
+    def _contador(self):
+        self.pago.refresh_from_db()
+        return self.pago.clases_consumidas
+
+    def test_contador_sigue_altas_bajas_y_cambios_de_estado(self):
+        primera = self._asistencia(3)
+        segunda = self._asistencia(10)
+        self.assertEqual(self._contador(), 2)
+        self.assertEqual(self.pago.saldo_clases, 0)
+
+        ClaseLiberada.objects.create(asistencia=primera, organizacion=self.organizacion, motivo="Invitada")
+        asignar_consumo_asistencia(primera)
+        self.assertEqual(self._contador(), 1)
+
+        segunda.delete()
+        self.assertEqual(self._contador(), 0)
+
+    def test_reversa_libera_el_contador_del_pago(self):
+        self._asistencia(3)
+        revertir_pago(pago=self.pago, motivo="Error de registro", usuario=self.user)
+        self.assertEqual(self._contador(), 0)
+
+    def test_guardado_completo_de_pago_no_pisa_el_contador(self):
+        pago_desactualizado = Payment.objects.get(pk=self.pago.pk)
+        self._asistencia(3)
+
+        pago_desactualizado.observaciones = "Editado"
+        pago_desactualizado.save()
+
+        self.assertEqual(self._contador(), 1)
+
+    def test_comando_detecta_y_reconstruye_contador_desincronizado(self):
+        self._asistencia(3)
+        Payment.objects.filter(pk=self.pago.pk).update(clases_consumidas=5)
+
+        with self.assertRaises(CommandError):
+            call_command("verificar_clases_consumidas", stdout=StringIO())
+        salida = StringIO()
+        call_command("verificar_clases_consumidas", aplicar=True, stdout=salida)
+
+        self.assertIn("Contadores reconstruidos: 1 pagos", salida.getvalue())
+        self.assertEqual(self._contador(), 1)
+
+
+class ProcesamientoDiferidoSenalesTests(TestCase):
+    def setUp(self):
+        self.organizacion = Organizacion.objects.create(
+            nombre="Org Diferida",
+            razon_social="Org Diferida SpA",
+            rut="73.000.000-2",
+        )
+        self.estudiante = Persona.objects.create(nombres="Alumno", apellidos="Diferido")
+        self.disciplina = Disciplina.objects.create(organizacion=self.organizacion, nombre="Diferida")
+        self.sesiones = [
+            SesionClase.objects.create(disciplina=self.disciplina, fecha=date(2026, 8, dia))
+            for dia in (4, 11, 18)
+        ]
+
+    def _crear_pago(self, *, clases):
+        return Payment.objects.create(
+            persona=self.estudiante,
+            organizacion=self.organizacion,
+            fecha_pago=date(2026, 8, 1),
+            metodo_pago=Payment.Metodo.EFECTIVO,
+            aplica_iva=False,
+            monto_referencia=10000,
+            monto_total=10000,
+            clases_asignadas=clases,
+        )
+
+    def _estados(self):
+        return list(
+            AttendanceConsumption.objects.filter(persona=self.estudiante)
+            .order_by("clase_fecha")
+            .values_list("estado", "pago_id")
+        )
+
+    def test_asistencias_del_bloque_se_imputan_en_lote_al_cerrar(self):
+        pago = self._crear_pago(clases=2)
+
+        with procesamiento_diferido():
+            for sesion in self.sesiones:
+                Asistencia.objects.create(sesion=sesion, persona=self.estudiante)
+            self.assertFalse(AttendanceConsumption.objects.filter(persona=self.estudiante).exists())
+            self.assertFalse(AlumnoDisciplina.objects.filter(alumno=self.estudiante).exists())
+
+        self.assertEqual(
+            self._estados(),
+            [
+                (AttendanceConsumption.Estado.CONSUMIDO, pago.pk),
+                (AttendanceConsumption.Estado.CONSUMIDO, pago.pk),
+                (AttendanceConsumption.Estado.DEUDA, None),
+            ],
+        )
+        pago.refresh_from_db()
+        self.assertEqual(pago.clases_consumidas, 2)
+        matricula = AlumnoDisciplina.objects.get(alumno=self.estudiante, disciplina=self.disciplina)
+        self.assertFalse(matricula.activa)
+        self.assertEqual(matricula.origen, AlumnoDisciplina.Origen.HISTORICA)
+
+    def test_pagos_del_bloque_cubren_deudas_existentes(self):
+        for sesion in self.sesiones:
+            Asistencia.objects.create(sesion=sesion, persona=self.estudiante)
+
+        with procesamiento_diferido():
+            pago = self._crear_pago(clases=2)
+
+        self.assertEqual(
+            self._estados(),
+            [
+                (AttendanceConsumption.Estado.CONSUMIDO, pago.pk),
+                (AttendanceConsumption.Estado.CONSUMIDO, pago.pk),
+                (AttendanceConsumption.Estado.DEUDA, None),
+            ],
+        )
+
+    def test_lote_diferido_usa_menos_consultas_que_modo_inmediato(self):
+        self._crear_pago(clases=3)
+        otro = Persona.objects.create(nombres="Otra", apellidos="Inmediata")
+
+        with CaptureQueriesContext(connection) as diferido:
+            with procesamiento_diferido():
+                for sesion in self.sesiones:
+                    Asistencia.objects.create(sesion=sesion, persona=self.estudiante)
+        with CaptureQueriesContext(connection) as inmediato:
+            with procesamiento_diferido(inmediato=True):
+                for sesion in self.sesiones:
+                    Asistencia.objects.create(sesion=sesion, persona=otro)
+                self.assertEqual(AttendanceConsumption.objects.filter(persona=otro).count(), 3)
+
+        self.assertLess(len(diferido), len(inmediato) - 1)
+
+    def test_error_dentro_del_bloque_descarta_el_trabajo_pendiente(self):
+        with self.assertRaises(ValidationError):
+            with procesamiento_diferido():
+                Asistencia.objects.create(sesion=self.sesiones[0], persona=self.estudiante)
+                raise ValidationError("falla")
+
+        self.assertFalse(Asistencia.objects.filter(persona=self.estudiante).exists())
+        Asistencia.objects.create(sesion=self.sesiones[1], persona=self.estudiante)
+        self.assertEqual(self._estados(), [(AttendanceConsumption.Estado.DEUDA, None)])
+
+    @override_settings(PROCESAMIENTO_SENALES_INMEDIATO=True)
+    def test_configuracion_fuerza_modo_inmediato(self):
+        with procesamiento_diferido():
+            Asistencia.objects.create(sesion=self.sesiones[0], persona=self.estudiante)
+            self.assertEqual(self._estados(), [(AttendanceConsumption.Estado.DEUDA, None)])
+
+
+class ResumenFinancieroMensualTests(TestCase):
+    def setUp(self):
+        self.organizacion = Organizacion.objects.create(
+            nombre="Org Resumen",
+            razon_social="Org Resumen SpA",
+            rut="74.000.000-2",
+        )
+        self.estudiante = Persona.objects.create(nombres="Alumna", apellidos="Resumen")
+        self.disciplina = Disciplina.objects.create(organizacion=self.organizacion, nombre="Resumen")
+        self.categoria = Category.objects.create(nombre="Ingreso resumen", tipo=Category.Tipo.INGRESO, activa=True)
+        self.pago = Payment.objects.create(
+            persona=self.estudiante,
+            organizacion=self.organizacion,
+            fecha_pago=date(2026, 2, 5),
+            metodo_pago=Payment.Metodo.EFECTIVO,
+            aplica_iva=False,
+            monto_referencia=30000,
+            clases_asignadas=1,
+        )
+        for dia in (6, 13):
+            sesion = SesionClase.objects.create(disciplina=self.disciplina, fecha=date(2026, 2, dia))
+            Asistencia.objects.create(sesion=sesion, persona=self.estudiante)
+        self.documento = DocumentoTributario.objects.create(
+            organizacion=self.organizacion,
+            tipo_documento=DocumentoTributario.TipoDocumento.FACTURA_AFECTA,
+            folio="9001",
+            fecha_emision=date(2026, 1, 30),
+            monto_total=12000,
+        )
+        self.transaccion = Transaction.objects.create(
+            organizacion=self.organizacion,
+            categoria=self.categoria,
+            fecha=date(2026, 2, 10),
+            tipo=Transaction.Tipo.INGRESO,
+            monto=12000,
+            descripcion="Venta febrero",
+        )
+        self.transaccion.documentos_tributarios.add(self.documento)
+
+    def _resumen(self, *, anio=2026, mes=2):
+        pagos_qs, transacciones_qs, documentos_qs, consumos_qs = dashboard_querysets(
+            None, organizacion=self.organizacion, mes=mes, anio=anio
+        )
+        en_vivo = resumen_dashboard(pagos_qs, transacciones_qs, documentos_qs, consumos_qs, mes=mes, anio=anio)
+        materializado = resumen_dashboard_mensual(
+            anio=anio,
+            mes=mes,
+            organizacion=self.organizacion,
+            pagos_qs=pagos_qs,
+            transacciones_qs=transacciones_qs,
+        )
+        return en_vivo, materializado
+
+    def _assert_resumen_coincide(self, en_vivo, materializado):
+        self.assertEqual(set(materializado), set(en_vivo))
+        for clave, valor in en_vivo.items():
+            if clave == "categorias_totales":
+                self.assertEqual(list(materializado[clave]), list(valor))
+            else:
+                self.assertEqual(materializado[clave], valor, clave)
+
+    def test_mes_cerrado_se_materializa_con_los_mismos_totales_que_en_vivo(self):
+        en_vivo, materializado = self._resumen()
+
+        self._assert_resumen_coincide(en_vivo, materializado)
+        self.assertEqual(materializado["deuda_clases"], 1)
+        self.assertEqual(materializado["transacciones_con_documento_fuera_periodo"], 1)
+        fila = ResumenFinancieroMensual.objects.get(organizacion=self.organizacion, anio=2026, mes=2)
+        self.assertEqual(fila.ingresos_contables, 12000)
+
+        pagos_qs, transacciones_qs, *_ = dashboard_querysets(None, organizacion=self.organizacion, mes=2, anio=2026)
+        with self.assertNumQueries(3):
+            resumen = resumen_dashboard_mensual(
+                anio=2026,
+                mes=2,
+                organizacion=self.organizacion,
+                pagos_qs=pagos_qs,
+                transacciones_qs=transacciones_qs,
+            )
+            list(resumen["categorias_totales"])
+
+    def test_escritura_en_mes_cerrado_invalida_el_resumen(self):
+        self._resumen()
+        self.transaccion.monto = 15000
+        self.transaccion.save()
+
+        self.assertFalse(ResumenFinancieroMensual.objects.filter(anio=2026, mes=2).exists())
+        en_vivo, materializado = self._resumen()
+        self._assert_resumen_coincide(en_vivo, materializado)
+        self.assertEqual(materializado["ingresos_contables"], 15000)
+
+        self.documento.fecha_emision = date(2026, 2, 1)
+        self.documento.save()
+        en_vivo, materializado = self._resumen()
+        self._assert_resumen_coincide(en_vivo, materializado)
+        self.assertEqual(materializado["transacciones_con_documento_fuera_periodo"], 0)
+
+        self.transaccion.documentos_tributarios.clear()
+        self.assertEqual(self._resumen()[1]["transacciones_sin_documento"], 1)
+
+    def test_consumos_y_reimputacion_en_mes_cerrado_invalidan_el_resumen(self):
+        self._resumen()
+        segundo_pago = Payment.objects.create(
+            persona=self.estudiante,
+            organizacion=self.organizacion,
+            fecha_pago=date(2026, 2, 20),
+            metodo_pago=Payment.Metodo.EFECTIVO,
+            aplica_iva=False,
+            monto_referencia=30000,
+            clases_asignadas=1,
+        )
+        en_vivo, materializado = self._resumen()
+        self._assert_resumen_coincide(en_vivo, materializado)
+        self.assertEqual(materializado["deuda_clases"], 0)
+
+        Payment.objects.filter(pk=segundo_pago.pk).update(revertido_en=timezone.now())
+        reimputar_consumos_mes(organizacion=self.organizacion, anio=2026, mes=2, aplicar=True)
+        en_vivo, materializado = self._resumen()
+        self._assert_resumen_coincide(en_vivo, materializado)
+        self.assertEqual(materializado["deuda_clases"], 1)
+
+    def test_mes_en_curso_no_se_materializa(self):
+        hoy = timezone.localdate()
+        Transaction.objects.create(
+            organizacion=self.organizacion,
+            categoria=self.categoria,
+            fecha=hoy,
+            tipo=Transaction.Tipo.INGRESO,
+            monto=7000,
+            descripcion="Venta actual",
+        )
+        user = crear_usuario_con_rol(
+            username="finanzas_resumen",
+            password=TEST_PASSWORD,
+            rol=Rol.objects.create(nombre="Finanzas Resumen", codigo="FINANZAS"),
+            organizacion=self.organizacion,
+        )
+        self.client.force_login(user)
+
+        response = self.client.get(
+            reverse("finanzas:dashboard"),
+            {"periodo_mes": hoy.month, "periodo_anio": hoy.year, "organizacion": self.organizacion.pk},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["ingresos_contables"], 7000)
+        self.assertFalse(ResumenFinancieroMensual.objects.exists())
+
+    def test_comando_reconstruye_resumenes_desactualizados(self):
+        valores = calcular_resumen_mensual(organizacion_id=self.organizacion.pk, anio=2026, mes=2)
+        ResumenFinancieroMensual.objects.create(
+            organizacion=self.organizacion,
+            anio=2026,
+            mes=2,
+            **{**valores, "ingresos_contables": 1},
+        )
+
+        salida = StringIO()
+        call_command(
+            "reconstruir_resumen_financiero",
+            organizacion=self.organizacion.pk,
+            anio=2026,
+            mes=2,
+            stdout=salida,
+        )
+        self.assertIn(f"2026-02 organizacion={self.organizacion.pk}: desactualizado", salida.getvalue())
+        self.assertEqual(ResumenFinancieroMensual.objects.get().ingresos_contables, 1)
+
+        call_command(
+            "reconstruir_resumen_financiero",
+            organizacion=self.organizacion.pk,
+            anio=2026,
+            mes=2,
+            aplicar=True,
+            stdout=StringIO(),
+        )
+        self.assertEqual(ResumenFinancieroMensual.objects.get().ingresos_contables, 12000)
+
+
+
+class ResumenFinancieroMensualConcurrenciaTests(TransactionTestCase):
+    def setUp(self):
+        if connection.vendor != "postgresql":
+            self.skipTest("Los locks del resumen mensual requieren PostgreSQL.")
+        self.organizacion = Organizacion.objects.create(
+            nombre="Org Resumen Concurrente",
+            razon_social="Org Resumen Concurrente SpA",
+            rut="74.000.001-0",
+        )
+        categoria = Category.objects.create(nombre="Ingreso concurrente", tipo=Category.Tipo.INGRESO, activa=True)
+        self.transaccion = Transaction.objects.create(
+            organizacion=self.organizacion,
+            categoria=categoria,
+            fecha=date(2026, 2, 10),
+            tipo=Transaction.Tipo.INGRESO,
+            monto=12000,
+            descripcion="Venta febrero",
+        )
+
+    def tearDown(self):
+        connections.close_all()
+        super().tearDown()
+
+    def test_lectura_durante_una_escritura_no_guarda_totales_anteriores_al_commit(self):
+        invalidado = Event()
+        lectura_iniciada = Event()
+        errores = []
+
+        def escribir():
+            connections.close_all()
+            try:
+                with transaction.atomic():
+                    transaccion = Transaction.objects.get(pk=self.transaccion.pk)
+                    transaccion.monto = 15000
+                    transaccion.save()
+                    invalidado.set()
+                    self.assertTrue(lectura_iniciada.wait(10))
+                    # La lectura queda esperando el lock de la clave hasta este commit.
+                    time.sleep(0.3)
+            except Exception as error:  # la aserción se realiza en el hilo principal
+                errores.append(error)
+            finally:
+                connections.close_all()
+
+        def leer():
+            connections.close_all()
+            try:
+                self.assertTrue(invalidado.wait(10))
+                lectura_iniciada.set()
+                resumenes_del_mes(anio=2026, mes=2, organizacion_ids=[self.organizacion.pk])
+            except Exception as error:
+                errores.append(error)
+            finally:
+                connections.close_all()
+
+        hilos = [Thread(target=escribir), Thread(target=leer)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join(15)
+        self.assertFalse(any(hilo.is_alive() for hilo in hilos), "Una de las transacciones no terminó.")
+        self.assertEqual(errores, [])
+        fila = ResumenFinancieroMensual.objects.get(organizacion=self.organizacion, anio=2026, mes=2)
+        self.assertEqual(fila.ingresos_contables, 15000)
+
+
+
+class IndiceUnicoDocumentosTests(TransactionTestCase):
+    def setUp(self):
+        if connection.vendor != "postgresql":
+            self.skipTest("El índice único concurrente requiere PostgreSQL.")
+        self.org = Organizacion.objects.create(nombre="Org Índice", razon_social="Org Índice SpA", rut="74.000.002-9")
+        self.addCleanup(self._borrar_indice)
+
+    def _borrar_indice(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP INDEX IF EXISTS {connection.ops.quote_name(INDICE_UNICO_CLAVE)}")
+
+    def _documento(self, rut):
+        return DocumentoTributario.objects.create(
+            organizacion=self.org,
+            tipo_documento=DocumentoTributario.TipoDocumento.BOLETA_VENTA_AFECTA,
+            folio="500",
+            fecha_emision=date(2026, 2, 2),
+            rut_emisor=rut,
+            monto_total=100,
+        )
+
+    def test_indice_invalido_de_un_intento_concurrente_fallido_se_recrea(self):
+        self._documento("44.444.444-4")
+        repetido = self._documento("44444444-4")
+        with self.assertRaises(IntegrityError):
+            crear_indice_unico_clave()
+        self.assertIs(estado_indice_unico_clave(), False)
+
+        repetido.delete()
+        salida = StringIO()
+        call_command("activar_unicidad_documentos", stdout=salida)
+        self.assertIn("quedó inválido", salida.getvalue())
+        self.assertIs(estado_indice_unico_clave(), False)
+
+        call_command("activar_unicidad_documentos", aplicar=True, stdout=StringIO())
+        self.assertIs(estado_indice_unico_clave(), True)
+        with self.assertRaises(IntegrityError):
+            self._documento("44444444-4")
+
+
+def _zip_lote(archivos):
+    contenido = BytesIO()
+    with zipfile.ZipFile(contenido, "w") as comprimido:
+        for nombre, datos in archivos.items():
+            comprimido.writestr(nombre, datos)
+    return contenido.getvalue()
+
+
+def _dte_lote(folio, *, total=11900):
+    neto = total * 100 // 119
+    return f"""
+    <EnvioDTE>
+      <SetDTE>
+        <DTE>
+          <Documento>
+            <Encabezado>
+              <IdDoc><TipoDTE>39</TipoDTE><Folio>{folio}</Folio><FchEmis>2026-03-05</FchEmis></IdDoc>
+              <Emisor><RUTEmisor>44.444.444-4</RUTEmisor><RznSoc>Org Lote</RznSoc></Emisor>
+              <Receptor><RUTRecep>22.222.222-2</RUTRecep><RznSocRecep>Cliente</RznSocRecep></Receptor>
+              <Totales><MntNeto>{neto}</MntNeto><IVA>{total - neto}</IVA><MntTotal>{total}</MntTotal></Totales>
+            </Encabezado>
+            <Detalle><NroLinDet>1</NroLinDet><NmbItem>Clase</NmbItem><MontoItem>{total}</MontoItem></Detalle>
+          </Documento>
+        </DTE>
+      </SetDTE>
+    </EnvioDTE>
+    """.encode()
+
+
+def _envio_dte(*folios):
+    """EnvioDTE firmado con un DTE por folio, como los que exporta el SII."""
+    dtes = "".join(
+        f"""
+        <DTE version="1.0">
+          <Documento ID="F{folio}T39">
+            <Encabezado>
+              <IdDoc><TipoDTE>39</TipoDTE><Folio>{folio}</Folio><FchEmis>2026-03-05</FchEmis></IdDoc>
+              <Emisor><RUTEmisor>44.444.444-4</RUTEmisor><RznSoc>Org Lote</RznSoc></Emisor>
+              <Receptor><RUTRecep>22.222.222-2</RUTRecep></Receptor>
+              <Totales><MntNeto>10000</MntNeto><IVA>1900</IVA><MntTotal>11900</MntTotal></Totales>
+            </Encabezado>
+            <Detalle><NroLinDet>1</NroLinDet><NmbItem>Clase {folio}</NmbItem><MontoItem>11900</MontoItem></Detalle>
+          </Documento>
+          <Signature xmlns="http://www.w3.org/2000/09/xmldsig#"><SignatureValue>firma</SignatureValue></Signature>
+        </DTE>"""
+        for folio in folios
+    )
+    return f"""<?xml version="1.0" encoding="ISO-8859-1"?>
+    <EnvioDTE xmlns="http://www.sii.cl/SiiDte" version="1.0">
+      <SetDTE ID="SetDoc">
+        <Caratula version="1.0">
+          <RutEmisor>44444444-4</RutEmisor><TmstFirmaEnv>2026-03-06T10:00:00</TmstFirmaEnv>
+        </Caratula>
+        {dtes}
+      </SetDTE>
+    </EnvioDTE>
+    """.encode("latin-1")
+
+
+class ImportacionLoteDocumentosTests(TestCase):
+    def setUp(self):
+        self.media = TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        self.enterContext(self.settings(MEDIA_ROOT=self.media.name))
+        self.org = Organizacion.objects.create(nombre="Org Lote", razon_social="Org Lote SPA", rut="44.444.444-4")
+        rol = Rol.objects.create(nombre="Administrador", codigo="ADMINISTRADOR")
+        self.usuario = crear_usuario_con_rol(
+            username="admin_lote", password=TEST_PASSWORD, rol=rol, organizacion=self.org
+        )
+        DocumentoTributario.objects.create(
+            organizacion=self.org,
+            tipo_documento=DocumentoTributario.TipoDocumento.BOLETA_VENTA_AFECTA,
+            folio="300",
+            fecha_emision=date(2026, 2, 1),
+            rut_emisor="44444444-4",
+            monto_total=100,
+        )
+
+    def _zip(self):
+        return _zip_lote(
+            {
+                "marzo/f100.xml": _dte_lote(100),
+                "marzo/f100.pdf": b"%PDF-1.4 boleta 100",
+                "f200.xml": _dte_lote(200, total=23800),
+                "scan_000200.pdf": b"%PDF-1.4 boleta 200",
+                "copia/f100.xml": _dte_lote(100),
+                "f300.xml": _dte_lote(300),
+                "suelto.pdf": b"%PDF-1.4 sin texto",
+                "notas.txt": b"ignorado",
+                "__MACOSX/._f100.xml": b"ignorado",
+            }
+        )
+
+    @patch("finanzas.documentos.parsers.PdfFallbackParser._extract_text_with_pdftotext", return_value="")
+    @patch("finanzas.documentos.parsers.PdfFallbackParser._extract_text_with_pypdf", return_value="")
+    def test_preparar_lote_empareja_archivos_y_marca_duplicados(self, *_mocks):
+        archivos = extraer_archivos_lote(BytesIO(self._zip()), Path(self.media.name) / "lote")
+        self.assertEqual(len(archivos), 7)
+
+        with CaptureQueriesContext(connection) as consultas:
+            filas = preparar_lote(archivos, organizacion_id=self.org.pk, procesos=1)
+
+        por_archivo = {fila["xml"] or fila["pdf"]: fila for fila in filas}
+        self.assertEqual(len(filas), 5)
+        self.assertEqual(por_archivo["marzo/f100.xml"]["pdf"], "marzo/f100.pdf")
+        self.assertEqual(por_archivo["f200.xml"]["pdf"], "scan_000200.pdf")
+        self.assertEqual(por_archivo["f200.xml"]["documento"]["monto_total"], Decimal("23800"))
+        self.assertTrue(por_archivo["marzo/f100.xml"]["sugerida"])
+        self.assertEqual(por_archivo["copia/f100.xml"]["duplicado_de"], por_archivo["marzo/f100.xml"]["indice"])
+        self.assertFalse(por_archivo["copia/f100.xml"]["sugerida"])
+        self.assertEqual(len(por_archivo["f300.xml"]["duplicados"]), 1)
+        self.assertFalse(por_archivo["f300.xml"]["sugerida"])
+        self.assertFalse(por_archivo["suelto.pdf"]["importable"])
+        duplicados = [sql for sql in consultas.captured_queries if 'FROM "finanzas_invoice"' in sql["sql"]]
+        self.assertEqual(len(duplicados), 1)
+
+    def test_preparar_lote_en_procesos_separados_guarda_el_cache_de_parseo(self):
+        directorio = Path(self.media.name) / "origen"
+        directorio.mkdir()
+        for folio in (501, 502, 503):
+            (directorio / f"boleta_{folio}.xml").write_bytes(_dte_lote(folio))
+
+        filas = preparar_lote(extraer_archivos_lote(directorio), organizacion_id=self.org.pk, procesos=2)
+
+        self.assertEqual([fila["documento"]["folio"] for fila in filas], ["501", "502", "503"])
+        self.assertEqual(ResultadoParseoDocumento.objects.count(), 3)
+        with patch("finanzas.documentos.procesos.parsear_rutas") as parsear:
+            en_cache = preparar_lote(extraer_archivos_lote(directorio), organizacion_id=self.org.pk, procesos=2)
+        parsear.assert_not_called()
+        self.assertEqual(
+            [{**fila["documento"], "metadata_extra": None} for fila in en_cache],
+            [{**fila["documento"], "metadata_extra": None} for fila in filas],
+        )
+
+    @patch("finanzas.documentos.parsers.PdfFallbackParser._extract_text_with_pdftotext", return_value="")
+    @patch("finanzas.documentos.parsers.PdfFallbackParser._extract_text_with_pypdf", return_value="")
+    @override_settings(DOCUMENTOS_LOTE_PROCESOS=1)
+    def test_vista_lote_revisa_en_una_tabla_y_confirma_con_un_solo_insert(self, *_mocks):
+        self.client.force_login(self.usuario)
+        url = f"{reverse('finanzas:documento_tributario_importar_lote')}?organizacion={self.org.pk}"
+
+        response = self.client.post(
+            url,
+            {"accion": "parsear", "archivo": SimpleUploadedFile("marzo.zip", self._zip(), "application/zip")},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.context["resumen_lote"],
+            {"total": 5, "sugeridas": 2, "duplicadas": 2, "con_errores": 1},
+        )
+        token = response.context["token_importacion"]
+        filas = response.context["filas"]
+        todas = [str(fila["indice"]) for fila in filas]
+
+        with CaptureQueriesContext(connection) as consultas, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {"accion": "confirmar", "token_importacion": token, "filas": todas})
+
+        inserts = [sql for sql in consultas.captured_queries if sql["sql"].startswith('INSERT INTO "finanzas_invoice"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertRedirects(response, f"{reverse('finanzas:documentos_tributarios_list')}?organizacion={self.org.pk}")
+        nuevos = DocumentoTributario.objects.filter(organizacion=self.org).exclude(folio="300").order_by("folio")
+        self.assertEqual([documento.folio for documento in nuevos], ["100", "200"])
+        self.assertTrue(nuevos[1].archivo_xml.name.endswith("f200.xml"))
+        self.assertTrue(nuevos[1].archivo_pdf.name.endswith("scan_000200.pdf"))
+        self.assertEqual(nuevos[1].metadata_extra["importacion_lote"]["archivo_pdf"], "scan_000200.pdf")
+        self.assertEqual(AuditLog.objects.filter(accion=AuditLog.ACCION_IMPORTAR).count(), 2)
+        self.assertNotIn(token, self.client.session.get(SESSION_KEY, {}))
+        self.assertFalse((Path(self.media.name) / "finanzas" / "importaciones_tmp" / token).exists())
+
+    @override_settings(DOCUMENTOS_LOTE_MAX_ARCHIVOS=2)
+    def test_lote_rechaza_zip_con_demasiados_archivos(self):
+        self.client.force_login(self.usuario)
+
+        response = self.client.post(
+            f"{reverse('finanzas:documento_tributario_importar_lote')}?organizacion={self.org.pk}",
+            {"accion": "parsear", "archivo": SimpleUploadedFile("marzo.zip", self._zip(), "application/zip")},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("máximo de 2 archivos", str(response.context["upload_form"].errors["archivo"]))
+        self.assertFalse(self.client.session.get(SESSION_KEY))
+
+    def test_comando_importar_documentos_muestra_revision_y_aplica(self):
+        directorio = Path(self.media.name) / "origen"
+        directorio.mkdir()
+        (directorio / "f700.xml").write_bytes(_dte_lote(700))
+        (directorio / "f300.xml").write_bytes(_dte_lote(300))
+
+        salida = StringIO()
+        call_command(
+            "importar_documentos_tributarios",
+            str(directorio),
+            organizacion=self.org.pk,
+            procesos=1,
+            stdout=salida,
+        )
+        self.assertIn("PREVIEW: 2 documentos, 1 se importarían.", salida.getvalue())
+        self.assertIn("duplicado de", salida.getvalue())
+        self.assertFalse(DocumentoTributario.objects.filter(folio="700").exists())
+
+        call_command(
+            "importar_documentos_tributarios",
+            str(directorio),
+            organizacion=self.org.pk,
+            procesos=1,
+            aplicar=True,
+            stdout=StringIO(),
+        )
+        self.assertEqual(DocumentoTributario.objects.filter(organizacion=self.org).count(), 2)
+        self.assertTrue(DocumentoTributario.objects.get(folio="700").archivo_xml.name.endswith("f700.xml"))
+
+    def test_envio_dte_con_varios_documentos_da_una_fila_e_importa_cada_dte(self):
+        directorio = Path(self.media.name) / "origen"
+        directorio.mkdir()
+        (directorio / "envio.xml").write_bytes(_envio_dte(801, 802, 300))
+
+        documentos = list(DteXmlParser().iterar(directorio / "envio.xml", xml_name="envio.xml"))
+        self.assertEqual(
+            [normalized.get_value("encabezado", "folio") for normalized in documentos], ["801", "802", "300"]
+        )
+        self.assertEqual(documentos[2].get_value("metadata_archivo", "indice_en_archivo"), 2)
+        self.assertEqual(documentos[1].get_value("encabezado", "fecha_generacion"), "2026-03-06T10:00:00")
+
+        filas = preparar_lote(extraer_archivos_lote(directorio), organizacion_id=self.org.pk, procesos=1)
+
+        self.assertEqual([fila["indice_dte"] for fila in filas], [0, 1, 2])
+        self.assertEqual([fila["xml"] for fila in filas], ["envio.xml"] * 3)
+        self.assertEqual([fila["sugerida"] for fila in filas], [True, True, False])
+        self.assertEqual(ResultadoParseoDocumento.objects.count(), 1)
+
+        resultado = importar_lote_documentos(usuario=None, organizacion=self.org, filas=filas)
+
+        self.assertEqual(len(resultado["creados"]), 2)
+        documento = DocumentoTributario.objects.get(folio="802")
+        self.assertEqual(documento.metadata_extra["importacion_lote"]["indice_dte"], 1)
+        self.assertTrue(documento.archivo_xml.name.endswith("envio_0002.xml"))
+        with documento.archivo_xml.open("rb") as archivo:
+            fragmento = archivo.read()
+        self.assertIn(b"<Folio>802</Folio>", fragmento)
+        self.assertNotIn(b"<Folio>801</Folio>", fragmento)
+        reparseado = parse_tax_document(xml_bytes=fragmento, xml_name="f802.xml")
+        self.assertEqual(reparseado.get_value("encabezado", "folio"), "802")
+
+    @override_settings(DOCUMENTOS_LOTE_PROCESOS=1)
+    def test_carga_asistida_deriva_envio_con_varios_dte_a_la_revision_del_lote(self):
+        envio = _envio_dte(901, 902)
+        normalized = parse_tax_document(xml_bytes=envio, xml_name="envio.xml", organizacion_id=self.org.pk)
+        self.assertEqual(normalized.get_value("encabezado", "folio"), "901")
+        self.assertEqual(normalized.get_value("metadata_archivo", "documentos_en_archivo"), 2)
+        self.assertTrue(any("contiene 2 documentos" in warning for warning in normalized.warnings))
+
+        self.client.force_login(self.usuario)
+        response = self.client.post(
+            f"{reverse('finanzas:documento_tributario_importar')}?organizacion={self.org.pk}",
+            {"accion": "parsear", "archivo": SimpleUploadedFile("envio.xml", envio, "application/xml")},
+        )
+
+        self.assertTemplateUsed(response, "finanzas/documento_tributario_importar_lote.html")
+        self.assertEqual([fila["documento"]["folio"] for fila in response.context["filas"]], ["901", "902"])
+        response = self.client.post(
+            f"{reverse('finanzas:documento_tributario_importar_lote')}?organizacion={self.org.pk}",
+            {"accion": "confirmar", "token_importacion": response.context["token_importacion"], "filas": ["0", "1"]},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            sorted(DocumentoTributario.objects.filter(folio__in=["901", "902"]).values_list("folio", flat=True)),
+            ["901", "902"],
+        )
+
+    def test_importacion_temporal_guarda_solo_el_token_en_la_sesion_y_tiene_dueno(self):
+        self.client.force_login(self.usuario)
+        url = f"{reverse('finanzas:documento_tributario_importar')}?organizacion={self.org.pk}"
+        response = self.client.post(
+            url, {"accion": "parsear", "archivo": SimpleUploadedFile("f100.xml", _dte_lote(100), "application/xml")}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        tokens = self.client.session[SESSION_KEY]
+        self.assertEqual(len(tokens), 1)
+        importacion = ImportacionTemporal.objects.get(token=tokens[0])
+        self.assertEqual(importacion.usuario, self.usuario)
+        self.assertIn("normalized", importacion.payload)
+        self.assertTrue(Path(importacion.archivos["xml"]["path"]).exists())
+
+        otro = crear_usuario_con_rol(
+            username="otro_lote",
+            password=TEST_PASSWORD,
+            rol=Rol.objects.get(codigo="ADMINISTRADOR"),
+            organizacion=self.org,
+        )
+        self.client.force_login(otro)
+        sesion = self.client.session
+        sesion[SESSION_KEY] = tokens
+        sesion.save()
+        response = self.client.post(url, {"accion": "confirmar", "token_importacion": tokens[0]})
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+        self.assertFalse(DocumentoTributario.objects.filter(folio="100").exists())
+
+    def test_limpiar_importaciones_temporales_borra_vencidas_y_directorios_huerfanos(self):
+        base = Path(self.media.name) / "finanzas" / "importaciones_tmp"
+        vencida, vigente, huerfano, reciente = (base / nombre for nombre in ("a" * 32, "b" * 32, "c" * 32, "d" * 32))
+        for directorio in (vencida, vigente, huerfano, reciente):
+            directorio.mkdir(parents=True)
+            (directorio / "f.xml").write_bytes(b"<x/>")
+        antiguo = (timezone.now() - timedelta(days=3)).timestamp()
+        os.utime(huerfano, (antiguo, antiguo))
+        ahora = timezone.now()
+        ImportacionTemporal.objects.create(
+            token=vencida.name, usuario=self.usuario, directorio=str(vencida), expira_en=ahora - timedelta(hours=1)
+        )
+        ImportacionTemporal.objects.create(
+            token=vigente.name, usuario=self.usuario, directorio=str(vigente), expira_en=ahora + timedelta(hours=1)
+        )
+
+        salida = StringIO()
+        call_command("limpiar_importaciones_temporales", stdout=salida)
+        self.assertIn("Importaciones vencidas: 1; directorios sin registro: 1.", salida.getvalue())
+        self.assertTrue(vencida.exists() and huerfano.exists())
+
+        call_command("limpiar_importaciones_temporales", aplicar=True, stdout=StringIO())
+        self.assertFalse(vencida.exists())
+        self.assertFalse(huerfano.exists())
+        self.assertTrue(vigente.exists())
+        self.assertTrue(reciente.exists())
+        self.assertEqual(list(ImportacionTemporal.objects.values_list("token", flat=True)), [vigente.name])
+
+    def test_duplicados_se_buscan_por_rut_normalizado_y_por_hash_del_archivo(self):
+        normalized = DteXmlParser().parse(xml_bytes=_dte_lote(300), xml_name="f300.xml")
+        existente = DocumentoTributario.objects.get(folio="300")
+        self.assertEqual(existente.rut_emisor_normalizado, "444444444")
+
+        duplicados = detectar_duplicados_documento(normalized, self.org.pk)
+        self.assertEqual([item["id"] for item in duplicados], [existente.pk])
+        self.assertEqual(
+            duplicados_por_clave([clave_documento("boleta_venta_afecta", "300", "44.444.444-4")], self.org.pk),
+            {("boleta_venta_afecta", "300", "444444444"): duplicados},
+        )
+
+        # Mismo archivo, otro folio leído: el hash del contenido lo sigue marcando como duplicado.
+        importado = DocumentoTributario.objects.create(
+            organizacion=self.org,
+            tipo_documento=DocumentoTributario.TipoDocumento.FACTURA_AFECTA,
+            folio="9",
+            fecha_emision=date(2026, 3, 5),
+            monto_total=1,
+            metadata_extra={"importacion_normalizada": normalized.to_dict()},
+        )
+        self.assertEqual(importado.hash_contenido, normalized.get_value("metadata_archivo", "hash"))
+        normalized.set_field("encabezado", "folio", "301", "xml", "high")
+        duplicados = detectar_duplicados_documento(normalized, self.org.pk)
+        self.assertEqual([item["id"] for item in duplicados], [importado.pk])
+
+    def test_activar_unicidad_documentos_lista_conflictos_y_crea_el_indice(self):
+        existente = DocumentoTributario.objects.get(folio="300")
+        repetido = DocumentoTributario(
+            organizacion=self.org,
+            tipo_documento=DocumentoTributario.TipoDocumento.BOLETA_VENTA_AFECTA,
+            folio="300",
+            fecha_emision=date(2026, 2, 2),
+            rut_emisor="44.444.444-4",
+            monto_total=100,
+        )
+        with self.assertRaises(ValidationError):
+            repetido.validate_unique()
+        repetido.save()
+
+        salida = StringIO()
+        with self.assertRaisesMessage(CommandError, "1 claves repetidas"):
+            call_command("activar_unicidad_documentos", aplicar=True, stdout=salida)
+        self.assertIn(f"documentos #{existente.pk}, #{repetido.pk}", salida.getvalue())
+
+        repetido.delete()
+        call_command("activar_unicidad_documentos", aplicar=True, stdout=StringIO())
+        repetido.pk = None
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            repetido.save()
@@ -6,6 +6,7 @@ app_name = "finanzas"
 
 urlpatterns = [
     path("", views.dashboard, name="dashboard"),
+    path("buscar/", views.buscar, name="buscar"),
     path("planes/", views.planes_list, name="planes_list"),
     path("planes/<int:pk>/editar/", views.plan_edit, name="plan_edit"),
     path("planes/<int:pk>/eliminar/", views.plan_delete, name="plan_delete"),
@@ -22,6 +23,11 @@ urlpatterns = [
         views.documento_tributario_importar,
         name="documento_tributario_importar",
     ),
+    path(
+        "documentos-tributarios/importar/lote/",
+        views.documento_tributario_importar_lote,
+        name="documento_tributario_importar_lote",
+    ),
     path(
         "documentos-tributarios/importar/parse-preview/",
         views.documento_tributario_parse_preview,
@@ -1,8 +1,8 @@
-﻿import csv
-import json
+﻿import json
 import mimetypes
 import uuid
 from pathlib import Path
+from urllib.parse import urlencode
 from decimal import Decimal
 
 from django.contrib import messages
@@ -21,19 +21,25 @@ from auditoria.models import AuditLog
 from auditoria.services import registrar_auditoria, registrar_cambio
 from asistencias.forms import PersonaRapidaForm
 from plataformaelemental.context import (
+    argumentos_periodo,
+    contexto_peticion,
     descripcion_periodo,
     organizacion_desde_request,
     organizaciones_visibles_para_usuario,
     resolver_periodo,
 )
-from plataformaelemental.exports import periodo_sufijo_archivo, xlsx_response
-from asistencias.selectors import resumen_profesores_periodo_queryset
-from asistencias.services.exportaciones import (
-    PAGOS_PROFESORES_XLSX_HEADERS,
-    filas_export_pagos_profesores,
-)
+from exportaciones.views import responder_exportacion
 
 from .documentos.dtos import NormalizedTaxDocument
+from .exportaciones import (
+    exportacion_libro_caja_csv,
+    exportacion_pagos_alumnos_xlsx,
+    exportacion_pagos_csv,
+    exportacion_pagos_profesores_xlsx,
+    exportacion_transacciones_csv,
+    exportacion_transacciones_xlsx,
+)
+from .documentos.lote import ArchivoLote, extraer_archivos_lote, preparar_lote
 from .documentos.services import build_review_payload, parse_tax_document
 from .documentos.temp_storage import (
     actualizar_payload_importacion,
@@ -41,6 +47,7 @@ from .documentos.temp_storage import (
     cargar_importacion_temporal,
     eliminar_importacion_temporal,
     guardar_importacion_temporal,
+    reservar_importacion_temporal,
 )
 from .decorators import (
     documentos_required,
@@ -55,6 +62,7 @@ from personas.permissions import (
     ACCION_OPERAR_PAGOS,
     ACCION_OPERAR_TRANSACCIONES,
     ACCION_REVERTIR_PAGO,
+    ACCION_VER_FINANZAS,
     usuario_tiene_permiso,
 )
 from .forms import (
@@ -62,6 +70,7 @@ from .forms import (
     DocumentoTributarioForm,
     DocumentoTributarioImportConfirmForm,
     DocumentoTributarioImportUploadForm,
+    DocumentoTributarioLoteUploadForm,
     PaymentForm,
     PagoMasivoForm,
     PaymentPlanForm,
@@ -84,21 +93,20 @@ from .models import Category, DocumentoTributario, LotePago, Payment, PaymentPla
 from personas.models import Persona
 from personas.search import filtrar_por_fragmentos
 from .selectors import (
+    buscar_en_finanzas,
     categorias_queryset,
     consolidado_categorias_queryset,
     dashboard_querysets,
     documentos_tributarios_queryset,
-    libro_caja_queryset,
     pago_detail_queryset,
-    pagos_export_queryset,
     pagos_queryset,
     planes_queryset,
     resumen_documentos_tributarios,
     resumen_pagos,
     resumen_transacciones,
-    transacciones_export_queryset,
     transacciones_queryset,
 )
+from .services.documentos import importar_lote_documentos
 from .services.pagos import (
     confirmar_lote_pagos,
     crear_persona_estudiante_desde_modal,
@@ -109,18 +117,8 @@ from .services.pagos import (
 )
 from .services.reversas import revertir_pago
 from .services.reportes import (
-    PAGOS_ALUMNOS_XLSX_HEADERS,
-    PAGOS_CSV_HEADERS,
-    TRANSACCIONES_CSV_HEADERS,
-    TRANSACCIONES_XLSX_HEADERS,
     armar_dashboard_financiero,
     armar_reporte_categorias,
-    LIBRO_CAJA_CSV_HEADERS,
-    filas_export_libro_caja,
-    filas_export_pagos,
-    filas_export_pagos_alumnos_xlsx,
-    filas_export_transacciones,
-    filas_export_transacciones_xlsx,
 )
 
 
@@ -369,8 +367,8 @@ def dashboard(request):
             consumos_qs=consumos_qs,
             periodo_descripcion=descripcion_periodo(request=request, corta=False),
             organizacion=organizacion,
-            mes=periodo["mes"],
-            anio=periodo["anio"],
+            **argumentos_periodo(periodo),
+            resumen_mensual=not (periodo["desde"] or periodo["hasta"]),
         )
     )
     context["ayuda_seccion"] = _ayuda_finanzas("dashboard")
@@ -399,6 +397,63 @@ def dashboard(request):
     return render(request, "finanzas/dashboard.html", context)
 
 
+def _organizaciones_busqueda(request):
+    """La organización activa o, con "Todas", las visibles donde el usuario puede ver finanzas."""
+    organizacion = organizacion_desde_request(request)
+    organizaciones = [organizacion] if organizacion else contexto_peticion(request).organizaciones_visibles()
+    return [
+        organizacion.pk
+        for organizacion in organizaciones
+        if usuario_tiene_permiso(request.user, ACCION_VER_FINANZAS, organizacion=organizacion)
+    ]
+
+
+_URL_RESULTADO_BUSQUEDA = {
+    "pago": "finanzas:pago_detail",
+    "documento": "finanzas:documento_tributario_detail",
+    "transaccion": "finanzas:transaccion_detail",
+}
+
+
+def _url_resultado_busqueda(resultado):
+    if resultado["tipo"] == "persona":
+        parametros = {"q": resultado["titulo"], "periodo_mes": "todos", "periodo_anio": "todos"}
+        url = reverse("finanzas:pagos_list")
+    else:
+        parametros = {}
+        url = reverse(_URL_RESULTADO_BUSQUEDA[resultado["tipo"]], args=[resultado["id"]])
+    parametros["organizacion"] = resultado["organizacion_id"]
+    return f"{url}?{urlencode(parametros)}"
+
+
+@login_required
+def buscar(request):
+    termino = " ".join((request.GET.get("q") or "").split())
+    organizacion_ids = _organizaciones_busqueda(request)
+    if not organizacion_ids:
+        return JsonResponse(
+            {"ok": False, "codigo": "PERMISO_DENEGADO", "mensaje": "No tienes permiso de lectura financiera."},
+            status=403,
+        )
+    if len(termino) < 2:
+        return JsonResponse({"ok": True, "resultados": []})
+    resultados = buscar_en_finanzas(termino, organizacion_ids=organizacion_ids)
+    return JsonResponse(
+        {
+            "ok": True,
+            "resultados": [
+                {
+                    **resultado,
+                    "fecha": resultado["fecha"].isoformat() if resultado["fecha"] else None,
+                    "rango": round(resultado["rango"], 4),
+                    "url": _url_resultado_busqueda(resultado),
+                }
+                for resultado in resultados
+            ],
+        }
+    )
+
+
 @pagos_required
 def planes_list(request):
     context = _base_context(request)
@@ -467,7 +522,7 @@ def _contexto_pagos_list(request, *, form=None, edit_form=None, edit_pago=None,
     context = _base_context(request)
     periodo = resolver_periodo(request)
     organizacion = organizacion_desde_request(request)
-    pagos_qs = pagos_queryset(request, organizacion=organizacion, mes=periodo["mes"], anio=periodo["anio"])
+    pagos_qs = pagos_queryset(request, organizacion=organizacion)
     q = request.GET.get("q")
     metodo = request.GET.get("metodo")
     persona_id = request.GET.get("persona")
@@ -1075,11 +1130,18 @@ def documento_tributario_importar(request):
                 pdf_name=pdf_file.name if pdf_file else None,
                 organizacion_id=organizacion.pk if organizacion else None,
             )
-            payload = build_review_payload(normalized, organizacion_id=organizacion.pk if organizacion else None)
             if xml_file:
                 xml_file.seek(0)
             if pdf_file:
                 pdf_file.seek(0)
+            documentos_en_archivo = normalized.get_value("metadata_archivo", "documentos_en_archivo") or 1
+            if documentos_en_archivo > 1 and organizacion:
+                # Un EnvioDTE con varios DTE se revisa en la tabla del lote, una fila por documento.
+                token = guardar_importacion_temporal(request, xml_file=xml_file)
+                guardado = cargar_archivo_importacion_temporal(request, token, "xml")
+                archivos = [ArchivoLote(nombre=guardado["name"], ruta=guardado["path"], tipo="xml")]
+                return _render_revision_lote(request, context, organizacion, token, archivos)
+            payload = build_review_payload(normalized, organizacion_id=organizacion.pk if organizacion else None)
             token = guardar_importacion_temporal(request, xml_file=xml_file, pdf_file=pdf_file, payload=payload)
             context.update(_review_context_from_payload(request, payload, token_importacion=token))
             context["confirm_form"] = DocumentoTributarioImportConfirmForm(
@@ -1102,6 +1164,89 @@ def documento_tributario_importar(request):
     return render(request, "finanzas/documento_tributario_importar.html", context)
 
 
+def _resumen_lote(filas):
+    return {
+        "total": len(filas),
+        "sugeridas": sum(1 for fila in filas if fila["sugerida"]),
+        "duplicadas": sum(1 for fila in filas if fila["duplicados"] or fila["duplicado_de"] is not None),
+        "con_errores": sum(1 for fila in filas if fila["errores"]),
+    }
+
+
+def _render_revision_lote(request, context, organizacion, token, archivos):
+    filas = preparar_lote(archivos, organizacion_id=organizacion.pk)
+    actualizar_payload_importacion(request, token, {"organizacion_id": organizacion.pk, "filas": filas})
+    context.update({"token_importacion": token, "filas": filas, "resumen_lote": _resumen_lote(filas)})
+    return render(request, "finanzas/documento_tributario_importar_lote.html", context)
+
+
+@documentos_required
+def documento_tributario_importar_lote(request):
+    context = _base_context(request)
+    organizacion = organizacion_desde_request(request)
+    url_lote = _url_with_query(request, "finanzas:documento_tributario_importar_lote")
+    if request.method == "POST" and not organizacion:
+        messages.error(request, "Selecciona una organizacion antes de importar un lote.")
+        return redirect(url_lote)
+
+    if request.method == "POST" and request.POST.get("accion") == "confirmar":
+        token = request.POST.get("token_importacion")
+        temporal = cargar_importacion_temporal(request, token) if token else None
+        payload = (temporal or {}).get("payload", {})
+        if "filas" not in payload or payload.get("organizacion_id") != organizacion.pk:
+            messages.error(request, "La importacion temporal ya no existe. Vuelve a subir el archivo.")
+            return redirect(url_lote)
+        indices = {int(valor) for valor in request.POST.getlist("filas") if valor.isdigit()}
+        try:
+            resultado = importar_lote_documentos(
+                usuario=request.user,
+                organizacion=organizacion,
+                filas=payload["filas"],
+                indices=indices,
+            )
+        except IntegrityError:
+            messages.error(
+                request,
+                "Otro usuario guardo alguno de estos documentos durante la revision. Vuelve a subir el lote.",
+            )
+            return redirect(url_lote)
+        eliminar_importacion_temporal(request, token)
+        messages.success(request, f"Se importaron {len(resultado['creados'])} documentos tributarios.")
+        if resultado["omitidos"]:
+            messages.warning(
+                request,
+                "Filas omitidas: "
+                + "; ".join(f"{item['indice']}: {item['motivo']}" for item in resultado["omitidos"]),
+            )
+        return redirect(_url_with_query(request, "finanzas:documentos_tributarios_list"))
+
+    upload_form = DocumentoTributarioLoteUploadForm(request.POST or None, request.FILES or None)
+    if request.method == "POST" and request.POST.get("accion") == "parsear" and upload_form.is_valid():
+        token, directorio = reservar_importacion_temporal(request)
+        try:
+            archivos = extraer_archivos_lote(upload_form.cleaned_data["archivo"], directorio)
+        except ValidationError as exc:
+            eliminar_importacion_temporal(request, token)
+            upload_form.add_error("archivo", exc.messages)
+        else:
+            return _render_revision_lote(request, context, organizacion, token, archivos)
+
+    context.update(
+        {
+            "filas": None,
+            "upload_form": upload_form if request.method == "POST" else DocumentoTributarioLoteUploadForm(),
+            "ayuda_seccion": {
+                "titulo": "Importar lote",
+                "texto": (
+                    "Sube un ZIP con los XML y PDF del mes. Se parsean en paralelo, se marcan los duplicados "
+                    "y se revisan en una sola tabla antes de guardarlos todos juntos."
+                ),
+            },
+        }
+    )
+    return render(request, "finanzas/documento_tributario_importar_lote.html", context)
+
+
 @documentos_required
 def documento_tributario_parse_preview(request):
     if request.method != "POST":
@@ -1476,75 +1621,27 @@ def reporte_categorias(request):
 
 @exportar_finanzas_required
 def export_pagos_csv(request):
-    organizacion = organizacion_desde_request(request)
-    pagos = pagos_export_queryset(request, organizacion=organizacion)
-
-    response = HttpResponse(content_type="text/csv")
-    response["Content-Disposition"] = 'attachment; filename="pagos_finanzas.csv"'
-    writer = csv.writer(response)
-    writer.writerow(PAGOS_CSV_HEADERS)
-    writer.writerows(filas_export_pagos(pagos))
-    return response
+    return responder_exportacion(request, exportacion_pagos_csv)
 
 
 @exportar_finanzas_required
 def export_pagos_alumnos_xlsx(request):
-    periodo = resolver_periodo(request)
-    organizacion = organizacion_desde_request(request)
-    pagos = pagos_export_queryset(request, organizacion=organizacion)
-    return xlsx_response(
-        filename=f"pagos_alumnos_{periodo_sufijo_archivo(periodo)}.xlsx",
-        sheet_title="Pagos alumnos",
-        headers=PAGOS_ALUMNOS_XLSX_HEADERS,
-        rows=filas_export_pagos_alumnos_xlsx(pagos),
-    )
+    return responder_exportacion(request, exportacion_pagos_alumnos_xlsx)
 
 
 @exportar_finanzas_required
 def export_transacciones_csv(request):
-    organizacion = organizacion_desde_request(request)
-    transacciones = transacciones_export_queryset(request, organizacion=organizacion)
-
-    response = HttpResponse(content_type="text/csv")
-    response["Content-Disposition"] = 'attachment; filename="transacciones_finanzas.csv"'
-    writer = csv.writer(response)
-    writer.writerow(TRANSACCIONES_CSV_HEADERS)
-    writer.writerows(filas_export_transacciones(transacciones))
-    return response
+    return responder_exportacion(request, exportacion_transacciones_csv)
 
 
 @exportar_finanzas_required
 def export_transacciones_xlsx(request):
-    periodo = resolver_periodo(request)
-    organizacion = organizacion_desde_request(request)
-    transacciones = transacciones_export_queryset(request, organizacion=organizacion)
-    return xlsx_response(
-        filename=f"transacciones_{periodo_sufijo_archivo(periodo)}.xlsx",
-        sheet_title="Transacciones",
-        headers=TRANSACCIONES_XLSX_HEADERS,
-        rows=filas_export_transacciones_xlsx(transacciones),
-    )
+    return responder_exportacion(request, exportacion_transacciones_xlsx)
 
 
 @exportar_finanzas_required
 def export_pagos_profesores_xlsx(request):
-    periodo = resolver_periodo(request)
-    organizacion = organizacion_desde_request(request)
-    roles, asistencias_por_profesor, sesiones_por_profesor, disciplinas_por_profesor = (
-        resumen_profesores_periodo_queryset(request, organizacion=organizacion)
-    )
-    return xlsx_response(
-        filename=f"estimacion_pagos_profesores_{periodo_sufijo_archivo(periodo)}.xlsx",
-        sheet_title="Estimacion profesores",
-        headers=PAGOS_PROFESORES_XLSX_HEADERS,
-        rows=filas_export_pagos_profesores(
-            roles,
-            asistencias_por_profesor=asistencias_por_profesor,
-            sesiones_por_profesor=sesiones_por_profesor,
-            disciplinas_por_profesor=disciplinas_por_profesor,
-            periodo_descripcion=descripcion_periodo(request=request, corta=True),
-        ),
-    )
+    return responder_exportacion(request, exportacion_pagos_profesores_xlsx)
 
 
 @exportar_finanzas_required
@@ -1556,15 +1653,6 @@ def export_libro_caja_csv(request):
             status=400,
             content_type="text/plain; charset=utf-8",
         )
-    organizacion = organizacion_desde_request(request)
-    transacciones = libro_caja_queryset(request, organizacion=organizacion)
-
-    response = HttpResponse(content_type="text/csv; charset=utf-8")
-    response["Content-Disposition"] = 'attachment; filename="libro_caja.csv"'
-    response.write("\ufeff")
-    writer = csv.writer(response)
-    writer.writerow(LIBRO_CAJA_CSV_HEADERS)
-    writer.writerows(filas_export_libro_caja(transacciones))
-    return response
+    return responder_exportacion(request, exportacion_libro_caja_csv)
 
 # Create your views here.
@@ -5,3 +5,5 @@ class PersonasConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "personas"
 
+    def ready(self):
+        from . import signals  # noqa: F401
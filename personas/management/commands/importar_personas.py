@@ -86,6 +86,8 @@ class Command(BaseCommand):
                 self.stdout.write(f"- {email}")
             return
 
+        for persona in nuevos:
+            persona.completar_campos_calculados()
         with transaction.atomic():
             Persona.objects.bulk_create(nuevos, batch_size=1000)
         self.stdout.write(f"Personas creadas: {total}")
@@ -0,0 +1,68 @@
+import unicodedata
+
+from django.db import DatabaseError, migrations, models, transaction
+
+
+CAMPOS_TEXTO_BUSQUEDA = ("nombres", "apellidos", "email", "rut", "telefono")
+INDICE_TRIGRAMAS_PERSONA = "persona_texto_busqueda_trgm"
+
+
+def texto_busqueda(*valores):
+    """Copia de `personas.search.texto_busqueda` al crear esta migración."""
+    return "\n".join(_sin_tildes(str(valor or "")).lower() for valor in valores)
+
+
+def _sin_tildes(texto):
+    normalizado = unicodedata.normalize("NFKD", texto or "")
+    return "".join(caracter for caracter in normalizado if not unicodedata.combining(caracter))
+
+
+def poblar_texto_busqueda(apps, schema_editor):
+    Persona = apps.get_model("personas", "Persona")
+    lote = []
+    for persona in Persona.objects.only("pk", *CAMPOS_TEXTO_BUSQUEDA).iterator(chunk_size=2000):
+        persona.texto_busqueda = texto_busqueda(*(getattr(persona, campo) for campo in CAMPOS_TEXTO_BUSQUEDA))
+        lote.append(persona)
+        if len(lote) >= 2000:
+            Persona.objects.bulk_update(lote, ["texto_busqueda"])
+            lote = []
+    Persona.objects.bulk_update(lote, ["texto_busqueda"])
+
+
+def crear_indice_trigramas(apps, schema_editor):
+    """Índice GIN `gin_trgm_ops` si `pg_trgm` está o se puede instalar; sin él la búsqueda funciona igual."""
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            with transaction.atomic(using=schema_editor.connection.alias):
+                cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        except DatabaseError:
+            # Extensión ausente o sin permiso para instalarla: ver docs/apps/PERSONAS.md para crear el índice después.
+            return
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS {INDICE_TRIGRAMAS_PERSONA} "
+            "ON cuentas_persona USING gin (texto_busqueda gin_trgm_ops)"
+        )
+
+
+def borrar_indice_trigramas(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"DROP INDEX IF EXISTS {INDICE_TRIGRAMAS_PERSONA}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("personas", "0009_solicitudacceso_resolucion_organizacion_rol"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="persona",
+            name="texto_busqueda",
+            field=models.TextField(blank=True, default="", editable=False),
+        ),
+        migrations.RunPython(poblar_texto_busqueda, migrations.RunPython.noop),
+        migrations.RunPython(crear_indice_trigramas, borrar_indice_trigramas),
+    ]
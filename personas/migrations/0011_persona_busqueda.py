@@ -0,0 +1,24 @@
+# Generated by Django 5.2.9 on 2026-10-17 01:20
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('personas', '0010_persona_texto_busqueda'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='persona',
+            name='busqueda',
+            field=models.GeneratedField(db_persist=True, expression=django.contrib.postgres.search.SearchVector(models.Func('texto_busqueda', models.Value('ÁÉÍÓÚÜÑáéíóúüñ'), models.Value('AEIOUUNaeiouun'), function='TRANSLATE', output_field=models.CharField()), models.Func(models.F('rut'), models.Value('[^0-9kK]'), models.Value(''), models.Value('g'), function='regexp_replace', output_field=models.CharField()), config='simple'), output_field=django.contrib.postgres.search.SearchVectorField()),
+        ),
+        migrations.AddIndex(
+            model_name='persona',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['busqueda'], name='persona_busqueda'),
+        ),
+    ]
@@ -2,9 +2,12 @@ from decimal import Decimal
 import uuid
 
 from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.exceptions import ValidationError
 from django.db import models
 
+from .search import CAMPOS_TEXTO_BUSQUEDA, rut_sin_formato, texto_busqueda, vector_busqueda
 from .utils import normalizar_telefono, tiene_identidad_minima
 from .validators import formatear_rut_chileno, validar_rut_chileno
 
@@ -60,6 +63,14 @@ class Persona(models.Model):
         blank=True,
         related_name="persona",
     )
+    # Derivado en `completar_campos_calculados`; lo usa `personas.search.filtrar_por_fragmentos`.
+    texto_busqueda = models.TextField(blank=True, default="", editable=False)
+    # Texto completo de la búsqueda transversal (`finanzas.selectors.buscar_en_finanzas`).
+    busqueda = models.GeneratedField(
+        expression=vector_busqueda("texto_busqueda", rut_sin_formato("rut")),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
     creado_en = models.DateTimeField(auto_now_add=True)
     actualizado_en = models.DateTimeField(auto_now=True)
 
@@ -68,6 +79,7 @@ class Persona(models.Model):
         verbose_name_plural = "Personas"
         ordering = ["apellidos", "nombres"]
         db_table = "cuentas_persona"
+        indexes = [GinIndex(fields=["busqueda"], name="persona_busqueda")]
 
     def __str__(self) -> str:
         return f"{self.nombres} {self.apellidos}".strip()
@@ -92,9 +104,17 @@ class Persona(models.Model):
         if rut and Persona.objects.filter(rut__iexact=rut).exclude(pk=self.pk).exists():
             raise ValidationError({"rut": "Ya existe una persona con este RUT."})
 
-    def save(self, *args, **kwargs):
+    def completar_campos_calculados(self):
+        """RUT y teléfono normalizados y `texto_busqueda`; `bulk_create` debe llamarlo antes de insertar."""
         self.rut = formatear_rut_chileno(self.rut)
         self.telefono = normalizar_telefono(self.telefono)
+        self.texto_busqueda = texto_busqueda(*(getattr(self, campo) for campo in CAMPOS_TEXTO_BUSQUEDA))
+
+    def save(self, *args, **kwargs):
+        self.completar_campos_calculados()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and set(update_fields) & set(CAMPOS_TEXTO_BUSQUEDA):
+            kwargs["update_fields"] = {*update_fields, "texto_busqueda"}
         super().save(*args, **kwargs)
 
 
@@ -1,8 +1,11 @@
 from functools import wraps
+from itertools import count
 
 from django.contrib.auth.decorators import login_required
 from django.core.exceptions import PermissionDenied
 
+from plataformaelemental.cache_selectores import cache_compartida, invalidar_ambitos, resultado_cacheado
+
 from .models import PersonaRol
 
 
@@ -59,6 +62,78 @@ def normalizar_codigo_rol(codigo):
     return ROL_ALIASES.get(codigo_normalizado.upper(), codigo_normalizado.lower())
 
 
+# Mapa de permisos: `{organizacion_id: frozenset(roles normalizados)}` con los `PersonaRol`
+# activos de una persona. Se guarda en el `User` de la petición mientras no cambie
+# `_generacion`, que sube en este proceso con cada invalidación: un cambio de roles hecho en
+# la misma petición se ve en la siguiente consulta. Entre peticiones solo se reutiliza si la
+# caché de selectores es compartida (ámbitos `permisos` y `permisos:<persona_id>`): con
+# `locmem` cada worker tendría su copia y un rol revocado en uno seguiría valiendo en otro.
+AMBITO_PERMISOS = "permisos"
+_contador_generaciones = count(1)
+_generacion = 0
+
+
+def _ambito_persona(persona_id):
+    return f"{AMBITO_PERMISOS}:{persona_id}"
+
+
+def invalidar_permisos(persona_ids=None):
+    """Descarta los mapas de permisos de `persona_ids`, o los de todas las personas con `None`."""
+    global _generacion
+    _generacion = next(_contador_generaciones)
+    if persona_ids is None:
+        invalidar_ambitos([AMBITO_PERMISOS])
+    else:
+        invalidar_ambitos([_ambito_persona(persona_id) for persona_id in sorted(set(persona_ids))])
+
+
+def _calcular_mapa_permisos(persona_id):
+    mapa = {}
+    roles = PersonaRol.objects.filter(persona_id=persona_id, activo=True).values_list("organizacion_id", "rol__codigo")
+    for organizacion_id, codigo in roles:
+        # Una organización con un rol sin código sigue siendo visible, aunque no habilite acciones.
+        roles_organizacion = mapa.setdefault(organizacion_id, set())
+        if rol := normalizar_codigo_rol(codigo):
+            roles_organizacion.add(rol)
+    return {organizacion_id: frozenset(roles) for organizacion_id, roles in mapa.items()}
+
+
+def mapa_permisos(user):
+    """`{organizacion_id: frozenset(roles normalizados)}` de los roles activos del usuario.
+
+    No considera `is_superuser` ni `is_staff`: esas excepciones las aplica quien consulta.
+    """
+    persona = getattr(user, "persona", None) if getattr(user, "is_authenticated", False) else None
+    if not persona:
+        return {}
+    generacion, persona_id, mapa = getattr(user, "_mapa_permisos", (None, None, None))
+    if generacion == _generacion and persona_id == persona.pk:
+        return mapa
+    generacion = _generacion
+    if cache_compartida():
+        mapa = resultado_cacheado(
+            "personas.mapa_permisos",
+            ambitos=[AMBITO_PERMISOS, _ambito_persona(persona.pk)],
+            calcular=lambda: _calcular_mapa_permisos(persona.pk),
+        )
+    else:
+        mapa = _calcular_mapa_permisos(persona.pk)
+    user._mapa_permisos = (generacion, persona.pk, mapa)
+    return mapa
+
+
+def roles_usuario(user, *, organizacion=None):
+    """Roles normalizados del usuario en `organizacion`, o en cualquiera si es `None`."""
+    mapa = mapa_permisos(user)
+    if organizacion is None:
+        return frozenset().union(*mapa.values())
+    try:
+        organizacion_id = int(getattr(organizacion, "pk", organizacion))
+    except (TypeError, ValueError):
+        return frozenset()
+    return mapa.get(organizacion_id, frozenset())
+
+
 def usuario_tiene_permiso(user, accion, *, organizacion=None, permitir_staff_global=True):
     if not user.is_authenticated:
         return False
@@ -67,15 +142,7 @@ def usuario_tiene_permiso(user, accion, *, organizacion=None, permitir_staff_glo
     roles_permitidos = ACCION_ROLES.get(accion, set())
     if not roles_permitidos:
         return False
-    persona = getattr(user, "persona", None)
-    if not persona:
-        return False
-
-    roles_qs = PersonaRol.objects.filter(persona=persona, activo=True)
-    if organizacion is not None:
-        roles_qs = roles_qs.filter(organizacion=organizacion)
-    roles_usuario = {normalizar_codigo_rol(codigo) for codigo in roles_qs.values_list("rol__codigo", flat=True)}
-    return bool(roles_usuario.intersection(roles_permitidos))
+    return bool(roles_usuario(user, organizacion=organizacion) & roles_permitidos)
 
 
 def permiso_requerido(accion, *, accion_lectura=None, mensaje=None, permitir_staff_global=True):
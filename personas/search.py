@@ -1,19 +1,32 @@
+import re
 import unicodedata
 
-from django.db.models import CharField, Func, Q, Value
+from django.contrib.postgres.search import SearchQuery, SearchVector
+from django.db.models import CharField, F, Func, Q, Value
 
 
 CARACTERES_CON_TILDE = "ÁÉÍÓÚÜÑáéíóúüñ"
 CARACTERES_SIN_TILDE = "AEIOUUNaeiouun"
 
 
+# Campos de `Persona` plegados en `Persona.texto_busqueda`.
+CAMPOS_TEXTO_BUSQUEDA = ("nombres", "apellidos", "email", "rut", "telefono")
+INDICE_TRIGRAMAS_PERSONA = "persona_texto_busqueda_trgm"
+
+
+def _sin_tildes(texto):
+    normalizado = unicodedata.normalize("NFKD", texto or "")
+    return "".join(caracter for caracter in normalizado if not unicodedata.combining(caracter))
+
+
 def fragmentos_busqueda(termino):
     """Divide una consulta y normaliza tildes para comparar cada fragmento."""
-    normalizado = unicodedata.normalize("NFKD", termino or "")
-    sin_tildes = "".join(
-        caracter for caracter in normalizado if not unicodedata.combining(caracter)
-    )
-    return [fragmento.lower() for fragmento in sin_tildes.split() if fragmento]
+    return [fragmento.lower() for fragmento in _sin_tildes(termino).split() if fragmento]
+
+
+def texto_busqueda(*valores):
+    """Valores sin tildes y en minúsculas, uno por línea: un fragmento nunca cruza de un campo a otro."""
+    return "\n".join(_sin_tildes(str(valor or "")).lower() for valor in valores)
 
 
 def _texto_sin_tildes(campo):
@@ -26,16 +39,65 @@ def _texto_sin_tildes(campo):
     )
 
 
+def rut_sin_formato(campo):
+    """El RUT sin puntos ni guion, como un solo lexema ("12.345.678-9" daría `12.345.678` y `-9`)."""
+    return Func(F(campo), Value("[^0-9kK]"), Value(""), Value("g"), function="regexp_replace", output_field=CharField())
+
+
+def vector_busqueda(*campos):
+    """`tsvector` con configuración `simple` de los campos sin tildes.
+
+    Se usa como expresión de las columnas generadas `busqueda` (con su índice GIN) de
+    `Persona`, `DocumentoTributario` y `Transaction`, que se consultan con `consulta_busqueda`.
+    """
+    return SearchVector(
+        *(campo if hasattr(campo, "resolve_expression") else _texto_sin_tildes(campo) for campo in campos),
+        config="simple",
+    )
+
+
+def consulta_busqueda(termino):
+    """`tsquery` con AND entre fragmentos y coincidencia por prefijo (`fragmento:*`); `None` si no hay palabras."""
+    palabras = [palabra for fragmento in fragmentos_busqueda(termino) for palabra in re.findall(r"[^\W_]+", fragmento)]
+    if not palabras:
+        return None
+    return SearchQuery(" & ".join(f"{palabra}:*" for palabra in palabras), search_type="raw", config="simple")
+
+
+def _ruta_texto_busqueda(modelo, campos):
+    """Ruta ORM a `Persona.texto_busqueda` si todos los `campos` son de la misma persona y están plegados ahí."""
+    rutas = set()
+    for campo in campos:
+        *relaciones, nombre = campo.split("__")
+        actual = modelo
+        for relacion in relaciones:
+            actual = actual._meta.get_field(relacion).related_model
+        if actual._meta.label != "personas.Persona" or nombre not in CAMPOS_TEXTO_BUSQUEDA:
+            return None
+        rutas.add("__".join([*relaciones, "texto_busqueda"]))
+    return rutas.pop() if len(rutas) == 1 else None
+
+
 def filtrar_por_fragmentos(queryset, termino, *, campos, prefijo="persona_busqueda"):
     """Filtra con AND entre palabras y OR entre campos, ignorando tildes y mayúsculas.
 
     Los campos deben ser rutas ORM constantes y autorizadas por quien llama. El
     helper no altera el alcance inicial del queryset (organización, rol o clase).
+
+    Si todos los campos son de `Persona` (directos o a través de una FK), cada
+    fragmento se busca primero en `Persona.texto_busqueda`, que el índice de
+    trigramas `INDICE_TRIGRAMAS_PERSONA` resuelve sin recorrer la tabla; la
+    comparación campo a campo queda solo como verificación de esos candidatos.
     """
     fragmentos = fragmentos_busqueda(termino)
     if not fragmentos:
         return queryset
 
+    ruta_indexada = _ruta_texto_busqueda(queryset.model, campos)
+    if ruta_indexada:
+        for fragmento in fragmentos:
+            queryset = queryset.filter(**{f"{ruta_indexada}__contains": fragmento})
+
     aliases = []
     anotaciones = {}
     for indice, campo in enumerate(campos):
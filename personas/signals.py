@@ -0,0 +1,49 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from plataformaelemental.cache_selectores import invalidar_selectores_de
+
+from .models import Organizacion, Persona, PersonaRol, Rol
+from .permissions import invalidar_permisos
+
+
+RUTA_ORGANIZACION_CACHE = {
+    Organizacion: "pk",
+    Persona: None,
+    PersonaRol: "organizacion_id",
+    Rol: None,
+}
+
+
+@receiver([post_save, post_delete], sender=Organizacion)
+@receiver([post_save, post_delete], sender=Persona)
+@receiver([post_save, post_delete], sender=PersonaRol)
+@receiver([post_save, post_delete], sender=Rol)
+def invalidar_cache_selectores(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    invalidar_selectores_de(instance, RUTA_ORGANIZACION_CACHE[sender], eliminada="created" not in kwargs)
+
+
+@receiver(pre_save, sender=PersonaRol)
+def recordar_persona_anterior(sender, instance, raw=False, **kwargs):
+    if raw or instance._state.adding:
+        return
+    # Si el rol pasa a otra persona, la anterior también pierde sus permisos cacheados.
+    instance._persona_id_anterior = (
+        PersonaRol.objects.filter(pk=instance.pk).values_list("persona_id", flat=True).first()
+    )
+
+
+@receiver([post_save, post_delete], sender=PersonaRol)
+def invalidar_permisos_persona_rol(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    invalidar_permisos({instance.persona_id, getattr(instance, "_persona_id_anterior", None)} - {None})
+
+
+@receiver([post_save, post_delete], sender=Rol)
+def invalidar_permisos_rol(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    invalidar_permisos()
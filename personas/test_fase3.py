@@ -228,7 +228,7 @@ class MatrizAislamientoOrganizacionalTests(TestCase):
         self.assertEqual(self.client.get(url, {**self._query_a(), "organizacion": "Todas"}).status_code, 403)
         respuesta = self.client.get(url, self._query_a())
         self.assertEqual(respuesta.status_code, 200)
-        self.assertNotIn("Privada exportación B", respuesta.content.decode("latin1"))
+        self.assertNotIn("Privada exportación B", respuesta.getvalue().decode("latin1"))
 
     @override_settings(ACCESS_REQUESTS_ENABLED=True, ACCESS_REQUEST_APPROVAL_ENABLED=True)
     def test_admin_organizacional_no_adquiere_permiso_global_de_solicitudes(self):
@@ -1,11 +1,14 @@
 from io import StringIO
 from datetime import timedelta
+from tempfile import TemporaryDirectory
 from time import time
 from types import SimpleNamespace
 from unittest.mock import patch
 
 from django.contrib.auth import get_user_model
+from django.conf import settings
 from django.contrib.auth.models import Permission
+from django.core.cache import caches
 from django.core.exceptions import ValidationError
 from django.core.management import call_command
 from django.db import connection
@@ -24,14 +27,23 @@ from auditoria.models import AuditLog
 from asistencias.forms import PersonaRapidaForm
 from asistencias.models import Asistencia, Disciplina, SesionClase
 from finanzas.models import AttendanceConsumption, Payment
+from plataformaelemental.cache_selectores import ALIAS_CACHE
 
 from .admin import PersonaRolBulkForm
 from .auth_google import AdaptadorSocialGoogleElemental
 from .auth_views import GoogleOAuth2AdapterElemental
 from .forms import PersonaCRMForm
 from .models import Organizacion, Persona, PersonaRol, Rol, SolicitudAcceso
+from .permissions import (
+    ACCION_ADMINISTRAR_PERSONAS,
+    ACCION_VER_FINANZAS,
+    ACCION_VER_SESION,
+    mapa_permisos,
+    usuario_tiene_permiso,
+)
 from .solicitudes_acceso import SESION_IDENTIDAD_PENDIENTE
 from .resolucion_solicitudes import aprobar_solicitud, rechazar_solicitud
+from .search import filtrar_por_fragmentos
 
 
 TEST_PASSWORD = "not-a-real-test-password"
@@ -76,6 +88,129 @@ class PersonaRolBulkFormTests(TestCase):
         self.assertTrue(form.is_valid(), form.errors)
 
 
+@override_settings(SELECTORES_CACHE_SEGUNDOS=300)
+class MapaPermisosTests(TestCase):
+    def setUp(self):
+        # Caché de archivos compartida, como con `SELECTORES_CACHE_BACKEND=file` y varios workers.
+        directorio = self.enterContext(TemporaryDirectory())
+        self.enterContext(
+            override_settings(
+                CACHES={
+                    **settings.CACHES,
+                    ALIAS_CACHE: {
+                        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                        "LOCATION": directorio,
+                    },
+                }
+            )
+        )
+        self.organizacion = Organizacion.objects.create(
+            nombre="Org Permisos", razon_social="Org Permisos SPA", rut="55.555.555-5"
+        )
+        self.otra_organizacion = Organizacion.objects.create(
+            nombre="Otra Permisos", razon_social="Otra Permisos SPA", rut="66.666.666-6"
+        )
+        self.rol_admin = Rol.objects.create(nombre="Administrador", codigo="ADMINISTRADOR")
+        self.rol_profesor = Rol.objects.create(nombre="Profesor", codigo="PROFESOR")
+        self.user = get_user_model().objects.create_user("permisos", password=TEST_PASSWORD)
+        self.persona = Persona.objects.create(nombres="Paula", apellidos="Permisos", user=self.user)
+        self.rol_persona = PersonaRol.objects.create(
+            persona=self.persona, rol=self.rol_admin, organizacion=self.organizacion, activo=True
+        )
+        PersonaRol.objects.create(
+            persona=self.persona, rol=self.rol_profesor, organizacion=self.otra_organizacion, activo=True
+        )
+
+    def _usuario(self):
+        """Un `User` recién leído, como el de una petición nueva."""
+        return get_user_model().objects.select_related("persona").get(pk=self.user.pk)
+
+    def _consultas_roles(self, funcion):
+        with CaptureQueriesContext(connection) as consultas:
+            resultado = funcion()
+        return resultado, len([query for query in consultas.captured_queries if "cuentas_personarol" in query["sql"]])
+
+    def test_mapa_se_calcula_una_vez_por_peticion_y_se_reutiliza_entre_peticiones(self):
+        user = self._usuario()
+        permisos, consultas = self._consultas_roles(
+            lambda: [
+                usuario_tiene_permiso(user, ACCION_ADMINISTRAR_PERSONAS, organizacion=self.organizacion),
+                usuario_tiene_permiso(user, ACCION_ADMINISTRAR_PERSONAS, organizacion=self.otra_organizacion),
+                usuario_tiene_permiso(user, ACCION_VER_SESION, organizacion=self.otra_organizacion.pk),
+                usuario_tiene_permiso(user, ACCION_VER_FINANZAS),
+            ]
+        )
+        self.assertEqual(permisos, [True, False, True, True])
+        self.assertEqual(consultas, 1)
+        self.assertEqual(
+            mapa_permisos(user),
+            {self.organizacion.pk: frozenset({"admin"}), self.otra_organizacion.pk: frozenset({"profesor"})},
+        )
+
+        permiso, consultas = self._consultas_roles(
+            lambda: usuario_tiene_permiso(self._usuario(), ACCION_ADMINISTRAR_PERSONAS, organizacion=self.organizacion)
+        )
+        self.assertTrue(permiso)
+        self.assertEqual(consultas, 0)
+
+    def test_cambios_de_roles_revocan_al_instante_aunque_el_mapa_este_memorizado(self):
+        user = self._usuario()
+        self.assertTrue(usuario_tiene_permiso(user, ACCION_ADMINISTRAR_PERSONAS, organizacion=self.organizacion))
+
+        self.rol_persona.activo = False
+        self.rol_persona.save(update_fields=["activo"])
+        self.assertFalse(usuario_tiene_permiso(user, ACCION_ADMINISTRAR_PERSONAS, organizacion=self.organizacion))
+        self.assertFalse(usuario_tiene_permiso(self._usuario(), ACCION_ADMINISTRAR_PERSONAS))
+
+        self.rol_persona.activo = True
+        self.rol_persona.save(update_fields=["activo"])
+        self.assertTrue(usuario_tiene_permiso(user, ACCION_ADMINISTRAR_PERSONAS, organizacion=self.organizacion))
+        self.rol_admin.codigo = "ESTUDIANTE"
+        self.rol_admin.save(update_fields=["codigo"])
+        self.assertFalse(usuario_tiene_permiso(self._usuario(), ACCION_ADMINISTRAR_PERSONAS))
+
+        self.rol_admin.codigo = "ADMINISTRADOR"
+        self.rol_admin.save(update_fields=["codigo"])
+        self.assertTrue(usuario_tiene_permiso(user, ACCION_ADMINISTRAR_PERSONAS))
+        otra_persona = Persona.objects.create(nombres="Otra", apellidos="Persona")
+        self.rol_persona.persona = otra_persona
+        self.rol_persona.save(update_fields=["persona"])
+        self.assertFalse(usuario_tiene_permiso(self._usuario(), ACCION_ADMINISTRAR_PERSONAS))
+
+        PersonaRol.objects.filter(persona=self.persona).delete()
+        self.assertEqual(mapa_permisos(user), {})
+        self.assertFalse(usuario_tiene_permiso(user, ACCION_VER_SESION))
+
+    def test_rol_revocado_no_sigue_valiendo_en_otro_worker(self):
+        self.assertTrue(usuario_tiene_permiso(self._usuario(), ACCION_ADMINISTRAR_PERSONAS))
+        otro_worker = caches.create_connection(ALIAS_CACHE)
+        with patch("plataformaelemental.cache_selectores._cache", return_value=otro_worker):
+            permiso, consultas = self._consultas_roles(
+                lambda: usuario_tiene_permiso(self._usuario(), ACCION_ADMINISTRAR_PERSONAS)
+            )
+            self.assertTrue(permiso)
+            self.assertEqual(consultas, 0)
+
+        self.rol_persona.activo = False
+        self.rol_persona.save(update_fields=["activo"])
+
+        with patch("plataformaelemental.cache_selectores._cache", return_value=otro_worker):
+            self.assertFalse(usuario_tiene_permiso(self._usuario(), ACCION_ADMINISTRAR_PERSONAS))
+
+    def test_cache_por_proceso_no_reutiliza_el_mapa_entre_peticiones(self):
+        with override_settings(
+            CACHES={
+                **settings.CACHES,
+                ALIAS_CACHE: {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "permisos"},
+            }
+        ):
+            self.assertTrue(usuario_tiene_permiso(self._usuario(), ACCION_ADMINISTRAR_PERSONAS))
+            # Revocación hecha por otro worker: las señales de este proceso no se enteran.
+            PersonaRol.objects.filter(pk=self.rol_persona.pk).update(activo=False)
+
+            self.assertFalse(usuario_tiene_permiso(self._usuario(), ACCION_ADMINISTRAR_PERSONAS))
+
+
 class AuditarIdentidadesAccesoCommandTests(TestCase):
     def setUp(self):
         User = get_user_model()
@@ -740,6 +875,28 @@ class PersonasOrganizacionesTests(TestCase):
         self.assertContains(response, "Ingresos periodo")
         self.assertEqual(len(response.context["organizaciones"]), 1)
 
+    def test_metricas_organizacion_respetan_trimestre_y_rango(self):
+        Payment.objects.create(
+            persona=self.estudiante,
+            organizacion=self.org,
+            fecha_pago="2026-05-06",
+            metodo_pago=Payment.Metodo.EFECTIVO,
+            aplica_iva=False,
+            monto_referencia=8000,
+            clases_asignadas=1,
+        )
+        url = reverse("personas:organizacion_detail", kwargs={"pk": self.org.pk})
+
+        trimestre = self.client.get(url, {"periodo_anio": 2026, "periodo_trimestre": 1})
+        rango = self.client.get(url, {"periodo_desde": "2026-03-01", "periodo_hasta": "2026-03-10"})
+        anio = self.client.get(url, {"periodo_anio": 2026, "periodo_mes": "todos"})
+
+        self.assertEqual(trimestre.context["metricas"]["pagos_periodo"], 1)
+        self.assertEqual(trimestre.context["metricas"]["sesiones_periodo"], 2)
+        self.assertEqual(rango.context["metricas"]["pagos_periodo"], 1)
+        self.assertEqual(rango.context["metricas"]["sesiones_periodo"], 1)
+        self.assertEqual(anio.context["metricas"]["pagos_periodo"], 2)
+
     def test_logo_organizacion_es_opcional(self):
         field = Organizacion._meta.get_field("logo")
 
@@ -1232,6 +1389,28 @@ class PersonasRutFormTests(TestCase):
         self.assertEqual(form.cleaned_data["telefono"], "+56912345678")
 
 
+    def test_texto_busqueda_se_mantiene_al_guardar_y_sirve_el_filtro_por_fragmentos(self):
+        persona = Persona.objects.create(nombres="Álvaro José", apellidos="Peña", email="AJP@example.com")
+        Persona.objects.create(nombres="Jose", apellidos="Soto", email="jose@example.com")
+        self.assertEqual(persona.texto_busqueda, "alvaro jose\npena\najp@example.com\n\n")
+
+        persona.apellidos = "Núñez"
+        persona.save(update_fields=["apellidos"])
+        persona.refresh_from_db()
+        self.assertIn("\nnunez\n", persona.texto_busqueda)
+
+        with CaptureQueriesContext(connection) as consultas:
+            encontrados = list(
+                filtrar_por_fragmentos(Persona.objects.all(), "JOSÉ núñ", campos=("nombres", "apellidos"))
+            )
+        self.assertEqual(encontrados, [persona])
+        self.assertIn('"texto_busqueda"', consultas.captured_queries[0]["sql"])
+        # El correo está en `texto_busqueda`, pero quien llama no lo pidió: no amplía el resultado.
+        self.assertEqual(
+            list(filtrar_por_fragmentos(Persona.objects.all(), "ajp", campos=("nombres", "apellidos"))), []
+        )
+
+
 class AuditarDatosV1CommandTests(TestCase):
     def test_auditoria_corre_sin_modificar_datos(self):
         persona = Persona.objects.create(nombres="Sin", apellidos="Identidad")
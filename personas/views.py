@@ -23,11 +23,12 @@ from finanzas.models import AttendanceConsumption, Payment
 from finanzas.services import asociar_asistencia_a_pago, resumen_financiero_estudiante
 from plataformaelemental.context import (
     aplicar_periodo,
+    argumentos_periodo,
+    contexto_peticion,
     descripcion_periodo,
     filtros_periodo,
     nav_context,
     organizacion_desde_request,
-    organizaciones_visibles_para_usuario,
     resolver_periodo,
 )
 
@@ -349,25 +350,22 @@ def _personas_queryset(organizacion=None):
     return queryset
 
 
-def _organizacion_metricas(organizacion, *, mes=None, anio=None):
+def _organizacion_metricas(organizacion, periodo):
     roles_qs = PersonaRol.objects.filter(organizacion=organizacion, activo=True)
     sesiones_qs = aplicar_periodo(
         SesionClase.objects.filter(disciplina__organizacion=organizacion),
         "fecha",
-        mes=mes,
-        anio=anio,
+        **argumentos_periodo(periodo),
     )
     pagos_qs = aplicar_periodo(
         Payment.objects.filter(organizacion=organizacion, revertido_en__isnull=True),
         "fecha_pago",
-        mes=mes,
-        anio=anio,
+        **argumentos_periodo(periodo),
     )
     asistencias_qs = aplicar_periodo(
         Asistencia.objects.filter(sesion__disciplina__organizacion=organizacion),
         "sesion__fecha",
-        mes=mes,
-        anio=anio,
+        **argumentos_periodo(periodo),
     )
     return {
         "personas_activas": roles_qs.values("persona_id").distinct().count(),
@@ -383,23 +381,23 @@ def _organizacion_metricas(organizacion, *, mes=None, anio=None):
     }
 
 
-def _annotate_personas_resumen(queryset, *, mes=None, anio=None, organizacion=None):
+def _annotate_personas_resumen(queryset, periodo, *, organizacion=None):
     asistencias_qs = Asistencia.objects.filter(
         persona=OuterRef("pk"),
-        **filtros_periodo("sesion__fecha", mes=mes, anio=anio),
+        **filtros_periodo("sesion__fecha", **argumentos_periodo(periodo)),
     )
     pagos_qs = Payment.objects.filter(
         persona=OuterRef("pk"),
         revertido_en__isnull=True,
-        **filtros_periodo("fecha_pago", mes=mes, anio=anio),
+        **filtros_periodo("fecha_pago", **argumentos_periodo(periodo)),
     )
     consumos_qs = AttendanceConsumption.objects.filter(
         persona=OuterRef("pk"),
-        **filtros_periodo("clase_fecha", mes=mes, anio=anio),
+        **filtros_periodo("clase_fecha", **argumentos_periodo(periodo)),
     )
     sesiones_profesor_qs = SesionClase.objects.filter(
         profesores=OuterRef("pk"),
-        **filtros_periodo("fecha", mes=mes, anio=anio),
+        **filtros_periodo("fecha", **argumentos_periodo(periodo)),
     )
     if organizacion:
         asistencias_qs = asistencias_qs.filter(sesion__disciplina__organizacion=organizacion)
@@ -446,8 +444,7 @@ def dashboard(request):
 
     personas_qs = _annotate_personas_resumen(
         _personas_queryset(organizacion),
-        mes=periodo["mes"],
-        anio=periodo["anio"],
+        periodo,
         organizacion=organizacion,
     )
     pagos_qs = aplicar_periodo(
@@ -500,7 +497,7 @@ def organizaciones_list(request):
         organizaciones.append(
             {
                 "organizacion": organizacion,
-                "metricas": _organizacion_metricas(organizacion, mes=periodo["mes"], anio=periodo["anio"]),
+                "metricas": _organizacion_metricas(organizacion, periodo),
             }
         )
 
@@ -517,10 +514,10 @@ def organizaciones_list(request):
 def organizacion_detail(request, pk):
     context = _base_context(request)
     periodo = resolver_periodo(request)
-    organizaciones_autorizadas = organizaciones_visibles_para_usuario(request.user)
+    organizaciones_autorizadas = contexto_peticion(request).organizaciones_visibles()
     organizacion = get_object_or_404(organizaciones_autorizadas, pk=pk)
     disciplinas = Disciplina.objects.filter(organizacion=organizacion).order_by("nombre")
-    metricas = _organizacion_metricas(organizacion, mes=periodo["mes"], anio=periodo["anio"])
+    metricas = _organizacion_metricas(organizacion, periodo)
     context.update(
         {
             "organizacion_obj": organizacion,
@@ -551,7 +548,7 @@ def organizacion_create(request):
 @role_required(ROLE_ADMIN)
 def organizacion_edit(request, pk):
     context = _base_context(request)
-    organizacion = get_object_or_404(organizaciones_visibles_para_usuario(request.user), pk=pk)
+    organizacion = get_object_or_404(contexto_peticion(request).organizaciones_visibles(), pk=pk)
     form = OrganizacionCRMForm(request.POST or None, instance=organizacion)
     if request.method == "POST" and form.is_valid():
         organizacion = form.save()
@@ -594,16 +591,14 @@ def personas_list(request):
     if con_deuda == "si":
         personas_qs = _annotate_personas_resumen(
             personas_qs,
-            mes=periodo["mes"],
-            anio=periodo["anio"],
+            periodo,
             organizacion=organizacion,
         )
         personas_qs = personas_qs.filter(deuda_periodo__gt=0)
     elif con_deuda == "no":
         personas_qs = _annotate_personas_resumen(
             personas_qs,
-            mes=periodo["mes"],
-            anio=periodo["anio"],
+            periodo,
             organizacion=organizacion,
         )
         personas_qs = personas_qs.filter(deuda_periodo=0)
@@ -617,8 +612,7 @@ def personas_list(request):
         personas_pagina = list(
             _annotate_personas_resumen(
                 _personas_queryset(organizacion).filter(pk__in=page_ids),
-                mes=periodo["mes"],
-                anio=periodo["anio"],
+                periodo,
                 organizacion=organizacion,
             ).order_by("apellidos", "nombres", "pk")
         )
@@ -647,7 +641,7 @@ def personas_list(request):
 @role_required(ROLE_ADMIN)
 def persona_create(request):
     context = _base_context(request)
-    organizaciones_autorizadas = organizaciones_visibles_para_usuario(request.user)
+    organizaciones_autorizadas = contexto_peticion(request).organizaciones_visibles()
     form = PersonaCRMForm(request.POST or None)
     rol_form = PersonaRolCRMForm(request.POST or None, prefix="rol", organizaciones=organizaciones_autorizadas)
     if request.method == "POST":
@@ -690,7 +684,7 @@ def persona_detail(request, pk):
     context = _base_context(request)
     periodo = resolver_periodo(request)
     organizacion = organizacion_desde_request(request)
-    organizaciones_autorizadas = organizaciones_visibles_para_usuario(request.user)
+    organizaciones_autorizadas = contexto_peticion(request).organizaciones_visibles()
     roles_visibles = PersonaRol.objects.select_related("rol", "organizacion").order_by("organizacion__nombre", "rol__nombre")
     if organizacion:
         roles_visibles = roles_visibles.filter(organizacion=organizacion)
@@ -859,13 +853,7 @@ def persona_detail(request, pk):
     finanzas_resumen = resumen_financiero_estudiante(persona, organizacion) if es_estudiante else None
     if es_estudiante:
         pagos_asociables_periodo = list(
-            pagos_vigentes.annotate(
-                clases_consumidas_total=Count(
-                    "consumos",
-                    filter=Q(consumos__estado=AttendanceConsumption.Estado.CONSUMIDO),
-                    distinct=True,
-                )
-            )
+            pagos_vigentes.annotate(clases_consumidas_total=F("clases_consumidas"))
             .annotate(
                 saldo_clases_total=ExpressionWrapper(
                     F("clases_asignadas") - F("clases_consumidas_total"),
@@ -962,7 +950,7 @@ def persona_detail(request, pk):
 @role_required(ROLE_ADMIN)
 def persona_edit(request, pk):
     context = _base_context(request)
-    organizaciones_autorizadas = organizaciones_visibles_para_usuario(request.user)
+    organizaciones_autorizadas = contexto_peticion(request).organizaciones_visibles()
     organizacion = organizacion_desde_request(request)
     roles_visibles = PersonaRol.objects.select_related("rol", "organizacion").order_by("organizacion__nombre", "rol__nombre")
     if organizacion:
@@ -0,0 +1,219 @@
+"""Caché versionada de resultados de selectores pesados.
+
+Cada resultado se guarda bajo `(selector, organización, parámetros, versión)`. La
+versión combina un contador global con el contador de la organización; las señales
+de escritura de cada app incrementan esos contadores, así que un resultado guardado
+nunca se vuelve a leer después de un cambio en su organización: queda huérfano y
+expira solo. Un selector sin organización usa el contador `todas`, que sube con
+cualquier organización. Un resultado que no depende de una organización (p. ej. los
+permisos de una persona) puede declarar sus propios ámbitos con `ambitos=` y subirlos
+con `invalidar_ambitos`.
+
+El backend se elige con `SELECTORES_CACHE_BACKEND` (`locmem` por proceso o `file`
+compartido entre workers) y `SELECTORES_CACHE_SEGUNDOS=0` desactiva la caché. Las señales
+solo suben las versiones de la caché que ven: con varios workers la caché tiene que ser
+compartida, por eso con `locmem` viene desactivada salvo que se fije `SELECTORES_CACHE_SEGUNDOS`.
+"""
+
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+
+ALIAS_CACHE = "selectores"
+VERSION_GLOBAL = "global"
+VERSION_TODAS = "todas"
+SELECTORES_CACHEADOS = set()
+
+_AUSENTE = object()
+
+
+def cache_activa():
+    return getattr(settings, "SELECTORES_CACHE_SEGUNDOS", 0) > 0
+
+
+def cache_compartida():
+    """La caché está activa y la ven todos los workers: su backend no es `locmem` por proceso."""
+    return cache_activa() and not isinstance(_cache(), LocMemCache)
+
+
+def _cache():
+    return caches[ALIAS_CACHE]
+
+
+def _clave_version(ambito):
+    return f"selectores:version:{ambito}"
+
+
+def _clave_estadistica(nombre, tipo):
+    return f"selectores:estadistica:{nombre}:{tipo}"
+
+
+def _incrementar(cache, clave, *, inicial=1):
+    try:
+        cache.incr(clave)
+    except ValueError:
+        cache.set(clave, inicial, timeout=None)
+
+
+def _versiones(cache, ambitos):
+    claves = [_clave_version(ambito) for ambito in ambitos]
+    versiones = cache.get_many(claves)
+    for clave in claves:
+        if clave not in versiones:
+            cache.add(clave, time.time_ns(), timeout=None)
+            versiones[clave] = cache.get(clave)
+    return ".".join(str(versiones[clave]) for clave in claves)
+
+
+def _subir_versiones(ambitos):
+    cache = _cache()
+    for ambito in ambitos:
+        # Un contador ausente parte de un valor que no repite versiones anteriores a un reinicio.
+        _incrementar(cache, _clave_version(ambito), inicial=time.time_ns())
+
+
+def invalidar_selectores(organizacion_ids):
+    """Sube la versión de datos de las organizaciones indicadas.
+
+    `None` entre los ids sube la versión global e invalida todo. La versión sube al
+    instante, para que la misma transacción ya no lea resultados viejos, y otra vez al
+    confirmar, para descartar lo que otro proceso haya guardado con datos anteriores
+    al commit.
+    """
+    organizacion_ids = set(organizacion_ids)
+    if not organizacion_ids:
+        return
+    invalidar_ambitos([VERSION_GLOBAL] if None in organizacion_ids else [*sorted(organizacion_ids), VERSION_TODAS])
+
+
+def invalidar_ambitos(ambitos):
+    """Sube la versión de `ambitos`, al instante y otra vez al confirmar (ver `invalidar_selectores`)."""
+    if not cache_activa():
+        return
+    ambitos = list(ambitos)
+    _subir_versiones(ambitos)
+    transaction.on_commit(lambda: _subir_versiones(ambitos))
+
+
+def _organizacion_en_memoria(instancia, ruta):
+    *relaciones, campo = ruta.split("__")
+    objeto = instancia
+    for relacion in relaciones:
+        field = objeto._meta.get_field(relacion)
+        if not field.is_cached(objeto):
+            return _AUSENTE
+        objeto = field.get_cached_value(objeto)
+        if objeto is None:
+            return None
+    return getattr(objeto, campo)
+
+
+def invalidar_selectores_de(instancia, ruta_organizacion, *, eliminada=False):
+    """Invalida la organización de `instancia`, ubicada por `ruta_organizacion` (lookup ORM).
+
+    Usa las relaciones ya cargadas y solo consulta la base si falta alguna. Con
+    `ruta_organizacion=None`, o si la organización no se puede determinar, invalida todo.
+    """
+    if not cache_activa():
+        return
+    organizacion_id = None
+    if ruta_organizacion is not None:
+        organizacion_id = _organizacion_en_memoria(instancia, ruta_organizacion)
+        if organizacion_id is _AUSENTE:
+            organizacion_id = None
+            if not eliminada:
+                organizacion_id = (
+                    type(instancia)
+                    ._default_manager.filter(pk=instancia.pk)
+                    .values_list(ruta_organizacion, flat=True)
+                    .first()
+                )
+    invalidar_selectores([organizacion_id])
+
+
+def _firma(parametros):
+    return hashlib.sha256(repr(sorted((parametros or {}).items())).encode()).hexdigest()[:20]
+
+
+def resultado_cacheado(nombre, *, calcular, organizacion=None, parametros=None, ambitos=None):
+    """Devuelve el resultado guardado de `nombre` o lo calcula con `calcular()` y lo guarda.
+
+    `ambitos`, si se indica, reemplaza a la organización: el resultado vale mientras no suban
+    la versión global ni la de ninguno de esos ámbitos.
+    """
+    if not cache_activa():
+        return calcular()
+    if ambitos is None:
+        organizacion_id = getattr(organizacion, "pk", organizacion)
+        ambitos = [organizacion_id if organizacion_id is not None else VERSION_TODAS]
+    cache = _cache()
+    version = _versiones(cache, [VERSION_GLOBAL, *ambitos])
+    clave = f"selectores:{nombre}:{'.'.join(map(str, ambitos))}:{version}:{_firma(parametros)}"
+    resultado = cache.get(clave, _AUSENTE)
+    if resultado is not _AUSENTE:
+        _incrementar(cache, _clave_estadistica(nombre, "aciertos"))
+        return resultado
+    _incrementar(cache, _clave_estadistica(nombre, "fallos"))
+    resultado = calcular()
+    cache.set(clave, resultado, timeout=settings.SELECTORES_CACHE_SEGUNDOS)
+    return resultado
+
+
+def selector_cacheado(nombre, clave):
+    """Decora un selector para cachear su resultado.
+
+    `clave(*args, **kwargs)` recibe los mismos argumentos que el selector y devuelve
+    `(organizacion, parametros)`. El selector original queda en `.sin_cache`.
+    """
+
+    def decorador(funcion):
+        SELECTORES_CACHEADOS.add(nombre)
+
+        @wraps(funcion)
+        def envoltura(*args, **kwargs):
+            organizacion, parametros = clave(*args, **kwargs)
+            return resultado_cacheado(
+                nombre,
+                organizacion=organizacion,
+                parametros=parametros,
+                calcular=lambda: funcion(*args, **kwargs),
+            )
+
+        envoltura.sin_cache = funcion
+        return envoltura
+
+    return decorador
+
+
+def estadisticas_cache():
+    """Aciertos y fallos acumulados por selector en el backend configurado."""
+    cache = _cache()
+    nombres = sorted(SELECTORES_CACHEADOS)
+    valores = cache.get_many(
+        [_clave_estadistica(nombre, tipo) for nombre in nombres for tipo in ("aciertos", "fallos")]
+    )
+    return {
+        nombre: {
+            tipo: valores.get(_clave_estadistica(nombre, tipo), 0)
+            for tipo in ("aciertos", "fallos")
+        }
+        for nombre in nombres
+    }
+
+
+__all__ = [
+    "cache_activa",
+    "cache_compartida",
+    "estadisticas_cache",
+    "invalidar_ambitos",
+    "invalidar_selectores",
+    "invalidar_selectores_de",
+    "resultado_cacheado",
+    "selector_cacheado",
+]
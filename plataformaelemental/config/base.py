@@ -6,7 +6,7 @@ from __future__ import annotations
 
 import os
 from pathlib import Path
-from typing import List
+from typing import Dict, List
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -23,6 +23,21 @@ def env_list(var_name: str, default: str = "") -> List[str]:
     return [item.strip() for item in raw_value.split(",") if item.strip()]
 
 
+def env_list_mapping(var_name: str, default: str = "") -> Dict[str, List[str]]:
+    """
+    Turn "key:a,b;other:c" into {"key": ["a", "b"], "other": ["c"]}.
+    Entries without a key are discarded.
+    """
+
+    raw_value = os.environ.get(var_name, default)
+    mapping = {}
+    for entry in raw_value.split(";"):
+        key, _, values = entry.partition(":")
+        if key.strip():
+            mapping[key.strip()] = [item.strip() for item in values.split(",") if item.strip()]
+    return mapping
+
+
 def env_bool(var_name: str, default: bool = False) -> bool:
     """
     Read a boolean environment variable using explicit common truthy values.
@@ -59,6 +74,7 @@ INSTALLED_APPS = [
     "asistencias.apps.AsistenciasConfig",
     "personas.apps.PersonasConfig",
     "finanzas.apps.FinanzasConfig",
+    "exportaciones.apps.ExportacionesConfig",
     "monitor.apps.MonitorConfig",
 ]
 
@@ -68,6 +84,7 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "plataformaelemental.context.ContextoPeticionMiddleware",
     "allauth.account.middleware.AccountMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
@@ -136,6 +153,77 @@ X_FRAME_OPTIONS = "DENY"
 
 SITE_ID = 1
 
+# Disable per-transaction batching of attendance/payment signal work (see plataformaelemental.procesamiento).
+PROCESAMIENTO_SENALES_INMEDIATO = env_bool("PROCESAMIENTO_SENALES_INMEDIATO", False)
+
+# Audit rows are buffered per transaction and written with one bulk insert on commit (see auditoria.services).
+# Past this many pending rows the buffer is written inside the transaction, in batches of the same size.
+AUDITORIA_BUFFER_MAXIMO = int(os.environ.get("AUDITORIA_BUFFER_MAXIMO", "1000"))
+# Months of audit partitions kept live by `archivar_auditoria`; older ones move to the archive.
+# See auditoria.particiones.
+AUDITORIA_RETENCION_MESES = int(os.environ.get("AUDITORIA_RETENCION_MESES", "24"))
+AUDITORIA_ARCHIVO_DIR = os.environ.get("AUDITORIA_ARCHIVO_DIR", str(BASE_DIR / "archivo" / "auditoria"))
+
+# Rows fetched per server-side cursor round trip (and prefetched together) by streaming exports.
+EXPORTACION_FILAS_POR_BLOQUE = int(os.environ.get("EXPORTACION_FILAS_POR_BLOQUE", "2000"))
+# Background export jobs (see exportaciones.services). Off by default: enable only where the
+# `procesar_exportaciones` worker runs, otherwise queued exports never finish.
+EXPORTACIONES_SEGUNDO_PLANO = env_bool("EXPORTACIONES_SEGUNDO_PLANO", False)
+EXPORTACIONES_DIR = "exportaciones"  # under MEDIA_ROOT; must not be published by the web server
+EXPORTACIONES_HORAS_VIGENCIA = int(os.environ.get("EXPORTACIONES_HORAS_VIGENCIA", "24"))
+EXPORTACIONES_MINUTOS_MAXIMOS = int(os.environ.get("EXPORTACIONES_MINUTOS_MAXIMOS", "60"))
+
+# Batch import of tax documents from a ZIP or directory (see finanzas.documentos.lote).
+# Parsing runs in this many spawned processes; 1 parses inline in the request/command process.
+DOCUMENTOS_LOTE_PROCESOS = int(os.environ.get("DOCUMENTOS_LOTE_PROCESOS", str(min(4, os.cpu_count() or 1))))
+DOCUMENTOS_LOTE_MAX_ARCHIVOS = int(os.environ.get("DOCUMENTOS_LOTE_MAX_ARCHIVOS", "1000"))
+DOCUMENTOS_LOTE_MAX_MB = int(os.environ.get("DOCUMENTOS_LOTE_MAX_MB", "200"))  # uncompressed ZIP content
+# Tax document uploads under review live in finanzas.ImportacionTemporal and
+# MEDIA_ROOT/finanzas/importaciones_tmp/ for this long; `limpiar_importaciones_temporales` removes them.
+DOCUMENTOS_IMPORTACION_HORAS_VIGENCIA = int(os.environ.get("DOCUMENTOS_IMPORTACION_HORAS_VIGENCIA", "24"))
+
+# PDF text extraction (see finanzas.documentos.parsers.ConfigExtraccionPdf). Extractor order per
+# document family; "default" applies until the extracted text reveals the family.
+DOCUMENTOS_PDF_ORDEN_EXTRACCION = env_list_mapping(
+    "DOCUMENTOS_PDF_ORDEN_EXTRACCION",
+    "default:pypdf,pdftotext;boleta_honorarios:pdftotext,pypdf",
+)
+# Each extractor run (pdftotext, or pypdf in a child Python process) is killed after this many
+# seconds and capped at this much virtual memory; at most DOCUMENTOS_PDF_CONCURRENCIA of them run
+# at once per Python process.
+DOCUMENTOS_PDF_TIMEOUT_SEGUNDOS = int(os.environ.get("DOCUMENTOS_PDF_TIMEOUT_SEGUNDOS", "20"))
+DOCUMENTOS_PDF_MEMORIA_MB = int(os.environ.get("DOCUMENTOS_PDF_MEMORIA_MB", "512"))
+DOCUMENTOS_PDF_CONCURRENCIA = int(os.environ.get("DOCUMENTOS_PDF_CONCURRENCIA", "2"))
+
+# Versioned cache for heavy selectors (see plataformaelemental.cache_selectores).
+# "locmem" keeps one cache per process; "file" shares it between workers on the same host.
+# Writes only bump the versions of the cache they see, so with several gunicorn workers a
+# per-process cache would serve stale results from the other workers: it is only enabled by
+# default on the shared backend. Set SELECTORES_CACHE_SEGUNDOS explicitly for a single process.
+SELECTORES_CACHE_BACKEND = os.environ.get("SELECTORES_CACHE_BACKEND", "locmem").strip().lower()
+SELECTORES_CACHE_SEGUNDOS = int(
+    os.environ.get("SELECTORES_CACHE_SEGUNDOS", "300" if SELECTORES_CACHE_BACKEND == "file" else "0")
+)
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "default",
+    },
+    "selectores": (
+        {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.environ.get("SELECTORES_CACHE_DIR", str(BASE_DIR / "cache" / "selectores")),
+            "OPTIONS": {"MAX_ENTRIES": int(os.environ.get("SELECTORES_CACHE_MAX_ENTRADAS", "5000"))},
+        }
+        if SELECTORES_CACHE_BACKEND == "file"
+        else {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "selectores",
+            "OPTIONS": {"MAX_ENTRIES": int(os.environ.get("SELECTORES_CACHE_MAX_ENTRADAS", "5000"))},
+        }
+    ),
+}
+
 GOOGLE_AUTH_ENABLED = env_bool("GOOGLE_AUTH_ENABLED", False)
 ACCESS_REQUESTS_ENABLED = env_bool("ACCESS_REQUESTS_ENABLED", False)
 ACCESS_REQUEST_APPROVAL_ENABLED = env_bool("ACCESS_REQUEST_APPROVAL_ENABLED", False)
@@ -1,11 +1,104 @@
 from datetime import date, timedelta
 
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.utils.formats import date_format
 
 from django.core.exceptions import PermissionDenied
 
-from personas.models import Organizacion, PersonaRol
+from personas.models import Organizacion
+from personas.permissions import mapa_permisos, roles_usuario
+
+
+class ContextoPeticion:
+    """Periodo, organización activa, organizaciones visibles y roles de una petición, resueltos una vez.
+
+    `ContextoPeticionMiddleware` lo deja en `request.contexto`; `contexto_peticion` lo crea si la
+    petición no pasó por el middleware (`RequestFactory`, `request_de_trabajo`). Lo memorizado se
+    descarta si cambia `request.GET` o `request.user` (p. ej. al iniciar sesión en la misma petición).
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self._origen = None
+        self._memo = {}
+
+    def _memorizado(self, clave, calcular):
+        origen = (self.request.GET, getattr(self.request, "user", None))
+        if self._origen is None or any(actual is not anterior for actual, anterior in zip(origen, self._origen)):
+            self._origen = origen
+            self._memo = {}
+        if clave not in self._memo:
+            # Un `PermissionDenied` no se memoriza: se vuelve a resolver y a lanzar.
+            self._memo[clave] = calcular()
+        return self._memo[clave]
+
+    @property
+    def user(self):
+        return getattr(self.request, "user", None)
+
+    @property
+    def periodo(self):
+        return self._memorizado("periodo", lambda: _calcular_periodo(self.request))
+
+    @property
+    def organizacion_activa(self):
+        return self._memorizado("organizacion_activa", self._calcular_organizacion_activa)
+
+    def organizaciones_visibles(self, *, permitir_staff_global=True):
+        """El mismo queryset en toda la petición: se evalúa una vez y luego se lee de su caché."""
+        return self._memorizado(
+            ("organizaciones_visibles", permitir_staff_global),
+            lambda: organizaciones_visibles_para_usuario(self.user, permitir_staff_global=permitir_staff_global),
+        )
+
+    @property
+    def roles(self):
+        """Roles normalizados del usuario en cualquier organización (ver `personas.permissions`)."""
+        return self._memorizado("roles", lambda: roles_usuario(self.user))
+
+    @property
+    def codigos_rol(self):
+        """Códigos de rol activos tal como están guardados, para `nav_context`."""
+        persona = getattr(self.user, "persona", None)
+        return self._memorizado(
+            "codigos_rol",
+            lambda: list(persona.roles.filter(activo=True).values_list("rol__codigo", flat=True)) if persona else [],
+        )
+
+    def _calcular_organizacion_activa(self):
+        org_id = self.request.GET.get("organizacion")
+        if not org_id or str(org_id).strip().lower() in {"todos", "todas"}:
+            return None
+        try:
+            org_pk = int(org_id)
+        except (TypeError, ValueError):
+            org_pk = None
+        organizacion = next((org for org in self.organizaciones_visibles() if org.pk == org_pk), None)
+        user = self.user
+        if organizacion or getattr(user, "is_superuser", False) or getattr(user, "is_staff", False):
+            return organizacion
+        if getattr(user, "is_authenticated", False):
+            raise PermissionDenied("La organización seleccionada no está disponible para este usuario.")
+        return None
+
+
+class ContextoPeticionMiddleware:
+    """Deja un `ContextoPeticion` vacío en `request.contexto`; se resuelve a medida que se usa."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.contexto = ContextoPeticion(request)
+        return self.get_response(request)
+
+
+def contexto_peticion(request):
+    contexto = getattr(request, "contexto", None)
+    if contexto is None:
+        contexto = request.contexto = ContextoPeticion(request)
+    return contexto
 
 
 def organizaciones_visibles_para_usuario(user, *, permitir_staff_global=True):
@@ -14,10 +107,7 @@ def organizaciones_visibles_para_usuario(user, *, permitir_staff_global=True):
         return Organizacion.objects.all().order_by("nombre")
     if user.is_superuser or (permitir_staff_global and user.is_staff):
         return Organizacion.objects.all().order_by("nombre")
-    persona = getattr(user, "persona", None)
-    if not persona:
-        return Organizacion.objects.none()
-    return Organizacion.objects.filter(persona_roles__persona=persona, persona_roles__activo=True).distinct().order_by("nombre")
+    return Organizacion.objects.filter(pk__in=list(mapa_permisos(user))).order_by("nombre")
 
 
 MESES_PERIODO = [
@@ -67,44 +157,123 @@ def _normalizar_anio(raw_anio, hoy):
     return anio if 2000 <= anio <= 2100 else hoy.year
 
 
+def _normalizar_trimestre(raw_trimestre):
+    try:
+        trimestre = int((raw_trimestre or "").strip())
+    except (TypeError, ValueError):
+        return None
+    return trimestre if 1 <= trimestre <= 4 else None
+
+
+def _normalizar_fecha(raw_fecha):
+    try:
+        return parse_date((raw_fecha or "").strip())
+    except ValueError:
+        return None
+
+
+def _inicio_mes_siguiente(fecha):
+    return _fin_de_mes(fecha) + timedelta(days=1)
+
+
 def resolver_periodo(request):
+    return dict(contexto_peticion(request).periodo)
+
+
+def _calcular_periodo(request):
     hoy = timezone.localdate()
     mes = _normalizar_mes(request.GET.get("periodo_mes"), hoy)
     anio = _normalizar_anio(request.GET.get("periodo_anio"), hoy)
+    trimestre = _normalizar_trimestre(request.GET.get("periodo_trimestre")) if anio is not None else None
+    desde = _normalizar_fecha(request.GET.get("periodo_desde"))
+    hasta = _normalizar_fecha(request.GET.get("periodo_hasta"))
+    if trimestre is not None:
+        mes = None
     referencia = hoy.replace(year=anio or hoy.year, month=mes or hoy.month, day=1)
     return {
         "mes": mes,
         "anio": anio,
+        "trimestre": trimestre,
+        "desde": desde,
+        "hasta": hasta,
         "referencia_inicio": referencia,
         "referencia_fin": _fin_de_mes(referencia),
     }
 
 
-def filtros_periodo(campo, *, request=None, mes=None, anio=None):
+def argumentos_periodo(periodo):
+    """`mes`, `anio`, `trimestre`, `desde` y `hasta` de un periodo de `resolver_periodo`.
+
+    Quien ya resolvió el periodo los pasa completos a `filtros_periodo`/`aplicar_periodo`;
+    pasar solo `mes` y `anio` pierde el trimestre y el rango personalizado.
+    """
+    return {clave: periodo[clave] for clave in ("mes", "anio", "trimestre", "desde", "hasta")}
+
+
+def rango_periodo(*, mes=None, anio=None, trimestre=None, desde=None, hasta=None):
+    """Rango semiabierto `(inicio, fin)` con `inicio <= fecha < fin`.
+
+    Prioridad: rango personalizado (`desde`/`hasta`, ambos inclusive), trimestre,
+    mes y año completo. Cualquiera de los extremos puede ser `None` (sin cota).
+    Devuelve `None` cuando el periodo no es un intervalo continuo (sin año).
+    """
+    if desde is not None or hasta is not None:
+        return desde, (hasta + timedelta(days=1)) if hasta is not None else None
+    if anio is None:
+        return None
+    if trimestre is not None:
+        inicio = date(anio, 3 * (trimestre - 1) + 1, 1)
+        fin = date(anio + 1, 1, 1) if trimestre == 4 else date(anio, 3 * trimestre + 1, 1)
+        return inicio, fin
+    if mes is not None:
+        inicio = date(anio, mes, 1)
+        return inicio, _inicio_mes_siguiente(inicio)
+    return date(anio, 1, 1), date(anio + 1, 1, 1)
+
+
+def filtros_periodo(campo, *, request=None, mes=None, anio=None, trimestre=None, desde=None, hasta=None):
+    """Filtros del periodo como rango `campo__gte`/`campo__lt` para aprovechar índices por fecha."""
     if request is not None:
-        periodo = resolver_periodo(request)
-        mes = periodo["mes"]
-        anio = periodo["anio"]
+        return filtros_periodo(campo, **argumentos_periodo(resolver_periodo(request)))
+    rango = rango_periodo(mes=mes, anio=anio, trimestre=trimestre, desde=desde, hasta=hasta)
+    if rango is None:
+        # "Un mes de todos los años" no es un intervalo: se mantiene el filtro por mes.
+        return {f"{campo}__month": mes} if mes is not None else {}
+    inicio, fin = rango
     filtros = {}
-    if anio is not None:
-        filtros[f"{campo}__year"] = anio
-    if mes is not None:
-        filtros[f"{campo}__month"] = mes
+    if inicio is not None:
+        filtros[f"{campo}__gte"] = inicio
+    if fin is not None:
+        filtros[f"{campo}__lt"] = fin
     return filtros
 
 
-def aplicar_periodo(queryset, campo, *, request=None, mes=None, anio=None):
-    filtros = filtros_periodo(campo, request=request, mes=mes, anio=anio)
+def aplicar_periodo(queryset, campo, *, request=None, mes=None, anio=None, trimestre=None, desde=None, hasta=None):
+    filtros = filtros_periodo(
+        campo,
+        request=request,
+        mes=mes,
+        anio=anio,
+        trimestre=trimestre,
+        desde=desde,
+        hasta=hasta,
+    )
     if not filtros:
         return queryset
     return queryset.filter(**filtros)
 
 
-def descripcion_periodo(*, request=None, mes=None, anio=None, corta=False):
+def descripcion_periodo(*, request=None, mes=None, anio=None, trimestre=None, desde=None, hasta=None, corta=False):
     if request is not None:
-        periodo = resolver_periodo(request)
-        mes = periodo["mes"]
-        anio = periodo["anio"]
+        return descripcion_periodo(**argumentos_periodo(resolver_periodo(request)), corta=corta)
+    if desde is not None or hasta is not None:
+        desde_txt = desde.strftime("%d-%m-%Y") if desde else "el inicio"
+        if hasta is None:
+            return f"{desde_txt} en adelante" if corta else f"Desde {desde_txt} en adelante"
+        hasta_txt = hasta.strftime("%d-%m-%Y")
+        return f"{desde_txt} a {hasta_txt}" if corta else f"Desde {desde_txt} hasta {hasta_txt}"
+    if trimestre is not None and anio is not None:
+        return f"T{trimestre} {anio}" if corta else f"Trimestre {trimestre} de {anio}"
     if mes is None and anio is None:
         return "Todo el periodo" if corta else "Todos los meses y todos los años"
     if mes is None:
@@ -116,41 +285,25 @@ def descripcion_periodo(*, request=None, mes=None, anio=None, corta=False):
 
 
 def nav_context(request, *, permitir_staff_global=True):
-    persona = getattr(request.user, "persona", None)
-    roles = []
-    if persona:
-        roles = list(persona.roles.filter(activo=True).values_list("rol__codigo", flat=True))
-    context = {"persona": persona, "roles_usuario": roles}
+    contexto = contexto_peticion(request)
+    context = {"persona": getattr(request.user, "persona", None), "roles_usuario": list(contexto.codigos_rol)}
     if not permitir_staff_global:
-        context["organizaciones_global"] = organizaciones_visibles_para_usuario(
-            request.user,
-            permitir_staff_global=False,
-        )
+        context["organizaciones_global"] = contexto.organizaciones_visibles(permitir_staff_global=False)
     return context
 
 
 def organizacion_desde_request(request):
-    org_id = request.GET.get("organizacion")
-    if not org_id or str(org_id).strip().lower() in {"todos", "todas"}:
-        return None
-    user = getattr(request, "user", None)
-    if getattr(user, "is_superuser", False) or getattr(user, "is_staff", False):
-        return Organizacion.objects.filter(pk=org_id).first()
-    organizacion = organizaciones_visibles_para_usuario(user).filter(pk=org_id).first()
-    if organizacion:
-        return organizacion
-    if getattr(getattr(request, "user", None), "is_authenticated", False):
-        raise PermissionDenied("La organización seleccionada no está disponible para este usuario.")
-    return None
+    return contexto_peticion(request).organizacion_activa
 
 
 def periodo_context(request):
     hoy = timezone.localdate()
-    periodo = resolver_periodo(request)
+    contexto = contexto_peticion(request)
+    periodo = contexto.periodo
     anio = str(periodo["anio"]) if periodo["anio"] is not None else "todos"
     mes = str(periodo["mes"]) if periodo["mes"] is not None else "todos"
     organizacion_id = request.GET.get("organizacion") or ""
-    organizacion_activa = organizacion_desde_request(request)
+    organizacion_activa = contexto.organizacion_activa
 
     return {
         "periodo_anio": anio,
@@ -159,7 +312,7 @@ def periodo_context(request):
         "periodo_meses": MESES_PERIODO,
         "periodo_descripcion": descripcion_periodo(request=request, corta=False),
         "periodo_descripcion_corta": descripcion_periodo(request=request, corta=True),
-        "organizaciones_global": organizaciones_visibles_para_usuario(getattr(request, "user", None)),
+        "organizaciones_global": contexto.organizaciones_visibles(),
         "organizacion_id": str(organizacion_id),
         "organizacion_activa": organizacion_activa,
     }
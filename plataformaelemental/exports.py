@@ -1,12 +1,21 @@
-from io import BytesIO
+import csv
+import tempfile
+from collections.abc import Iterable
+from dataclasses import dataclass
+from itertools import chain, islice
 
-from django.http import HttpResponse
+from django.conf import settings
+from django.http import FileResponse, StreamingHttpResponse
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, PatternFill
 from openpyxl.utils import get_column_letter
 
 
 XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+XLSX_FILAS_MUESTRA_ANCHO = 500
+FORMATO_CSV = "csv"
+FORMATO_XLSX = "xlsx"
 
 
 def periodo_sufijo_archivo(periodo):
@@ -21,26 +30,138 @@ def periodo_sufijo_archivo(periodo):
     return f"{anio}_{mes:02d}"
 
 
-def xlsx_response(*, filename, sheet_title, headers, rows):
-    workbook = Workbook()
-    worksheet = workbook.active
-    worksheet.title = sheet_title[:31]
+class _Eco:
+    """Destino de `csv.writer` que devuelve cada línea en vez de guardarla."""
 
-    worksheet.append(headers)
-    header_fill = PatternFill("solid", fgColor="E9ECEF")
-    for cell in worksheet[1]:
-        cell.font = Font(bold=True)
-        cell.fill = header_fill
+    def write(self, valor):
+        return valor
+
+
+def filas_por_bloque():
+    return max(1, getattr(settings, "EXPORTACION_FILAS_POR_BLOQUE", 2000))
+
+
+def iterar_en_bloques(queryset):
+    """Recorre `queryset` con cursor del lado del servidor, de a `EXPORTACION_FILAS_POR_BLOQUE` filas.
+
+    Los `prefetch_related` del queryset se resuelven por bloque, así que la memoria no
+    crece con el total de filas exportadas.
+    """
+    return queryset.iterator(chunk_size=filas_por_bloque())
 
+
+def bloques_csv(*, headers, rows, bom=False):
+    """Texto CSV por bloques: primero los headers y luego `EXPORTACION_FILAS_POR_BLOQUE` filas por vez."""
+    writer = csv.writer(_Eco())
+    yield ("\ufeff" if bom else "") + writer.writerow(headers)
+    tamano = filas_por_bloque()
+    bloque = []
     for row in rows:
-        worksheet.append(row)
+        bloque.append(writer.writerow(row))
+        if len(bloque) >= tamano:
+            yield "".join(bloque)
+            bloque = []
+    if bloque:
+        yield "".join(bloque)
 
-    for column_index, column_cells in enumerate(worksheet.columns, start=1):
-        max_length = max(len(str(cell.value or "")) for cell in column_cells)
-        worksheet.column_dimensions[get_column_letter(column_index)].width = min(max(max_length + 2, 12), 45)
 
-    output = BytesIO()
-    workbook.save(output)
-    response = HttpResponse(output.getvalue(), content_type=XLSX_CONTENT_TYPE)
+def csv_streaming_response(*, filename, headers, rows, content_type="text/csv", bom=False):
+    """CSV enviado mientras se genera."""
+    response = StreamingHttpResponse(bloques_csv(headers=headers, rows=rows, bom=bom), content_type=content_type)
     response["Content-Disposition"] = f'attachment; filename="{filename}"'
     return response
+
+
+def _ancho_columnas(filas):
+    anchos = {}
+    for fila in filas:
+        for indice, valor in enumerate(fila, start=1):
+            anchos[indice] = max(anchos.get(indice, 0), len(str(valor or "")))
+    return {indice: min(max(largo + 2, 12), 45) for indice, largo in anchos.items()}
+
+
+def escribir_xlsx(destino, *, sheet_title, headers, rows):
+    """Escribe un XLSX en modo write-only en `destino` (ruta o archivo binario).
+
+    Los anchos de columna se calculan con los headers y las primeras
+    `XLSX_FILAS_MUESTRA_ANCHO` filas, porque en modo write-only deben fijarse antes de
+    escribir. El resto de las filas pasa directo del iterador al archivo.
+    """
+    rows = iter(rows)
+    muestra = list(islice(rows, XLSX_FILAS_MUESTRA_ANCHO))
+
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet(title=sheet_title[:31])
+    for column_index, width in _ancho_columnas([headers, *muestra]).items():
+        worksheet.column_dimensions[get_column_letter(column_index)].width = width
+
+    header_font = Font(bold=True)
+    header_fill = PatternFill("solid", fgColor="E9ECEF")
+    encabezados = []
+    for header in headers:
+        cell = WriteOnlyCell(worksheet, value=header)
+        cell.font = header_font
+        cell.fill = header_fill
+        encabezados.append(cell)
+    worksheet.append(encabezados)
+    for row in chain(muestra, rows):
+        worksheet.append(row)
+    workbook.save(destino)
+
+
+def xlsx_response(*, filename, sheet_title, headers, rows):
+    """XLSX escrito a un archivo temporal y enviado por streaming."""
+    archivo = tempfile.TemporaryFile(suffix=".xlsx")
+    try:
+        escribir_xlsx(archivo, sheet_title=sheet_title, headers=headers, rows=rows)
+    except Exception:
+        archivo.close()
+        raise
+    archivo.seek(0)
+    # FileResponse cierra el temporal al terminar de enviarlo, y el sistema lo borra.
+    return FileResponse(archivo, as_attachment=True, filename=filename, content_type=XLSX_CONTENT_TYPE)
+
+
+@dataclass
+class Exportacion:
+    """Archivo exportable descrito sin escribirlo: sirve para responder en línea o desde un trabajo."""
+
+    formato: str
+    filename: str
+    headers: list
+    rows: Iterable
+    sheet_title: str = ""
+    content_type: str = "text/csv"
+    bom: bool = False
+
+
+def respuesta_exportacion(exportacion):
+    if exportacion.formato == FORMATO_XLSX:
+        return xlsx_response(
+            filename=exportacion.filename,
+            sheet_title=exportacion.sheet_title,
+            headers=exportacion.headers,
+            rows=exportacion.rows,
+        )
+    return csv_streaming_response(
+        filename=exportacion.filename,
+        headers=exportacion.headers,
+        rows=exportacion.rows,
+        content_type=exportacion.content_type,
+        bom=exportacion.bom,
+    )
+
+
+def escribir_exportacion(exportacion, ruta):
+    """Escribe `exportacion` en `ruta`, bloque a bloque."""
+    if exportacion.formato == FORMATO_XLSX:
+        escribir_xlsx(
+            ruta,
+            sheet_title=exportacion.sheet_title,
+            headers=exportacion.headers,
+            rows=exportacion.rows,
+        )
+        return
+    with open(ruta, "w", encoding="utf-8", newline="") as archivo:
+        for bloque in bloques_csv(headers=exportacion.headers, rows=exportacion.rows, bom=exportacion.bom):
+            archivo.write(bloque)
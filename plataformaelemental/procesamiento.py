@@ -0,0 +1,75 @@
+"""Agrupación por transacción del trabajo derivado de señales `post_save`.
+
+Dentro de `procesamiento_diferido()` las señales de asistencias y pagos no procesan
+cada guardado: encolan claves en un buffer y el trabajo se ejecuta una sola vez, en
+lote, al cerrar el bloque y antes del commit. Fuera de un bloque diferido, o con
+`inmediato=True` / `PROCESAMIENTO_SENALES_INMEDIATO`, cada señal procesa al instante.
+"""
+
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+
+
+_estado = threading.local()
+
+
+def _buffer_activo():
+    return getattr(_estado, "buffer", None)
+
+
+def encolar_trabajo(tipo, claves, procesador):
+    """Agrega `claves` al buffer activo bajo `tipo`.
+
+    Devuelve `False` cuando no hay bloque diferido activo; en ese caso quien llama
+    debe procesar de inmediato.
+    """
+    buffer = _buffer_activo()
+    if buffer is None:
+        return False
+    _, pendientes = buffer.setdefault(tipo, (procesador, set()))
+    pendientes.update(claves)
+    return True
+
+
+def _vaciar_buffer(buffer):
+    while buffer:
+        tipo = next(iter(buffer))
+        procesador, claves = buffer.pop(tipo)
+        procesador(claves)
+
+
+@contextmanager
+def procesamiento_diferido(*, inmediato=None):
+    """Abre una unidad atómica que acumula el trabajo de señales y lo ejecuta en lote al cerrar.
+
+    Los bloques anidados se suman al buffer del bloque exterior. Con `inmediato=True`
+    el bloque desactiva el buffer y las señales vuelven a procesar guardado por guardado.
+    """
+    if inmediato is None:
+        inmediato = getattr(settings, "PROCESAMIENTO_SENALES_INMEDIATO", False)
+    buffer_exterior = _buffer_activo()
+    if inmediato:
+        _estado.buffer = None
+        try:
+            yield
+        finally:
+            _estado.buffer = buffer_exterior
+        return
+    if buffer_exterior is not None:
+        yield
+        return
+
+    buffer = {}
+    _estado.buffer = buffer
+    try:
+        with transaction.atomic():
+            yield
+            _vaciar_buffer(buffer)
+    finally:
+        _estado.buffer = None
+
+
+__all__ = ["encolar_trabajo", "procesamiento_diferido"]
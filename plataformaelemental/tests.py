@@ -1,11 +1,20 @@
+from io import BytesIO
+from unittest.mock import patch
+
 from django.contrib.auth import get_user_model
-from django.test import TestCase, override_settings
+from django.core.cache import caches
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
 from django.urls import reverse
 
 from asistencias.models import Asistencia, Disciplina, SesionClase
 from auditoria.models import AuditLog
 from finanzas.models import Category, DocumentoTributario, Payment, Transaction
+from finanzas.selectors import consolidado_categorias_queryset
 from personas.models import Organizacion, Persona, PersonaRol, Rol
+from openpyxl import load_workbook
+
+from plataformaelemental.cache_selectores import ALIAS_CACHE, estadisticas_cache, resultado_cacheado
+from plataformaelemental.exports import xlsx_response
 
 
 TEST_PASSWORD = "not-a-real-test-password"
@@ -347,3 +356,124 @@ class DjangoAdminSupportTests(TestCase):
         for admin_name, query in casos:
             response = self.client.get(reverse(admin_name), {"q": query})
             self.assertEqual(response.status_code, 200, admin_name)
+
+
+@override_settings(SELECTORES_CACHE_SEGUNDOS=300)
+class CacheSelectoresTests(TestCase):
+    def setUp(self):
+        caches[ALIAS_CACHE].clear()
+        self.organizacion = Organizacion.objects.create(
+            nombre="Org Cache",
+            razon_social="Org Cache SpA",
+            rut="75.000.000-2",
+        )
+        self.otra_organizacion = Organizacion.objects.create(
+            nombre="Otra Cache",
+            razon_social="Otra Cache SpA",
+            rut="75.000.001-0",
+        )
+        self.categoria = Category.objects.create(nombre="Ingreso cache", tipo=Category.Tipo.INGRESO, activa=True)
+        self.request = RequestFactory().get("/", {"periodo_mes": 3, "periodo_anio": 2026})
+
+    def _transaccion(self, organizacion, monto):
+        return Transaction.objects.create(
+            organizacion=organizacion,
+            categoria=self.categoria,
+            fecha="2026-03-10",
+            tipo=Transaction.Tipo.INGRESO,
+            monto=monto,
+            descripcion="Movimiento cache",
+        )
+
+    def _consolidado(self, organizacion):
+        return [item["total"] for item in consolidado_categorias_queryset(self.request, organizacion=organizacion)]
+
+    def test_resultado_se_reutiliza_hasta_que_cambia_la_organizacion(self):
+        self._transaccion(self.organizacion, 1000)
+        self.assertEqual(self._consolidado(self.organizacion), [1000])
+        with self.assertNumQueries(0):
+            self.assertEqual(self._consolidado(self.organizacion), [1000])
+
+        self._transaccion(self.otra_organizacion, 500)
+        with self.assertNumQueries(0):
+            self.assertEqual(self._consolidado(self.organizacion), [1000])
+
+        self._transaccion(self.organizacion, 250)
+        self.assertEqual(self._consolidado(self.organizacion), [1250])
+        self.assertEqual(
+            estadisticas_cache()["finanzas.consolidado_categorias"],
+            {"aciertos": 2, "fallos": 2},
+        )
+
+    def test_resultado_sin_organizacion_se_invalida_con_cualquier_organizacion(self):
+        self._transaccion(self.organizacion, 1000)
+        self.assertEqual(self._consolidado(None), [1000])
+
+        self._transaccion(self.otra_organizacion, 500)
+
+        self.assertEqual(self._consolidado(None), [1500])
+
+    def test_parametros_distintos_no_comparten_resultado(self):
+        calculos = []
+
+        def calcular():
+            calculos.append(1)
+            return len(calculos)
+
+        for parametros in ({"mes": 1}, {"mes": 2}, {"mes": 1}):
+            resultado_cacheado("prueba.parametros", calcular=calcular, parametros=parametros)
+
+        self.assertEqual(len(calculos), 2)
+
+    @override_settings(SELECTORES_CACHE_SEGUNDOS=0)
+    def test_cache_desactivada_siempre_calcula(self):
+        self._transaccion(self.organizacion, 1000)
+        self._consolidado(self.organizacion)
+
+        with self.assertNumQueries(1):
+            self._consolidado(self.organizacion)
+
+    def test_estadisticas_solo_para_staff(self):
+        url = reverse("api-cache-selectores")
+        usuario = get_user_model().objects.create_user("cache_normal", password=TEST_PASSWORD)
+        self.client.force_login(usuario)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        usuario.is_staff = True
+        usuario.save(update_fields=["is_staff"])
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["activa"])
+        self.assertIn("asistencias.estudiantes_operativos_periodo", response.json()["selectores"])
+
+
+class XlsxResponseTests(SimpleTestCase):
+    def test_escribe_por_streaming_con_anchos_desde_la_muestra(self):
+        entregadas = []
+
+        def filas():
+            for numero in range(1, 301):
+                entregadas.append(numero)
+                yield [numero, "x" * (80 if numero == 300 else 5)]
+
+        with patch("plataformaelemental.exports.XLSX_FILAS_MUESTRA_ANCHO", 10):
+            response = xlsx_response(
+                filename="prueba.xlsx",
+                sheet_title="Hoja de prueba con un titulo demasiado largo",
+                headers=["Numero", "Detalle largo de la columna"],
+                rows=filas(),
+            )
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(len(entregadas), 300)
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="prueba.xlsx"')
+        worksheet = load_workbook(BytesIO(response.getvalue())).active
+        self.assertEqual(worksheet.title, "Hoja de prueba con un titulo de")
+        rows = list(worksheet.iter_rows(values_only=True))
+        self.assertEqual(rows[0], ("Numero", "Detalle largo de la columna"))
+        self.assertEqual(len(rows), 301)
+        self.assertEqual(rows[-1][0], 300)
+        self.assertTrue(worksheet["A1"].font.bold)
+        self.assertEqual(worksheet.column_dimensions["A"].width, 12)
+        self.assertEqual(worksheet.column_dimensions["B"].width, 29)
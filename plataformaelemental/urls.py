@@ -61,5 +61,6 @@ urlpatterns += [
     path("asistencias/", include("asistencias.urls")),
     path("personas/", include("personas.urls")),
     path("finanzas/", include("finanzas.urls")),
+    path("exportaciones/", include("exportaciones.urls")),
     path("profesor/", include("asistencias.profesor_urls")),
 ]